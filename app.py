@@ -1,10 +1,31 @@
 import os
-import requests
 from flask import Flask, render_template, request, jsonify
-from models import db, Ticket, Customer, SepticSystem, ServiceHistory, Location, Truck, TeamMember, TruckTeamAssignment, DumpSite
+from models import db, Ticket, Customer, SepticSystem, ServiceHistory, Location, Truck, TeamMember, TruckTeamAssignment, DumpSite, Job
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
+from sqlalchemy.orm import joinedload
 import tank_tracking
+import geocoding
+import routing
+import route_optimization
+import fleet_routing
+import spatial
+import ticket_serializer
+import pagination
+from pagination import ASC, DESC
+import board_versions
+import board_events
+import board_operations
+import positions
+import geocode_backfill
+import db_indexes
+import search
+import ticket_counters
+import http_client
+import singleflight
+import jobs
+import metrics
+import profiler
 
 # Import OpenAI at the top level
 try:
@@ -50,73 +71,62 @@ except Exception as e:
     traceback.print_exc()
     raise
 
+# Request latency, status and SQL metrics (served at /metrics)
+metrics.init_app(app)
+# Opt-in SQL profiler (SQL_PROFILER=1 or the switch on /admin)
+profiler.init_app(app)
+
 # OpenRouteService configuration
 OPENROUTE_API_KEY = os.environ.get('OPENROUTE_API_KEY')
 OPENROUTE_BASE_URL = 'https://api.openrouteservice.org'
 
 def geocode_address(address):
-    """Convert address to coordinates using OpenRouteService geocoding"""
-    if not OPENROUTE_API_KEY:
-        print("Warning: OPENROUTE_API_KEY not configured")
-        return None
-    
-    try:
-        url = f"{OPENROUTE_BASE_URL}/geocode/search"
-        params = {
-            'api_key': OPENROUTE_API_KEY,
-            'text': address,
-            'size': 1,
-            'layers': 'address'
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        print(f"Geocoding response for '{address}': {data}")
-        print(f"Response type: {type(data)}")
-        print(f"Response keys: {data.keys() if isinstance(data, dict) else 'Not a dict'}")
-        
-        # Check if it's the OpenRouteService features format
-        if data.get('features') and len(data['features']) > 0:
-            coords = data['features'][0]['geometry']['coordinates']
-            return {'longitude': coords[0], 'latitude': coords[1]}
-        
-        # Check if it's a direct lat/lng format
-        elif data.get('lat') and data.get('lng'):
-            return {'longitude': data.get('lng'), 'latitude': data.get('lat')}
-        
-        # Check if it's a direct latitude/longitude format  
-        elif data.get('latitude') and data.get('longitude'):
-            return {'longitude': data.get('longitude'), 'latitude': data.get('latitude')}
-        
-        print(f"No geocoding results found for '{address}'")
-        return None
-    except Exception as e:
-        print(f"Geocoding error for '{address}': {e}")
-        return None
+    """Convert address to coordinates, trying OpenRouteService then Nominatim.
+
+    Results are served from the shared geocode cache (in-process LRU backed
+    by the geocode_cache table) so repeated addresses never hit the network.
+    """
+    return geocoding.geocode(address)
+
+def calculate_drive_time(origin_address, destination_address, details=True):
+    """Calculate drive time between two addresses in minutes
 
-def calculate_drive_time(origin_address, destination_address):
-    """Calculate drive time between two addresses in minutes"""
+    With details=False only duration, distance and geometry are returned and
+    the leg is served from the route leg cache when possible. Detailed
+    directions are always fetched, and their summary is added to the leg cache.
+    """
     if not OPENROUTE_API_KEY:
         print("Warning: OPENROUTE_API_KEY not configured")
         return None
     
     try:
-        # First geocode both addresses
-        print(f"Geocoding origin: '{origin_address}'")
+        # First geocode both addresses (cached)
         origin_coords = geocode_address(origin_address)
-        print(f"Origin coords: {origin_coords}")
-        
-        print(f"Geocoding destination: '{destination_address}'")
         dest_coords = geocode_address(destination_address)
-        print(f"Destination coords: {dest_coords}")
         
         if not origin_coords or not dest_coords:
             failed_address = origin_address if not origin_coords else destination_address
             print(f"Could not geocode address: '{failed_address}'")
             return None
         
+        if not details:
+            leg = routing.get_leg(origin_coords, dest_coords)
+            if not leg:
+                return None
+            return {
+                'duration_minutes': leg['duration_minutes'],
+                'distance_km': leg['distance_km'],
+                'origin_coords': {
+                    'latitude': origin_coords['latitude'],
+                    'longitude': origin_coords['longitude']
+                },
+                'dest_coords': {
+                    'latitude': dest_coords['latitude'],
+                    'longitude': dest_coords['longitude']
+                },
+                'geometry': leg['geometry']
+            }
+        
         # Calculate route
         url = f"{OPENROUTE_BASE_URL}/v2/directions/driving-car"
         headers = {
@@ -124,13 +134,10 @@ def calculate_drive_time(origin_address, destination_address):
             'Content-Type': 'application/json'
         }
         
-        # Handle both coordinate formats
-        origin_lon = origin_coords.get('longitude') or origin_coords.get('lng')
-        origin_lat = origin_coords.get('latitude') or origin_coords.get('lat')
-        dest_lon = dest_coords.get('longitude') or dest_coords.get('lng')  
-        dest_lat = dest_coords.get('latitude') or dest_coords.get('lat')
-        
-        print(f"Using coordinates: origin=[{origin_lon}, {origin_lat}], dest=[{dest_lon}, {dest_lat}]")
+        origin_lon = origin_coords['longitude']
+        origin_lat = origin_coords['latitude']
+        dest_lon = dest_coords['longitude']
+        dest_lat = dest_coords['latitude']
         
         data = {
             'coordinates': [
@@ -141,10 +148,13 @@ def calculate_drive_time(origin_address, destination_address):
             'elevation': True
         }
         
-        response = requests.post(url, json=data, headers=headers, timeout=15)
-        response.raise_for_status()
+        def fetch_route():
+            response = http_client.post('openroute', url, json=data, headers=headers)
+            response.raise_for_status()
+            return response.json()
         
-        result = response.json()
+        # Concurrent requests for the same route (in any worker) share one directions call
+        result = singleflight.do('directions', data, fetch_route)
         if result['routes'] and len(result['routes']) > 0:
             route = result['routes'][0]
             
@@ -152,6 +162,9 @@ def calculate_drive_time(origin_address, destination_address):
             duration_minutes = route['summary']['duration'] / 60
             distance_km = route['summary']['distance'] / 1000
             
+            # Share the summary with the leg cache (the geometry here has elevation, so it isn't cached)
+            routing.store_leg(origin_coords, dest_coords, route['summary']['duration'], route['summary']['distance'])
+            
             # Get turn-by-turn instructions if available
             instructions = []
             if 'segments' in route:
@@ -221,8 +234,11 @@ def job_board_new():
 
 @app.route('/database')
 def database_view():
-    tickets = Ticket.query.all()
-    return render_template('database.html', tickets=tickets)
+    # Rows are fetched a page at a time from /api/tickets; only the counts render here
+    ticket_counters.maybe_reconcile()
+    status_counts = ticket_counters.status_counts()
+    return render_template('database.html', status_counts=status_counts,
+                           total_tickets=sum(status_counts.values()))
 
 @app.route('/ticket/<int:ticket_id>')
 def ticket_detail(ticket_id):
@@ -231,21 +247,32 @@ def ticket_detail(ticket_id):
 
 @app.route('/customers')
 def customers_view():
-    customers = Customer.query.all()
-    return render_template('customers.html', customers=customers)
+    # Rows are fetched a page at a time from /api/customers
+    return render_template('customers.html')
+
+def requested_customer():
+    """Customer preselected with ?customer_id= (links from a customer's page)"""
+    customer_id = request.args.get('customer_id', type=int)
+    return db.session.get(Customer, customer_id) if customer_id else None
 
+def customer_septic_systems(customer_id):
+    """A customer's septic systems (the only ones a form can pick for them)"""
+    if not customer_id:
+        return []
+    return SepticSystem.query.filter_by(customer_id=customer_id).order_by(SepticSystem.id).all()
+
+# Forms render only the selected customer; others are found with the typeahead picker
 @app.route('/ticket/create')
 def create_ticket():
-    customers = Customer.query.all()
-    septic_systems = SepticSystem.query.all()
-    return render_template('ticket_form.html', customers=customers, septic_systems=septic_systems)
+    customer = requested_customer()
+    return render_template('ticket_form.html', selected_customer=customer,
+                           septic_systems=customer_septic_systems(customer and customer.id))
 
 @app.route('/ticket/<int:ticket_id>/edit')
 def edit_ticket(ticket_id):
     ticket = Ticket.query.get_or_404(ticket_id)
-    customers = Customer.query.all()
-    septic_systems = SepticSystem.query.all()
-    return render_template('ticket_form.html', ticket=ticket, customers=customers, septic_systems=septic_systems)
+    return render_template('ticket_form.html', ticket=ticket, selected_customer=ticket.customer,
+                           septic_systems=customer_septic_systems(ticket.customer_id))
 
 @app.route('/customer/create')
 def create_customer():
@@ -258,14 +285,13 @@ def edit_customer(customer_id):
 
 @app.route('/septic-system/create')
 def create_septic_system():
-    customers = Customer.query.all()
-    return render_template('septic_system_form.html', customers=customers)
+    return render_template('septic_system_form.html', selected_customer=requested_customer())
 
 @app.route('/septic-system/<int:system_id>/edit')
 def edit_septic_system(system_id):
     septic_system = SepticSystem.query.get_or_404(system_id)
-    customers = Customer.query.all()
-    return render_template('septic_system_form.html', septic_system=septic_system, customers=customers)
+    return render_template('septic_system_form.html', septic_system=septic_system,
+                           selected_customer=septic_system.customer)
 
 # Fleet Management Routes
 @app.route('/fleet')
@@ -326,6 +352,9 @@ def edit_team_member(member_id):
 # Dump Site Management Routes
 @app.route('/api/dump-sites', methods=['GET'])
 def get_dump_sites():
+    # Small reference list: the whole list unless a page is asked for
+    if pagination.wants_page(request.args):
+        return reference_list_page(DumpSite.query, DumpSite, lambda site: site.to_dict())
     dump_sites = DumpSite.query.all()
     return jsonify([site.to_dict() for site in dump_sites])
 
@@ -424,39 +453,98 @@ def delete_dump_site(site_id):
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 400
 
+def reference_list_page(query, model, to_item):
+    """One id-ordered page of a small reference list (trucks, dump sites, ...)"""
+    try:
+        page = pagination.parse_page_args(request.args, {'id': ((model.id, ASC),)}, 'id')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    rows, next_cursor = pagination.page_of_models(query, model, page)
+    return jsonify(pagination.page_response([to_item(row) for row in rows], page, next_cursor))
+
+def requested_ticket_fields():
+    """Ticket fields asked for with ?fields= and/or ?profile= (card, detail, export)"""
+    return ticket_serializer.parse_fields(request.args.get('fields'), request.args.get('profile'))
+
+def dump_stop_labels(stop):
+    """Card name/address for a dump stop (None if the ticket isn't one)"""
+    if stop['service_type'] == 'Waste Disposal' or (stop['job_id'] and stop['job_id'].startswith('DUMP-')):
+        return {
+            'customer_name': f"🗑️ {stop['disposal_location'] or 'Dump Site'}",
+            'customer_address': stop['service_description'] or 'Tank dump location'
+        }
+    return None
+
+def board_stop_labels(stop):
+    """Job board name/address for tickets without a customer"""
+    return dump_stop_labels(stop) or {'customer_name': 'No customer', 'customer_address': 'No address'}
+
+# Sort orders for paginated lists; each ends in the primary key so the order is total
+TICKET_SORTS = {
+    'board': ((Ticket.status, ASC), (db.func.coalesce(Ticket.column_position, 0), ASC), (Ticket.id, ASC)),
+    'newest': ((Ticket.created_at, DESC), (Ticket.id, DESC)),
+    'oldest': ((Ticket.created_at, ASC), (Ticket.id, ASC)),
+    'job_id': ((Ticket.job_id, ASC), (Ticket.id, ASC)),
+}
+CUSTOMER_SORTS = {
+    'name': ((Customer.last_name, ASC), (Customer.first_name, ASC), (Customer.id, ASC)),
+    'newest': ((Customer.created_at, DESC), (Customer.id, DESC)),
+}
+SEPTIC_SYSTEM_SORTS = {
+    'id': ((SepticSystem.id, ASC),),
+}
+
 @app.route('/api/tickets', methods=['GET'])
 def get_tickets():
-    tickets = Ticket.query.order_by(Ticket.status, Ticket.column_position).all()
-    return jsonify([ticket.to_dict() for ticket in tickets])
-
-@app.route('/api/job-board', methods=['GET'])
-def get_job_board_data():
-    from datetime import datetime, date
+    """
+    Tickets, a page at a time when a page is asked for
     
-    # Get date parameter (default to today)
-    date_str = request.args.get('date', date.today().isoformat())
+    ?sort= (board, newest, oldest, job_id), ?limit= (default 50, max 500) and
+    ?cursor= (next_cursor from the previous page); ?status= (comma-separated)
+    and ?customer_id= filter; ?fields= / ?profile= choose the fields.
+    Without ?limit= or ?cursor= the response is the whole list as a plain
+    array, in Ticket.to_dict()'s shape unless fields are asked for, as it
+    was before pages existed.
+    """
+    paged = pagination.wants_page(request.args)
     try:
-        target_date = datetime.fromisoformat(date_str).date()
-    except ValueError:
-        target_date = date.today()
+        fields = ticket_serializer.parse_fields(request.args.get('fields'), request.args.get('profile'),
+                                                default=ticket_serializer.DEFAULT_PROFILE if paged else 'export')
+        page = pagination.parse_page_args(request.args, TICKET_SORTS, 'board')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Get sort parameter for pending tickets
-    sort_by = request.args.get('sort', 'oldest')
+    query = Ticket.query
+    if request.args.get('status'):
+        query = query.filter(Ticket.status.in_(request.args['status'].split(',')))
+    if request.args.get('customer_id', type=int):
+        query = query.filter(Ticket.customer_id == request.args.get('customer_id', type=int))
     
-    # Get trucks
-    trucks = Truck.query.filter_by(status='active').all()
+    if not paged:
+        return jsonify(ticket_serializer.serialize_tickets(query.order_by(*pagination.order_by(page['keys'])), fields))
     
-    # Get pending tickets (only those not scheduled)
+    ids, next_cursor = pagination.keyset_page(query, page)
+    items = []
+    if ids:
+        page_query = Ticket.query.filter(Ticket.id.in_(ids)).order_by(*pagination.order_by(page['keys']))
+        items = ticket_serializer.serialize_tickets(page_query, fields)
+    return jsonify(pagination.page_response(items, page, next_cursor))
+
+def pending_tickets_query(sort_by):
+    """
+    Unscheduled pending tickets in the job board's sort order
+    
+    Returns:
+        (query, customer_joined) - the customer sort joins Customer itself
+    """
     pending_query = Ticket.query.filter(
         Ticket.scheduled_date.is_(None),
         Ticket.status == 'pending'
     )
     
     # Apply sorting
-    if sort_by == 'oldest':
-        pending_tickets = pending_query.order_by(Ticket.created_at.asc()).all()
-    elif sort_by == 'due_date':
-        pending_tickets = pending_query.order_by(Ticket.requested_service_date.asc().nullslast()).all()
+    if sort_by == 'due_date':
+        return pending_query.order_by(Ticket.requested_service_date.asc().nullslast()), False
     elif sort_by == 'priority':
         # Custom priority order: urgent, high, medium, low
         priority_order = db.case(
@@ -466,45 +554,20 @@ def get_job_board_data():
             (Ticket.priority == 'low', 4),
             else_=5
         )
-        pending_tickets = pending_query.order_by(priority_order).all()
+        return pending_query.order_by(priority_order), False
     elif sort_by == 'customer':
-        pending_tickets = pending_query.join(Customer).order_by(Customer.last_name, Customer.first_name).all()
-    else:
-        pending_tickets = pending_query.order_by(Ticket.created_at.asc()).all()
-    
-    # Get scheduled tickets for the target date, organized by truck
-    scheduled_tickets = Ticket.query.filter(
-        db.func.date(Ticket.scheduled_date) == target_date
-    ).all()
-    
-    # Organize scheduled tickets by truck
-    truck_schedules = {}
-    for truck in trucks:
-        truck_tickets = [t for t in scheduled_tickets if t.truck_id == truck.id]
-        print(f"🚛 Before sort - Truck {truck.id}: {[(t.id, t.route_position) for t in truck_tickets]}")
-        truck_tickets.sort(key=lambda x: x.route_position if x.route_position is not None else 999)  # Sort by route position
-        print(f"🚛 After sort - Truck {truck.id}: {[(t.id, t.route_position) for t in truck_tickets]}")
-        # Convert to dict with customer information
-        truck_tickets_with_customer = []
-        for ticket in truck_tickets:
-            ticket_dict = ticket.to_dict()
-            if ticket.customer:
-                ticket_dict['customer_name'] = f"{ticket.customer.first_name} {ticket.customer.last_name}"
-                ticket_dict['customer_address'] = f"{ticket.customer.street_address}, {ticket.customer.city}, {ticket.customer.state}"
-            else:
-                # Check if this is a dump stop
-                if ticket.service_type == 'Waste Disposal' or (ticket.job_id and ticket.job_id.startswith('DUMP-')):
-                    ticket_dict['customer_name'] = f"🗑️ {ticket.disposal_location or 'Dump Site'}"
-                    ticket_dict['customer_address'] = ticket.service_description or 'Tank dump location'
-                else:
-                    ticket_dict['customer_name'] = 'No customer'
-                    ticket_dict['customer_address'] = 'No address'
-            truck_tickets_with_customer.append(ticket_dict)
-        
-        truck_schedules[str(truck.id)] = truck_tickets_with_customer
-    
-    # Get team assignments for the target date
-    team_assignments = TruckTeamAssignment.query.filter_by(assignment_date=target_date).all()
+        return pending_query.join(Customer).order_by(Customer.last_name, Customer.first_name), True
+    return pending_query.order_by(Ticket.created_at.asc()), False
+
+def route_sort_key(ticket):
+    """Job board order within a truck column (unpositioned stops last)"""
+    return ticket['route_position'] if ticket['route_position'] is not None else 999
+
+def job_board_team_assignments(target_date):
+    """Crew assigned to each truck on a date, keyed by truck id"""
+    team_assignments = TruckTeamAssignment.query.options(
+        joinedload(TruckTeamAssignment.team_member)
+    ).filter_by(assignment_date=target_date).all()
     team_assignments_dict = {}
     for assignment in team_assignments:
         if assignment.team_member:  # Only include if there's actually a team member assigned
@@ -514,15 +577,227 @@ def get_job_board_data():
                 'position': assignment.team_member.position,
                 'home_address': f"{assignment.team_member.home_street_address}, {assignment.team_member.home_city}, {assignment.team_member.home_state}" if assignment.team_member.home_street_address else None
             }
+    return team_assignments_dict
+
+def build_job_board(target_date, sort_by, fields):
+    """Full job board payload for a date"""
+    # Get trucks (storage location and preferred dump site feed Truck.to_dict)
+    trucks = Truck.query.options(
+        joinedload(Truck.storage_location),
+        joinedload(Truck.preferred_dump_site)
+    ).filter_by(status='active').all()
     
-    return jsonify({
+    # Get pending tickets (only those not scheduled)
+    pending_query, customer_joined = pending_tickets_query(sort_by)
+    pending_tickets = ticket_serializer.serialize_tickets(pending_query, fields, customer_joined=customer_joined)
+    
+    # Get scheduled tickets for the target date (truck and position are needed for grouping)
+    scheduled_query = Ticket.query.filter(
+        Ticket.scheduled_on(target_date)
+    ).order_by(Ticket.id)
+    grouping_fields = [name for name in ('truck_id', 'route_position') if name not in fields]
+    scheduled_tickets = ticket_serializer.serialize_tickets(
+        scheduled_query, fields + grouping_fields, customer_fallback=board_stop_labels
+    )
+    
+    # Organize scheduled tickets by truck in one pass
+    tickets_by_truck = {truck.id: [] for truck in trucks}
+    for ticket in scheduled_tickets:
+        if ticket['truck_id'] in tickets_by_truck:
+            tickets_by_truck[ticket['truck_id']].append(ticket)
+    
+    truck_schedules = {}
+    for truck_id, truck_tickets in tickets_by_truck.items():
+        truck_tickets.sort(key=route_sort_key)  # Sort by route position
+        for ticket in truck_tickets:
+            for name in grouping_fields:
+                del ticket[name]
+        truck_schedules[str(truck_id)] = truck_tickets
+    
+    return {
         'date': target_date.isoformat(),
-        'pending_tickets': [ticket.to_dict() for ticket in pending_tickets],
+        'pending_tickets': pending_tickets,
         'truck_schedules': truck_schedules,
         'trucks': [t.to_dict() for t in trucks],
-        'team_assignments': team_assignments_dict,
+        'team_assignments': job_board_team_assignments(target_date),
         'sort_by': sort_by
-    })
+    }
+
+def build_job_board_delta(target_date, sort_by, fields, changes):
+    """
+    Job board changes for a client that already has an earlier version
+    
+    Changed tickets carry a board_column ('pending' or a truck id). Tickets
+    no longer on the board are listed in removed_ticket_ids. Columns that
+    changed come with their full ticket id order (pending_order,
+    schedule_order) so the client can re-sort without refetching.
+    """
+    target_key = target_date.isoformat()
+    active_truck_ids = {truck_id for (truck_id,) in Truck.query.filter_by(status='active').with_entities(Truck.id)}
+    
+    placement_fields = [name for name in ('truck_id', 'scheduled_date', 'status') if name not in fields]
+    changed = []
+    if changes['ticket_ids']:
+        changed = ticket_serializer.serialize_tickets(
+            Ticket.query.filter(Ticket.id.in_(changes['ticket_ids'])).order_by(Ticket.id),
+            ['id'] + [name for name in fields if name != 'id'] + placement_fields,
+            customer_fallback=board_stop_labels
+        )
+    
+    tickets = []
+    removed_ticket_ids = set(changes['ticket_ids'])
+    touched_trucks = set()
+    pending_changed = changes['pending']
+    for ticket in changed:
+        scheduled = ticket['scheduled_date']
+        if scheduled and scheduled[:10] == target_key and ticket['truck_id'] in active_truck_ids:
+            ticket['board_column'] = str(ticket['truck_id'])
+            touched_trucks.add(ticket['truck_id'])
+        elif scheduled is None and ticket['status'] == 'pending':
+            ticket['board_column'] = 'pending'
+            pending_changed = True
+        else:
+            continue
+        removed_ticket_ids.discard(ticket['id'])
+        for name in placement_fields:
+            del ticket[name]
+        if 'id' not in fields:
+            ticket['ticket_id'] = ticket.pop('id')
+        tickets.append(ticket)
+    
+    delta = {
+        'date': target_key,
+        'sort_by': sort_by,
+        'delta': True,
+        'tickets': tickets,
+        'removed_ticket_ids': sorted(removed_ticket_ids)
+    }
+    
+    if pending_changed:
+        pending_query, _ = pending_tickets_query(sort_by)
+        delta['pending_order'] = [ticket_id for (ticket_id,) in pending_query.with_entities(Ticket.id)]
+    
+    if touched_trucks:
+        stops = Ticket.query.filter(
+            Ticket.truck_id.in_(touched_trucks),
+            Ticket.scheduled_on(target_date)
+        ).order_by(Ticket.id).with_entities(Ticket.id, Ticket.truck_id, Ticket.route_position).all()
+        schedule_order = {str(truck_id): [] for truck_id in touched_trucks}
+        for stop in sorted(stops, key=lambda stop: route_sort_key({'route_position': stop.route_position})):
+            schedule_order[str(stop.truck_id)].append(stop.id)
+        delta['schedule_order'] = schedule_order
+    
+    if changes['team']:
+        delta['team_assignments'] = job_board_team_assignments(target_date)
+    
+    return delta
+
+@app.route('/api/job-board', methods=['GET'])
+def get_job_board_data():
+    """
+    Job board for a date
+    
+    Responses carry the board version as an ETag, so unchanged boards cost
+    a 304. With ?since=<version> only the tickets
+    added, changed or removed after that version are returned (or the full
+    board, flagged full=true, if the version is too old to diff against).
+    """
+    from datetime import datetime, date
+    
+    # Get date parameter (default to today)
+    date_str = request.args.get('date', date.today().isoformat())
+    try:
+        target_date = datetime.fromisoformat(date_str).date()
+    except ValueError:
+        target_date = date.today()
+    
+    # Get sort parameter for pending tickets
+    sort_by = request.args.get('sort', 'oldest')
+    
+    try:
+        fields = requested_ticket_fields()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    since = request.args.get('since', type=int)
+    
+    # Read the version before the data so a concurrent write is never hidden
+    version, last_changed = board_versions.board_version(target_date)
+    etag = board_versions.board_etag(target_date, version, request.args)
+    last_modified = board_versions.last_modified_for(last_changed)
+    
+    if board_versions.is_not_modified(request, etag):
+        response = app.response_class(status=304)
+    else:
+        changes = board_versions.changes_since(target_date, since, version) if since is not None else None
+        if changes is not None:
+            payload = build_job_board_delta(target_date, sort_by, fields, changes)
+            payload['since'] = since
+        else:
+            payload = build_job_board(target_date, sort_by, fields)
+            if since is not None:
+                payload['full'] = True
+        payload['version'] = version
+        response = jsonify(payload)
+    
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Board-Version'] = str(version)
+    return response
+
+@app.route('/api/job-board/stream', methods=['GET'])
+def stream_job_board():
+    """
+    Server-Sent Events stream of changes to a date's job board
+    
+    Events carry the board version; clients refetch with ?since= when an
+    event is newer than the board they hold. The stream itself never touches
+    the database after the hello event, however many viewers are connected.
+    Each stream holds a worker thread, so a worker serves at most
+    BOARD_STREAM_MAX_SUBSCRIBERS of them and answers 503 beyond that.
+    """
+    from datetime import datetime, date
+    
+    date_str = request.args.get('date', date.today().isoformat())
+    try:
+        target_date = datetime.fromisoformat(date_str).date()
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+    
+    subscription = board_events.subscribe(target_date.isoformat())
+    if subscription is None:
+        # Every stream holds a worker thread; past the cap viewers poll instead
+        response = jsonify({'error': 'Too many board viewers; poll /api/job-board instead'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(board_events.STREAM_MAX_SECONDS)
+        return response
+    try:
+        version, _ = board_versions.board_version(target_date)
+    except Exception:
+        board_events.broker.unsubscribe(subscription)
+        raise
+    
+    # Hand the connection back to the pool for the life of the stream
+    db.session.remove()
+    
+    hello = {'date': target_date.isoformat(), 'version': version}
+    return app.response_class(
+        board_events.stream(subscription, hello),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def publish_board_event(event_type, *days, pending=False, **data):
+    """Tell job board viewers about a committed change (never fails the request)"""
+    try:
+        dates = [board_events.ALL_DATES] if pending else []
+        for day in days:
+            if day is not None:
+                dates.append(day.date().isoformat() if isinstance(day, datetime) else day.isoformat())
+        board_events.publish(event_type, dates, version=board_versions.latest_version(), **data)
+    except Exception as e:
+        print(f"Board event error: {e}")
 
 @app.route('/api/tickets', methods=['POST'])
 def create_ticket_api():
@@ -751,28 +1026,16 @@ def reorder_tickets():
         
         print(f"Column reorder: ticket {ticket_id} from {old_status}:{old_position} to {new_status}:{new_position}")
         
-        # Get all tickets in the target status/column, ordered by column_position
-        all_column_tickets = Ticket.query.filter(
-            Ticket.status == new_status
-        ).order_by(Ticket.column_position).all()
-        
-        # Remove the ticket from its current position
-        tickets_without_moved = [t for t in all_column_tickets if t.id != ticket_id]
-        
-        # Create the final ordered list by inserting the moved ticket at the new position
-        final_positions = tickets_without_moved.copy()
-        final_positions.insert(new_position, ticket)
-        
-        # Update the ticket's status
+        # Key between the new neighbours: only the moved ticket is written
+        scope = positions.column_scope(new_status)
+        ticket.column_position, tight = positions.position_for_index(scope, new_position, exclude_id=ticket_id)
         ticket.status = new_status
         
-        # Assign sequential column_position values (0, 1, 2, etc.)
-        for i, t in enumerate(final_positions):
-            t.column_position = i
-            
         print(f"Column reorder complete: ticket {ticket_id} now at {new_status}:{ticket.column_position}")
         
         db.session.commit()
+        if tight:
+            positions.schedule_rebalance(app, scope)
         return jsonify({'success': True, 'ticket': ticket.to_dict()})
         
     except Exception as e:
@@ -797,34 +1060,19 @@ def reorder_route():
         
         ticket = Ticket.query.get_or_404(ticket_id)
         
-        # Get all tickets for this truck on this date (including the one being moved)
+        # Key between the stops either side of the drop: only the moved ticket is written
         target_date = datetime.fromisoformat(scheduled_date.replace('Z', '+00:00')).date()
-        all_truck_tickets = Ticket.query.filter(
-            Ticket.truck_id == truck_id,
-            db.func.date(Ticket.scheduled_date) == target_date
-        ).order_by(Ticket.route_position).all()
-        
-        # Get the old position of the ticket being moved
+        scope = positions.route_scope(truck_id, target_date)
         old_position = ticket.route_position
-        print(f"Old position: {old_position}, New position: {new_position}")
+        ticket.route_position, tight = positions.position_for_index(scope, new_position, exclude_id=ticket_id)
         
-        # Remove the ticket from its current position and reorder
-        tickets_without_moved = [t for t in all_truck_tickets if t.id != ticket_id]
-        print(f"Total tickets: {len(all_truck_tickets)}, Without moved: {len(tickets_without_moved)}")
-        
-        # Create the final ordered list by inserting the moved ticket at the new position
-        final_positions = tickets_without_moved.copy()
-        final_positions.insert(new_position, ticket)
-        
-        # Assign sequential route_position values (0, 1, 2, etc.)
-        for i, t in enumerate(final_positions):
-            t.route_position = i
-            print(f"Setting ticket {t.id} to route_position {i}")
-            
-        print(f"Moved ticket {ticket.id} from position {old_position} to position {new_position}")
-        print(f"Final positions: {[(t.id, t.route_position) for t in final_positions]}")
+        print(f"Moved ticket {ticket.id} from route_position {old_position} to {ticket.route_position} (index {new_position})")
         
         db.session.commit()
+        if tight:
+            positions.schedule_rebalance(app, scope)
+        publish_board_event('route_reordered', target_date, truck_id=ticket.truck_id, ticket_id=ticket.id,
+                            route_position=ticket.route_position)
         return jsonify({'success': True, 'ticket': ticket.to_dict()})
         
     except Exception as e:
@@ -843,6 +1091,7 @@ def assign_ticket():
         route_position = data.get('route_position', 0)
         
         ticket = Ticket.query.get_or_404(ticket_id)
+        previous_truck_id, previous_date, previous_status = ticket.truck_id, ticket.scheduled_date, ticket.status
         
         # Update truck assignment
         if truck_id:
@@ -861,10 +1110,21 @@ def assign_ticket():
             ticket.scheduled_date = None
             ticket.status = 'pending'
             
-        # Update route position
-        ticket.route_position = route_position
+        # Update route position: the drop index becomes a key between the new neighbours
+        scope = None
+        if ticket.truck_id and ticket.scheduled_date:
+            scope = positions.route_scope(ticket.truck_id, ticket.scheduled_date.date())
+            ticket.route_position, tight = positions.position_for_index(scope, route_position, exclude_id=ticket.id)
+        else:
+            ticket.route_position = None
         
         db.session.commit()
+        if scope and tight:
+            positions.schedule_rebalance(app, scope)
+        publish_board_event('ticket_assigned', previous_date, ticket.scheduled_date,
+                            pending='pending' in (previous_status, ticket.status),
+                            ticket_id=ticket.id, truck_id=ticket.truck_id, previous_truck_id=previous_truck_id,
+                            status=ticket.status)
         return jsonify({'success': True, 'ticket': ticket.to_dict()})
         
     except Exception as e:
@@ -877,35 +1137,20 @@ def geocode_customer_address(customer_id):
     try:
         customer = Customer.query.get_or_404(customer_id)
         
-        # Build full address
-        address_parts = []
-        if customer.street_address:
-            address_parts.append(customer.street_address)
-        if customer.city:
-            address_parts.append(customer.city)
-        if customer.state:
-            address_parts.append(customer.state)
-        if customer.zip_code:
-            address_parts.append(customer.zip_code)
-        
-        if not address_parts:
+        # Build full address (the string routing uses, so they share the cache entry)
+        full_address = geocoding.record_address(customer)
+        if not full_address:
             return jsonify({'error': 'No address information available'}), 400
         
-        full_address = ', '.join(address_parts)
-        
-        # Try geocoding using the available geocoding function
-        coords = None
-        if OPENROUTE_API_KEY:
-            coords = geocode_address(full_address)
-        
-        # If OpenRoute fails or isn't available, try Nominatim
-        if not coords:
-            coords = geocode_address_nominatim(full_address)
+        # Geocode through the shared cache (OpenRouteService, then Nominatim)
+        coords = geocode_address(full_address)
         
-        if coords and coords.get('latitude') and coords.get('longitude'):
+        if coords:
             # Store coordinates in "latitude,longitude" format
             gps_string = f"{coords['latitude']},{coords['longitude']}"
             customer.gps_coordinates = gps_string
+            customer.latitude = coords['latitude']
+            customer.longitude = coords['longitude']
             customer.updated_at = datetime.utcnow()
             
             db.session.commit()
@@ -924,42 +1169,41 @@ def geocode_customer_address(customer_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-def geocode_address_nominatim(address):
-    """Geocode address using Nominatim (OpenStreetMap) - free service"""
+# Customer Management APIs
+@app.route('/api/customers', methods=['GET'])
+def get_customers():
+    """
+    Customers a page at a time (?sort=name|newest, ?limit=, ?cursor=)
+    
+    ?include=septic_systems,latest_ticket adds each customer's systems and
+    the creation time of their latest ticket, with one query each per page.
+    """
     try:
-        import requests
-        
-        # OpenStreetMap Nominatim API - free, no key required
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            'q': address,
-            'format': 'json',
-            'addressdetails': 1,
-            'limit': 1,
-            'countrycodes': 'us'  # Limit to US addresses
-        }
-        
-        headers = {
-            'User-Agent': 'TrueTank-Septic-Service/1.0'  # Required by Nominatim
-        }
-        
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        if data and len(data) > 0:
-            result = data[0]
-            return {
-                'latitude': float(result['lat']),
-                'longitude': float(result['lon'])
-            }
-        
-        return None
-    except Exception as e:
-        print(f"Nominatim geocoding error: {e}")
-        return None
+        page = pagination.parse_page_args(request.args, CUSTOMER_SORTS, 'name')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    include = set(filter(None, request.args.get('include', '').split(',')))
+    
+    customers, next_cursor = pagination.page_of_models(Customer.query, Customer, page)
+    items = [customer.to_dict() for customer in customers]
+    ids = [customer.id for customer in customers]
+    
+    if ids and 'septic_systems' in include:
+        systems = {customer_id: [] for customer_id in ids}
+        for system in SepticSystem.query.filter(SepticSystem.customer_id.in_(ids)).order_by(SepticSystem.id):
+            systems[system.customer_id].append(septic_system_summary(system))
+        for item in items:
+            item['septic_systems'] = systems[item['id']]
+    
+    if ids and 'latest_ticket' in include:
+        latest = dict(db.session.query(Ticket.customer_id, db.func.max(Ticket.created_at)).filter(
+            Ticket.customer_id.in_(ids)
+        ).group_by(Ticket.customer_id).all())
+        for item in items:
+            item['latest_ticket_at'] = latest[item['id']].isoformat() if latest.get(item['id']) else None
+    
+    return jsonify(pagination.page_response(items, page, next_cursor))
 
-# Customer Management APIs
 @app.route('/api/customers', methods=['POST'])
 def create_customer_api():
     try:
@@ -1122,15 +1366,9 @@ def delete_customer_api(customer_id):
         return jsonify({'error': str(e)}), 500
 
 # Septic System Management APIs
-@app.route('/api/septic-systems', methods=['GET'])
-def get_septic_systems():
-    customer_id = request.args.get('customer_id')
-    if customer_id:
-        systems = SepticSystem.query.filter_by(customer_id=customer_id).all()
-    else:
-        systems = SepticSystem.query.all()
-    
-    return jsonify([{
+def septic_system_summary(system):
+    """Septic system fields shown in lists"""
+    return {
         'id': system.id,
         'customer_id': system.customer_id,
         'system_type': system.system_type,
@@ -1138,8 +1376,29 @@ def get_septic_systems():
         'tank_material': system.tank_material,
         'num_compartments': system.num_compartments,
         'system_condition': system.system_condition,
-        'access_notes': system.access_notes
-    } for system in systems])
+        'access_notes': system.access_notes,
+        'last_pumped': system.last_pumped.isoformat() if system.last_pumped else None,
+        'next_pump_due': system.next_pump_due.isoformat() if system.next_pump_due else None
+    }
+
+@app.route('/api/septic-systems', methods=['GET'])
+def get_septic_systems():
+    """Septic systems (?customer_id=); a page at a time with ?limit= / ?cursor=, otherwise the whole list"""
+    query = SepticSystem.query
+    customer_id = request.args.get('customer_id')
+    if customer_id:
+        query = query.filter_by(customer_id=customer_id)
+    
+    if not pagination.wants_page(request.args):
+        return jsonify([septic_system_summary(system) for system in query.order_by(SepticSystem.id)])
+    
+    try:
+        page = pagination.parse_page_args(request.args, SEPTIC_SYSTEM_SORTS, 'id')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    systems, next_cursor = pagination.page_of_models(query, SepticSystem, page)
+    return jsonify(pagination.page_response([septic_system_summary(system) for system in systems], page, next_cursor))
 
 @app.route('/api/septic-systems', methods=['POST'])
 def create_septic_system_api():
@@ -1325,18 +1584,9 @@ def delete_septic_system_api(system_id):
 def delete_ticket_api(ticket_id):
     try:
         ticket = Ticket.query.get_or_404(ticket_id)
-        old_status = ticket.status
-        old_position = ticket.column_position
         
-        # Delete the ticket
+        # Positions are gap keys, so the rest of the column keeps its order
         db.session.delete(ticket)
-        
-        # Adjust positions of remaining tickets in the same column
-        Ticket.query.filter(
-            Ticket.status == old_status,
-            Ticket.column_position > old_position
-        ).update({Ticket.column_position: Ticket.column_position - 1})
-        
         db.session.commit()
         
         return jsonify({'success': True, 'message': 'Ticket deleted successfully'})
@@ -1348,6 +1598,8 @@ def delete_ticket_api(ticket_id):
 # Fleet Management APIs
 @app.route('/api/trucks', methods=['GET'])
 def get_trucks():
+    if pagination.wants_page(request.args):
+        return reference_list_page(Truck.query, Truck, lambda truck: truck.to_dict())
     trucks = Truck.query.all()
     return jsonify([truck.to_dict() for truck in trucks])
 
@@ -1692,7 +1944,7 @@ def add_dump_stops():
         # First, get all existing tickets for this truck on this date to preserve their IDs
         existing_tickets = Ticket.query.filter(
             Ticket.truck_id == truck_id,
-            db.func.date(Ticket.scheduled_date) == target_date
+            Ticket.scheduled_on(target_date)
         ).order_by(Ticket.route_position).all()
         
         # Remove any existing dump stops to avoid duplicates
@@ -1727,7 +1979,7 @@ def add_dump_stops():
                         scheduled_date=datetime.combine(target_date, datetime.min.time().replace(hour=8)) + timedelta(hours=route_position),
                         estimated_duration=item.get('estimated_duration', 15),
                         truck_id=truck_id,
-                        route_position=route_position,
+                        route_position=route_position * positions.POSITION_GAP,
                         estimated_gallons=-item.get('gallons_to_dump', 0),  # Negative for dump
                         disposal_location=dump_site['name'],
                         office_notes=f"Auto-generated dump stop at {dump_site['name']}. Cost: ${dump_site.get('cost_per_gallon', 0):.2f}/gallon"
@@ -1741,12 +1993,13 @@ def add_dump_stops():
                 job_id = item.get('id')
                 if job_id and job_id in existing_job_map:
                     existing_ticket = existing_job_map[job_id]
-                    existing_ticket.route_position = route_position
+                    existing_ticket.route_position = route_position * positions.POSITION_GAP
                     existing_ticket.updated_at = datetime.utcnow()
             
             route_position += 1
         
         db.session.commit()
+        publish_board_event('dump_stops_added', target_date, truck_id=truck.id, dump_stops_added=dump_tickets_created)
         
         return jsonify({
             'success': True,
@@ -1772,34 +2025,25 @@ def get_truck_jobs(truck_id):
         except ValueError:
             return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
         
+        try:
+            fields = requested_ticket_fields()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         # Get the truck
         truck = Truck.query.get_or_404(truck_id)
         
         # Get scheduled tickets for this truck on the target date
-        tickets = Ticket.query.filter(
+        query = Ticket.query.filter(
             Ticket.truck_id == truck_id,
-            db.func.date(Ticket.scheduled_date) == target_date
-        ).order_by(Ticket.route_position).all()
+            Ticket.scheduled_on(target_date)
+        ).order_by(Ticket.route_position)
         
-        # Convert to dict with customer information
-        truck_jobs = []
-        for ticket in tickets:
-            ticket_dict = ticket.to_dict()
-            if ticket.customer:
-                ticket_dict['customer_name'] = f"{ticket.customer.first_name} {ticket.customer.last_name}"
-                ticket_dict['customer_address'] = f"{ticket.customer.street_address}, {ticket.customer.city}, {ticket.customer.state}" if ticket.customer.street_address else None
-                ticket_dict['customer_gps_coordinates'] = ticket.customer.gps_coordinates
-            else:
-                # Check if this is a dump stop
-                if ticket.service_type == 'Waste Disposal' or (ticket.job_id and ticket.job_id.startswith('DUMP-')):
-                    ticket_dict['customer_name'] = f"🗑️ {ticket.disposal_location or 'Dump Site'}"
-                    ticket_dict['customer_address'] = ticket.service_description or 'Tank dump location'
-                    ticket_dict['customer_gps_coordinates'] = None  # Dump sites don't have customer GPS
-                else:
-                    ticket_dict['customer_name'] = ticket.job_id  # Fallback to job ID for other tickets
-                    ticket_dict['customer_address'] = None
-                    ticket_dict['customer_gps_coordinates'] = None
-            truck_jobs.append(ticket_dict)
+        # Stops without a customer are labelled with their dump site or job ID
+        truck_jobs = ticket_serializer.serialize_tickets(
+            query, fields,
+            customer_fallback=lambda stop: dump_stop_labels(stop) or {'customer_name': stop['job_id']}
+        )
         
         return jsonify(truck_jobs)
         
@@ -1807,6 +2051,7 @@ def get_truck_jobs(truck_id):
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/update-estimated-gallons', methods=['POST'])
+@jobs.background()
 def update_estimated_gallons():
     """Update estimated gallons for all existing tickets based on service type and tank size"""
     try:
@@ -1815,7 +2060,9 @@ def update_estimated_gallons():
         
         print(f"Found {len(tickets)} tickets without estimated gallons")
         
-        for ticket in tickets:
+        for i, ticket in enumerate(tickets):
+            if i % 500 == 0:
+                jobs.report_progress(i, len(tickets))
             estimated_gallons = calculate_estimated_gallons_for_ticket(ticket)
             if estimated_gallons:
                 ticket.estimated_gallons = estimated_gallons
@@ -1867,19 +2114,24 @@ def calculate_estimated_gallons_for_ticket(ticket):
 # Location Management APIs
 @app.route('/api/locations', methods=['GET'])
 def get_locations():
-    locations = Location.query.filter_by(is_active=True).all()
-    return jsonify([{
-        'id': loc.id,
-        'name': loc.name,
-        'location_type': loc.location_type,
-        'street_address': loc.street_address,
-        'city': loc.city,
-        'state': loc.state,
-        'zip_code': loc.zip_code,
-        'gps_coordinates': loc.gps_coordinates,
-        'contact_person': loc.contact_person,
-        'phone_number': loc.phone_number
-    } for loc in locations])
+    def location_summary(loc):
+        return {
+            'id': loc.id,
+            'name': loc.name,
+            'location_type': loc.location_type,
+            'street_address': loc.street_address,
+            'city': loc.city,
+            'state': loc.state,
+            'zip_code': loc.zip_code,
+            'gps_coordinates': loc.gps_coordinates,
+            'contact_person': loc.contact_person,
+            'phone_number': loc.phone_number
+        }
+    
+    query = Location.query.filter_by(is_active=True)
+    if pagination.wants_page(request.args):
+        return reference_list_page(query, Location, location_summary)
+    return jsonify([location_summary(loc) for loc in query.all()])
 
 @app.route('/api/locations', methods=['POST'])
 def create_location_api():
@@ -1927,6 +2179,8 @@ def create_location_api():
 # Team Management APIs
 @app.route('/api/team-members', methods=['GET'])
 def get_team_members():
+    if pagination.wants_page(request.args):
+        return reference_list_page(TeamMember.query, TeamMember, lambda member: member.to_dict())
     members = TeamMember.query.all()
     return jsonify([member.to_dict() for member in members])
 
@@ -2043,11 +2297,16 @@ def init_database_endpoint():
     """Initialize database tables via web endpoint"""
     try:
         db.create_all()
+        spatial.ensure_spatial_columns()
+        db_indexes.ensure_indexes()
+        search.ensure_search_index()
+        ticket_counters.reconcile_counters()
         return jsonify({'success': True, 'message': 'Database tables created successfully'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/admin/import-sample-data', methods=['POST'])
+@jobs.background(max_attempts=1)  # a retry after a partial commit would duplicate rows
 def import_sample_data_endpoint():
     """Import sample data via web endpoint"""
     try:
@@ -2517,13 +2776,13 @@ def property_lookup():
         if not address:
             return jsonify({'error': 'Address is required'}), 400
         
-        # Step 1: Geocode the address using free service
+        # Step 1: Geocode the address (cached)
         geocode_data = geocode_address(address)
         if not geocode_data:
             return jsonify({'error': 'Could not geocode address'}), 400
         
         # Step 2: Get census data for the area
-        census_data = get_census_data(geocode_data['lat'], geocode_data['lng'])
+        census_data = get_census_data(geocode_data['latitude'], geocode_data['longitude'])
         
         # Step 3: Estimate property details using geocoding + census data
         property_data = estimate_property_from_location(address, geocode_data, census_data)
@@ -2533,42 +2792,9 @@ def property_lookup():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def geocode_address(address):
-    """Geocode address using Nominatim (OpenStreetMap) - free service"""
-    try:
-        import requests
-        import urllib.parse
-        
-        # Nominatim is free and doesn't require API key
-        encoded_address = urllib.parse.quote(address)
-        url = f"https://nominatim.openstreetmap.org/search?format=json&q={encoded_address}&countrycodes=us&limit=1"
-        
-        headers = {
-            'User-Agent': 'TrueTank-SepticService/1.0'
-        }
-        
-        response = requests.get(url, headers=headers, timeout=10)
-        if response.status_code == 200:
-            results = response.json()
-            if results:
-                result = results[0]
-                return {
-                    'lat': float(result['lat']),
-                    'lng': float(result['lon']),
-                    'display_name': result['display_name'],
-                    'address_type': result.get('type', 'unknown')
-                }
-        return None
-        
-    except Exception as e:
-        print(f"Geocoding error: {e}")
-        return None
-
 def get_census_data(lat, lng):
     """Get census data for coordinates using free Census API"""
     try:
-        import requests
-        
         # US Census Geocoding API - free, no key required
         url = f"https://geocoding.geo.census.gov/geocoder/geographies/coordinates"
         params = {
@@ -2579,7 +2805,7 @@ def get_census_data(lat, lng):
             'format': 'json'
         }
         
-        response = requests.get(url, params=params, timeout=10)
+        response = http_client.get('census', url, params=params)
         if response.status_code == 200:
             data = response.json()
             if 'result' in data and 'geographies' in data['result']:
@@ -2618,7 +2844,7 @@ def estimate_property_from_location(address, geocode_data, census_data):
     
     # Estimate based on location characteristics
     # Urban vs Rural estimation
-    display_name = geocode_data.get('display_name', '').lower()
+    display_name = (geocode_data.get('display_name') or '').lower()
     is_urban = any(word in display_name for word in ['city', 'urban', 'downtown', 'metro'])
     is_rural = any(word in display_name for word in ['rural', 'county', 'township', 'farm'])
     
@@ -2691,8 +2917,8 @@ def estimate_property_from_location(address, geocode_data, census_data):
         'property_type': property_type,
         'soil_type': soil_type,
         'water_table': water_table,
-        'lat': geocode_data['lat'],
-        'lng': geocode_data['lng'],
+        'lat': geocode_data['latitude'],
+        'lng': geocode_data['longitude'],
         'city': census_data.get('city', 'Unknown'),
         'county': census_data.get('county', 'Unknown'),
         'state': census_data.get('state', 'Unknown'),
@@ -2861,6 +3087,8 @@ def save_team_assignment():
                 db.session.add(assignment)
         
         db.session.commit()
+        publish_board_event('team_assignment_changed', assignment_date, truck_id=int(truck_id),
+                            team_member_id=team_member_id)
         return jsonify({'success': True})
         
     except Exception as e:
@@ -2875,22 +3103,26 @@ def save_team_assignment():
 def get_job_board_tickets():
     """Get all tickets organized by status for the kanban board"""
     try:
+        fields = requested_ticket_fields()
+        
         # Define the status columns we want to show
         statuses = ['pending', 'assigned', 'in-progress', 'completed']
         
-        result = {}
+        # One query for all columns, ordered by column_position within each status
+        query = Ticket.query.filter(
+            Ticket.status.in_(statuses)
+        ).order_by(Ticket.status, Ticket.column_position.asc().nullslast(), Ticket.id)
+        grouping_fields = [] if 'status' in fields else ['status']
         
-        for status in statuses:
-            # Get tickets for this status, ordered by column_position
-            tickets = Ticket.query.filter(
-                Ticket.status == status
-            ).order_by(Ticket.column_position.asc().nullslast()).all()
-            
-            # Convert to dict format
-            result[status] = [ticket.to_dict() for ticket in tickets]
+        result = {status: [] for status in statuses}
+        for ticket in ticket_serializer.serialize_tickets(query, fields + grouping_fields):
+            status = ticket.pop('status') if grouping_fields else ticket['status']
+            result[status].append(ticket)
         
         return jsonify(result)
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -2908,29 +3140,22 @@ def move_job_board_ticket():
         
         # Get the ticket being moved
         ticket = Ticket.query.get_or_404(ticket_id)
+        previous_status = ticket.status
         
-        # Get all tickets in the target status, ordered by column_position
-        all_status_tickets = Ticket.query.filter(
-            Ticket.status == new_status
-        ).order_by(Ticket.column_position.asc().nullslast()).all()
-        
-        # Remove the moved ticket from the list (if it was already in this status)
-        tickets_without_moved = [t for t in all_status_tickets if t.id != ticket_id]
-        
-        # Create the final ordered list by inserting the moved ticket at the new position
-        final_positions = tickets_without_moved.copy()
-        final_positions.insert(new_position, ticket)
-        
-        # Update the ticket's status
+        # Key between the new neighbours: only the moved ticket is written
+        scope = positions.column_scope(new_status)
+        ticket.column_position, tight = positions.position_for_index(scope, new_position, exclude_id=ticket_id)
         ticket.status = new_status
         
-        # Assign sequential column_position values (0, 1, 2, etc.)
-        for i, t in enumerate(final_positions):
-            t.column_position = i
-            
         print(f"Job Board Move Complete: ticket {ticket_id} now at {new_status}:{ticket.column_position}")
         
         db.session.commit()
+        if tight:
+            positions.schedule_rebalance(app, scope)
+        publish_board_event('ticket_moved', ticket.scheduled_date,
+                            pending='pending' in (previous_status, new_status),
+                            ticket_id=ticket.id, status=new_status, previous_status=previous_status,
+                            column_position=ticket.column_position)
         return jsonify({'success': True, 'ticket': ticket.to_dict()})
         
     except Exception as e:
@@ -2938,6 +3163,60 @@ def move_job_board_ticket():
         print(f"Error in move_job_board_ticket: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/job-board/batch', methods=['POST'])
+def batch_job_board_changes():
+    """
+    Apply an ordered list of board operations in one transaction
+    
+    The whole batch is validated first; if any operation is invalid nothing
+    is applied and the errors are returned by operation index. See
+    board_operations for the operation format. Returns the affected tickets
+    (?fields= / ?profile= as for /api/job-board), crew assignments for the
+    dates whose crews changed, and the board version after the commit
+    (for the board date given as "date", if any).
+    """
+    try:
+        fields = requested_ticket_fields()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    data = request.get_json(silent=True) or {}
+    board_date = None
+    if data.get('date'):
+        try:
+            board_date = datetime.fromisoformat(data['date']).date()
+        except ValueError:
+            return jsonify({'error': 'Invalid date format'}), 400
+    
+    try:
+        operations, errors = board_operations.validate_operations(data.get('operations'))
+        if errors:
+            return jsonify({'error': 'Invalid operations', 'errors': errors}), 400
+        
+        changes = board_operations.apply_operations(operations)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    
+    for scope in changes['tight_scopes']:
+        positions.schedule_rebalance(app, scope)
+    publish_board_event('board_batch', *changes['dates'], pending=changes['pending'],
+                        ticket_ids=changes['ticket_ids'], operations=len(operations))
+    
+    query = Ticket.query.filter(Ticket.id.in_(changes['ticket_ids'])).order_by(Ticket.id)
+    tickets = ticket_serializer.serialize_tickets(query, fields) if changes['ticket_ids'] else []
+    team_dates = sorted({assignment_date for _, assignment_date in changes['team']})
+    version = board_versions.board_version(board_date)[0] if board_date else board_versions.latest_version()
+    
+    return jsonify({
+        'success': True,
+        'tickets': tickets,
+        'team_assignments': {day.isoformat(): job_board_team_assignments(day) for day in team_dates},
+        'dates': sorted(day.isoformat() for day in changes['dates']),
+        'version': version
+    })
+
 @app.route('/api/job-board/create', methods=['POST'])
 def create_job_board_ticket():
     """Create a new ticket for the job board"""
@@ -2954,20 +3233,17 @@ def create_job_board_ticket():
         
         job_id = f"TT{str(next_num).zfill(8)}"
         
-        # Create new ticket
+        # Create new ticket at the top of the pending column (no other rows move)
+        customer_name = data.get('customer_name', '[New Customer]')
+        column_position, _ = positions.position_for_index(positions.column_scope('pending'), 0)
         ticket = Ticket(
             job_id=job_id,
-            customer_name=data.get('customer_name', '[New Customer]'),
             service_type=data.get('service_type', 'Septic Service'),
             status='pending',
             priority=data.get('priority', 'medium'),
             service_description=data.get('description', 'New septic service job'),
-            column_position=0  # Always add at top of pending column
-        )
-        
-        # Shift other pending tickets down
-        Ticket.query.filter(Ticket.status == 'pending').update(
-            {Ticket.column_position: Ticket.column_position + 1}
+            office_notes=f"Customer: {customer_name}",
+            column_position=column_position
         )
         
         db.session.add(ticket)
@@ -2985,19 +3261,9 @@ def delete_job_board_ticket(ticket_id):
     """Delete a ticket from the job board"""
     try:
         ticket = Ticket.query.get_or_404(ticket_id)
-        old_status = ticket.status
-        old_position = ticket.column_position
         
-        # Delete the ticket
+        # Positions are gap keys, so the rest of the column keeps its order
         db.session.delete(ticket)
-        
-        # Shift remaining tickets in the same status up to fill the gap
-        if old_position is not None:
-            Ticket.query.filter(
-                Ticket.status == old_status,
-                Ticket.column_position > old_position
-            ).update({Ticket.column_position: Ticket.column_position - 1})
-        
         db.session.commit()
         return jsonify({'success': True})
         
@@ -3041,81 +3307,338 @@ def calculate_drive_time_api():
         print(f"Drive time API error: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/route-optimization/<int:truck_id>/<date>', methods=['GET'])
+@app.route('/api/nearby', methods=['GET'])
+def nearby():
+    """
+    Nearest-K, radius or bounding-box lookup over the spatial index
+    
+    Query params:
+        type: customer, septic_system, location or dump_site
+        lat/lng or address: reference point (not needed for bbox)
+        k: number of results (default 5, max 100)
+        radius_miles: return everything within this radius instead of k nearest
+        bbox: south,west,north,east
+        waste: septic or grease (dump sites accepting that waste only)
+        include_inactive: include inactive dump sites/locations
+    """
+    try:
+        kind = request.args.get('type', 'customer')
+        if kind not in spatial.MODELS:
+            return jsonify({'error': f"type must be one of {', '.join(spatial.MODELS)}"}), 400
+        
+        filters = []
+        if kind in ('dump_site', 'location') and request.args.get('include_inactive') != 'true':
+            filters.append(lambda payload: payload.get('is_active', True) is not False)
+        waste = request.args.get('waste')
+        if kind == 'dump_site' and waste in ('septic', 'grease'):
+            filters.append(lambda payload: bool(payload.get(f'accepts_{waste}_waste')))
+        where = (lambda payload: all(check(payload) for check in filters)) if filters else None
+        
+        bbox = request.args.get('bbox')
+        if bbox:
+            south, west, north, east = (float(value) for value in bbox.split(','))
+            results = spatial.within_bbox(kind, south, west, north, east, where=where)
+            return jsonify({'success': True, 'type': kind, 'count': len(results), 'results': results})
+        
+        lat = request.args.get('lat', type=float)
+        lng = request.args.get('lng', type=float)
+        if (lat is None or lng is None) and request.args.get('address'):
+            coords = geocode_address(request.args['address'])
+            if coords:
+                lat, lng = coords['latitude'], coords['longitude']
+        if lat is None or lng is None:
+            return jsonify({'error': 'lat and lng (or a geocodable address, or bbox) are required'}), 400
+        
+        k = max(1, min(request.args.get('k', 5, type=int), 100))
+        radius = request.args.get('radius_miles', type=float)
+        if radius is not None:
+            results = spatial.within_radius(kind, lat, lng, radius, where=where, limit=k if 'k' in request.args else None)
+        else:
+            results = spatial.nearest(kind, lat, lng, k, where=where)
+        
+        return jsonify({
+            'success': True,
+            'type': kind,
+            'origin': {'latitude': lat, 'longitude': lng},
+            'count': len(results),
+            'results': results
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/search', methods=['GET'])
+def search_records():
+    """
+    Ranked typeahead search over customers, tickets and septic permit numbers
+    
+    Query params:
+        q: search text; every word matches the start of a word (min 2 characters)
+        types: comma-separated customer, ticket, septic_system (default all)
+        limit: number of results (default 10, max 50)
+    """
+    try:
+        kinds = [kind for kind in request.args.get('types', '').split(',') if kind]
+        results = search.search(request.args.get('q', ''), kinds,
+                                request.args.get('limit', search.DEFAULT_LIMIT, type=int))
+        return jsonify({'query': request.args.get('q', ''), 'count': len(results), 'results': results})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stats', methods=['GET'])
+def ticket_stats():
+    """
+    Ticket counts from the materialized counters (no scan of the tickets table)
+    
+    Query params:
+        date: day for per-truck counts (YYYY-MM-DD, default today)
+        start/end: range for per-date counts (default the 7 days from date)
+    """
+    def day_arg(name, default):
+        value = request.args.get(name)
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else default
+    
+    try:
+        day = day_arg('date', datetime.now().date())
+        start = day_arg('start', day)
+        end = day_arg('end', start + timedelta(days=6))
+        ticket_counters.maybe_reconcile()
+        return jsonify(ticket_counters.stats(day, start, end))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/route-cache/stats', methods=['GET'])
+def route_cache_stats():
+    """Report route leg cache hit/miss counters for this worker"""
+    return jsonify(routing.get_cache_stats())
+
+@app.route('/api/http-client/stats', methods=['GET'])
+def http_client_stats():
+    """Report outbound call counters, latency and circuit state per provider for this worker"""
+    return jsonify(http_client.get_stats())
+
+@app.route('/api/single-flight/stats', methods=['GET'])
+def single_flight_stats():
+    """Report how many provider calls this worker led, shared or waited on"""
+    return jsonify(singleflight.get_single_flight_stats())
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status, progress and (once finished) result or error of a background job"""
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/geocode-backfill', methods=['POST'])
+def start_geocode_backfill():
+    """Queue a geocoding backfill run (options as for `python geocode_backfill.py`)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        job = jobs.enqueue('geocode_backfill', {
+            'kinds': data.get('kinds'),
+            'limit': data.get('limit'),
+            'retry_failed': bool(data.get('retry_failed'))
+        }, idempotency_key=jobs.request_idempotency_key('geocode_backfill', data))
+        return jobs.accepted(job)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/geocode-backfill/status', methods=['GET'])
+def geocode_backfill_status():
+    """Report bulk geocoding progress (run it with `python geocode_backfill.py`)"""
+    try:
+        return jsonify({
+            'success': True,
+            'backfill': geocode_backfill.backfill_status(),
+            'geocode_stats': geocoding.get_geocode_stats()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+DEFAULT_STORAGE_ADDRESS = '100 Industrial Dr, Pewee Valley, KY 40056'
+
+def route_address(record, known=None):
+    """
+    Address of a customer, location or dump site for routing
+    
+    If known is a dict, the record's stored coordinates are added to it
+    (address -> coordinates) so routing.matrix_for_addresses skips geocoding.
+    """
+    address = geocoding.record_address(record)
+    coords = geocoding.record_coordinates(record)
+    if known is not None and address and coords:
+        known[address] = coords
+    return address
+
+def get_truck_storage_address(truck, known=None):
+    """Address a truck leaves from and returns to each day"""
+    if truck and truck.storage_location:
+        return route_address(truck.storage_location, known)
+    # Fallback to default location
+    return DEFAULT_STORAGE_ADDRESS
+
+def is_dump_ticket(ticket):
+    """Dump stops are generated Waste Disposal tickets without a customer"""
+    return ticket.service_type == 'Waste Disposal' or bool(ticket.job_id and ticket.job_id.startswith('DUMP-'))
+
+def get_ticket_stop_address(ticket, known=None):
+    """Street address a ticket's stop is at (customer or dump site), or None"""
+    if ticket.customer:
+        return route_address(ticket.customer, known)
+    if is_dump_ticket(ticket) and ticket.disposal_location:
+        dump_site = DumpSite.query.filter_by(name=ticket.disposal_location).first()
+        if dump_site:
+            return route_address(dump_site, known)
+    return None
+
+def team_member_works_on(team_member, target_date):
+    """Whether a team member's work_days (weekdays, weekends, all) include a date"""
+    work_days = (team_member.work_days or 'weekdays').lower()
+    if work_days == 'all':
+        return True
+    if work_days == 'weekends':
+        return target_date.weekday() >= 5
+    return target_date.weekday() < 5
+
+def clock_minutes(value):
+    """Minutes after midnight for a time object or 'HH:MM' string"""
+    if isinstance(value, str):
+        hours, minutes = value.split(':')[:2]
+        return int(hours) * 60 + int(minutes)
+    return value.hour * 60 + value.minute
+
+@app.route('/api/route-optimization/<int:truck_id>/<date>', methods=['GET', 'POST'])
 def optimize_truck_route(truck_id, date):
-    """Calculate optimized route with drive times for a truck's schedule"""
+    """
+    Optimize the stop order for a truck's schedule
+    
+    The route starts and ends at the truck's storage location. Dump stops,
+    jobs already in progress or completed, and stops that cannot be geocoded
+    keep their position; the other stops are reordered with nearest-neighbor
+    construction plus 2-opt/Or-opt improvement. POST {"apply": true} saves the
+    optimized order to route_position.
+    """
     try:
         from datetime import datetime
         
+        data = request.get_json(silent=True) or {}
+        apply_order = request.method == 'POST' and bool(data.get('apply'))
+        
         # Parse date
         target_date = datetime.fromisoformat(date).date()
         
+        truck = db.session.get(Truck, truck_id)
+        if not truck:
+            return jsonify({'error': 'Truck not found'}), 404
+        
         # Get truck tickets for the date
         tickets = Ticket.query.filter(
             Ticket.truck_id == truck_id,
-            db.func.date(Ticket.scheduled_date) == target_date
+            Ticket.scheduled_on(target_date)
         ).order_by(Ticket.route_position).all()
         
         if not tickets:
             return jsonify({'success': True, 'route': [], 'total_drive_time': 0})
         
-        # Get truck's starting location (we'll use first customer for now)
-        truck = Truck.query.get_or_404(truck_id)
+        known = {}
+        storage_address = get_truck_storage_address(truck, known)
+        stop_addresses = [get_ticket_stop_address(ticket, known) for ticket in tickets]
+        
+        # Matrix index 0 is the storage location, ticket i is index i + 1
+        matrix = routing.matrix_for_addresses([storage_address] + [address or '' for address in stop_addresses],
+                                              known=known)
+        durations = matrix['durations']
+        
+        stops = list(range(1, len(tickets) + 1))
+        fixed = [
+            i + 1 for i, ticket in enumerate(tickets)
+            if is_dump_ticket(ticket)
+            or ticket.status in ('in-progress', 'completed')
+            or matrix['coords'][i + 1] is None
+        ]
         
-        # Calculate drive times between consecutive stops
-        route_with_times = []
-        total_drive_time = 0
+        result = route_optimization.optimize_sequence(durations, 0, 0, stops, fixed)
+        ordered_tickets = [tickets[index - 1] for index in result['order']]
         
-        for i, ticket in enumerate(tickets):
-            if not ticket.customer:
-                continue
-                
-            customer_address = f"{ticket.customer.street_address}, {ticket.customer.city}, {ticket.customer.state}"
-            
-            ticket_data = {
-                'ticket_id': ticket.id,
-                'job_id': ticket.job_id,
-                'customer_name': f"{ticket.customer.first_name} {ticket.customer.last_name}",
-                'address': customer_address,
-                'service_type': ticket.service_type,
-                'estimated_duration': ticket.estimated_duration or 60,
-                'route_position': ticket.route_position
-            }
-            
-            # Calculate drive time to this stop
-            if i > 0:
-                prev_customer = tickets[i-1].customer
-                if prev_customer:
-                    prev_address = f"{prev_customer.street_address}, {prev_customer.city}, {prev_customer.state}"
-                    drive_result = calculate_drive_time(prev_address, customer_address)
-                    
-                    if drive_result:
-                        ticket_data['drive_time_from_previous'] = drive_result['duration_minutes']
-                        ticket_data['distance_from_previous'] = drive_result['distance_km']
-                        total_drive_time += drive_result['duration_minutes']
-                    else:
-                        ticket_data['drive_time_from_previous'] = None
-                        ticket_data['distance_from_previous'] = None
-            else:
-                ticket_data['drive_time_from_previous'] = 0
-                ticket_data['distance_from_previous'] = 0
-            
-            route_with_times.append(ticket_data)
+        if apply_order:
+            # Evenly gapped keys, so later drag-and-drop moves write one row
+            for position, ticket in enumerate(ordered_tickets):
+                ticket.route_position = (position + 1) * positions.POSITION_GAP
+                ticket.updated_at = datetime.utcnow()
+            db.session.commit()
+        
+        def build_route(order):
+            route = []
+            previous = 0
+            total = 0
+            for index in order:
+                ticket = tickets[index - 1]
+                drive_minutes = durations[previous][index]
+                if drive_minutes is not None:
+                    total += drive_minutes
+                if ticket.customer:
+                    name = f"{ticket.customer.first_name} {ticket.customer.last_name}"
+                elif is_dump_ticket(ticket):
+                    name = ticket.disposal_location or 'Dump Site'
+                else:
+                    name = 'No customer'
+                route.append({
+                    'ticket_id': ticket.id,
+                    'job_id': ticket.job_id,
+                    'customer_name': name,
+                    'address': stop_addresses[index - 1],
+                    'service_type': ticket.service_type,
+                    'estimated_duration': ticket.estimated_duration or 60,
+                    'route_position': ticket.route_position,
+                    'fixed': index in fixed,
+                    'drive_time_from_previous': drive_minutes,
+                    'distance_from_previous': matrix['distances'][previous][index]
+                })
+                previous = index
+            return_minutes = durations[previous][0]
+            if return_minutes is not None:
+                total += return_minutes
+            return route, round(total, 1)
+        
+        current_route, current_drive_time = build_route(stops)
+        optimized_route, optimized_drive_time = build_route(result['order'])
         
         return jsonify({
             'success': True,
             'truck_id': truck_id,
             'date': date,
-            'route': route_with_times,
-            'total_drive_time': round(total_drive_time, 1),
-            'total_stops': len(route_with_times)
+            'storage_location': storage_address,
+            'route': current_route,
+            'total_drive_time': current_drive_time,
+            'total_stops': len(current_route),
+            'optimization': {
+                'current_order': [ticket.id for ticket in tickets],
+                'optimized_order': [ticket.id for ticket in ordered_tickets],
+                'current_drive_time': current_drive_time,
+                'optimized_drive_time': optimized_drive_time,
+                'minutes_saved': round(current_drive_time - optimized_drive_time, 1),
+                'optimized_route': optimized_route,
+                'elapsed_ms': result['elapsed_ms'],
+                'applied': apply_order
+            }
         })
         
     except Exception as e:
+        db.session.rollback()
         print(f"Route optimization error: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/multi-stop-route/<int:truck_id>/<date>', methods=['POST'])
+@jobs.background()
 def calculate_multi_stop_route(truck_id, date):
     """Calculate optimal route with drive times between all stops"""
     try:
@@ -3131,17 +3654,14 @@ def calculate_multi_stop_route(truck_id, date):
         if not truck:
             return jsonify({'error': 'Truck not found'}), 404
             
-        # Get truck's storage location
-        if truck.storage_location:
-            storage_location = f"{truck.storage_location.street_address}, {truck.storage_location.city}, {truck.storage_location.state}"
-        else:
-            # Fallback to default location
-            storage_location = '100 Industrial Dr, Pewee Valley, KY 40056'
+        # Get truck's storage location (stored coordinates are collected in known for the matrices)
+        known = {}
+        storage_location = get_truck_storage_address(truck, known)
         
         # Get truck tickets for the date
         tickets = Ticket.query.filter(
             Ticket.truck_id == truck_id,
-            db.func.date(Ticket.scheduled_date) == target_date
+            Ticket.scheduled_on(target_date)
         ).order_by(Ticket.route_position).all()
         
         if not tickets:
@@ -3151,7 +3671,7 @@ def calculate_multi_stop_route(truck_id, date):
         tickets_data = []
         for ticket in tickets:
             if ticket.customer:
-                customer_address = f"{ticket.customer.street_address}, {ticket.customer.city}, {ticket.customer.state}"
+                customer_address = get_ticket_stop_address(ticket, known)
                 ticket_data = {
                     'id': ticket.id,
                     'job_id': ticket.job_id,
@@ -3159,7 +3679,8 @@ def calculate_multi_stop_route(truck_id, date):
                     'estimated_gallons': ticket.estimated_gallons,
                     'estimated_duration': ticket.estimated_duration or 60,
                     'customer_name': f"{ticket.customer.first_name} {ticket.customer.last_name}",
-                    'customer_address': customer_address
+                    'customer_address': customer_address,
+                    'waste_type': ticket.waste_type
                 }
                 tickets_data.append(ticket_data)
         
@@ -3171,10 +3692,36 @@ def calculate_multi_stop_route(truck_id, date):
         
         # Get available dump sites
         dump_sites = DumpSite.query.filter_by(is_active=True).all()
-        dump_sites_data = [site.to_dict() for site in dump_sites]
+        dump_sites_data = []
+        for site in dump_sites:
+            site_data = site.to_dict()
+            site_data['full_address'] = route_address(site, known)
+            dump_sites_data.append(site_data)
+        
+        # Dump placement needs drive times from every stop to every dump site
+        jobs.report_progress(1, 3, 'Placing dump stops')
+        dump_matrix = routing.matrix_for_addresses(
+            [storage_location]
+            + [ticket['customer_address'] for ticket in tickets_data]
+            + [storage_location]
+            + [site['full_address'] for site in dump_sites_data],
+            known=known
+        )
+        
+        # The route starts when the assigned crew's shift does
+        assignment = TruckTeamAssignment.query.filter_by(truck_id=truck_id, assignment_date=target_date).first()
+        if assignment and assignment.team_member and assignment.team_member.shift_start_time:
+            start_minutes = clock_minutes(assignment.team_member.shift_start_time)
+        else:
+            start_minutes = tank_tracking.DEFAULT_ROUTE_START_MINUTES
         
         # Build optimized route with dump sites
-        optimized_route = tank_tracking.optimize_route_with_dumps(truck_data, tickets_data, dump_sites_data)
+        optimized_route = tank_tracking.optimize_route_with_dumps(
+            truck_data, tickets_data, dump_sites_data,
+            durations=dump_matrix['durations'],
+            start_minutes=start_minutes,
+            service_date=target_date
+        )
         
         # Convert to route stops format for drive time calculation
         route_stops = []
@@ -3209,6 +3756,8 @@ def calculate_multi_stop_route(truck_id, date):
                     'dump_site_name': stop['name'],
                     'estimated_time': stop['estimated_time'],
                     'gallons_dumped': stop['gallons_dumped'],
+                    'detour_minutes': stop['detour_minutes'],
+                    'disposal_cost': stop['disposal_cost'],
                     'icon': '🗑️'
                 })
         
@@ -3227,7 +3776,20 @@ def calculate_multi_stop_route(truck_id, date):
             tickets_data
         )
         
-        # Calculate drive times between consecutive stops
+        # Drive times and distances for every leg come from one batched matrix request
+        jobs.report_progress(2, 3, 'Calculating drive times')
+        matrix = routing.matrix_for_addresses([stop['address'] for stop in route_stops], known=known)
+        
+        # Geometry is only fetched for legs the map draws: all of them by default,
+        # none with "include_geometry": false, or a list of leg indexes
+        include_geometry = data.get('include_geometry', True)
+        if isinstance(include_geometry, list):
+            geometry_legs = {int(i) for i in include_geometry}
+        elif include_geometry:
+            geometry_legs = set(range(len(route_stops) - 1))
+        else:
+            geometry_legs = set()
+        
         route_with_drive_times = []
         total_drive_time = 0
         total_distance = 0
@@ -3235,21 +3797,22 @@ def calculate_multi_stop_route(truck_id, date):
         for i, stop in enumerate(route_stops):
             stop_data = stop.copy()
             
-            # Calculate drive time to next stop
+            # Drive time to next stop
             if i < len(route_stops) - 1:
-                next_stop = route_stops[i + 1]
-                drive_result = calculate_drive_time(stop['address'], next_stop['address'])
+                drive_minutes = matrix['durations'][i][i + 1]
+                distance_km = matrix['distances'][i][i + 1]
+                geometry = None
                 
-                if drive_result:
-                    stop_data['drive_time_to_next'] = drive_result['duration_minutes']
-                    stop_data['distance_to_next'] = drive_result['distance_km']
-                    stop_data['route_geometry_to_next'] = drive_result['geometry']
-                    total_drive_time += drive_result['duration_minutes']
-                    total_distance += drive_result['distance_km']
-                else:
-                    stop_data['drive_time_to_next'] = None
-                    stop_data['distance_to_next'] = None
-                    stop_data['route_geometry_to_next'] = None
+                if drive_minutes is not None and i in geometry_legs and drive_minutes > 0:
+                    leg = routing.get_leg(matrix['coords'][i], matrix['coords'][i + 1])
+                    geometry = leg['geometry'] if leg else None
+                
+                stop_data['drive_time_to_next'] = drive_minutes
+                stop_data['distance_to_next'] = distance_km
+                stop_data['route_geometry_to_next'] = geometry
+                if drive_minutes is not None:
+                    total_drive_time += drive_minutes
+                    total_distance += distance_km or 0
             else:
                 stop_data['drive_time_to_next'] = 0
                 stop_data['distance_to_next'] = 0
@@ -3290,6 +3853,7 @@ def calculate_multi_stop_route(truck_id, date):
                 'tank_status': tank_status,
                 'tank_progression': tank_progression,
                 'dump_sites_used': len([s for s in route_stops if s['type'] == 'dump_site']),
+                'disposal_cost': round(sum(s['disposal_cost'] or 0 for s in route_stops if s['type'] == 'dump_site'), 2),
                 'estimated_gallons_collected': sum(ticket.get('estimated_gallons', 0) for ticket in tickets_data)
             },
             'summary': {
@@ -3306,7 +3870,291 @@ def calculate_multi_stop_route(truck_id, date):
         print(f"Multi-stop route error: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Fleet-wide route planning
+
+FLEET_DAY_START_HOUR = 8
+
+def build_fleet_problem(target_date, truck_ids=None, shift_minutes=None, time_windows=None):
+    """
+    Load trucks, tickets and dump sites for a service date into solver inputs
+    
+    Each truck works the shift of the team member assigned to it that day
+    (trucks whose crew is off that day are left out); unassigned trucks use
+    the default FLEET_DAY_START_HOUR shift. Ticket windows come from
+    priority, service type and requested_service_date; time_windows maps
+    ticket ids to dispatcher-set hard {'start': 'HH:MM', 'end': 'HH:MM'}
+    windows.
+    
+    Returns:
+        Dict with trucks, tickets, dump_sites (model rows aligned with the
+        solver's vehicle/job/dump indexes), vehicles, jobs, solver_dump_sites,
+        durations and skipped (tickets that could not be geocoded)
+    """
+    truck_query = Truck.query.filter_by(status='active')
+    if truck_ids:
+        truck_query = truck_query.filter(Truck.id.in_(truck_ids))
+    
+    assignments = {
+        assignment.truck_id: assignment
+        for assignment in TruckTeamAssignment.query.filter_by(assignment_date=target_date).all()
+    }
+    trucks = []
+    shifts = []
+    for truck in truck_query.order_by(Truck.id).all():
+        assignment = assignments.get(truck.id)
+        member = assignment.team_member if assignment else None
+        if member and not team_member_works_on(member, target_date):
+            continue
+        start = clock_minutes(member.shift_start_time) if member and member.shift_start_time else FLEET_DAY_START_HOUR * 60
+        if shift_minutes:
+            end = start + shift_minutes
+        elif member and member.shift_end_time:
+            end = clock_minutes(member.shift_end_time)
+        else:
+            end = start + fleet_routing.DEFAULT_SHIFT_MINUTES
+        trucks.append(truck)
+        shifts.append((start, end))
+    
+    # Scheduled tickets for the date plus pending tickets not yet given a date
+    candidate_query = Ticket.query.filter(
+        db.or_(
+            db.and_(Ticket.status == 'scheduled', Ticket.scheduled_on(target_date)),
+            db.and_(Ticket.status == 'pending', db.or_(Ticket.scheduled_date.is_(None),
+                                                       Ticket.scheduled_on(target_date)))
+        )
+    )
+    if truck_ids:
+        # Planning some trucks leaves the other trucks' tickets where they are
+        candidate_query = candidate_query.filter(db.or_(Ticket.truck_id.is_(None),
+                                                        Ticket.truck_id.in_([truck.id for truck in trucks])))
+    candidate_tickets = candidate_query.order_by(Ticket.id).all()
+    candidate_tickets = [ticket for ticket in candidate_tickets if ticket.customer and not is_dump_ticket(ticket)]
+    
+    dump_sites = DumpSite.query.filter_by(is_active=True, accepts_septic_waste=True).order_by(DumpSite.id).all()
+    
+    known = {}
+    depot_addresses = [get_truck_storage_address(truck, known) for truck in trucks]
+    dump_addresses = [route_address(site, known) for site in dump_sites]
+    ticket_addresses = [get_ticket_stop_address(ticket, known) for ticket in candidate_tickets]
+    matrix = routing.matrix_for_addresses(depot_addresses + dump_addresses + ticket_addresses, known=known)
+    coords = matrix['coords']
+    
+    dump_offset = len(depot_addresses)
+    ticket_offset = dump_offset + len(dump_addresses)
+    
+    vehicles = []
+    for i, truck in enumerate(trucks):
+        tank_capacity = truck.tank_capacity or 3000
+        vehicles.append({
+            'id': truck.id,
+            'depot': i,
+            'capacity': tank_capacity * (truck.tank_full_threshold or 0.85),
+            'max_load': tank_capacity,
+            'start_load': truck.current_tank_level or 0,
+            'start_minutes': shifts[i][0],
+            'end_minutes': shifts[i][1]
+        })
+    
+    routable_dump_sites = []
+    solver_dump_sites = []
+    for k, site in enumerate(dump_sites):
+        if coords[dump_offset + k]:
+            routable_dump_sites.append(site)
+            solver_dump_sites.append({
+                'id': site.id,
+                'node': dump_offset + k,
+                'service_minutes': site.estimated_dump_time or 15
+            })
+    
+    fleet_start = min((start for start, _ in shifts), default=FLEET_DAY_START_HOUR * 60)
+    time_windows = {str(ticket_id): window for ticket_id, window in (time_windows or {}).items()}
+    
+    tickets = []
+    jobs = []
+    skipped = []
+    for k, ticket in enumerate(candidate_tickets):
+        if not coords[ticket_offset + k]:
+            skipped.append(ticket.id)
+            continue
+        gallons = ticket.estimated_gallons
+        if gallons is None:
+            tank_size = ticket.septic_system.tank_size if ticket.septic_system else None
+            gallons = tank_tracking.estimate_gallons_for_job(ticket.service_type, tank_size)
+        job = {
+            'id': ticket.id,
+            'node': ticket_offset + k,
+            'service_minutes': ticket.estimated_duration or 60,
+            'gallons': max(0, gallons or 0)
+        }
+        job.update(fleet_routing.ticket_time_window(
+            ticket.priority, ticket.service_type, ticket.requested_service_date, target_date, fleet_start
+        ))
+        window = time_windows.get(str(ticket.id))
+        if window:
+            job['earliest'] = clock_minutes(window['start']) if window.get('start') else None
+            job['latest'] = clock_minutes(window['end']) if window.get('end') else None
+            job['hard'] = True
+        tickets.append(ticket)
+        jobs.append(job)
+    
+    return {
+        'trucks': trucks,
+        'tickets': tickets,
+        'dump_sites': routable_dump_sites,
+        'vehicles': vehicles,
+        'jobs': jobs,
+        'solver_dump_sites': solver_dump_sites,
+        'durations': matrix['durations'],
+        'skipped': skipped
+    }
+
+def apply_fleet_plan(target_date, problem, plan):
+    """Write a solver plan: truck assignments, route positions and dump tickets"""
+    import time
+    midnight = datetime.combine(target_date, datetime.min.time())
+    
+    for truck, route in zip(problem['trucks'], plan['routes']):
+        # Replace this truck's auto-generated dump stops for the date
+        existing_dumps = Ticket.query.filter(
+            Ticket.truck_id == truck.id,
+            Ticket.scheduled_on(target_date),
+            db.or_(Ticket.service_type == 'Waste Disposal', Ticket.job_id.like('DUMP-%'))
+        ).all()
+        for dump_ticket in existing_dumps:
+            db.session.delete(dump_ticket)
+        
+        timestamp = int(time.time())
+        dump_count = 0
+        for position, stop in enumerate(route['stops']):
+            if stop['type'] == 'dump':
+                site = problem['dump_sites'][stop['dump_index']]
+                dump_count += 1
+                db.session.add(Ticket(
+                    job_id=f"DUMP-{truck.truck_number}-{target_date.strftime('%Y%m%d')}-{timestamp}-{dump_count}",
+                    service_type='Waste Disposal',
+                    service_description=f"Dump at {site.name} - {site.street_address}, {site.city}, {site.state}",
+                    priority='medium',
+                    status='scheduled',
+                    scheduled_date=midnight + timedelta(minutes=stop['arrival_minutes']),
+                    estimated_duration=site.estimated_dump_time or 15,
+                    truck_id=truck.id,
+                    route_position=(position + 1) * positions.POSITION_GAP,
+                    disposal_location=site.name,
+                    office_notes=f"Auto-generated dump stop at {site.name}. Cost: ${site.cost_per_gallon or 0:.2f}/gallon"
+                ))
+            else:
+                ticket = problem['tickets'][stop['job_index']]
+                ticket.truck_id = truck.id
+                ticket.truck_number = truck.truck_number
+                ticket.status = 'scheduled'
+                ticket.scheduled_date = midnight + timedelta(minutes=stop['start_minutes'])
+                ticket.route_position = (position + 1) * positions.POSITION_GAP
+                ticket.updated_at = datetime.utcnow()
+    
+    # Tickets the plan couldn't fit go back to the pending column
+    for job_index in plan['unassigned']:
+        ticket = problem['tickets'][job_index]
+        ticket.truck_id = None
+        ticket.truck_number = None
+        ticket.scheduled_date = None
+        ticket.status = 'pending'
+        ticket.route_position = None
+        ticket.updated_at = datetime.utcnow()
+    
+    db.session.commit()
+
+@app.route('/api/fleet-optimization/<date>', methods=['POST'])
+@jobs.background()
+def optimize_fleet_routes(date):
+    """
+    Assign a service date's pending and scheduled tickets to active trucks
+    
+    Body (all optional): time_budget (seconds), seed, max_iterations,
+    truck_ids, shift_minutes, time_windows ({ticket_id: {start, end}} hard
+    windows as HH:MM) and apply (write the plan to the database). With
+    truck_ids, tickets already on other trucks are left alone. Tickets the
+    plan leaves unassigned go back to pending when it is applied.
+    Arrival and start times in the result are minutes after midnight.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        target_date = datetime.fromisoformat(date).date()
+        
+        time_budget = min(float(data.get('time_budget', fleet_routing.DEFAULT_TIME_BUDGET)), 60.0)
+        seed = int(data.get('seed', 0))
+        max_iterations = data.get('max_iterations')
+        max_iterations = int(max_iterations) if max_iterations is not None else None
+        
+        problem = build_fleet_problem(target_date, data.get('truck_ids'), data.get('shift_minutes'),
+                                      data.get('time_windows'))
+        if not problem['trucks']:
+            return jsonify({'error': 'No active trucks available'}), 400
+        
+        plan = fleet_routing.solve_fleet(
+            problem['durations'], problem['vehicles'], problem['jobs'], problem['solver_dump_sites'],
+            time_budget=time_budget, seed=seed, max_iterations=max_iterations
+        )
+        
+        routes = []
+        for truck, route in zip(problem['trucks'], plan['routes']):
+            stops = []
+            for stop in route['stops']:
+                if stop['type'] == 'dump':
+                    site = problem['dump_sites'][stop['dump_index']]
+                    stops.append({
+                        'type': 'dump',
+                        'dump_site_id': site.id,
+                        'dump_site_name': site.name,
+                        'arrival_minutes': stop['arrival_minutes']
+                    })
+                else:
+                    ticket = problem['tickets'][stop['job_index']]
+                    stops.append({
+                        'type': 'job',
+                        'ticket_id': ticket.id,
+                        'job_id': ticket.job_id,
+                        'customer_name': f"{ticket.customer.first_name} {ticket.customer.last_name}",
+                        'priority': ticket.priority,
+                        'arrival_minutes': stop['arrival_minutes'],
+                        'start_minutes': stop['start_minutes'],
+                        'minutes_late': stop['minutes_late']
+                    })
+            routes.append({
+                'truck_id': truck.id,
+                'truck_number': truck.truck_number,
+                'stops': stops,
+                'drive_minutes': route['drive_minutes'],
+                'duration_minutes': route['duration_minutes'],
+                'lateness': route['lateness'],
+                'gallons': route['gallons'],
+                'dump_count': route['dump_count']
+            })
+        
+        applied = bool(data.get('apply'))
+        if applied:
+            apply_fleet_plan(target_date, problem, plan)
+        
+        return jsonify({
+            'success': True,
+            'date': date,
+            'routes': routes,
+            'unassigned_ticket_ids': [problem['tickets'][j].id for j in plan['unassigned']],
+            'skipped_ticket_ids': problem['skipped'],
+            'total_drive_minutes': plan['total_drive_minutes'],
+            'total_lateness': plan['total_lateness'],
+            'iterations': plan['iterations'],
+            'elapsed_ms': plan['elapsed_ms'],
+            'seed': seed,
+            'applied': applied
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f"Fleet optimization error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/admin/update-all-dates', methods=['POST'])
+@jobs.background()
 def update_all_ticket_dates():
     """Update all tickets to be scheduled for today and tomorrow"""
     try:
@@ -3340,32 +4188,49 @@ def update_all_ticket_dates():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/health/live', methods=['GET'])
+def liveness_check():
+    """Liveness probe: the worker is up (no database access)"""
+    return jsonify(metrics.liveness())
+
+@app.route('/api/health/ready', methods=['GET'])
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Simple health check endpoint"""
+    """Readiness probe: the database answers (checked at most every few seconds per worker)"""
+    readiness = metrics.readiness()
+    database = readiness['checks']['database']
+    return jsonify(dict(
+        readiness,
+        status='healthy' if readiness['ready'] else 'error',
+        database='connected' if database['ok'] else 'error'
+    )), 200 if readiness['ready'] else 503
+
+@app.route('/api/profiler', methods=['GET'])
+def profiler_reports():
+    """SQL profiler settings and this worker's recent request reports, newest first"""
+    limit = request.args.get('limit', type=int)
+    suspects_only = request.args.get('suspects') == '1'
+    return jsonify({'settings': profiler.settings(), 'reports': profiler.reports(limit, suspects_only)})
+
+@app.route('/api/profiler', methods=['POST'])
+def configure_profiler():
+    """Turn the SQL profiler on or off (and set its sample rate) for this worker"""
     try:
-        # Try to query database
-        customer_count = db.session.execute(db.text('SELECT COUNT(*) FROM customer')).scalar()
-        ticket_count = db.session.execute(db.text('SELECT COUNT(*) FROM ticket')).scalar()
-        truck_count = db.session.execute(db.text('SELECT COUNT(*) FROM truck')).scalar()
-        dump_site_count = db.session.execute(db.text('SELECT COUNT(*) FROM dump_site')).scalar()
-        
-        return jsonify({
-            'status': 'healthy',
-            'database': 'connected',
-            'counts': {
-                'customers': customer_count,
-                'tickets': ticket_count,
-                'trucks': truck_count,
-                'dump_sites': dump_site_count
-            }
-        })
-    except Exception as e:
-        return jsonify({
-            'status': 'error',
-            'database': 'error',
-            'error': str(e)
-        }), 500
+        data = request.get_json() or {}
+        return jsonify({'settings': profiler.configure(data.get('enabled'), data.get('sample_rate'))})
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/profiler', methods=['DELETE'])
+def clear_profiler_reports():
+    """Empty this worker's report buffer"""
+    profiler.clear()
+    return jsonify({'success': True})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request, SQL, provider, cache and job metrics for this worker in Prometheus text format"""
+    return app.response_class(metrics.render(), mimetype=None, content_type=metrics.CONTENT_TYPE)
 
 @app.route('/api/debug-job-board', methods=['GET'])
 def debug_job_board():
@@ -3399,7 +4264,7 @@ def debug_job_board():
         try:
             from datetime import date
             today = date.today()
-            today_tickets = Ticket.query.filter(db.func.date(Ticket.scheduled_date) == today).all()
+            today_tickets = Ticket.query.filter(Ticket.scheduled_on(today)).all()
             debug_info['date_filter_query'] = f'Success - found {len(today_tickets)} tickets for today'
         except Exception as e:
             debug_info['date_filter_query'] = f'Failed: {str(e)}'
@@ -3430,6 +4295,12 @@ def init_database():
             # Create all tables (won't affect existing ones)
             db.create_all()
         
+        # Columns and indexes added after the first release (create_all skips existing tables)
+        spatial.ensure_spatial_columns()
+        db_indexes.ensure_indexes()
+        search.ensure_search_index(rebuild=force_recreate)
+        ticket_counters.reconcile_counters()
+        
         # Add essential dump sites if none exist
         if DumpSite.query.count() == 0:
             dump_sites = [
@@ -3499,6 +4370,7 @@ def init_database():
         }), 500
 
 @app.route('/api/create-sample-data', methods=['POST'])
+@jobs.background(max_attempts=1)  # a retry after a partial commit would duplicate rows
 def create_sample_data():
     """Create basic sample data for testing"""
     try:
@@ -3611,6 +4483,7 @@ def create_sample_data():
         }), 500
 
 @app.route('/api/create-comprehensive-data', methods=['POST'])
+@jobs.background(max_attempts=1)  # a retry after a partial commit would duplicate rows
 def create_comprehensive_data():
     """Create comprehensive sample data including many tickets"""
     try:
@@ -64,7 +64,7 @@ def assign_tickets_to_trucks():
         # Show summary
         print("\nSummary of today's assignments:")
         today_tickets = Ticket.query.filter(
-            db.func.date(Ticket.scheduled_date) == today,
+            Ticket.scheduled_on(today),
             Ticket.truck_id.isnot(None)
         ).all()
         
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Schedule Query Benchmark for TrueTank
+
+This module handles:
+- Generating a large synthetic ticket table (one million tickets by default)
+- Running the job board's hot queries with the old func.date() filter and
+  with the half-open range filter (Ticket.scheduled_on)
+- Printing query plans (EXPLAIN QUERY PLAN on SQLite, EXPLAIN ANALYZE on
+  Postgres) and timings before and after the indexes in db_indexes
+
+Runs only against the scratch database named with --database (never the
+app's DATABASE_URL): it replaces the crew assignments, fills the ticket
+table and drops the declared indexes. It refuses a database holding
+anything but its own BENCH-* rows.
+    python benchmark_schedule_queries.py --database sqlite:////tmp/truetank_bench.db
+    python benchmark_schedule_queries.py --database postgresql:///truetank_bench --tickets 200000 --repeat 5
+"""
+
+from typing import Dict, List, Optional
+from datetime import date, datetime, timedelta
+import argparse
+import os
+import random
+import sys
+import time
+
+from sqlalchemy import inspect, text
+
+from models import db, Customer, TeamMember, Ticket, Truck, TruckTeamAssignment
+import db_indexes
+
+STATUSES = ('pending', 'scheduled', 'assigned', 'in-progress', 'completed')
+BENCH_DAYS = 730
+BENCH_TRUCKS = 40
+INSERT_CHUNK = 20000
+
+
+def generate_tickets(count: int, seed: int = 7):
+    """Bulk-insert synthetic tickets spread over BENCH_DAYS days and BENCH_TRUCKS trucks"""
+    rng = random.Random(seed)
+    first_day = datetime(2024, 1, 1)
+    table = Ticket.__table__
+    now = datetime.utcnow()
+    start_id = (db.session.query(db.func.max(Ticket.id)).scalar() or 0) + 1
+    with db.engine.begin() as conn:
+        for offset in range(0, count, INSERT_CHUNK):
+            rows = []
+            for n in range(start_id + offset, start_id + min(offset + INSERT_CHUNK, count)):
+                status = rng.choice(STATUSES)
+                scheduled = None
+                if status != 'pending' or rng.random() < 0.1:
+                    scheduled = first_day + timedelta(days=rng.randrange(BENCH_DAYS), hours=rng.randrange(7, 17))
+                rows.append({
+                    'job_id': f'BENCH-{n}', 'status': status, 'priority': 'medium',
+                    'truck_id': rng.randrange(1, BENCH_TRUCKS + 1) if scheduled else None,
+                    'scheduled_date': scheduled, 'route_position': rng.randrange(1, 20) * 1024,
+                    'column_position': n * 1024, 'created_at': now, 'updated_at': now,
+                })
+            conn.execute(table.insert(), rows)
+
+    with db.engine.begin() as conn:
+        conn.execute(TruckTeamAssignment.__table__.delete())
+        conn.execute(TruckTeamAssignment.__table__.insert(), [
+            {'truck_id': truck, 'assignment_date': (first_day + timedelta(days=day)).date(),
+             'created_at': now, 'updated_at': now}
+            for truck in range(1, BENCH_TRUCKS + 1) for day in range(BENCH_DAYS)
+        ])
+
+
+def non_benchmark_rows() -> Dict[str, int]:
+    """Rows this benchmark didn't generate, per table (any means it's not a scratch database)"""
+    counts = {
+        'ticket': Ticket.query.filter(db.not_(Ticket.job_id.like('BENCH-%'))).count(),
+        'truck_team_assignment': TruckTeamAssignment.query.filter(
+            TruckTeamAssignment.team_member_id.isnot(None)
+        ).count(),
+        'customer': Customer.query.count(),
+        'truck': Truck.query.count(),
+        'team_member': TeamMember.query.count(),
+    }
+    return {table: count for table, count in counts.items() if count}
+
+
+def drop_declared_indexes():
+    """Put the tables back in their pre-migration state"""
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for index in db_indexes.declared_indexes():
+            existing = {row['name'] for row in inspector.get_indexes(index.table.name)}
+            if index.name in existing:
+                conn.execute(text(f'DROP INDEX {index.name}'))
+
+
+def benchmark_queries(day: date, truck_id: int) -> Dict[str, object]:
+    """The job board's hot queries, old and new forms"""
+    old_day = db.func.date(Ticket.scheduled_date) == day
+    return {
+        'day schedule (func.date)': Ticket.query.filter(old_day),
+        'day schedule (range)': Ticket.query.filter(Ticket.scheduled_on(day)),
+        'truck route (func.date)': Ticket.query.filter(Ticket.truck_id == truck_id, old_day).order_by(Ticket.route_position),
+        'truck route (range)': Ticket.query.filter(Ticket.truck_id == truck_id, Ticket.scheduled_on(day)).order_by(Ticket.route_position),
+        'kanban column': Ticket.query.filter(Ticket.status == 'assigned').order_by(Ticket.column_position).limit(50),
+        'scheduled on day (range)': Ticket.query.filter(Ticket.status == 'scheduled', Ticket.scheduled_on(day)),
+        'crews for day': TruckTeamAssignment.query.filter_by(assignment_date=day),
+    }
+
+
+def _compiled(query) -> str:
+    return str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+
+
+def explain(query) -> List[str]:
+    """Query plan lines for the current dialect"""
+    sql = _compiled(query)
+    if db.engine.dialect.name == 'postgresql':
+        rows = db.session.execute(text(f'EXPLAIN (ANALYZE, BUFFERS) {sql}')).fetchall()
+        return [row[0] for row in rows]
+    rows = db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')).fetchall()
+    return [row[-1] for row in rows]
+
+
+def time_query(query, repeat: int) -> float:
+    """Best-of-N wall time in milliseconds"""
+    sql = text(_compiled(query))
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        db.session.execute(sql).fetchall()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(repeat: int, day: date, truck_id: int) -> Dict[str, Dict]:
+    results = {}
+    for name, query in benchmark_queries(day, truck_id).items():
+        results[name] = {'plan': explain(query), 'ms': time_query(query, repeat)}
+    return results
+
+
+def _print_results(title: str, results: Dict[str, Dict]):
+    print(f"\n=== {title} ===")
+    for name, result in results.items():
+        print(f"\n{name}: {result['ms']:.2f} ms")
+        for line in result['plan']:
+            print(f"    {line}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='EXPLAIN and time schedule queries before and after the indexes')
+    parser.add_argument('--database', required=True,
+                        help='Scratch database URL to fill and benchmark (never the live database)')
+    parser.add_argument('--tickets', type=int, default=1_000_000, help='Tickets to generate if the table is smaller')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per query (best time is reported)')
+    args = parser.parse_args(argv)
+
+    if args.database == os.environ.get('DATABASE_URL'):
+        sys.exit("Refusing to benchmark the app's DATABASE_URL; pass a scratch database with --database")
+    os.environ['DATABASE_URL'] = args.database
+
+    from app import app
+    if app.config['SQLALCHEMY_DATABASE_URI'] != args.database.replace('postgres://', 'postgresql://', 1):
+        sys.exit("The app was configured before --database could apply; run this as its own process")
+    with app.app_context():
+        db.create_all()
+        foreign = non_benchmark_rows()
+        if foreign:
+            found = ', '.join(f"{count} {table}" for table, count in sorted(foreign.items()))
+            sys.exit(f"Refusing to run: {args.database} holds rows the benchmark didn't create ({found})")
+
+        existing = Ticket.query.count()
+        if existing < args.tickets:
+            print(f"Generating {args.tickets - existing} tickets...")
+            started = time.perf_counter()
+            generate_tickets(args.tickets - existing)
+            print(f"  done in {time.perf_counter() - started:.1f}s")
+
+        day, truck_id = date(2024, 6, 3), 7
+        drop_declared_indexes()
+        db.session.execute(text('ANALYZE'))
+        before = run(args.repeat, day, truck_id)
+        _print_results('Before (primary keys and unique constraints only)', before)
+
+        db_indexes.ensure_indexes(progress=print)
+        db.session.execute(text('ANALYZE'))
+        after = run(args.repeat, day, truck_id)
+        _print_results('After db_indexes.ensure_indexes()', after)
+
+        print("\n=== Summary (ms, before -> after) ===")
+        for name in before:
+            print(f"  {name:28} {before[name]['ms']:10.2f} -> {after[name]['ms']:10.2f}")
+
+
+if __name__ == '__main__':
+    main()
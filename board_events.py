@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Job Board Change Events for TrueTank
+
+This module handles:
+- An in-process broker fanning board change events out to subscribers
+  (one per open /api/job-board/stream connection), keyed by board date
+- An optional Redis pub/sub backend so events published by one gunicorn
+  worker reach viewers connected to the others
+- Formatting the Server-Sent Events stream (hello, change events,
+  keep-alives, resync)
+
+Viewers never query the database from the stream: mutation endpoints
+publish one compact event after they commit, and the broker copies it to
+every connected viewer of the affected dates.
+"""
+
+from typing import Dict, Iterator, List, Optional
+import json
+import os
+import queue
+import threading
+import time
+
+# Optional cross-worker backend
+try:
+    import redis
+    redis_available = True
+except ImportError:
+    redis_available = False
+
+BOARD_EVENTS_REDIS_URL = os.environ.get('BOARD_EVENTS_REDIS_URL') or os.environ.get('REDIS_URL')
+BOARD_EVENTS_CHANNEL = os.environ.get('BOARD_EVENTS_CHANNEL', 'truetank:board-events')
+
+# Events a slow viewer may fall behind by before it is told to resync
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Comment line sent when no event arrives for this long (keeps proxies from
+# closing the connection)
+STREAM_KEEPALIVE_SECONDS = int(os.environ.get('BOARD_STREAM_KEEPALIVE_SECONDS', 15))
+
+# Streams end after this long and the browser reconnects, so a connection
+# that died without closing does not hold a worker thread forever
+STREAM_MAX_SECONDS = int(os.environ.get('BOARD_STREAM_MAX_SECONDS', 300))
+STREAM_RETRY_MS = 3000
+
+# Open streams per worker. Each one holds a gthread worker thread (the
+# Procfile runs 16), so past this many viewers are refused with a 503 and
+# poll the board instead, leaving threads for ordinary requests
+STREAM_MAX_SUBSCRIBERS = int(os.environ.get('BOARD_STREAM_MAX_SUBSCRIBERS', 8))
+
+ALL_DATES = '*'
+
+
+class Subscription:
+    """One viewer's queue of pending events"""
+
+    def __init__(self, board_date: str):
+        self.board_date = board_date
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def offer(self, event: Dict):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout: float) -> Optional[Dict]:
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LocalBroker:
+    """Thread-safe fan-out of events to this worker's subscribers"""
+
+    def __init__(self):
+        self._subscribers = {}  # board date -> set of Subscription
+        self._lock = threading.Lock()
+
+    def subscribe(self, board_date: str, limit: Optional[int] = None) -> Optional[Subscription]:
+        """New subscription, or None if `limit` subscribers are already connected"""
+        subscription = Subscription(board_date)
+        with self._lock:
+            if limit is not None and sum(len(subs) for subs in self._subscribers.values()) >= limit:
+                return None
+            self._subscribers.setdefault(board_date, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.board_date)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.board_date]
+
+    def deliver(self, event: Dict):
+        dates = event.get('dates') or []
+        with self._lock:
+            if ALL_DATES in dates:
+                targets = [sub for subs in self._subscribers.values() for sub in subs]
+            else:
+                targets = [sub for board_date in dates for sub in self._subscribers.get(board_date, ())]
+        for subscription in targets:
+            subscription.offer(event)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subs) for subs in self._subscribers.values())
+
+
+class RedisBackend:
+    """Relays events between workers over one Redis pub/sub channel"""
+
+    def __init__(self, url: str, channel: str, deliver):
+        self.client = redis.Redis.from_url(url)
+        self.channel = channel
+        self._deliver = deliver
+        self._thread = threading.Thread(target=self._listen, name='board-events-redis', daemon=True)
+        self._thread.start()
+
+    def publish(self, event: Dict):
+        self.client.publish(self.channel, json.dumps(event))
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    self._deliver(json.loads(message['data']))
+            except Exception as e:
+                print(f"Board events Redis listener error: {e}")
+                time.sleep(5)
+
+
+broker = LocalBroker()
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> Optional[RedisBackend]:
+    """Cross-worker backend, started on first use (None when not configured)"""
+    global _backend
+    if _backend is None and BOARD_EVENTS_REDIS_URL and redis_available:
+        with _backend_lock:
+            if _backend is None:
+                try:
+                    _backend = RedisBackend(BOARD_EVENTS_REDIS_URL, BOARD_EVENTS_CHANNEL, broker.deliver)
+                except Exception as e:
+                    print(f"Board events Redis backend unavailable: {e}")
+    return _backend
+
+
+def publish(event_type: str, dates: List[str], **data) -> Dict:
+    """
+    Publish a board change event to every viewer of the given dates
+
+    Args:
+        event_type: Event name (ticket_moved, route_reordered, ticket_assigned,
+            dump_stops_added, team_assignment_changed)
+        dates: Board dates (YYYY-MM-DD) the change shows on; ALL_DATES for
+            changes to the shared pending list
+        **data: Event fields (ticket ids, truck id, board version, ...)
+
+    Returns:
+        The published event
+    """
+    event = dict(data, type=event_type, dates=sorted({d for d in dates if d}))
+    backend = get_backend()
+    try:
+        if backend:
+            backend.publish(event)  # our own listener delivers it locally too
+            return event
+    except Exception as e:
+        print(f"Board events publish error: {e}")
+    broker.deliver(event)
+    return event
+
+
+def subscribe(board_date: str) -> Optional[Subscription]:
+    """Subscribe a viewer to a date's events (None when this worker is at STREAM_MAX_SUBSCRIBERS)"""
+    get_backend()
+    return broker.subscribe(board_date, limit=STREAM_MAX_SUBSCRIBERS)
+
+
+def format_event(event_type: str, data: Dict, event_id=None) -> str:
+    """One SSE message"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream(subscription: Subscription, hello: Dict) -> Iterator[str]:
+    """
+    SSE body for one viewer: hello, then change events until the stream expires
+
+    The subscription is always released, including when the client
+    disconnects mid-stream.
+    """
+    try:
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        yield format_event('hello', hello, hello.get('version'))
+
+        deadline = time.monotonic() + STREAM_MAX_SECONDS
+        while time.monotonic() < deadline:
+            event = subscription.get(timeout=STREAM_KEEPALIVE_SECONDS)
+            if subscription.overflowed:
+                yield format_event('resync', {'date': subscription.board_date})
+                return
+            if event is None:
+                yield ': keepalive\n\n'
+                continue
+            yield format_event(event['type'], event, event.get('version'))
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Batched Job Board Mutations for TrueTank
+
+This module handles:
+- Parsing and validating a list of board operations as a whole before any
+  of them is applied (unknown tickets, trucks or crew members, bad dates)
+- Applying the operations in order inside the caller's transaction
+- Reporting what changed (tickets, crew assignments, board dates) so the
+  caller can commit once, notify viewers and return the affected rows
+
+Operations use the same field names as the single-change endpoints:
+    {"op": "assign",   "ticket_id", "truck_id", "scheduled_date", "route_position"}
+    {"op": "unassign", "ticket_id"}
+    {"op": "reorder",  "ticket_id", "route_position"}
+    {"op": "move",     "ticket_id", "new_status", "new_position"}
+    {"op": "set_team", "truck_id", "assignment_date", "team_member_id"}
+Positions are drop indexes, as in drag and drop; they become gap keys.
+"""
+
+from typing import Dict, List, Optional, Tuple
+from datetime import date, datetime
+
+from models import db, Ticket, Truck, TeamMember, TruckTeamAssignment
+import positions
+
+OPERATIONS = ('assign', 'unassign', 'reorder', 'move', 'set_team')
+
+MAX_BATCH_OPERATIONS = 200
+
+# Ticket.status is a String(20)
+MAX_STATUS_LENGTH = 20
+
+
+def _parse_int(op: Dict, name: str, required: bool = True) -> Optional[int]:
+    value = op.get(name)
+    if value is None or value == '':
+        if required:
+            raise ValueError(f"{name} is required")
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer")
+
+
+def _parse_datetime(value) -> datetime:
+    if not value:
+        raise ValueError("a date is required")
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError(f"Invalid date format: {value}")
+
+
+def _parse_operation(op) -> Dict:
+    """Check one operation's shape and types (no database access)"""
+    if not isinstance(op, dict):
+        raise ValueError("operation must be an object")
+    kind = op.get('op')
+    if kind not in OPERATIONS:
+        raise ValueError(f"Unknown operation: {kind} (expected one of {', '.join(OPERATIONS)})")
+
+    parsed = {'op': kind}
+    if kind == 'set_team':
+        parsed['truck_id'] = _parse_int(op, 'truck_id')
+        parsed['assignment_date'] = _parse_datetime(op.get('assignment_date')).date()
+        parsed['team_member_id'] = _parse_int(op, 'team_member_id', required=False)
+        return parsed
+
+    parsed['ticket_id'] = _parse_int(op, 'ticket_id')
+    if kind == 'assign':
+        parsed['truck_id'] = _parse_int(op, 'truck_id')
+        parsed['scheduled_date'] = _parse_datetime(op.get('scheduled_date'))
+        parsed['route_position'] = _parse_int(op, 'route_position', required=False)
+    elif kind == 'reorder':
+        parsed['route_position'] = _parse_int(op, 'route_position')
+    elif kind == 'move':
+        status = op.get('new_status')
+        if not status or not isinstance(status, str) or len(status) > MAX_STATUS_LENGTH:
+            raise ValueError("new_status is required")
+        parsed['new_status'] = status
+        parsed['new_position'] = _parse_int(op, 'new_position', required=False) or 0
+    return parsed
+
+
+def validate_operations(operations) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Validate a whole batch before anything is applied
+
+    Referenced tickets, trucks and crew members are looked up with one
+    query per table, not one per operation.
+
+    Returns:
+        (parsed operations, errors); errors are {'index', 'error'} dicts
+        and the batch must not be applied unless the list is empty
+    """
+    if not isinstance(operations, list) or not operations:
+        return [], [{'index': None, 'error': 'operations must be a non-empty list'}]
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return [], [{'index': None, 'error': f'at most {MAX_BATCH_OPERATIONS} operations per batch'}]
+
+    parsed, errors = [], []
+    for index, op in enumerate(operations):
+        try:
+            parsed.append(_parse_operation(op))
+        except ValueError as e:
+            parsed.append(None)
+            errors.append({'index': index, 'error': str(e)})
+
+    valid = [op for op in parsed if op]
+    ticket_ids = {op['ticket_id'] for op in valid if 'ticket_id' in op}
+    truck_ids = {op['truck_id'] for op in valid if op.get('truck_id') is not None}
+    member_ids = {op['team_member_id'] for op in valid if op.get('team_member_id') is not None}
+
+    tickets = {t.id: t for t in Ticket.query.filter(Ticket.id.in_(ticket_ids))} if ticket_ids else {}
+    trucks = {row.id for row in db.session.query(Truck.id).filter(Truck.id.in_(truck_ids))} if truck_ids else set()
+    members = ({row.id for row in db.session.query(TeamMember.id).filter(TeamMember.id.in_(member_ids))}
+               if member_ids else set())
+
+    # Track each ticket's truck/date through the batch so a reorder after an
+    # assign in the same batch is checked against the assigned route
+    scheduled = {ticket_id: (t.truck_id, t.scheduled_date) for ticket_id, t in tickets.items()}
+    for index, op in enumerate(parsed):
+        if op is None:
+            continue
+        problem = None
+        if 'ticket_id' in op and op['ticket_id'] not in tickets:
+            problem = f"Ticket {op['ticket_id']} not found"
+        elif op.get('truck_id') is not None and op['truck_id'] not in trucks:
+            problem = f"Truck {op['truck_id']} not found"
+        elif op.get('team_member_id') is not None and op['team_member_id'] not in members:
+            problem = f"Team member {op['team_member_id']} not found"
+        elif op['op'] == 'assign':
+            scheduled[op['ticket_id']] = (op['truck_id'], op['scheduled_date'])
+        elif op['op'] == 'unassign':
+            scheduled[op['ticket_id']] = (None, None)
+        elif op['op'] == 'reorder' and None in scheduled[op['ticket_id']]:
+            problem = f"Ticket {op['ticket_id']} is not on a truck's route"
+        if problem:
+            errors.append({'index': index, 'error': problem})
+
+    return parsed, sorted(errors, key=lambda error: error['index'])
+
+
+def _day(value) -> Optional[date]:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def apply_operations(operations: List[Dict]) -> Dict:
+    """
+    Apply validated operations in order, without committing
+
+    Later operations see earlier ones (a reorder after an assign places the
+    ticket within its new route).
+
+    Returns:
+        Dict with ticket_ids, team (list of (truck_id, date)), dates (board
+        dates touched), pending (the pending list changed) and tight_scopes
+        (scopes to rebalance after the commit)
+    """
+    changes = {'ticket_ids': [], 'team': [], 'dates': set(), 'pending': False, 'tight_scopes': set()}
+
+    def place(scope, index, ticket):
+        if index is None:
+            return positions.append_positions(scope, 1)[0]
+        key, tight = positions.position_for_index(scope, index, exclude_id=ticket.id)
+        if tight:
+            changes['tight_scopes'].add(scope)
+        return key
+
+    for op in operations:
+        if op['op'] == 'set_team':
+            existing = TruckTeamAssignment.query.filter_by(
+                truck_id=op['truck_id'], assignment_date=op['assignment_date']
+            ).first()
+            if existing and op['team_member_id']:
+                existing.team_member_id = op['team_member_id']
+                existing.updated_at = datetime.utcnow()
+            elif existing:
+                db.session.delete(existing)
+            elif op['team_member_id']:
+                db.session.add(TruckTeamAssignment(truck_id=op['truck_id'], team_member_id=op['team_member_id'],
+                                                   assignment_date=op['assignment_date']))
+            changes['team'].append((op['truck_id'], op['assignment_date']))
+            changes['dates'].add(op['assignment_date'])
+            continue
+
+        ticket = db.session.get(Ticket, op['ticket_id'])
+        changes['dates'].add(_day(ticket.scheduled_date))
+        if ticket.status == 'pending':
+            changes['pending'] = True
+
+        if op['op'] == 'assign':
+            ticket.truck_id = op['truck_id']
+            ticket.scheduled_date = op['scheduled_date']
+            ticket.status = 'scheduled'
+            ticket.route_position = place(positions.route_scope(ticket.truck_id, ticket.scheduled_date.date()),
+                                          op['route_position'], ticket)
+        elif op['op'] == 'unassign':
+            ticket.truck_id = None
+            ticket.scheduled_date = None
+            ticket.status = 'pending'
+            ticket.route_position = None
+        elif op['op'] == 'reorder':
+            ticket.route_position = place(positions.route_scope(ticket.truck_id, ticket.scheduled_date.date()),
+                                          op['route_position'], ticket)
+        elif op['op'] == 'move':
+            ticket.column_position = place(positions.column_scope(op['new_status']), op['new_position'], ticket)
+            ticket.status = op['new_status']
+
+        changes['dates'].add(_day(ticket.scheduled_date))
+        if ticket.status == 'pending':
+            changes['pending'] = True
+        if ticket.id not in changes['ticket_ids']:
+            changes['ticket_ids'].append(ticket.id)
+
+    changes['dates'].discard(None)
+    return changes
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Job Board Versioning for TrueTank
+
+This module handles:
+- Logging every write to tickets, truck team assignments and trucks to the
+  board_change table, in the same transaction as the write
+- A board version counter bumped inside every writing transaction, so
+  versions follow commit order
+- Per-date board versions (the newest change touching that date's board)
+- ETag / Last-Modified values for conditional GETs of the board
+- Working out which tickets changed since a version, for delta responses
+- Pruning old change rows without letting board versions go backwards
+
+A date's board shows the tickets scheduled on that date, the unscheduled
+pending tickets (shared by every date) and the truck list (also shared),
+so its version covers the board keys 'YYYY-MM-DD', 'pending' and 'all'.
+"""
+
+from typing import Dict, List, Optional, Tuple
+from datetime import date, datetime, timedelta
+import hashlib
+import os
+import time
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import db, BoardChange, BoardVersion, Ticket, Truck, TruckTeamAssignment
+
+PENDING_KEY = 'pending'
+ALL_KEY = 'all'
+PRUNED_KEY = '_pruned'  # watermark row: version is the highest pruned version
+VERSION_COUNTER = 'board'  # BoardVersion row every board write bumps
+
+BOARD_CHANGE_RETENTION_HOURS = int(os.environ.get('BOARD_CHANGE_RETENTION_HOURS', 24))
+BOARD_CHANGE_PRUNE_INTERVAL = int(os.environ.get('BOARD_CHANGE_PRUNE_INTERVAL', 3600))
+
+_last_prune = None
+
+
+def ticket_board_key(scheduled_date, status) -> Optional[str]:
+    """Board a ticket shows on: its scheduled date, the pending list, or none"""
+    if scheduled_date is not None:
+        return scheduled_date.date().isoformat() if isinstance(scheduled_date, datetime) else scheduled_date.isoformat()
+    if status == 'pending':
+        return PENDING_KEY
+    return None
+
+
+def board_keys(target_date: date) -> List[str]:
+    """Board keys whose changes show up on one date's board"""
+    return [target_date.isoformat(), PENDING_KEY, ALL_KEY]
+
+
+# Change logging
+
+def _previous(state, name):
+    """Value an attribute had before this flush"""
+    history = state.attrs[name].history
+    return history.deleted[0] if history.deleted else getattr(state.obj(), name)
+
+
+def _changes_for(obj, removed: bool = False) -> List[Dict]:
+    state = inspect(obj)
+    if isinstance(obj, Ticket):
+        entity, entity_id = 'ticket', obj.id
+        old_key = ticket_board_key(_previous(state, 'scheduled_date'), _previous(state, 'status'))
+        new_key = None if removed else ticket_board_key(obj.scheduled_date, obj.status)
+    elif isinstance(obj, TruckTeamAssignment):
+        entity, entity_id = 'team', obj.truck_id
+        old_value = _previous(state, 'assignment_date')
+        old_key = old_value.isoformat() if old_value else None
+        new_key = None if removed or not obj.assignment_date else obj.assignment_date.isoformat()
+    else:
+        entity, entity_id = 'truck', obj.id
+        old_key = new_key = ALL_KEY
+
+    keys = {key for key in (old_key, new_key) if key}
+    return [{'board_key': key, 'entity': entity, 'entity_id': entity_id} for key in sorted(keys)]
+
+
+def _next_version(connection, now: datetime) -> int:
+    """
+    Bump the board version counter on the writing transaction's connection
+
+    The counter row stays locked until that transaction ends, so a second
+    writer waits for the first to commit before taking the next number:
+    versions follow commit order, and once a reader sees version N every
+    write stamped N or lower is visible too.
+    """
+    table = BoardVersion.__table__
+    bump = table.update().where(table.c.name == VERSION_COUNTER).values(
+        version=table.c.version + 1, updated_at=now
+    ).returning(table.c.version)
+    version = connection.execute(bump).scalar()
+    if version is None:
+        dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+        connection.execute(dialect.insert(table).values(
+            name=VERSION_COUNTER, version=0, updated_at=now
+        ).on_conflict_do_nothing(index_elements=['name']))
+        version = connection.execute(bump).scalar()
+    return version
+
+
+def _record_board_changes(session, flush_context):
+    """after_flush: log board writes on the flush's own connection"""
+    rows = []
+    for obj in session.new:
+        if isinstance(obj, (Ticket, TruckTeamAssignment, Truck)):
+            rows.extend(_changes_for(obj))
+    for obj in session.dirty:
+        if isinstance(obj, (Ticket, TruckTeamAssignment, Truck)) and session.is_modified(obj, include_collections=False):
+            rows.extend(_changes_for(obj))
+    for obj in session.deleted:
+        if isinstance(obj, (Ticket, TruckTeamAssignment, Truck)):
+            rows.extend(_changes_for(obj, removed=True))
+
+    if rows:
+        connection = session.connection()
+        now = datetime.utcnow()
+        version = _next_version(connection, now)
+        for row in rows:
+            row['version'] = version
+            row['created_at'] = now
+        connection.execute(BoardChange.__table__.insert(), rows)
+
+
+def _record_bulk_changes(orm_execute_state):
+    """do_orm_execute: bulk UPDATE/DELETE can't say which rows they touched"""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ not in (Ticket, TruckTeamAssignment, Truck):
+        return
+    connection = orm_execute_state.session.connection()
+    now = datetime.utcnow()
+    connection.execute(BoardChange.__table__.insert().values(
+        version=_next_version(connection, now), board_key=ALL_KEY, entity='bulk', entity_id=None, created_at=now
+    ))
+
+
+event.listen(Session, 'after_flush', _record_board_changes)
+event.listen(Session, 'do_orm_execute', _record_bulk_changes)
+
+
+# Versions and conditional requests
+
+def board_version(target_date: date) -> Tuple[int, Optional[datetime]]:
+    """
+    Current version of a date's board and when it last changed
+
+    Returns:
+        (version, last_changed); version is 0 for a board never written to
+    """
+    maybe_prune()
+    latest = db.session.query(BoardChange.version, BoardChange.created_at).filter(
+        BoardChange.board_key.in_(board_keys(target_date))
+    ).order_by(BoardChange.version.desc()).first()
+    return (latest.version, latest.created_at) if latest else (0, None)
+
+
+def latest_version() -> int:
+    """Newest version of any board (at least as new as every date's version)"""
+    return db.session.query(BoardVersion.version).filter(BoardVersion.name == VERSION_COUNTER).scalar() or 0
+
+
+def board_etag(target_date: date, version: int, args) -> str:
+    """ETag for one rendering of a board (query parameters change the body)"""
+    variant = '&'.join(f"{key}={value}" for key, value in sorted(args.items(multi=True)) if key != 'date')
+    digest = hashlib.sha1(variant.encode()).hexdigest()[:8]
+    return f"board-{target_date.isoformat()}-{version}-{digest}"
+
+
+def last_modified_for(last_changed: Optional[datetime], now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    Last-Modified value for a board, or None if it is not safe to send one
+
+    HTTP dates have one-second resolution. Rounding the change time up to
+    the next second is only safe once that second is over; otherwise a
+    second write in the same second would be hidden behind a 304.
+    """
+    if last_changed is None:
+        return None
+    now = now or datetime.utcnow()
+    rounded = last_changed.replace(microsecond=0)
+    if rounded != last_changed:
+        rounded += timedelta(seconds=1)
+    return rounded if now >= rounded else None
+
+
+def is_not_modified(request, etag: str) -> bool:
+    """
+    True if the client's cached copy (If-None-Match) is current
+
+    If-Modified-Since alone never earns a 304: change times are taken at
+    flush, so a write committed after a client's fetch can carry an earlier
+    time. Only the commit-ordered version in the ETag is safe to compare.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    return False
+
+
+# Deltas
+
+def changes_since(target_date: date, since: int, version: int) -> Optional[Dict]:
+    """
+    What changed on a date's board after a version
+
+    Returns:
+        Dict with ticket_ids, pending (the pending list changed) and team
+        (crew assignments changed), or None when the client needs the full
+        board: unknown or pruned version, bulk writes, or truck changes
+    """
+    if since > version:
+        return None
+
+    watermark = db.session.query(func.max(BoardChange.version)).filter(
+        BoardChange.board_key == PRUNED_KEY
+    ).scalar()
+    if watermark and since < watermark:
+        return None
+
+    changes = BoardChange.query.filter(
+        BoardChange.board_key.in_(board_keys(target_date)),
+        BoardChange.version > since,
+        BoardChange.version <= version
+    ).all()
+
+    delta = {'ticket_ids': set(), 'pending': False, 'team': False}
+    for change in changes:
+        if change.entity in ('truck', 'bulk'):
+            return None
+        if change.entity == 'team':
+            delta['team'] = True
+        elif change.entity == 'ticket':
+            delta['ticket_ids'].add(change.entity_id)
+            if change.board_key == PENDING_KEY:
+                delta['pending'] = True
+    return delta
+
+
+def prune_changes(retention_hours: int = BOARD_CHANGE_RETENTION_HOURS) -> int:
+    """
+    Delete change rows older than the retention window
+
+    The newest row of every board key is kept so versions never go
+    backwards, and a watermark row records the highest pruned version so
+    deltas from before it fall back to a full board.
+
+    Returns:
+        Number of rows deleted
+    """
+    table = BoardChange.__table__
+    cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
+    try:
+        with db.engine.begin() as conn:
+            newest = db.select(func.max(table.c.version)).group_by(table.c.board_key)
+            doomed = db.and_(table.c.created_at < cutoff, table.c.board_key != PRUNED_KEY,
+                             table.c.version.not_in(newest))
+            highest = conn.execute(db.select(func.max(table.c.version)).where(doomed)).scalar()
+            if highest is None:
+                return 0
+            previous = conn.execute(
+                db.select(func.max(table.c.version)).where(table.c.board_key == PRUNED_KEY)
+            ).scalar()
+            deleted = conn.execute(table.delete().where(doomed)).rowcount
+            conn.execute(table.delete().where(table.c.board_key == PRUNED_KEY))
+            conn.execute(table.insert().values(
+                version=max(highest, previous or 0), board_key=PRUNED_KEY, entity='prune', entity_id=None,
+                created_at=datetime.utcnow()
+            ))
+            return deleted
+    except Exception as e:
+        print(f"Board change prune error: {e}")
+        return 0
+
+
+def maybe_prune():
+    """Prune at most once per BOARD_CHANGE_PRUNE_INTERVAL seconds per worker"""
+    global _last_prune
+    now = time.monotonic()
+    if _last_prune is not None and now - _last_prune < BOARD_CHANGE_PRUNE_INTERVAL:
+        return
+    _last_prune = now
+    prune_changes()
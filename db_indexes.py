@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Index Migration for TrueTank
+
+This module handles:
+- Creating the indexes declared on the models in databases whose tables
+  were created before them (db.create_all() skips existing tables)
+- Building them with CREATE INDEX CONCURRENTLY on Postgres so a live
+  tickets table is not locked against writes while they build
+
+Run from the command line:
+    python db_indexes.py            # create missing indexes
+    python db_indexes.py --list     # show declared indexes and whether they exist
+"""
+
+from typing import Dict, List, Optional
+import argparse
+
+from sqlalchemy import inspect, text
+
+from models import db, Ticket, SepticSystem, TruckTeamAssignment
+
+# Tables whose indexes were added after the first release
+MIGRATED_MODELS = (Ticket, SepticSystem, TruckTeamAssignment)
+
+
+def declared_indexes() -> List:
+    """Index objects the models declare (explicit and index=True columns)"""
+    indexes = []
+    for model in MIGRATED_MODELS:
+        indexes.extend(sorted(model.__table__.indexes, key=lambda index: index.name))
+    return indexes
+
+
+def missing_indexes() -> List:
+    """Declared indexes the database doesn't have yet"""
+    inspector = inspect(db.engine)
+    missing = []
+    for index in declared_indexes():
+        table = index.table.name
+        if not inspector.has_table(table):
+            continue
+        existing = {row['name'] for row in inspector.get_indexes(table)}
+        if index.name not in existing:
+            missing.append(index)
+    return missing
+
+
+def _create_statement(index, concurrently: bool) -> str:
+    columns = ', '.join(column.name for column in index.columns)
+    return (f"CREATE {'UNIQUE ' if index.unique else ''}INDEX {'CONCURRENTLY ' if concurrently else ''}"
+            f"IF NOT EXISTS {index.name} ON {index.table.name} ({columns})")
+
+
+def ensure_indexes(progress=None) -> Dict[str, bool]:
+    """
+    Create any declared indexes that are missing
+
+    Args:
+        progress: Optional callback for one line per index created
+
+    Returns:
+        Dict of index name -> True if created, False if creation failed
+    """
+    postgres = db.engine.dialect.name == 'postgresql'
+    results = {}
+    for index in missing_indexes():
+        statement = _create_statement(index, concurrently=postgres)
+        try:
+            if postgres:
+                # CONCURRENTLY can't run inside a transaction block
+                with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                    conn.execute(text(statement))
+            else:
+                with db.engine.begin() as conn:
+                    conn.execute(text(statement))
+            results[index.name] = True
+            if progress:
+                progress(f"Created {index.name} on {index.table.name}")
+        except Exception as e:
+            print(f"Index creation error ({index.name}): {e}")
+            results[index.name] = False
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Create indexes missing from an existing database')
+    parser.add_argument('--list', action='store_true', help='Show declared indexes without creating any')
+    args = parser.parse_args(argv)
+
+    from app import app
+    with app.app_context():
+        db.create_all()
+        if args.list:
+            missing = {index.name for index in missing_indexes()}
+            for index in declared_indexes():
+                columns = ', '.join(column.name for column in index.columns)
+                print(f"{'missing' if index.name in missing else 'ok':8} {index.name} ({columns})")
+            return
+
+        results = ensure_indexes(progress=print)
+        if not results:
+            print("All indexes present")
+        elif not all(results.values()):
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
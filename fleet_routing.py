@@ -0,0 +1,741 @@
+#!/usr/bin/env python3
+"""
+Fleet-Wide Vehicle Routing for TrueTank
+
+This module handles:
+- Assigning a service date's tickets to trucks and ordering each route
+- Tank capacity limits, with dump-site refills inserted where the tank fills
+- Shift length limits (drive + service + dump time)
+- Hard and soft time windows with priority-weighted lateness penalties
+- Greedy insertion, granular local search and ruin-and-recreate improvement
+  under a time budget with deterministic seeding
+
+Like route_optimization, the solver works on matrix indexes only, so it can
+be run without the database or a routing provider.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+import random
+import time
+
+from route_optimization import UNREACHABLE, improve_path
+
+INFINITY = float('inf')
+
+DEFAULT_SHIFT_MINUTES = 600
+DEFAULT_TIME_BUDGET = 10.0
+
+# Only try moves next to the closest few tickets (granular neighborhood)
+NEIGHBOR_COUNT = 12
+
+# Cost (in drive minutes) of leaving a ticket off the schedule, scaled by priority
+UNASSIGNED_PENALTY = 10000
+PRIORITY_WEIGHTS = {
+    'low': 0.5,
+    'medium': 1.0,
+    'high': 2.0,
+    'urgent': 4.0,
+}
+
+# Soft deadline (minutes after shift start) by priority; others only need the shift
+PRIORITY_TARGET_MINUTES = {
+    'urgent': 120,
+    'high': 240,
+}
+
+# Cost (in drive minutes) of each minute a job starts past its soft deadline
+LATENESS_WEIGHTS = {
+    'low': 0.25,
+    'medium': 0.5,
+    'high': 1.0,
+    'urgent': 3.0,
+}
+
+# Unassigned penalty multipliers for tickets due (or overdue) vs. requested later
+DUE_PENALTY_FACTOR = 2.0
+NOT_YET_DUE_PENALTY_FACTOR = 0.5
+
+# Share of tickets removed and reinserted per ruin-and-recreate iteration
+RUIN_FRACTION = 0.1
+
+# Evaluated routes kept in memory before the memo is reset
+EVALUATION_CACHE_SIZE = 200000
+
+
+def vehicle_end(vehicle: Dict) -> float:
+    """Clock minute a vehicle's shift ends"""
+    if vehicle.get('end_minutes') is not None:
+        return vehicle['end_minutes']
+    return (vehicle.get('start_minutes') or 0) + vehicle.get('shift_minutes', DEFAULT_SHIFT_MINUTES)
+
+
+class FleetProblem:
+    """
+    Immutable problem data plus route evaluation
+
+    Args:
+        durations: Drive-time matrix in minutes (None for unroutable pairs)
+        vehicles: Dicts with id, depot (matrix index), capacity (gallons
+            before a dump is required), max_load (absolute tank size),
+            start_load, start_minutes (clock time the shift starts, minutes
+            after midnight) and end_minutes or shift_minutes
+        jobs: Dicts with id, node (matrix index), service_minutes, gallons,
+            priority and optional earliest/latest (clock minutes), hard,
+            lateness_weight and unassigned_penalty
+        dump_sites: Dicts with id, node and service_minutes
+
+    Times are clock minutes so shifts and windows line up across trucks.
+    Arriving before a job's earliest time means waiting; starting after its
+    latest time makes the route infeasible for hard windows and costs
+    lateness_weight per minute for soft ones.
+    """
+
+    def __init__(self, durations: Sequence[Sequence[Optional[float]]], vehicles: List[Dict],
+                 jobs: List[Dict], dump_sites: Optional[List[Dict]] = None):
+        self.d = [[UNREACHABLE if value is None else value for value in row] for row in durations]
+        self.vehicles = vehicles
+        self.jobs = jobs
+        self.dump_sites = dump_sites or []
+        self.penalties = [
+            job['unassigned_penalty'] if job.get('unassigned_penalty') is not None
+            else UNASSIGNED_PENALTY * PRIORITY_WEIGHTS.get(job.get('priority'), 1.0)
+            for job in jobs
+        ]
+        self.lateness_weights = [
+            job['lateness_weight'] if job.get('lateness_weight') is not None
+            else LATENESS_WEIGHTS.get(job.get('priority'), 0.5)
+            for job in jobs
+        ]
+        self.neighbors = self._build_neighbors()
+        self._best_dump = {}
+        self._cache = {}
+
+    def _build_neighbors(self) -> List[List[int]]:
+        """The NEIGHBOR_COUNT closest other jobs for every job"""
+        nodes = [job['node'] for job in self.jobs]
+        neighbors = []
+        for i, a in enumerate(nodes):
+            row = self.d[a]
+            others = sorted((min(row[b], self.d[b][a]), j) for j, b in enumerate(nodes) if j != i)
+            neighbors.append([j for _, j in others[:NEIGHBOR_COUNT]])
+        return neighbors
+
+    def best_dump(self, a: int, b: int) -> Optional[Tuple[float, int]]:
+        """Cheapest dump site to visit between matrix nodes a and b as (minutes, dump index)"""
+        key = (a, b)
+        if key not in self._best_dump:
+            best = None
+            for k, site in enumerate(self.dump_sites):
+                node = site['node']
+                minutes = self.d[a][node] + self.d[node][b] + (site.get('service_minutes') or 0)
+                if best is None or minutes < best[0]:
+                    best = (minutes, k)
+            self._best_dump[key] = best
+        return self._best_dump[key]
+
+    def walk(self, vehicle_index: int, route: Sequence[int]) -> Optional[Dict]:
+        """
+        Drive a route and insert dumps wherever the next job would overfill the tank
+
+        Returns:
+            Dict with drive minutes, weighted lateness, cost (drive plus
+            lateness), duration, dumps and per-stop arrival/start clock times,
+            or None if the route is infeasible (dumps are (position, dump
+            index, arrival) and happen before route[position])
+        """
+        vehicle = self.vehicles[vehicle_index]
+        d = self.d
+        capacity = vehicle['capacity']
+        max_load = vehicle.get('max_load') or capacity
+        node = vehicle['depot']
+        load = vehicle.get('start_load') or 0
+        start_minutes = vehicle.get('start_minutes') or 0
+        clock = start_minutes
+        drive = 0.0
+        lateness = 0.0
+        dumps = []
+        arrivals = []
+        starts = []
+
+        for position, job_index in enumerate(route):
+            job = self.jobs[job_index]
+            gallons = job.get('gallons') or 0
+            if load + gallons > capacity and load > 0:
+                dump = self.best_dump(node, job['node'])
+                if dump is None or gallons > max_load:
+                    return None
+                site = self.dump_sites[dump[1]]
+                leg = d[node][site['node']]
+                drive += leg
+                clock += leg
+                dumps.append((position, dump[1], clock))
+                clock += site.get('service_minutes') or 0
+                node = site['node']
+                load = 0
+            elif load + gallons > max_load:
+                return None
+
+            leg = d[node][job['node']]
+            drive += leg
+            clock += leg
+            arrivals.append(clock)
+
+            earliest = job.get('earliest')
+            if earliest is not None and clock < earliest:
+                clock = earliest
+            latest = job.get('latest')
+            if latest is not None and clock > latest:
+                if job.get('hard'):
+                    return None
+                lateness += (clock - latest) * self.lateness_weights[job_index]
+            starts.append(clock)
+
+            clock += job.get('service_minutes') or 0
+            load += gallons
+            node = job['node']
+
+        leg = d[node][vehicle['depot']]
+        drive += leg
+        clock += leg
+        if drive >= UNREACHABLE or clock > vehicle_end(vehicle):
+            return None
+
+        return {
+            'drive': drive,
+            'lateness': lateness,
+            'cost': drive + lateness,
+            'duration': clock - start_minutes,
+            'end': clock,
+            'dumps': dumps,
+            'arrivals': arrivals,
+            'starts': starts,
+            'end_load': load
+        }
+
+    # Time-window segments
+    #
+    # A segment summarizes a stretch of route as (first node, last node,
+    # duration, time warp, earliest start, latest start): the shortest time
+    # from starting service at the first stop to finishing the last, how many
+    # minutes it would have to go back in time to meet every hard window, and
+    # the window in which service at the first stop can start without
+    # waiting being wasted or a window being missed. Two segments concatenate
+    # in O(1), so a move's feasibility comes from the pieces of the routes it
+    # changes instead of a walk over the whole route.
+
+    def visit_segment(self, job_index: int) -> Tuple:
+        job = self.jobs[job_index]
+        latest = job.get('latest') if job.get('hard') else None
+        return (job['node'], job['node'], job.get('service_minutes') or 0, 0.0,
+                job['earliest'] if job.get('earliest') is not None else -INFINITY,
+                latest if latest is not None else INFINITY)
+
+    def concat(self, first: Tuple, second: Tuple) -> Tuple:
+        """Segment of `first` followed by `second`"""
+        travel = self.d[first[1]][second[0]]
+        offset = first[2] - first[3] + travel
+        wait = max(second[4] - offset - first[5], 0)
+        warp = max(first[4] + offset - second[5], 0)
+        return (first[0], second[1], first[2] + second[2] + travel + wait, first[3] + second[3] + warp,
+                max(second[4] - offset, first[4]) - wait, min(second[5] - offset, first[5]) + warp)
+
+    def feasible(self, *segments: Tuple) -> bool:
+        """Whether segments driven in order meet every hard window and the shift end"""
+        total = segments[0]
+        for segment in segments[1:]:
+            total = self.concat(total, segment)
+        return total[3] <= 1e-9
+
+    def schedule(self, vehicle_index: int, route: Sequence[int]) -> Optional[Dict]:
+        """
+        Walk a route and build its forward and backward segments
+
+        prefix[p] is the route before route[p] as driven, dumps included;
+        suffix[p] is route[p:] plus the drive back to the depot, without
+        dumps (where they fall depends on the load brought in). middle holds
+        segments of route[i:j] built on first use for intra-route moves.
+        """
+        result = self.walk(vehicle_index, route)
+        if result is None:
+            return None
+
+        vehicle = self.vehicles[vehicle_index]
+        depot = vehicle['depot']
+        start = vehicle.get('start_minutes') or 0
+        prefix = [(depot, depot, 0.0, 0.0, start, start)]
+        for p, job_index in enumerate(route):
+            job = self.jobs[job_index]
+            finished = result['starts'][p] + (job.get('service_minutes') or 0)
+            prefix.append((depot, job['node'], finished - start, 0.0, start, start))
+
+        suffix = [None] * len(route) + [(depot, depot, 0.0, 0.0, -INFINITY, vehicle_end(vehicle))]
+        for p in range(len(route) - 1, -1, -1):
+            suffix[p] = self.concat(self.visit_segment(route[p]), suffix[p + 1])
+
+        result.update(route=list(route), prefix=prefix, suffix=suffix, middle={})
+        return result
+
+    def middle(self, schedule: Dict, i: int, j: int) -> Optional[Tuple]:
+        """Segment of route[i:j] (None when empty), memoized on the schedule"""
+        if i >= j:
+            return None
+        cache = schedule['middle']
+        if (i, j) not in cache:
+            segment = None
+            for k in range(i + 1, j + 1):
+                if (i, k) not in cache:
+                    last = self.visit_segment(schedule['route'][k - 1])
+                    cache[(i, k)] = self.concat(segment, last) if segment else last
+                segment = cache[(i, k)]
+        return cache[(i, j)]
+
+    def can_insert(self, schedule: Dict, vehicle_index: int, job_index: int, position: int) -> bool:
+        """
+        O(1) time-window check for inserting a job before route[position]
+
+        Exact unless the extra gallons move a dump, which only adds time, so
+        a False answer is always safe to skip.
+        """
+        return self.feasible(schedule['prefix'][position], self.visit_segment(job_index), schedule['suffix'][position])
+
+    def can_replace(self, schedule: Dict, position: int, job_index: int) -> bool:
+        """O(1) time-window check for putting a job in place of route[position] (one side of a swap)"""
+        return self.feasible(schedule['prefix'][position], self.visit_segment(job_index),
+                             schedule['suffix'][position + 1])
+
+    def can_relocate(self, schedule: Dict, position: int, target: int) -> bool:
+        """
+        Time-window check for moving route[position] within its route
+
+        target is the job's index in the route once it has been removed.
+        Apart from the memoized middle segment this is O(1).
+        """
+        moved = self.visit_segment(schedule['route'][position])
+        prefix, suffix = schedule['prefix'], schedule['suffix']
+        if target <= position:
+            between = self.middle(schedule, target, position)
+            pieces = (prefix[target], moved, between, suffix[position + 1])
+        else:
+            between = self.middle(schedule, position + 1, target + 1)
+            pieces = (prefix[position], between, moved, suffix[target + 1])
+        return self.feasible(*[piece for piece in pieces if piece is not None])
+
+    def cost(self, vehicle_index: int, route: Sequence[int]) -> Optional[float]:
+        """Memoized route cost (drive minutes plus lateness), or None if infeasible"""
+        if not route:
+            return 0.0
+        key = (vehicle_index, tuple(route))
+        if key in self._cache:
+            return self._cache[key]
+        if len(self._cache) > EVALUATION_CACHE_SIZE:
+            self._cache.clear()
+        result = self.walk(vehicle_index, route)
+        cost = result['cost'] if result else None
+        self._cache[key] = cost
+        return cost
+
+
+class FleetSolution:
+    """Routes per vehicle plus the unassigned jobs"""
+
+    def __init__(self, problem: FleetProblem):
+        self.problem = problem
+        self.routes = [[] for _ in problem.vehicles]
+        self.costs = [0.0 for _ in problem.vehicles]
+        self.schedules = [None for _ in problem.vehicles]
+        self.unassigned = set(range(len(problem.jobs)))
+
+    def copy(self) -> 'FleetSolution':
+        other = FleetSolution.__new__(FleetSolution)
+        other.problem = self.problem
+        other.routes = [list(route) for route in self.routes]
+        other.costs = list(self.costs)
+        other.schedules = list(self.schedules)
+        other.unassigned = set(self.unassigned)
+        return other
+
+    def objective(self) -> float:
+        penalties = self.problem.penalties
+        return sum(self.costs) + sum(penalties[j] for j in self.unassigned)
+
+    def locate(self) -> Dict[int, Tuple[int, int]]:
+        """Job index -> (vehicle index, position)"""
+        where = {}
+        for v, route in enumerate(self.routes):
+            for position, job_index in enumerate(route):
+                where[job_index] = (v, position)
+        return where
+
+    def set_route(self, vehicle_index: int, route: List[int], cost: float):
+        self.routes[vehicle_index] = route
+        self.costs[vehicle_index] = cost
+        self.schedules[vehicle_index] = None
+
+    def schedule(self, vehicle_index: int) -> Dict:
+        """Forward/backward schedule of a (feasible) route, built on first use"""
+        if self.schedules[vehicle_index] is None:
+            self.schedules[vehicle_index] = self.problem.schedule(vehicle_index, self.routes[vehicle_index])
+        return self.schedules[vehicle_index]
+
+
+def _insertion_candidates(solution: FleetSolution, job_index: int, where: Dict) -> List[Tuple[int, int]]:
+    """Positions next to neighboring jobs, plus one empty route per vehicle type"""
+    problem = solution.problem
+    candidates = set()
+    for neighbor in problem.neighbors[job_index]:
+        if neighbor in where:
+            v, position = where[neighbor]
+            candidates.add((v, position))
+            candidates.add((v, position + 1))
+
+    seen_empty = set()
+    for v, route in enumerate(solution.routes):
+        if not route:
+            vehicle = problem.vehicles[v]
+            signature = (vehicle['depot'], vehicle['capacity'], vehicle.get('start_load'),
+                         vehicle.get('start_minutes'), vehicle_end(vehicle))
+            if signature not in seen_empty:
+                seen_empty.add(signature)
+                candidates.add((v, 0))
+    return sorted(candidates)
+
+
+def _best_insertion(solution: FleetSolution, job_index: int, where: Dict,
+                    exhaustive: bool = False) -> Optional[Tuple[float, int, List[int], float]]:
+    """Cheapest feasible insertion of a job as (delta, vehicle, new route, new cost)"""
+    problem = solution.problem
+    if exhaustive:
+        candidates = [(v, position) for v, route in enumerate(solution.routes) for position in range(len(route) + 1)]
+    else:
+        candidates = _insertion_candidates(solution, job_index, where)
+
+    best = None
+    for v, position in candidates:
+        route = solution.routes[v]
+        if route and not problem.can_insert(solution.schedule(v), v, job_index, position):
+            continue
+        new_route = route[:position] + [job_index] + route[position:]
+        cost = problem.cost(v, new_route)
+        if cost is None:
+            continue
+        delta = cost - solution.costs[v]
+        if best is None or delta < best[0]:
+            best = (delta, v, new_route, cost)
+    return best
+
+
+def insert_jobs(solution: FleetSolution, job_indexes: Sequence[int], rng: random.Random):
+    """Greedily insert jobs (highest priority first) at their cheapest feasible position"""
+    problem = solution.problem
+    order = list(job_indexes)
+    rng.shuffle(order)
+    order.sort(key=lambda j: -problem.penalties[j])
+
+    for job_index in order:
+        where = solution.locate()
+        best = _best_insertion(solution, job_index, where)
+        if best is None:
+            best = _best_insertion(solution, job_index, where, exhaustive=True)
+        if best is not None:
+            _, v, new_route, cost = best
+            solution.set_route(v, new_route, cost)
+            solution.unassigned.discard(job_index)
+
+
+def _improve_sequence(solution: FleetSolution, v: int) -> bool:
+    """Reorder one route with 2-opt/Or-opt on its drive times"""
+    problem = solution.problem
+    route = solution.routes[v]
+    if len(route) < 3:
+        return False
+
+    depot = problem.vehicles[v]['depot']
+    nodes = [depot] + [problem.jobs[j]['node'] for j in route] + [depot]
+    local = [[problem.d[a][b] for b in nodes] for a in nodes]
+    path = list(range(len(nodes)))
+    improve_path(local, path)
+    new_route = [route[i - 1] for i in path[1:-1]]
+    if new_route == route:
+        return False
+
+    cost = problem.cost(v, new_route)
+    if cost is not None and cost < solution.costs[v] - 1e-9:
+        solution.set_route(v, new_route, cost)
+        return True
+    return False
+
+
+def local_search(solution: FleetSolution, rng: random.Random, deadline: Optional[float] = None,
+                 jobs: Optional[Sequence[int]] = None):
+    """
+    Relocate and swap jobs between neighboring positions until no move improves
+
+    Args:
+        solution: Solution improved in place
+        rng: Random source for the job visiting order
+        deadline: perf_counter() value to stop at
+        jobs: Restrict moves to these jobs (defaults to every assigned job)
+    """
+    problem = solution.problem
+    improved = True
+    while improved:
+        improved = False
+        where = solution.locate()
+        candidates = [j for j in (jobs if jobs is not None else where) if j in where]
+        rng.shuffle(candidates)
+
+        for job_index in candidates:
+            if deadline is not None and time.perf_counter() > deadline:
+                return
+            if job_index not in where:
+                continue
+            v, position = where[job_index]
+            route = solution.routes[v]
+            removed = route[:position] + route[position + 1:]
+            removed_cost = problem.cost(v, removed)
+            if removed_cost is None:
+                continue
+
+            best = None
+            for neighbor in problem.neighbors[job_index]:
+                if neighbor not in where:
+                    continue
+                w, neighbor_position = where[neighbor]
+
+                # Relocate next to the neighbor
+                for offset in (0, 1):
+                    if w == v:
+                        base = removed
+                        target = neighbor_position - (1 if neighbor_position > position else 0) + offset
+                        if target == position or not problem.can_relocate(solution.schedule(v), position, target):
+                            continue
+                        new_route = base[:target] + [job_index] + base[target:]
+                        cost = problem.cost(v, new_route)
+                        if cost is None:
+                            continue
+                        delta = cost - solution.costs[v]
+                        move = ((v, new_route, cost),)
+                    else:
+                        target_route = solution.routes[w]
+                        target = neighbor_position + offset
+                        if not problem.can_insert(solution.schedule(w), w, job_index, target):
+                            continue
+                        new_route = target_route[:target] + [job_index] + target_route[target:]
+                        cost = problem.cost(w, new_route)
+                        if cost is None:
+                            continue
+                        delta = (removed_cost + cost) - (solution.costs[v] + solution.costs[w])
+                        move = ((v, removed, removed_cost), (w, new_route, cost))
+                    if delta < -1e-9 and (best is None or delta < best[0]):
+                        best = (delta, move)
+
+                # Swap with the neighbor
+                if (w != v and problem.can_replace(solution.schedule(v), position, neighbor)
+                        and problem.can_replace(solution.schedule(w), neighbor_position, job_index)):
+                    route_v = list(route)
+                    route_w = list(solution.routes[w])
+                    route_v[position] = neighbor
+                    route_w[neighbor_position] = job_index
+                    cost_v = problem.cost(v, route_v)
+                    cost_w = problem.cost(w, route_w) if cost_v is not None else None
+                    if cost_w is not None:
+                        delta = (cost_v + cost_w) - (solution.costs[v] + solution.costs[w])
+                        if delta < -1e-9 and (best is None or delta < best[0]):
+                            best = (delta, ((v, route_v, cost_v), (w, route_w, cost_w)))
+
+            if best is not None:
+                for vehicle_index, new_route, cost in best[1]:
+                    solution.set_route(vehicle_index, new_route, cost)
+                    _improve_sequence(solution, vehicle_index)
+                where = solution.locate()
+                improved = True
+
+        # Try again to fit anything left over
+        if solution.unassigned:
+            before = len(solution.unassigned)
+            insert_jobs(solution, sorted(solution.unassigned), rng)
+            improved = improved or len(solution.unassigned) < before
+
+
+def _ruin(solution: FleetSolution, rng: random.Random) -> List[int]:
+    """Remove a cluster of related jobs (or a random sample) from the solution"""
+    problem = solution.problem
+    where = solution.locate()
+    assigned = sorted(where)
+    if not assigned:
+        return []
+
+    count = max(2, int(len(assigned) * RUIN_FRACTION))
+    if rng.random() < 0.5:
+        seed_job = rng.choice(assigned)
+        removed = [seed_job] + [j for j in problem.neighbors[seed_job] if j in where]
+        removed = removed[:count]
+    else:
+        removed = rng.sample(assigned, min(count, len(assigned)))
+
+    removed_set = set(removed)
+    for v, route in enumerate(solution.routes):
+        if any(j in removed_set for j in route):
+            new_route = [j for j in route if j not in removed_set]
+            # Removing a job can only be infeasible if it strands a dump; rebuild from scratch then
+            cost = problem.cost(v, new_route)
+            if cost is None:
+                removed_set.update(new_route)
+                new_route, cost = [], 0.0
+            solution.set_route(v, new_route, cost)
+    solution.unassigned.update(removed_set)
+    return sorted(removed_set)
+
+
+def ticket_time_window(priority: str, service_type: Optional[str], requested_service_date,
+                       service_date, shift_start: float) -> Dict:
+    """
+    Soft window, lateness weight and unassigned penalty for a ticket
+
+    Emergency Service tickets count as urgent, and tickets due on or before
+    the service date count as at least high priority. Urgent and high jobs
+    get a soft deadline a few hours into the shift so they are done early;
+    everything else only has to fit in the shift.
+
+    Args:
+        priority: Ticket priority (low, medium, high, urgent)
+        service_type: Ticket service type
+        requested_service_date: Date the customer wants service by (or None)
+        service_date: Date being planned
+        shift_start: Clock minute the crew starts
+
+    Returns:
+        Dict with priority, latest, hard, lateness_weight and unassigned_penalty
+    """
+    effective = priority if priority in PRIORITY_WEIGHTS else 'medium'
+    if service_type == 'Emergency Service':
+        effective = 'urgent'
+
+    penalty_factor = 1.0
+    if requested_service_date is not None:
+        if requested_service_date <= service_date:
+            penalty_factor = DUE_PENALTY_FACTOR
+            if PRIORITY_WEIGHTS[effective] < PRIORITY_WEIGHTS['high']:
+                effective = 'high'
+        else:
+            penalty_factor = NOT_YET_DUE_PENALTY_FACTOR
+
+    target = PRIORITY_TARGET_MINUTES.get(effective)
+    return {
+        'priority': effective,
+        'latest': shift_start + target if target is not None else None,
+        'hard': False,
+        'lateness_weight': LATENESS_WEIGHTS[effective],
+        'unassigned_penalty': UNASSIGNED_PENALTY * PRIORITY_WEIGHTS[effective] * penalty_factor
+    }
+
+
+def solve_fleet(durations: Sequence[Sequence[Optional[float]]], vehicles: List[Dict], jobs: List[Dict],
+                dump_sites: Optional[List[Dict]] = None, time_budget: float = DEFAULT_TIME_BUDGET,
+                seed: int = 0, max_iterations: Optional[int] = None) -> Dict:
+    """
+    Assign jobs to vehicles and order every route
+
+    The same seed and max_iterations always give the same answer; with only
+    a time budget, a faster machine may run more improvement iterations.
+
+    Args:
+        durations: Drive-time matrix in minutes
+        vehicles: Vehicle dicts (see FleetProblem)
+        jobs: Job dicts (see FleetProblem)
+        dump_sites: Dump site dicts (see FleetProblem)
+        time_budget: Seconds to spend in total
+        seed: Random seed
+        max_iterations: Optional cap on ruin-and-recreate iterations
+
+    Returns:
+        Dict with routes, unassigned job indexes, total_drive_minutes,
+        objective, iterations and elapsed_ms
+    """
+    started = time.perf_counter()
+    deadline = started + time_budget
+    rng = random.Random(seed)
+    problem = FleetProblem(durations, vehicles, jobs, dump_sites)
+
+    solution = FleetSolution(problem)
+    insert_jobs(solution, range(len(jobs)), rng)
+    for v in range(len(vehicles)):
+        _improve_sequence(solution, v)
+    local_search(solution, rng, deadline)
+
+    best = solution.copy()
+    best_objective = best.objective()
+    current_objective = best_objective
+    iterations = 0
+
+    while time.perf_counter() < deadline and (max_iterations is None or iterations < max_iterations):
+        iterations += 1
+        candidate = solution.copy()
+        removed = _ruin(candidate, rng)
+        insert_jobs(candidate, sorted(candidate.unassigned), rng)
+        touched = {j for j in removed}
+        for j in removed:
+            touched.update(problem.neighbors[j])
+        local_search(candidate, rng, deadline, jobs=sorted(touched))
+
+        objective = candidate.objective()
+        if objective < current_objective - 1e-9:
+            solution, current_objective = candidate, objective
+            if objective < best_objective - 1e-9:
+                best, best_objective = candidate.copy(), objective
+
+    return describe_solution(best, iterations, started)
+
+
+def describe_solution(solution: FleetSolution, iterations: int, started: float) -> Dict:
+    """Turn a solution into plain dicts with stops, dumps and clock times"""
+    problem = solution.problem
+    routes = []
+    total_drive = 0.0
+    total_lateness = 0.0
+    for v, route in enumerate(solution.routes):
+        vehicle = problem.vehicles[v]
+        if not route:
+            routes.append({'vehicle_id': vehicle['id'], 'stops': [], 'drive_minutes': 0,
+                           'duration_minutes': 0, 'lateness': 0, 'gallons': 0, 'dump_count': 0})
+            continue
+
+        result = problem.walk(v, route)
+        dumps_before = {position: (dump, arrival) for position, dump, arrival in result['dumps']}
+        stops = []
+        for position, job_index in enumerate(route):
+            if position in dumps_before:
+                dump, arrival = dumps_before[position]
+                stops.append({'type': 'dump', 'dump_index': dump, 'arrival_minutes': round(arrival, 1)})
+            job = problem.jobs[job_index]
+            start = result['starts'][position]
+            stops.append({
+                'type': 'job',
+                'job_index': job_index,
+                'arrival_minutes': round(result['arrivals'][position], 1),
+                'start_minutes': round(start, 1),
+                'minutes_late': round(max(0, start - job['latest']), 1) if job.get('latest') is not None else 0
+            })
+
+        total_drive += result['drive']
+        total_lateness += result['lateness']
+
+        routes.append({
+            'vehicle_id': vehicle['id'],
+            'stops': stops,
+            'drive_minutes': round(result['drive'], 1),
+            'duration_minutes': round(result['duration'], 1),
+            'lateness': round(result['lateness'], 1),
+            'gallons': round(sum(problem.jobs[j].get('gallons') or 0 for j in route), 1),
+            'dump_count': len(result['dumps'])
+        })
+
+    return {
+        'routes': routes,
+        'unassigned': sorted(solution.unassigned),
+        'total_drive_minutes': round(total_drive, 1),
+        'total_lateness': round(total_lateness, 1),
+        'objective': round(solution.objective(), 1),
+        'iterations': iterations,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Bulk Geocoding Backfill for TrueTank
+
+This module handles:
+- Finding customers, septic systems, locations and dump sites without coordinates
+- Geocoding them through the shared geocode cache under the provider rate limits
+- Checkpointing progress per record type so an interrupted run resumes where it stopped
+- Throughput, ETA and failure reporting
+- Running as a background job (POST /api/geocode-backfill), reporting progress on the job
+
+Run from the command line:
+    python geocode_backfill.py                      # backfill everything
+    python geocode_backfill.py --kinds customer --limit 500
+    python geocode_backfill.py --retry-failed       # revisit records that failed before
+    python geocode_backfill.py --status
+"""
+
+from typing import Callable, Dict, List, Optional, Sequence
+from datetime import datetime
+import argparse
+import json
+import time
+
+import geocoding
+import jobs
+from models import db, Customer, SepticSystem, Location, DumpSite, GeocodeBackfillCheckpoint
+from spatial import ensure_spatial_columns, parse_gps_coordinates
+
+# Depots and dump sites first: every route needs them, and there are few
+BACKFILL_ORDER = ('location', 'dump_site', 'customer', 'septic_system')
+
+BACKFILL_MODELS = {
+    'customer': Customer,
+    'septic_system': SepticSystem,
+    'location': Location,
+    'dump_site': DumpSite,
+}
+
+DEFAULT_BATCH_SIZE = 50
+
+# Failures listed per record type in status reports
+FAILURE_SAMPLE_SIZE = 20
+
+
+def record_address(kind: str, record) -> Optional[str]:
+    """
+    Address to geocode for a record (septic systems use their customer's address)
+
+    The same string routing uses, so a backfilled address is a cache hit there.
+    """
+    if kind == 'septic_system':
+        record = record.customer
+        if record is None:
+            return None
+    return geocoding.record_address(record)
+
+
+def missing_coordinates(kind: str):
+    """Query for records of a type that have no usable coordinates"""
+    model = BACKFILL_MODELS[kind]
+    return model.query.filter(model.latitude.is_(None))
+
+
+def get_checkpoint(kind: str) -> GeocodeBackfillCheckpoint:
+    """Load (or start) the checkpoint row for a record type"""
+    checkpoint = GeocodeBackfillCheckpoint.query.filter_by(kind=kind).first()
+    if checkpoint is None:
+        checkpoint = GeocodeBackfillCheckpoint(kind=kind, last_id=0, processed=0, geocoded=0, failed=0)
+        db.session.add(checkpoint)
+        db.session.flush()
+    return checkpoint
+
+
+def _locate(kind: str, record, providers: Sequence[str]):
+    """
+    Find coordinates for one record
+
+    Returns:
+        ((latitude, longitude), None) on success or (None, reason) on failure
+    """
+    coords = parse_gps_coordinates(record.gps_coordinates)
+    if coords:
+        return coords, None
+
+    if kind == 'septic_system' and record.customer and record.customer.latitude is not None:
+        return (record.customer.latitude, record.customer.longitude), None
+
+    address = record_address(kind, record)
+    if not address:
+        return None, 'no address'
+
+    # Wait out rate limits rather than skipping providers: nobody is waiting on us
+    result = geocoding.geocode(address, providers=providers, rate_limit_wait=None)
+    if not result:
+        return None, 'not found'
+    return (result['latitude'], result['longitude']), None
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{(seconds % 3600) // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+def run_backfill(kinds: Optional[Sequence[str]] = None,
+                 providers: Sequence[str] = geocoding.DEFAULT_PROVIDERS,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 limit: Optional[int] = None,
+                 retry_failed: bool = False,
+                 progress: Optional[Callable[[str], None]] = print) -> Dict:
+    """
+    Geocode every record missing coordinates, resuming from the last checkpoint
+
+    Each batch's coordinate updates and its checkpoint are committed together,
+    so a crash or Ctrl-C loses at most one batch (whose lookups are still in
+    the geocode cache, so redoing it costs no provider calls).
+
+    Args:
+        kinds: Record types to backfill (defaults to BACKFILL_ORDER)
+        providers: Geocoding providers to try, in order
+        batch_size: Records per commit
+        limit: Stop after this many records (e.g. to stay inside a daily quota)
+        retry_failed: Start over from the first record so earlier failures are retried
+        progress: Callback for progress lines (None for silence)
+
+    Returns:
+        Report dict with per-type counts, throughput and provider usage
+    """
+    kinds = [kind for kind in BACKFILL_ORDER if kind in (kinds or BACKFILL_ORDER)]
+    log = progress or (lambda message: None)
+    stats_before = geocoding.get_geocode_stats()
+    started = time.perf_counter()
+
+    report = {'kinds': {}, 'processed': 0, 'geocoded': 0, 'failed': 0, 'interrupted': False}
+    remaining_limit = limit
+
+    try:
+        for kind in kinds:
+            if remaining_limit is not None and remaining_limit <= 0:
+                break
+
+            model = BACKFILL_MODELS[kind]
+            checkpoint = get_checkpoint(kind)
+            if retry_failed:
+                checkpoint.last_id = 0
+                checkpoint.failed = 0
+                checkpoint.failures = None
+                checkpoint.completed_at = None
+            failures = json.loads(checkpoint.failures or '{}')
+            db.session.commit()
+
+            pending = missing_coordinates(kind).filter(model.id > checkpoint.last_id)
+            total = pending.count()
+            counts = {'total': total, 'processed': 0, 'geocoded': 0, 'failed': 0}
+            report['kinds'][kind] = counts
+            log(f"{kind}: {total} records to geocode (resuming after id {checkpoint.last_id})")
+            kind_started = time.perf_counter()
+
+            while remaining_limit is None or remaining_limit > 0:
+                size = batch_size if remaining_limit is None else min(batch_size, remaining_limit)
+                batch = pending.filter(model.id > checkpoint.last_id).order_by(model.id).limit(size).all()
+                if not batch:
+                    checkpoint.completed_at = datetime.utcnow()
+                    db.session.commit()
+                    break
+
+                for record in batch:
+                    coords, reason = _locate(kind, record, providers)
+                    if coords:
+                        record.latitude, record.longitude = coords
+                        record.gps_coordinates = f"{coords[0]},{coords[1]}"
+                        counts['geocoded'] += 1
+                        checkpoint.geocoded += 1
+                    else:
+                        failures[str(record.id)] = reason
+                        counts['failed'] += 1
+                        checkpoint.failed += 1
+                    counts['processed'] += 1
+                    checkpoint.processed += 1
+                    checkpoint.last_id = record.id
+
+                checkpoint.failures = json.dumps(failures) if failures else None
+                db.session.commit()
+
+                if remaining_limit is not None:
+                    remaining_limit -= len(batch)
+                elapsed = time.perf_counter() - kind_started
+                rate = counts['processed'] / elapsed if elapsed > 0 else 0
+                eta = (total - counts['processed']) / rate if rate > 0 else 0
+                log(f"{kind}: {counts['processed']}/{total} "
+                    f"({counts['geocoded']} geocoded, {counts['failed']} failed) "
+                    f"{rate:.2f} records/s, ETA {_format_duration(eta)}")
+    except KeyboardInterrupt:
+        db.session.rollback()
+        report['interrupted'] = True
+        log("Interrupted - progress up to the last committed batch is saved")
+
+    elapsed = time.perf_counter() - started
+    stats_after = geocoding.get_geocode_stats()
+    for counts in report['kinds'].values():
+        for key in ('processed', 'geocoded', 'failed'):
+            report[key] += counts[key]
+    report['elapsed_seconds'] = round(elapsed, 1)
+    report['records_per_second'] = round(report['processed'] / elapsed, 2) if elapsed > 0 else None
+    report['cache_hits'] = ((stats_after['memory_hits'] - stats_before['memory_hits'])
+                            + (stats_after['db_hits'] - stats_before['db_hits']))
+    report['provider_calls'] = stats_after['provider_calls'] - stats_before['provider_calls']
+    report['rate_limited'] = stats_after['rate_limited'] - stats_before['rate_limited']
+    return report
+
+
+@jobs.task('geocode_backfill')
+def backfill_job(payload: Dict) -> Dict:
+    """Job entry point; safe to retry since every run resumes from the checkpoints"""
+    kinds = payload.get('kinds')
+    if isinstance(kinds, str):
+        kinds = [kind.strip() for kind in kinds.split(',')]
+    unknown = [kind for kind in kinds or [] if kind not in BACKFILL_MODELS]
+    if unknown:
+        raise ValueError(f"Unknown record type: {', '.join(unknown)}")
+    return run_backfill(kinds=kinds, limit=payload.get('limit'), retry_failed=payload.get('retry_failed', False),
+                        progress=lambda line: jobs.report_progress(message=line))
+
+
+def backfill_status(kinds: Optional[Sequence[str]] = None) -> Dict:
+    """Records still missing coordinates, checkpoint totals and a sample of failures per type"""
+    status = {}
+    for kind in kinds or BACKFILL_ORDER:
+        model = BACKFILL_MODELS[kind]
+        checkpoint = GeocodeBackfillCheckpoint.query.filter_by(kind=kind).first()
+        failures = json.loads(checkpoint.failures or '{}') if checkpoint else {}
+
+        sample = []
+        for record_id, reason in list(failures.items())[:FAILURE_SAMPLE_SIZE]:
+            record = db.session.get(model, int(record_id))
+            if record is None or record.latitude is not None:
+                continue  # deleted or fixed since
+            sample.append({'id': record.id, 'address': record_address(kind, record), 'reason': reason})
+
+        status[kind] = {
+            'total': model.query.count(),
+            'missing': missing_coordinates(kind).count(),
+            'checkpoint': checkpoint.to_dict() if checkpoint else None,
+            'failures': sample
+        }
+    return status
+
+
+def _print_report(report: Dict):
+    print()
+    for kind, counts in report['kinds'].items():
+        print(f"  {kind:14} {counts['geocoded']:6} geocoded {counts['failed']:6} failed of {counts['total']}")
+    print(f"  {report['processed']} records in {_format_duration(report['elapsed_seconds'])} "
+          f"({report['records_per_second'] or 0} records/s)")
+    print(f"  {report['provider_calls']} provider calls, {report['cache_hits']} cache hits, "
+          f"{report['rate_limited']} rate-limited skips")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Geocode records that have no coordinates')
+    parser.add_argument('--kinds', help=f"Comma-separated record types ({', '.join(BACKFILL_ORDER)})")
+    parser.add_argument('--providers', default=','.join(geocoding.DEFAULT_PROVIDERS),
+                        help='Comma-separated geocoding providers, in order')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--limit', type=int, help='Stop after this many records')
+    parser.add_argument('--retry-failed', action='store_true', help='Retry records that failed in earlier runs')
+    parser.add_argument('--status', action='store_true', help='Show progress without geocoding')
+    args = parser.parse_args(argv)
+
+    kinds = [kind.strip() for kind in args.kinds.split(',')] if args.kinds else None
+    unknown = [kind for kind in kinds or [] if kind not in BACKFILL_MODELS]
+    if unknown:
+        parser.error(f"Unknown record type: {', '.join(unknown)}")
+
+    from app import app
+    with app.app_context():
+        db.create_all()
+        ensure_spatial_columns()
+
+        if args.status:
+            for kind, info in backfill_status(kinds).items():
+                print(f"{kind}: {info['missing']} of {info['total']} missing coordinates")
+                for failure in info['failures']:
+                    print(f"    #{failure['id']} {failure['reason']}: {failure['address']}")
+            return
+
+        report = run_backfill(
+            kinds=kinds,
+            providers=[provider.strip() for provider in args.providers.split(',')],
+            batch_size=args.batch_size,
+            limit=args.limit,
+            retry_failed=args.retry_failed
+        )
+        _print_report(report)
+
+
+if __name__ == '__main__':
+    main()
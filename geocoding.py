@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+"""
+Geocoding and Geocode Cache for TrueTank
+
+This module handles:
+- The address string used for a customer, location or dump site everywhere,
+  and the coordinates already stored on it
+- Address normalization for cache keys
+- In-process LRU cache in front of the database cache
+- Database-backed geocode cache with per-entry TTL
+- Provider lookups (OpenRouteService, Nominatim) with fallback
+- Token-bucket rate limits per provider (Nominatim's 1 req/s policy, ORS
+  quota), shared by every worker through the rate_limit_bucket table
+- One provider lookup for concurrent misses of the same address (singleflight)
+"""
+
+from typing import Dict, Optional, Sequence
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import os
+import re
+import threading
+import time
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+import http_client
+from models import db, GeocodeCache, RateLimitBucket
+import singleflight
+
+OPENROUTE_BASE_URL = 'https://api.openrouteservice.org'
+NOMINATIM_URL = 'https://nominatim.openstreetmap.org/search'
+NOMINATIM_USER_AGENT = 'TrueTank-Septic-Service/1.0'  # Required by Nominatim
+
+# How long a geocoded address stays valid before we ask the provider again
+GEOCODE_CACHE_TTL_SECONDS = int(os.environ.get('GEOCODE_CACHE_TTL_SECONDS', 180 * 24 * 3600))
+GEOCODE_LRU_SIZE = int(os.environ.get('GEOCODE_LRU_SIZE', 4096))
+
+DEFAULT_PROVIDERS = ('openroute', 'nominatim')
+
+# Provider rate limits, shared by the web and job processes. Nominatim's
+# usage policy allows one request per second; the ORS free plan allows 100
+# geocodes/minute and 1,000/day.
+NOMINATIM_REQUESTS_PER_SECOND = float(os.environ.get('NOMINATIM_REQUESTS_PER_SECOND', 1.0))
+ORS_GEOCODE_PER_MINUTE = int(os.environ.get('ORS_GEOCODE_PER_MINUTE', 100))
+ORS_GEOCODE_PER_DAY = int(os.environ.get('ORS_GEOCODE_PER_DAY', 1000))
+
+# Longest an interactive lookup waits for a rate-limit token before trying
+# the next provider
+GEOCODE_RATE_LIMIT_WAIT = float(os.environ.get('GEOCODE_RATE_LIMIT_WAIT', 5))
+
+# Common street suffix / direction spellings collapsed so that
+# "123 Main Street" and "123 main st." share a cache entry
+ADDRESS_ABBREVIATIONS = {
+    'street': 'st',
+    'avenue': 'ave',
+    'road': 'rd',
+    'drive': 'dr',
+    'lane': 'ln',
+    'boulevard': 'blvd',
+    'court': 'ct',
+    'place': 'pl',
+    'highway': 'hwy',
+    'parkway': 'pkwy',
+    'circle': 'cir',
+    'terrace': 'ter',
+    'turnpike': 'tpke',
+    'north': 'n',
+    'south': 's',
+    'east': 'e',
+    'west': 'w',
+}
+
+
+def format_address(street_address: Optional[str], city: Optional[str] = None, state: Optional[str] = None,
+                   zip_code: Optional[str] = None) -> Optional[str]:
+    """
+    "street, city, state, zip" with empty parts left out, or None without a street
+
+    Routing, the geocode endpoints and the backfill all build addresses
+    with this, so a place is geocoded (and cached) under one key.
+    """
+    if not street_address or not street_address.strip():
+        return None
+    return ', '.join(part.strip() for part in (street_address, city, state, zip_code) if part and part.strip())
+
+
+def record_address(record) -> Optional[str]:
+    """Address of a customer, location or dump site"""
+    return format_address(record.street_address, record.city, record.state, record.zip_code)
+
+
+def record_coordinates(record) -> Optional[Dict]:
+    """Coordinates stored on a customer, location or dump site (geocoded or backfilled), or None"""
+    if record.latitude is None or record.longitude is None:
+        return None
+    return {'latitude': record.latitude, 'longitude': record.longitude}
+
+
+def normalize_address(address: str) -> str:
+    """
+    Build the cache key for an address
+
+    Lowercases, strips punctuation, collapses whitespace and abbreviates
+    common street suffixes so trivially different spellings of the same
+    address map to one cache entry.
+    """
+    if not address:
+        return ''
+
+    text = address.lower().replace('#', ' ')
+    text = re.sub(r'[^\w\s,]', '', text)
+    parts = []
+    for part in text.split(','):
+        words = [ADDRESS_ABBREVIATIONS.get(word, word) for word in part.split()]
+        if words:
+            parts.append(' '.join(words))
+    return ', '.join(parts)
+
+
+class LRUCache:
+    """Small thread-safe LRU cache with per-entry expiry"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= datetime.utcnow():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value, expires_at: Optional[datetime] = None):
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_memory_cache = LRUCache(GEOCODE_LRU_SIZE)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket
+
+    Holds up to `capacity` tokens and refills at `rate` tokens per second.
+    Buckets created with blocking=False never wait (used for daily quotas,
+    where waiting for a refill is pointless).
+    """
+
+    def __init__(self, rate: float, capacity: float, blocking: bool = True):
+        self.rate = rate
+        self.capacity = capacity
+        self.blocking = blocking
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """Take a token if one is available; otherwise return the seconds until one is"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate if self.rate > 0 else float('inf')
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Take a token, sleeping for a refill if needed
+
+        Args:
+            timeout: Longest to wait in seconds (None waits as long as it takes)
+
+        Returns:
+            True if a token was taken
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return True
+            if not self.blocking or wait == float('inf'):
+                return False
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining < wait:
+                    return False
+            time.sleep(wait)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket kept in the rate_limit_bucket table
+
+    Every process draws from the same row, and a restart doesn't refill a
+    daily quota. Tokens are taken with a compare-and-set update, so no row
+    lock is held. If the table can't be used, the bucket falls back to this
+    process's own tokens.
+    """
+
+    # Compare-and-set attempts before reporting a short wait instead
+    CONTENTION_RETRIES = 10
+    CONTENTION_WAIT = 0.05
+
+    def __init__(self, name: str, rate: float, capacity: float, blocking: bool = True):
+        super().__init__(rate, capacity, blocking)
+        self.name = name
+
+    def try_acquire(self) -> float:
+        try:
+            return self._try_acquire_shared()
+        except Exception as e:
+            print(f"Shared rate limit error for {self.name}: {e}")
+            return super().try_acquire()
+
+    def _try_acquire_shared(self) -> float:
+        table = RateLimitBucket.__table__
+        for _ in range(self.CONTENTION_RETRIES):
+            now = datetime.utcnow()
+            with db.engine.begin() as conn:
+                row = conn.execute(
+                    db.select(table.c.tokens, table.c.updated_at).where(table.c.name == self.name)
+                ).first()
+                if row is None:
+                    dialect = postgresql if conn.dialect.name == 'postgresql' else sqlite
+                    inserted = conn.execute(dialect.insert(table).values(
+                        name=self.name, tokens=self.capacity - 1, updated_at=now
+                    ).on_conflict_do_nothing(index_elements=['name'])).rowcount
+                    if inserted:
+                        return 0.0
+                    continue
+
+                elapsed = max(0.0, (now - row.updated_at).total_seconds())
+                tokens = min(self.capacity, row.tokens + elapsed * self.rate)
+                if tokens < 1:
+                    return (1 - tokens) / self.rate if self.rate > 0 else float('inf')
+                taken = conn.execute(table.update().where(
+                    (table.c.name == self.name) & (table.c.updated_at == row.updated_at) & (table.c.tokens == row.tokens)
+                ).values(tokens=tokens - 1, updated_at=now)).rowcount
+                if taken:
+                    return 0.0
+        return self.CONTENTION_WAIT
+
+
+RATE_LIMITS = {
+    'openroute': [
+        SharedTokenBucket('openroute:minute', ORS_GEOCODE_PER_MINUTE / 60.0, ORS_GEOCODE_PER_MINUTE),
+        SharedTokenBucket('openroute:day', ORS_GEOCODE_PER_DAY / 86400.0, ORS_GEOCODE_PER_DAY, blocking=False),
+    ],
+    'nominatim': [
+        SharedTokenBucket('nominatim:second', NOMINATIM_REQUESTS_PER_SECOND, 1),
+    ],
+}
+
+
+def acquire_provider(provider: str, timeout: Optional[float] = GEOCODE_RATE_LIMIT_WAIT) -> bool:
+    """
+    Wait for a request slot under every rate limit configured for a provider
+
+    Blocking buckets are waited on first, so a daily quota token is only
+    spent once the call is otherwise clear to go out.
+    """
+    for bucket in sorted(RATE_LIMITS.get(provider, []), key=lambda bucket: not bucket.blocking):
+        if not bucket.acquire(timeout):
+            return False
+    return True
+
+
+_stats_lock = threading.Lock()
+_stats = {
+    'memory_hits': 0,
+    'db_hits': 0,
+    'misses': 0,
+    'provider_calls': 0,
+    'rate_limited': 0,
+    'not_found': 0,
+}
+
+
+def _count(name: str, amount: int = 1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def get_geocode_stats() -> Dict:
+    """Return geocode cache and provider counters for this process"""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+    stats['lookups'] = lookups
+    stats['hit_rate'] = round((stats['memory_hits'] + stats['db_hits']) / lookups, 3) if lookups else None
+    stats['memory_entries'] = len(_memory_cache)
+    return stats
+
+
+# Provider lookups
+
+def geocode_openroute(address: str) -> Optional[Dict]:
+    """Geocode an address with OpenRouteService (requires OPENROUTE_API_KEY)"""
+    api_key = os.environ.get('OPENROUTE_API_KEY')
+    if not api_key:
+        return None
+
+    try:
+        params = {
+            'api_key': api_key,
+            'text': address,
+            'size': 1,
+            'layers': 'address'
+        }
+        response = http_client.get('openroute', f"{OPENROUTE_BASE_URL}/geocode/search", params=params)
+        response.raise_for_status()
+        data = response.json()
+
+        if data.get('features'):
+            feature = data['features'][0]
+            coords = feature['geometry']['coordinates']
+            properties = feature.get('properties', {})
+            return {
+                'latitude': coords[1],
+                'longitude': coords[0],
+                'display_name': properties.get('label'),
+                'address_type': properties.get('layer', 'address'),
+                'confidence': properties.get('confidence')
+            }
+
+        print(f"No OpenRouteService geocoding results for '{address}'")
+        return None
+    except Exception as e:
+        print(f"OpenRouteService geocoding error for '{address}': {e}")
+        return None
+
+
+def geocode_nominatim(address: str) -> Optional[Dict]:
+    """Geocode an address with Nominatim (OpenStreetMap) - free service"""
+    try:
+        params = {
+            'q': address,
+            'format': 'json',
+            'addressdetails': 1,
+            'limit': 1,
+            'countrycodes': 'us'  # Limit to US addresses
+        }
+        headers = {'User-Agent': NOMINATIM_USER_AGENT}
+        response = http_client.get('nominatim', NOMINATIM_URL, params=params, headers=headers)
+        response.raise_for_status()
+        data = response.json()
+
+        if data:
+            result = data[0]
+            return {
+                'latitude': float(result['lat']),
+                'longitude': float(result['lon']),
+                'display_name': result.get('display_name'),
+                'address_type': result.get('type', 'unknown'),
+                'confidence': result.get('importance')
+            }
+
+        return None
+    except Exception as e:
+        print(f"Nominatim geocoding error for '{address}': {e}")
+        return None
+
+
+PROVIDERS = {
+    'openroute': geocode_openroute,
+    'nominatim': geocode_nominatim,
+}
+
+
+# Database cache
+
+def _load_cached(address_key: str) -> Optional[Dict]:
+    """Read a non-expired geocode cache row (outside the request session)"""
+    table = GeocodeCache.__table__
+    try:
+        with db.engine.connect() as conn:
+            row = conn.execute(
+                table.select().where(table.c.address_key == address_key)
+            ).mappings().first()
+    except Exception as e:
+        print(f"Geocode cache read error: {e}")
+        return None
+
+    if not row:
+        return None
+
+    expires_at = row['created_at'] + timedelta(seconds=row['ttl_seconds'] or GEOCODE_CACHE_TTL_SECONDS)
+    if expires_at <= datetime.utcnow():
+        return None
+
+    return {
+        'latitude': row['latitude'],
+        'longitude': row['longitude'],
+        'display_name': row['display_name'],
+        'address_type': row['address_type'],
+        'confidence': row['confidence'],
+        'provider': row['provider'],
+        '_expires_at': expires_at
+    }
+
+
+def _store_cached(address_key: str, address: str, result: Dict, ttl_seconds: int):
+    """Insert or replace a geocode cache row in its own transaction"""
+    table = GeocodeCache.__table__
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(table.delete().where(table.c.address_key == address_key))
+            conn.execute(table.insert().values(
+                address_key=address_key,
+                address=address[:300],
+                provider=result.get('provider'),
+                latitude=result['latitude'],
+                longitude=result['longitude'],
+                display_name=(result.get('display_name') or '')[:300] or None,
+                address_type=result.get('address_type'),
+                confidence=result.get('confidence'),
+                created_at=datetime.utcnow(),
+                ttl_seconds=ttl_seconds
+            ))
+    except Exception as e:
+        print(f"Geocode cache write error: {e}")
+
+
+def geocode(address: str, providers: Sequence[str] = DEFAULT_PROVIDERS,
+            ttl_seconds: Optional[int] = None,
+            rate_limit_wait: Optional[float] = GEOCODE_RATE_LIMIT_WAIT) -> Optional[Dict]:
+    """
+    Geocode an address through the in-process LRU and the database cache
+
+    Args:
+        address: Free-form address string
+        providers: Provider names to try in order on a cache miss
+        ttl_seconds: TTL for a newly cached result (defaults to GEOCODE_CACHE_TTL_SECONDS)
+        rate_limit_wait: Longest to wait for a provider's rate limit before
+            skipping to the next provider (None waits as long as needed)
+
+    Returns:
+        Dict with latitude, longitude, display_name, address_type, confidence
+        and provider, or None if no provider could geocode the address
+    """
+    address_key = normalize_address(address)
+    if not address_key:
+        return None
+
+    cached = _memory_cache.get(address_key)
+    if cached is not None:
+        _count('memory_hits')
+        return dict(cached)
+
+    cached = _load_cached(address_key)
+    if cached is not None:
+        _count('db_hits')
+        expires_at = cached.pop('_expires_at')
+        _memory_cache.put(address_key, cached, expires_at)
+        return dict(cached)
+
+    _count('misses')
+    # Concurrent misses for the same address (in any worker) share one lookup
+    result = singleflight.do('geocode', [address_key, list(providers)],
+                             lambda: _lookup_providers(address_key, address, providers, ttl_seconds, rate_limit_wait))
+    if result is None:
+        return None
+    _memory_cache.put(address_key, result, datetime.utcnow() + timedelta(seconds=ttl_seconds or GEOCODE_CACHE_TTL_SECONDS))
+    return dict(result)
+
+
+def _lookup_providers(address_key: str, address: str, providers: Sequence[str],
+                      ttl_seconds: Optional[int], rate_limit_wait: Optional[float]) -> Optional[Dict]:
+    """Try providers in order and cache the first result"""
+    ttl_seconds = ttl_seconds or GEOCODE_CACHE_TTL_SECONDS
+    for provider in providers:
+        lookup = PROVIDERS.get(provider)
+        if not lookup:
+            continue
+        if not acquire_provider(provider, rate_limit_wait):
+            _count('rate_limited')
+            continue
+        _count('provider_calls')
+        result = lookup(address)
+        if result and result.get('latitude') is not None and result.get('longitude') is not None:
+            result['provider'] = provider
+            _store_cached(address_key, address, result, ttl_seconds)
+            return result
+
+    _count('not_found')
+    return None
+
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Outbound HTTP Client for TrueTank
+
+This module handles:
+- One pooled keep-alive requests.Session per host, shared by every
+  thread in the worker, instead of a new connection per call
+- Short connect/read timeouts per provider (OpenRouteService, Nominatim,
+  Census geocoder) and an overall time budget per call
+- Bounded retries of timeouts, connection errors, 429 and 502/503/504
+  with jittered exponential backoff (Retry-After is honoured up to the cap)
+- A circuit breaker per provider: after repeated failures calls fail fast
+  for a cool-down, then a single probe decides whether to close it again
+- Per-provider call, retry, error, status code and latency counters
+
+Callers keep their existing error handling: responses are returned as
+from requests, and an open circuit raises CircuitOpenError, which is a
+requests.RequestException.
+"""
+
+from typing import Dict, NamedTuple, Optional
+from collections import deque
+from urllib.parse import urlsplit
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 10))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05))
+HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 2))
+HTTP_BACKOFF_BASE = float(os.environ.get('HTTP_BACKOFF_BASE', 0.25))
+HTTP_BACKOFF_CAP = float(os.environ.get('HTTP_BACKOFF_CAP', 2.0))
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_RESET_SECONDS = float(os.environ.get('CIRCUIT_RESET_SECONDS', 30))
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# Latency histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RECENT_LATENCIES = 512
+
+
+class ProviderConfig(NamedTuple):
+    read_timeout: float
+    budget_seconds: float  # no retry starts once this much time has gone
+
+
+def _provider(name: str, read_timeout: float, budget_seconds: float) -> ProviderConfig:
+    prefix = f"HTTP_{name.upper()}_"
+    return ProviderConfig(
+        read_timeout=float(os.environ.get(prefix + 'READ_TIMEOUT', read_timeout)),
+        budget_seconds=float(os.environ.get(prefix + 'BUDGET_SECONDS', budget_seconds)),
+    )
+
+
+PROVIDERS = {
+    'openroute': _provider('openroute', read_timeout=10, budget_seconds=15),  # matrices can be slow
+    'nominatim': _provider('nominatim', read_timeout=5, budget_seconds=8),
+    'census': _provider('census', read_timeout=5, budget_seconds=8),
+}
+
+
+class CircuitOpenError(requests.RequestException):
+    """A provider's circuit is open; the call was not attempted"""
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `threshold` consecutive failures; open -> half-open
+    after `reset_seconds`, letting one probe through; the probe's result
+    closes or re-opens it
+    """
+
+    def __init__(self, threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.opened_count = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.threshold:
+                if self.state != 'open':
+                    self.opened_count += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def release(self):
+        """Give up a half-open probe that ended without a verdict (the next caller probes instead)"""
+        with self._lock:
+            self._probing = False
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {'state': self.state, 'consecutive_failures': self.failures, 'times_opened': self.opened_count}
+
+
+# Connection pools
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def session_for(url: str) -> requests.Session:
+    """The shared keep-alive session for a URL's scheme and host"""
+    parts = urlsplit(url)
+    key = f"{parts.scheme}://{parts.netloc}"
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                # Retries are ours (so the breaker and counters see every attempt)
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+                session.mount(key, adapter)
+                _sessions[key] = session
+    return session
+
+
+# Metrics
+
+_breakers = {name: CircuitBreaker() for name in PROVIDERS}
+_metrics_lock = threading.Lock()
+
+
+def _empty_metrics() -> Dict:
+    return {
+        'calls': 0, 'attempts': 0, 'retries': 0, 'errors': 0, 'short_circuited': 0,
+        'status_codes': {}, 'latency_sum': 0.0, 'latency_buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+        'recent': deque(maxlen=RECENT_LATENCIES),
+    }
+
+
+_metrics = {name: _empty_metrics() for name in PROVIDERS}
+
+
+def _record_attempt(provider: str, seconds: float, outcome):
+    """outcome: an HTTP status code, or an exception class name"""
+    with _metrics_lock:
+        metrics = _metrics[provider]
+        metrics['attempts'] += 1
+        metrics['latency_sum'] += seconds
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+        metrics['latency_buckets'][bucket] += 1
+        metrics['recent'].append(seconds)
+        key = str(outcome)
+        metrics['status_codes'][key] = metrics['status_codes'].get(key, 0) + 1
+
+
+def _count(provider: str, name: str):
+    with _metrics_lock:
+        _metrics[provider][name] += 1
+
+
+def _percentile(values, fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 1)
+
+
+def get_stats() -> Dict[str, Dict]:
+    """Per-provider counters, latency (ms) and circuit state for this process"""
+    stats = {}
+    with _metrics_lock:
+        for provider, metrics in _metrics.items():
+            recent = list(metrics['recent'])
+            stats[provider] = {
+                'calls': metrics['calls'],
+                'attempts': metrics['attempts'],
+                'retries': metrics['retries'],
+                'errors': metrics['errors'],
+                'short_circuited': metrics['short_circuited'],
+                'status_codes': dict(metrics['status_codes']),
+                'latency_ms': {
+                    'avg': round(metrics['latency_sum'] / metrics['attempts'] * 1000, 1) if metrics['attempts'] else None,
+                    'p50': _percentile(recent, 0.5),
+                    'p95': _percentile(recent, 0.95),
+                    'max': _percentile(recent, 1.0),
+                },
+                'latency_buckets': dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'],
+                                            metrics['latency_buckets'])),
+                'latency_sum_seconds': round(metrics['latency_sum'], 3),
+            }
+    for provider, breaker in _breakers.items():
+        stats[provider]['circuit'] = breaker.snapshot()
+    return stats
+
+
+def reset():
+    """Close every circuit and zero the counters (tests)"""
+    with _metrics_lock:
+        for provider in PROVIDERS:
+            _metrics[provider] = _empty_metrics()
+    for provider in PROVIDERS:
+        _breakers[provider] = CircuitBreaker()
+
+
+# Requests
+
+def _backoff(attempt: int, response: Optional[requests.Response]) -> float:
+    """Full-jitter exponential backoff, or the server's Retry-After (both capped)"""
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), HTTP_BACKOFF_CAP)
+    return random.uniform(0, min(HTTP_BACKOFF_CAP, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+
+def request(provider: str, method: str, url: str, retries: Optional[int] = None, **kwargs) -> requests.Response:
+    """
+    Send a request to a provider through its pooled session and circuit breaker
+
+    Args:
+        provider: Key of PROVIDERS ('openroute', 'nominatim', 'census')
+        method: HTTP method
+        url: Full URL
+        retries: Retries after the first attempt (default HTTP_MAX_RETRIES)
+        **kwargs: Passed to requests (params, json, headers, ...); timeout
+            defaults to the provider's (connect, read) timeouts
+
+    Returns:
+        The last response, whatever its status
+
+    Raises:
+        CircuitOpenError: The provider's circuit is open
+        requests.RequestException: The last attempt failed (only timeouts and
+            connection errors are retried)
+    """
+    config = PROVIDERS[provider]
+    breaker = _breakers[provider]
+    retries = HTTP_MAX_RETRIES if retries is None else retries
+    kwargs.setdefault('timeout', (HTTP_CONNECT_TIMEOUT, config.read_timeout))
+    session = session_for(url)
+    started = time.monotonic()
+    _count(provider, 'calls')
+
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            _count(provider, 'short_circuited')
+            raise CircuitOpenError(f"{provider} circuit open; not calling {urlsplit(url).netloc}")
+
+        attempt_started = time.monotonic()
+        response, error = None, None
+        try:
+            response = session.request(method, url, **kwargs)
+            _record_attempt(provider, time.monotonic() - attempt_started, response.status_code)
+        except requests.RequestException as e:
+            error = e
+            _record_attempt(provider, time.monotonic() - attempt_started, type(e).__name__)
+        except BaseException:
+            breaker.release()
+            raise
+
+        failed = error is not None or response.status_code in RETRY_STATUSES or response.status_code >= 500
+        if not failed:
+            breaker.record_success()
+            return response
+        breaker.record_failure()
+
+        if error is not None:
+            retryable = isinstance(error, (requests.ConnectionError, requests.Timeout))
+        else:
+            retryable = response.status_code in RETRY_STATUSES
+        delay = _backoff(attempt, response)
+        out_of_time = time.monotonic() - started + delay >= config.budget_seconds
+        if not retryable or attempt >= retries or out_of_time:
+            _count(provider, 'errors')
+            if error is not None:
+                raise error
+            return response
+
+        attempt += 1
+        _count(provider, 'retries')
+        if response is not None:
+            response.close()  # hand the connection back to the pool
+        time.sleep(delay)
+
+
+def get(provider: str, url: str, **kwargs) -> requests.Response:
+    return request(provider, 'GET', url, **kwargs)
+
+
+def post(provider: str, url: str, **kwargs) -> requests.Response:
+    return request(provider, 'POST', url, **kwargs)
@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Background Jobs for TrueTank
+
+This module handles:
+- A database-backed job queue (the job table): enqueueing with optional
+  idempotency keys, claiming with a lease, retries with jittered backoff
+- Registering task functions by name, and running heavy endpoints as jobs:
+  a @background view answers 202 with a job id, and a worker replays the
+  request, storing the view's JSON response as the job's result
+- Progress reporting from inside a task, visible while it runs
+- Worker processes that poll the queue, heartbeat their leases, and take
+  over jobs whose worker died
+- Deleting finished jobs once they are older than the retention window, so
+  the job table (and the /metrics query over it) stays small
+
+Errors that mean the input is wrong (ValueError, or a 4xx from a view)
+fail a job at once; anything else is retried up to its max_attempts.
+
+Run from the command line:
+    python jobs.py                  # one worker process
+    python jobs.py --processes 4    # four worker processes
+    python jobs.py --once           # run what is due, then exit
+    python jobs.py --status
+    python jobs.py --prune          # delete finished jobs past retention now
+"""
+
+from typing import Callable, Dict, List, Optional
+from datetime import datetime, timedelta
+import argparse
+import functools
+import hashlib
+import json
+import os
+import random
+import signal
+import socket
+import threading
+import time
+
+from flask import current_app, jsonify, request, url_for
+
+from models import db, Job
+
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_RETRY_BASE_SECONDS = float(os.environ.get('JOB_RETRY_BASE_SECONDS', 10))
+JOB_RETRY_CAP_SECONDS = float(os.environ.get('JOB_RETRY_CAP_SECONDS', 600))
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 120))
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 1.0))
+
+# Run @background views in the request instead of queueing them (development without a worker)
+JOBS_INLINE = os.environ.get('JOBS_INLINE', '0') == '1'
+
+# Succeeded and failed jobs are kept this long for their status and result
+JOB_RETENTION_HOURS = int(os.environ.get('JOB_RETENTION_HOURS', 7 * 24))
+JOB_PRUNE_INTERVAL = int(os.environ.get('JOB_PRUNE_INTERVAL', 3600))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+# Derived idempotency keys only dedupe jobs still queued or running; they
+# are cleared when a job finishes so the same request later runs afresh
+AUTO_KEY_PREFIX = 'auto:'
+
+TASKS = {}
+
+_last_prune = None
+
+_local = threading.local()
+
+
+class Task:
+    def __init__(self, name: str, fn: Callable, max_attempts: int):
+        self.name = name
+        self.fn = fn
+        self.max_attempts = max_attempts
+
+
+def task(name: str, max_attempts: int = JOB_MAX_ATTEMPTS):
+    """
+    Register a function as a task; it is called with the job's payload dict
+    and its return value (JSON-serializable) becomes the job's result
+    """
+    def decorator(fn):
+        TASKS[name] = Task(name, fn, max_attempts)
+        return fn
+    return decorator
+
+
+def _worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"[:80]
+
+
+# Enqueueing
+
+def enqueue(kind: str, payload: Optional[Dict] = None, idempotency_key: Optional[str] = None,
+            max_attempts: Optional[int] = None) -> Job:
+    """
+    Queue a job, or return the job already queued under the same idempotency key
+
+    Raises:
+        ValueError: For unknown task names
+    """
+    if kind not in TASKS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    if idempotency_key:
+        existing = Job.query.filter_by(idempotency_key=idempotency_key).first()
+        if existing is not None:
+            return existing
+
+    job = Job(kind=kind, payload=json.dumps(payload or {}), idempotency_key=idempotency_key or None,
+              max_attempts=max_attempts or TASKS[kind].max_attempts, status=QUEUED, run_after=datetime.utcnow())
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except Exception:
+        # Lost a race for the idempotency key
+        db.session.rollback()
+        existing = Job.query.filter_by(idempotency_key=idempotency_key).first() if idempotency_key else None
+        if existing is None:
+            raise
+        return existing
+    return job
+
+
+def accepted(job: Job):
+    """202 response pointing at a job's status"""
+    status_url = url_for('job_status', job_id=job.id)
+    response = jsonify({'success': True, 'job_id': job.id, 'status': job.status, 'status_url': status_url})
+    response.status_code = 202
+    response.headers['Location'] = status_url
+    return response
+
+
+def request_idempotency_key(kind: str, body) -> str:
+    """The client's Idempotency-Key header, or a key derived from the request itself"""
+    client_key = request.headers.get('Idempotency-Key')
+    if client_key:
+        return f"{kind}:{client_key}"[:120]
+    call = json.dumps([request.path, request.query_string.decode(), body], sort_keys=True)
+    return f"{AUTO_KEY_PREFIX}{kind}:{hashlib.sha1(call.encode()).hexdigest()}"
+
+
+def background(max_attempts: int = JOB_MAX_ATTEMPTS):
+    """
+    Run a view as a job: requests are answered 202 with a job id, and a
+    worker calls the view with the same path, arguments and JSON body
+
+    Put it below @app.route; the task is named after the view's endpoint.
+    """
+    def decorator(view):
+        name = view.__name__
+        TASKS[name] = Task(name, _replay, max_attempts)
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if JOBS_INLINE or getattr(_local, 'replaying', False):
+                return view(*args, **kwargs)
+            body = request.get_json(silent=True)
+            job = enqueue(name, {
+                'endpoint': request.endpoint,
+                'path': request.path,
+                'method': request.method,
+                'query': request.query_string.decode(),
+                'view_args': kwargs,
+                'json': body,
+            }, idempotency_key=request_idempotency_key(name, body))
+            return accepted(job)
+        return wrapper
+    return decorator
+
+
+def _replay(payload: Dict):
+    """Call a @background view as the original request did and return its JSON"""
+    app = current_app._get_current_object()
+    options = {'method': payload['method'], 'query_string': payload['query']}
+    if payload['json'] is not None:
+        options['json'] = payload['json']
+    _local.replaying = True
+    try:
+        with app.test_request_context(payload['path'], **options):
+            response = app.make_response(app.view_functions[payload['endpoint']](**payload['view_args']))
+    finally:
+        _local.replaying = False
+
+    body = response.get_json(silent=True)
+    error = body.get('error') if isinstance(body, dict) else None
+    if response.status_code >= 500:
+        raise RuntimeError(error or f"HTTP {response.status_code}")
+    if response.status_code >= 400:
+        raise ValueError(error or f"HTTP {response.status_code}")
+    return body
+
+
+# Progress
+
+def report_progress(done: Optional[int] = None, total: Optional[int] = None, message: Optional[str] = None):
+    """Record a running job's progress; does nothing outside a job"""
+    job_id = getattr(_local, 'job_id', None)
+    if job_id is None:
+        return
+    table = Job.__table__
+    values = {'progress_done': done if done is not None else db.func.coalesce(table.c.progress_done, 0)}
+    if total is not None:
+        values['progress_total'] = total
+    if message is not None:
+        values['progress_message'] = message[:300]
+    try:
+        # Its own transaction, so progress shows while the task's is still open
+        with db.engine.begin() as conn:
+            conn.execute(table.update().where(table.c.id == job_id).values(**values))
+    except Exception as e:
+        print(f"Job {job_id} progress error: {e}")
+
+
+# Running
+
+def _claimable(now: datetime):
+    table = Job.__table__
+    return db.or_(
+        db.and_(table.c.status == QUEUED, table.c.run_after <= now),
+        # Leases left by workers that died mid-job
+        db.and_(table.c.status == RUNNING, table.c.locked_until < now, table.c.attempts < table.c.max_attempts),
+    )
+
+
+def _fail_abandoned(conn, now: datetime):
+    """Jobs whose worker died on their last attempt"""
+    table = Job.__table__
+    conn.execute(table.update().where(
+        table.c.status == RUNNING, table.c.locked_until < now, table.c.attempts >= table.c.max_attempts
+    ).values(status=FAILED, error='Worker stopped responding', finished_at=now, locked_by=None,
+             locked_until=None, idempotency_key=_cleared_auto_key(table)))
+
+
+def _cleared_auto_key(table):
+    return db.case((table.c.idempotency_key.like(f"{AUTO_KEY_PREFIX}%"), None), else_=table.c.idempotency_key)
+
+
+def claim_next(worker_id: str, kinds: Optional[List[str]] = None) -> Optional[int]:
+    """
+    Lease the next due job to a worker
+
+    Returns:
+        The job id, or None when nothing is due
+    """
+    table = Job.__table__
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        _fail_abandoned(conn, now)
+        candidates = db.select(table.c.id).where(_claimable(now))
+        if kinds:
+            candidates = candidates.where(table.c.kind.in_(kinds))
+        job_id = conn.execute(
+            candidates.order_by(table.c.run_after, table.c.id).limit(1).with_for_update(skip_locked=True)
+        ).scalar()
+        if job_id is None:
+            return None
+        claimed = conn.execute(table.update().where(table.c.id == job_id, _claimable(now)).values(
+            status=RUNNING, locked_by=worker_id, locked_until=now + timedelta(seconds=JOB_LEASE_SECONDS),
+            attempts=table.c.attempts + 1, started_at=now, error=None
+        )).rowcount
+    return job_id if claimed else None
+
+
+def _heartbeat(job_id: int, worker_id: str, stop: threading.Event, app):
+    """Extend a running job's lease until it finishes"""
+    table = Job.__table__
+    while not stop.wait(JOB_LEASE_SECONDS / 3):
+        try:
+            with app.app_context(), db.engine.begin() as conn:
+                conn.execute(table.update().where(table.c.id == job_id, table.c.locked_by == worker_id).values(
+                    locked_until=datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)
+                ))
+        except Exception as e:
+            print(f"Job {job_id} heartbeat error: {e}")
+
+
+def retry_delay(attempts: int) -> float:
+    """Full-jitter exponential backoff before the next attempt"""
+    return random.uniform(0, min(JOB_RETRY_CAP_SECONDS, JOB_RETRY_BASE_SECONDS * (2 ** (attempts - 1))))
+
+
+def run_job(job_id: int, worker_id: str) -> str:
+    """
+    Run a claimed job and record its outcome
+
+    Returns:
+        The job's new status
+    """
+    table = Job.__table__
+    job = db.session.get(Job, job_id)
+    kind, attempts, max_attempts = job.kind, job.attempts, job.max_attempts
+    payload = json.loads(job.payload or '{}')
+    job_task = TASKS.get(kind)
+    db.session.rollback()
+
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job_id, worker_id, stop,
+                                                          current_app._get_current_object()), daemon=True)
+    heartbeat.start()
+    _local.job_id = job_id
+    try:
+        if job_task is None:
+            raise ValueError(f"Unknown job kind: {kind}")
+        result = job_task.fn(payload)
+        values = {'status': SUCCEEDED, 'result': json.dumps(result), 'error': None}
+    except Exception as e:
+        db.session.rollback()
+        retry = not isinstance(e, ValueError) and attempts < max_attempts
+        values = {'status': QUEUED if retry else FAILED, 'error': f"{type(e).__name__}: {e}"}
+        if retry:
+            values['run_after'] = datetime.utcnow() + timedelta(seconds=retry_delay(attempts))
+        print(f"Job {job_id} ({kind}) attempt {attempts}/{max_attempts} failed: {e}")
+    finally:
+        _local.job_id = None
+        stop.set()
+        heartbeat.join()
+        db.session.remove()
+
+    if values['status'] != QUEUED:
+        values.update(finished_at=datetime.utcnow(), idempotency_key=_cleared_auto_key(table))
+    with db.engine.begin() as conn:
+        conn.execute(table.update().where(table.c.id == job_id, table.c.locked_by == worker_id).values(
+            locked_by=None, locked_until=None, **values
+        ))
+    return values['status']
+
+
+def run_pending(worker_id: Optional[str] = None, kinds: Optional[List[str]] = None,
+                should_stop: Callable[[], bool] = lambda: False) -> int:
+    """Run due jobs until none are left; returns how many ran"""
+    worker_id = worker_id or _worker_id()
+    ran = 0
+    while not should_stop():
+        job_id = claim_next(worker_id, kinds)
+        if job_id is None:
+            break
+        run_job(job_id, worker_id)
+        ran += 1
+    return ran
+
+
+def prune_jobs(retention_hours: int = JOB_RETENTION_HOURS) -> int:
+    """
+    Delete succeeded and failed jobs that finished before the retention window
+
+    Returns:
+        Number of jobs deleted
+    """
+    table = Job.__table__
+    cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
+    try:
+        with db.engine.begin() as conn:
+            return conn.execute(table.delete().where(
+                table.c.status.in_((SUCCEEDED, FAILED)), table.c.finished_at < cutoff
+            )).rowcount
+    except Exception as e:
+        print(f"Job prune error: {e}")
+        return 0
+
+
+def maybe_prune():
+    """Prune at most once per JOB_PRUNE_INTERVAL seconds per worker"""
+    global _last_prune
+    now = time.monotonic()
+    if _last_prune is not None and now - _last_prune < JOB_PRUNE_INTERVAL:
+        return
+    _last_prune = now
+    prune_jobs()
+
+
+def queue_status() -> Dict[str, int]:
+    """Job counts by status"""
+    return dict(db.session.query(Job.status, db.func.count()).group_by(Job.status).all())
+
+
+# Workers
+
+def work(kinds: Optional[List[str]] = None, once: bool = False, poll_seconds: float = JOB_POLL_SECONDS):
+    """Worker loop (one process); SIGTERM finishes the running job, then exits"""
+    from app import app
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    worker_id = _worker_id()
+    with app.app_context():
+        db.create_all()
+        print(f"Job worker {worker_id} started ({', '.join(kinds) if kinds else 'all kinds'})")
+        try:
+            while not stopping.is_set():
+                try:
+                    maybe_prune()
+                    ran = run_pending(worker_id, kinds, stopping.is_set)
+                except Exception as e:
+                    print(f"Job worker error: {e}")
+                    db.session.remove()
+                    ran = 0
+                if once:
+                    break
+                if not ran:
+                    stopping.wait(poll_seconds)
+        except KeyboardInterrupt:
+            pass
+        print(f"Job worker {worker_id} stopped")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Run background job workers')
+    parser.add_argument('--processes', type=int, default=1, help='Worker processes to start')
+    parser.add_argument('--kinds', help='Comma-separated job kinds to run (default: all)')
+    parser.add_argument('--once', action='store_true', help='Run the jobs that are due, then exit')
+    parser.add_argument('--poll', type=float, default=JOB_POLL_SECONDS, metavar='SECONDS',
+                        help='How often an idle worker checks the queue')
+    parser.add_argument('--status', action='store_true', help='Show job counts by status')
+    parser.add_argument('--prune', action='store_true', help='Delete finished jobs older than JOB_RETENTION_HOURS')
+    args = parser.parse_args(argv)
+    kinds = [kind.strip() for kind in args.kinds.split(',')] if args.kinds else None
+
+    if args.status:
+        from app import app
+        with app.app_context():
+            for status, count in sorted(queue_status().items()):
+                print(f"{status:10} {count}")
+        return
+
+    if args.prune:
+        from app import app
+        with app.app_context():
+            print(f"Deleted {prune_jobs()} finished jobs")
+        return
+
+    if args.processes <= 1:
+        work(kinds, args.once, args.poll)
+        return
+
+    import multiprocessing
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=work, args=(kinds, args.once, args.poll)) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    # Pass a stop request on; each worker finishes its running job first
+    signal.signal(signal.SIGTERM, lambda signum, frame: [process.terminate() for process in processes])
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
+
+if __name__ == '__main__':
+    # app.py registers its tasks on the imported jobs module, not on this
+    # __main__ copy, so the CLI has to run from that module
+    import jobs
+    jobs.main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Request Metrics and Health Checks for TrueTank
+
+This module handles:
+- Request instrumentation: latency histograms and status code counts per
+  route, requests in flight, SQL statements and SQL time per request,
+  and uncaught exceptions
+- Prometheus text exposition of those and of the outbound HTTP client,
+  single-flight, geocode and route leg cache counters and job queue depth
+- A cheap liveness check and a readiness check (database reachable)
+  whose result is cached for READINESS_CACHE_SECONDS
+
+Metrics are per process, like the other get_*_stats() counters; each
+gunicorn worker serves its own.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+from collections import defaultdict
+import os
+import threading
+import time
+
+from flask import g, has_request_context, request, got_request_exception
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from models import db, Job
+
+# Request latency histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# SQL statements per request histogram bucket upper bounds
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+READINESS_CACHE_SECONDS = float(os.environ.get('READINESS_CACHE_SECONDS', 5))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Label for requests that matched no route (keeps 404 scans from adding series)
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+class Histogram:
+    """Cumulative-on-export histogram with a running sum"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+
+
+_lock = threading.Lock()
+_in_flight = 0
+_requests = defaultdict(int)  # (method, route, status) -> count
+_latency = {}  # (method, route) -> Histogram
+_sql_count = {}  # (method, route) -> Histogram of statements per request
+_sql_seconds = defaultdict(float)  # (method, route) -> total SQL time
+_exceptions = defaultdict(int)  # (route, exception class) -> count
+
+
+# Instrumentation
+
+def _route() -> str:
+    return request.url_rule.rule if request.url_rule is not None else UNMATCHED_ROUTE
+
+
+def _start_request():
+    global _in_flight
+    g.metrics_started = time.perf_counter()
+    g.metrics_sql_count = 0
+    g.metrics_sql_seconds = 0.0
+    with _lock:
+        _in_flight += 1
+
+
+def _record_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _finish_request(error=None):
+    global _in_flight
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    key = (request.method, _route())
+    status = g.pop('metrics_status', 500)
+    with _lock:
+        _in_flight -= 1
+        _requests[key + (status,)] += 1
+        _latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(elapsed)
+        _sql_count.setdefault(key, Histogram(SQL_COUNT_BUCKETS)).observe(g.get('metrics_sql_count', 0))
+        _sql_seconds[key] += g.get('metrics_sql_seconds', 0.0)
+
+
+def _count_exception(sender, exception, **extra):
+    with _lock:
+        _exceptions[(_route(), type(exception).__name__)] += 1
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics_started' in g:
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    if not starts or not has_request_context() or 'metrics_started' not in g:
+        return
+    g.metrics_sql_count += 1
+    g.metrics_sql_seconds += time.perf_counter() - starts.pop()
+
+
+def _discard_query_start(context):
+    """handle_error: the failed statement gets no after_cursor_execute"""
+    starts = context.connection.info.get('metrics_query_start') if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+event.listen(Engine, 'handle_error', _discard_query_start)
+
+
+def init_app(app):
+    """Instrument every request of a Flask app"""
+    app.before_request(_start_request)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_request)
+    got_request_exception.connect(_count_exception, app)
+
+
+def reset():
+    """Zero the request metrics (tests)"""
+    global _readiness
+    with _lock:
+        for collection in (_requests, _latency, _sql_count, _sql_seconds, _exceptions):
+            collection.clear()
+    _readiness = None
+
+
+# Prometheus text format
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _number(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Writer:
+    def __init__(self):
+        self.lines = []
+
+    def header(self, name: str, kind: str, help_text: str):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, names: Sequence[str], values: Sequence, value):
+        self.lines.append(f"{name}{_labels(names, values)} {_number(value)}")
+
+    def metric(self, name: str, kind: str, help_text: str, samples: List[Tuple[Sequence, object]],
+               label_names: Sequence[str] = ()):
+        self.header(name, kind, help_text)
+        for values, value in samples:
+            self.sample(name, label_names, values, value)
+
+    def histogram(self, name: str, help_text: str, label_names: Sequence[str],
+                  series: List[Tuple[Sequence, Sequence[float], Sequence[int], float]]):
+        """series: (label values, bucket bounds, per-bucket counts incl. +Inf, sum)"""
+        self.header(name, 'histogram', help_text)
+        for values, bounds, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(list(bounds) + [float('inf')], counts):
+                cumulative += count
+                self.sample(f"{name}_bucket", list(label_names) + ['le'], list(values) + [_number(bound)], cumulative)
+            self.sample(f"{name}_sum", label_names, values, total)
+            self.sample(f"{name}_count", label_names, values, cumulative)
+
+    def text(self) -> str:
+        return '\n'.join(self.lines) + '\n'
+
+
+def _request_metrics(out: _Writer):
+    with _lock:
+        in_flight = _in_flight
+        requests_total = sorted(_requests.items())
+        latency = [(key, list(h.counts), h.sum) for key, h in sorted(_latency.items())]
+        sql_count = [(key, list(h.counts), h.sum) for key, h in sorted(_sql_count.items())]
+        sql_seconds = sorted(_sql_seconds.items())
+        exceptions = sorted(_exceptions.items())
+
+    out.metric('truetank_http_requests_in_flight', 'gauge', 'Requests being served', [((), in_flight)])
+    out.metric('truetank_http_requests_total', 'counter', 'Requests served by route and status',
+               [(key, count) for key, count in requests_total], ('method', 'route', 'status'))
+    out.histogram('truetank_http_request_duration_seconds', 'Request latency by route', ('method', 'route'),
+                  [(key, LATENCY_BUCKETS, counts, total) for key, counts, total in latency])
+    out.histogram('truetank_http_request_sql_statements', 'SQL statements per request by route', ('method', 'route'),
+                  [(key, SQL_COUNT_BUCKETS, counts, total) for key, counts, total in sql_count])
+    out.metric('truetank_http_request_sql_seconds_total', 'counter', 'Time spent in SQL by route',
+               [(key, round(seconds, 6)) for key, seconds in sql_seconds], ('method', 'route'))
+    out.metric('truetank_http_request_exceptions_total', 'counter', 'Uncaught exceptions by route',
+               [(key, count) for key, count in exceptions], ('route', 'exception'))
+
+
+CIRCUIT_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+
+def _provider_metrics(out: _Writer):
+    import http_client
+
+    stats = sorted(http_client.get_stats().items())
+    for field, help_text in (('calls', 'Outbound calls by provider'),
+                             ('attempts', 'Outbound attempts, including retries'),
+                             ('retries', 'Outbound retries'),
+                             ('errors', 'Outbound calls that failed after retries'),
+                             ('short_circuited', 'Outbound calls refused by an open circuit')):
+        out.metric(f"truetank_provider_{field}_total", 'counter', help_text,
+                   [((provider,), values[field]) for provider, values in stats], ('provider',))
+    out.metric('truetank_provider_responses_total', 'counter', 'Outbound attempts by status code or error',
+               [((provider, code), count) for provider, values in stats
+                for code, count in sorted(values['status_codes'].items())], ('provider', 'code'))
+    out.histogram('truetank_provider_request_duration_seconds', 'Outbound attempt latency by provider', ('provider',),
+                  [((provider,), http_client.LATENCY_BUCKETS, list(values['latency_buckets'].values()),
+                    values['latency_sum_seconds']) for provider, values in stats])
+    out.metric('truetank_provider_circuit_state', 'gauge', 'Circuit state (0 closed, 1 half-open, 2 open)',
+               [((provider,), CIRCUIT_STATES[values['circuit']['state']]) for provider, values in stats],
+               ('provider',))
+
+
+def _cache_metrics(out: _Writer):
+    import geocoding
+    import routing
+    import singleflight
+
+    for prefix, source, stats, fields in (
+        ('truetank_geocode', 'Geocode cache', geocoding.get_geocode_stats(),
+         ('memory_hits', 'db_hits', 'misses', 'provider_calls', 'rate_limited', 'not_found')),
+        ('truetank_route_leg', 'Route leg cache', routing.get_cache_stats(),
+         ('memory_hits', 'db_hits', 'misses', 'provider_calls', 'matrix_calls', 'provider_errors')),
+        ('truetank_single_flight', 'Single-flight', singleflight.get_single_flight_stats(),
+         ('leaders', 'local_waiters', 'shared_waiters', 'takeovers', 'timeouts', 'lease_errors')),
+    ):
+        for field in fields:
+            if field in stats:
+                out.metric(f"{prefix}_{field}_total", 'counter', f"{source} {field.replace('_', ' ')}",
+                           [((), stats[field])])
+
+
+def _job_metrics(out: _Writer):
+    try:
+        counts = dict(db.session.query(Job.status, db.func.count()).group_by(Job.status).all())
+    except Exception as e:
+        print(f"Job metrics error: {e}")
+        db.session.rollback()
+        return
+    out.metric('truetank_jobs', 'gauge', 'Background jobs by status',
+               [((status,), counts.get(status, 0)) for status in ('queued', 'running', 'succeeded', 'failed')],
+               ('status',))
+
+
+def render() -> str:
+    """Every metric in Prometheus text format"""
+    out = _Writer()
+    _request_metrics(out)
+    _provider_metrics(out)
+    _cache_metrics(out)
+    _job_metrics(out)
+    return out.text()
+
+
+# Health
+
+_readiness = None  # (checked_at, result)
+_readiness_lock = threading.Lock()
+
+
+def liveness() -> Dict:
+    """The process is up and serving; touches nothing else"""
+    return {'status': 'alive', 'pid': os.getpid()}
+
+
+def readiness(max_age: Optional[float] = None) -> Dict:
+    """
+    Whether the app can serve traffic (the database answers), checked at most
+    once per READINESS_CACHE_SECONDS per worker however often it is probed
+
+    Returns:
+        Dict with ready, checks and age_seconds (how long ago the check ran)
+    """
+    global _readiness
+    max_age = READINESS_CACHE_SECONDS if max_age is None else max_age
+    now = time.monotonic()
+    with _readiness_lock:
+        if _readiness is None or now - _readiness[0] >= max_age:
+            _readiness = (now, _check_readiness())
+        checked_at, result = _readiness
+    return dict(result, age_seconds=round(now - checked_at, 1))
+
+
+def _check_readiness() -> Dict:
+    started = time.perf_counter()
+    try:
+        with db.engine.connect() as conn:
+            conn.execute(db.text('SELECT 1'))
+        database = {'ok': True, 'latency_ms': round((time.perf_counter() - started) * 1000, 1)}
+    except Exception as e:
+        print(f"Readiness check failed: {e}")
+        database = {'ok': False, 'error': str(e)}
+    return {'ready': database['ok'], 'checks': {'database': database}}
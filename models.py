@@ -1,6 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import Enum
+import json
 
 db = SQLAlchemy()
 
@@ -51,6 +52,8 @@ class Customer(db.Model):
     zip_code = db.Column(db.String(20), nullable=True)
     county = db.Column(db.String(100), nullable=True)
     gps_coordinates = db.Column(db.String(50), nullable=True)  # "latitude,longitude" format
+    latitude = db.Column(db.Float, nullable=True, index=True)  # numeric copies of gps_coordinates
+    longitude = db.Column(db.Float, nullable=True, index=True)
     
     # Billing Address (if different)
     billing_street_address = db.Column(db.String(200), nullable=True)
@@ -95,6 +98,8 @@ class Customer(db.Model):
             'zip_code': self.zip_code,
             'county': self.county,
             'gps_coordinates': self.gps_coordinates,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
             'billing_street_address': self.billing_street_address,
             'billing_city': self.billing_city,
             'billing_state': self.billing_state,
@@ -111,7 +116,7 @@ class Customer(db.Model):
 
 class SepticSystem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False, index=True)
     
     # System Details
     system_type = db.Column(db.String(50), nullable=True)  # conventional, aerobic, etc.
@@ -137,6 +142,8 @@ class SepticSystem(db.Model):
     # Location Info
     access_notes = db.Column(db.Text, nullable=True)
     gps_coordinates = db.Column(db.String(50), nullable=True)
+    latitude = db.Column(db.Float, nullable=True, index=True)
+    longitude = db.Column(db.Float, nullable=True, index=True)
     
     # Timestamps
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -150,8 +157,8 @@ class Ticket(db.Model):
     
     # Basic Info
     job_id = db.Column(db.String(50), unique=True, nullable=False)
-    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=True)
-    septic_system_id = db.Column(db.Integer, db.ForeignKey('septic_system.id'), nullable=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=True, index=True)
+    septic_system_id = db.Column(db.Integer, db.ForeignKey('septic_system.id'), nullable=True, index=True)
     
     # Service Details
     service_type = db.Column(db.String(50), nullable=True)
@@ -240,6 +247,26 @@ class Ticket(db.Model):
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     completed_at = db.Column(db.DateTime, nullable=True)
     
+    # Schedule, route and kanban lookups (date filters must use scheduled_on to reach them)
+    __table_args__ = (
+        db.Index('ix_ticket_truck_schedule', 'truck_id', 'scheduled_date', 'route_position'),
+        db.Index('ix_ticket_status_column', 'status', 'column_position'),
+        db.Index('ix_ticket_status_schedule', 'status', 'scheduled_date'),
+    )
+    
+    @staticmethod
+    def scheduled_on(day):
+        """
+        Filter for tickets scheduled on a day, as a half-open datetime range
+        
+        Unlike func.date(scheduled_date) == day, this can use the indexes
+        on scheduled_date.
+        """
+        if isinstance(day, datetime):
+            day = day.date()
+        start = datetime.combine(day, datetime.min.time())
+        return db.and_(Ticket.scheduled_date >= start, Ticket.scheduled_date < start + timedelta(days=1))
+    
     def __repr__(self):
         return f'<Ticket {self.job_id}>'
     
@@ -353,6 +380,8 @@ class Location(db.Model):
     
     # Location Specifications
     gps_coordinates = db.Column(db.String(50), nullable=True)
+    latitude = db.Column(db.Float, nullable=True, index=True)
+    longitude = db.Column(db.Float, nullable=True, index=True)
     access_notes = db.Column(db.Text, nullable=True)
     capacity_notes = db.Column(db.Text, nullable=True)  # How many trucks can be stored
     security_info = db.Column(db.Text, nullable=True)  # Gate codes, security details
@@ -390,6 +419,8 @@ class DumpSite(db.Model):
     zip_code = db.Column(db.String(20), nullable=True)
     county = db.Column(db.String(100), nullable=True)
     gps_coordinates = db.Column(db.String(50), nullable=True)
+    latitude = db.Column(db.Float, nullable=True, index=True)
+    longitude = db.Column(db.Float, nullable=True, index=True)
     
     # Operational Details
     operating_hours = db.Column(db.String(100), nullable=True)
@@ -427,6 +458,9 @@ class DumpSite(db.Model):
             'city': self.city,
             'state': self.state,
             'zip_code': self.zip_code,
+            'gps_coordinates': self.gps_coordinates,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
             'operating_hours': self.operating_hours,
             'cost_per_gallon': self.cost_per_gallon,
             'max_capacity_per_visit': self.max_capacity_per_visit,
@@ -624,7 +658,7 @@ class TruckTeamAssignment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     truck_id = db.Column(db.Integer, db.ForeignKey('truck.id'), nullable=False)
     team_member_id = db.Column(db.Integer, db.ForeignKey('team_member.id'), nullable=True)  # Null = no assignment
-    assignment_date = db.Column(db.Date, nullable=False)
+    assignment_date = db.Column(db.Date, nullable=False, index=True)
     
     # Timestamps
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -648,4 +682,211 @@ class TruckTeamAssignment(db.Model):
             'assignment_date': self.assignment_date.isoformat() if self.assignment_date else None,
             'truck_number': self.truck.truck_number if self.truck else None,
             'team_member_name': f"{self.team_member.first_name} {self.team_member.last_name}" if self.team_member else None
-        }
\ No newline at end of file
+        }
+
+class GeocodeCache(db.Model):
+    """Cached geocoding results keyed by normalized address"""
+    __tablename__ = 'geocode_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    address_key = db.Column(db.String(300), unique=True, nullable=False, index=True)  # normalized address
+    address = db.Column(db.String(300), nullable=True)  # address as first requested
+    
+    # Result
+    provider = db.Column(db.String(30), nullable=True)  # openroute, nominatim
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    display_name = db.Column(db.String(300), nullable=True)
+    address_type = db.Column(db.String(50), nullable=True)
+    confidence = db.Column(db.Float, nullable=True)  # provider-reported confidence/importance
+    
+    # Expiry
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    ttl_seconds = db.Column(db.Integer, nullable=True)
+    
+    def __repr__(self):
+        return f'<GeocodeCache {self.address_key} ({self.provider})>'
+
+class RouteLegCache(db.Model):
+    """Cached drive legs keyed by snapped origin/destination and routing profile"""
+    __tablename__ = 'route_leg_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    leg_key = db.Column(db.String(120), unique=True, nullable=False, index=True)  # profile:olat,olng:dlat,dlng
+    profile = db.Column(db.String(30), nullable=False, default='driving-car')
+    
+    # Snapped endpoints (~10 m grid)
+    origin_latitude = db.Column(db.Float, nullable=False)
+    origin_longitude = db.Column(db.Float, nullable=False)
+    dest_latitude = db.Column(db.Float, nullable=False)
+    dest_longitude = db.Column(db.Float, nullable=False)
+    
+    # Result
+    duration_seconds = db.Column(db.Float, nullable=False)
+    distance_meters = db.Column(db.Float, nullable=False)
+    geometry = db.Column(db.Text, nullable=True)  # encoded polyline
+    
+    # Expiry
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    ttl_seconds = db.Column(db.Integer, nullable=True)
+    
+    def __repr__(self):
+        return f'<RouteLegCache {self.leg_key}>'
+
+class GeocodeBackfillCheckpoint(db.Model):
+    """Progress of the bulk geocoding backfill, one row per record type"""
+    __tablename__ = 'geocode_backfill_checkpoint'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), unique=True, nullable=False)  # customer, septic_system, location, dump_site
+    last_id = db.Column(db.Integer, nullable=False, default=0)  # highest record id already attempted
+    
+    # Totals across runs
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    geocoded = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    failures = db.Column(db.Text, nullable=True)  # JSON: {record_id: reason}
+    
+    # Timestamps
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'last_id': self.last_id,
+            'processed': self.processed,
+            'geocoded': self.geocoded,
+            'failed': self.failed,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+    
+    def __repr__(self):
+        return f'<GeocodeBackfillCheckpoint {self.kind} @{self.last_id}>'
+
+class BoardChange(db.Model):
+    """Append-only log of job board writes, stamped with the board version of the writing transaction"""
+    __tablename__ = 'board_change'
+    __table_args__ = (db.Index('ix_board_change_key_version', 'board_key', 'version'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)  # BoardVersion counter after this write
+    board_key = db.Column(db.String(20), nullable=False)  # YYYY-MM-DD, 'pending', 'all'
+    entity = db.Column(db.String(20), nullable=False)  # ticket, team, truck, bulk
+    entity_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<BoardChange v{self.version} {self.board_key} {self.entity}:{self.entity_id}>'
+
+class BoardVersion(db.Model):
+    """Board version counter, bumped inside every transaction that writes the board"""
+    __tablename__ = 'board_version'
+    
+    name = db.Column(db.String(20), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<BoardVersion {self.name} {self.version}>'
+
+class TicketCounter(db.Model):
+    """Materialized ticket counts, kept current by ticket_counters in the writing transaction"""
+    __tablename__ = 'ticket_counter'
+    __table_args__ = (db.UniqueConstraint('dimension', 'key', name='uq_ticket_counter_dimension_key'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    dimension = db.Column(db.String(20), nullable=False)  # status, date, truck_day, pending_priority
+    key = db.Column(db.String(40), nullable=False)  # status name, YYYY-MM-DD, YYYY-MM-DD/truck_id, priority
+    count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<TicketCounter {self.dimension}:{self.key}={self.count}>'
+
+class SingleFlight(db.Model):
+    """Cross-worker lease on an in-flight provider call; holds the result briefly once done"""
+    __tablename__ = 'single_flight'
+    
+    key = db.Column(db.String(80), primary_key=True)  # namespace:sha1 of the normalized call
+    owner = db.Column(db.String(80), nullable=False)  # host:pid:thread of the worker making the call
+    status = db.Column(db.String(10), nullable=False, default='running')  # running, done
+    result = db.Column(db.Text, nullable=True)  # JSON, once done
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<SingleFlight {self.key} {self.status}>'
+
+class RateLimitBucket(db.Model):
+    """Token bucket shared by every worker, for provider quotas (see geocoding.SharedTokenBucket)"""
+    __tablename__ = 'rate_limit_bucket'
+    
+    name = db.Column(db.String(80), primary_key=True)  # provider:period
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)  # when tokens was last computed
+    
+    def __repr__(self):
+        return f'<RateLimitBucket {self.name} {self.tokens:.2f}>'
+
+class Job(db.Model):
+    """Background job run by `python jobs.py` workers"""
+    __tablename__ = 'job'
+    __table_args__ = (db.Index('ix_job_status_run_after', 'status', 'run_after'),
+                      db.Index('ix_job_status_finished_at', 'status', 'finished_at'))
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(80), nullable=False)  # registered task name
+    status = db.Column(db.String(12), nullable=False, default='queued')  # queued, running, succeeded, failed
+    payload = db.Column(db.Text, nullable=True)  # JSON arguments
+    idempotency_key = db.Column(db.String(120), unique=True, nullable=True)
+    
+    # Retry policy
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    # Lease held by the worker running the job
+    locked_by = db.Column(db.String(80), nullable=True)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    
+    # Progress and outcome
+    progress_done = db.Column(db.Integer, nullable=True)
+    progress_total = db.Column(db.Integer, nullable=True)
+    progress_message = db.Column(db.String(300), nullable=True)
+    result = db.Column(db.Text, nullable=True)  # JSON
+    error = db.Column(db.Text, nullable=True)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        progress = None
+        if self.progress_done is not None:
+            progress = {
+                'done': self.progress_done,
+                'total': self.progress_total,
+                'percent': round(100 * self.progress_done / self.progress_total, 1) if self.progress_total else None,
+                'message': self.progress_message
+            }
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'progress': progress,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'run_after': self.run_after.isoformat() if self.run_after and self.status == 'queued' else None
+        }
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
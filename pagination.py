@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Keyset (Cursor) Pagination for TrueTank
+
+This module handles:
+- Named sort orders per list endpoint, each ending in the primary key so
+  every row has a unique, stable position
+- Opaque cursors holding the sort keys of the last row of a page
+- Fetching a page with WHERE (keys) > (cursor keys) instead of OFFSET, so
+  page 500 costs the same as page 1 and rows inserted meanwhile never make
+  a page repeat or skip rows
+
+A page is fetched in two steps: the sort keys (and ids) of the page, then
+the rows themselves by id, so serializers that build their own column
+projections (ticket_serializer) work unchanged.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+from datetime import date, datetime
+import base64
+import json
+
+from models import db
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+ASC = 'asc'
+DESC = 'desc'
+
+
+def wants_page(args) -> bool:
+    """True if a request asked for a page (limit or cursor given)"""
+    return 'limit' in args or 'cursor' in args
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return ['dt', value.isoformat()]
+    if isinstance(value, date):
+        return ['d', value.isoformat()]
+    return ['v', value]
+
+
+def _decode_value(encoded):
+    kind, value = encoded
+    if kind == 'dt':
+        return datetime.fromisoformat(value)
+    if kind == 'd':
+        return date.fromisoformat(value)
+    return value
+
+
+def encode_cursor(sort_name: str, values: Sequence) -> str:
+    payload = json.dumps({'s': sort_name, 'k': [_encode_value(value) for value in values]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, sort_name: str, key_count: int) -> List:
+    """
+    Sort keys stored in a cursor
+
+    Raises:
+        ValueError: For malformed cursors or cursors from another sort order
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = [_decode_value(value) for value in payload['k']]
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if payload.get('s') != sort_name or len(values) != key_count:
+        raise ValueError('Cursor does not match the sort order')
+    return values
+
+
+def parse_page_args(args, sorts: Dict[str, Sequence[Tuple]], default_sort: str) -> Dict:
+    """
+    Read ?sort=, ?limit= and ?cursor= from a request
+
+    Args:
+        args: request.args
+        sorts: Sort name -> ((expression, ASC|DESC), ...), ending in the primary key
+        default_sort: Sort used when ?sort= is absent
+
+    Raises:
+        ValueError: For unknown sorts, bad limits and bad cursors
+    """
+    sort_name = args.get('sort') or default_sort
+    if sort_name not in sorts:
+        raise ValueError(f"Unknown sort: {sort_name} (expected one of {', '.join(sorts)})")
+    keys = sorts[sort_name]
+
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be at least 1')
+
+    cursor = args.get('cursor')
+    return {
+        'sort': sort_name,
+        'keys': keys,
+        'limit': min(limit, MAX_PAGE_SIZE),
+        'after': decode_cursor(cursor, sort_name, len(keys)) if cursor else None,
+    }
+
+
+def order_by(keys: Sequence[Tuple]) -> List:
+    return [expression.asc() if direction == ASC else expression.desc() for expression, direction in keys]
+
+
+def _after(keys: Sequence[Tuple], values: Sequence):
+    """Rows strictly after `values` in key order (row-value comparison spelled out for mixed directions)"""
+    clauses = []
+    for i, (expression, direction) in enumerate(keys):
+        equal = [keys[j][0] == values[j] for j in range(i)]
+        beyond = expression > values[i] if direction == ASC else expression < values[i]
+        clauses.append(db.and_(*equal, beyond))
+    return db.or_(*clauses)
+
+
+def keyset_page(query, page: Dict) -> Tuple[List[int], Optional[str]]:
+    """
+    Primary keys of one page of a query, in order, and the next page's cursor
+
+    The last sort key must be the primary key.
+
+    Returns:
+        (ids, next_cursor); next_cursor is None on the last page
+    """
+    keys = page['keys']
+    if page['after'] is not None:
+        query = query.filter(_after(keys, page['after']))
+    rows = query.with_entities(*[expression for expression, _ in keys]).order_by(None).order_by(
+        *order_by(keys)
+    ).limit(page['limit'] + 1).all()
+
+    next_cursor = None
+    if len(rows) > page['limit']:
+        rows = rows[:page['limit']]
+        next_cursor = encode_cursor(page['sort'], list(rows[-1]))
+    return [row[-1] for row in rows], next_cursor
+
+
+def page_of_models(query, model, page: Dict) -> Tuple[List, Optional[str]]:
+    """One page of ORM objects, in sort order, and the next page's cursor"""
+    ids, next_cursor = keyset_page(query, page)
+    if not ids:
+        return [], next_cursor
+    by_id = {obj.id: obj for obj in model.query.filter(model.id.in_(ids))}
+    return [by_id[i] for i in ids if i in by_id], next_cursor
+
+
+def page_response(items: List, page: Dict, next_cursor: Optional[str]) -> Dict:
+    """JSON envelope shared by every paginated endpoint"""
+    return {'items': items, 'next_cursor': next_cursor, 'limit': page['limit'], 'sort': page['sort']}
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Gap-Based Ticket Ordering for TrueTank
+
+This module handles:
+- Sortable position keys for kanban columns (column_position) and truck
+  routes (route_position), spaced POSITION_GAP apart
+- Turning a drop index into a key between the two neighbouring tickets, so
+  a drag-and-drop move writes only the moved ticket
+- Rebalancing a column or route back to even gaps, inline when a gap is
+  used up and in the background when one is getting tight
+- Migrating the old sequential positions (0, 1, 2, ...) lazily: the first
+  move into a column that has no room renumbers it once
+
+Keys stay integers so existing clients keep sorting on them unchanged.
+"""
+
+from typing import List, NamedTuple, Optional, Tuple
+from datetime import date
+import os
+import threading
+
+from models import db, Ticket
+
+# Distance between neighbouring keys after a rebalance: ten moves into the
+# same slot before it fills up
+POSITION_GAP = 1024
+
+# Rebalance in the background once a move leaves less room than this
+REBALANCE_THRESHOLD = int(os.environ.get('POSITION_REBALANCE_THRESHOLD', 16))
+REBALANCE_IN_BACKGROUND = os.environ.get('POSITION_REBALANCE_IN_BACKGROUND', 'true').lower() == 'true'
+
+# Keys must fit a 32-bit INTEGER column on Postgres
+MIN_POSITION = -(2 ** 31) + POSITION_GAP
+MAX_POSITION = 2 ** 31 - 1 - POSITION_GAP
+
+
+class Scope(NamedTuple):
+    """One ordered list of tickets: a kanban column or a truck's route on a day"""
+    kind: str  # 'column' or 'route'
+    status: Optional[str] = None
+    truck_id: Optional[int] = None
+    day: Optional[date] = None
+
+
+def column_scope(status: str) -> Scope:
+    return Scope('column', status=status)
+
+
+def route_scope(truck_id: int, day: date) -> Scope:
+    return Scope('route', truck_id=int(truck_id), day=day)
+
+
+def _attribute(scope: Scope):
+    return Ticket.column_position if scope.kind == 'column' else Ticket.route_position
+
+
+def scope_query(scope: Scope, exclude_id: Optional[int] = None):
+    """Tickets in a scope, in display order"""
+    attribute = _attribute(scope)
+    if scope.kind == 'column':
+        query = Ticket.query.filter(Ticket.status == scope.status)
+    else:
+        query = Ticket.query.filter(Ticket.truck_id == scope.truck_id, Ticket.scheduled_on(scope.day))
+    if exclude_id is not None:
+        query = query.filter(Ticket.id != exclude_id)
+    return query.order_by(attribute.asc().nullslast(), Ticket.id)
+
+
+def _neighbours(scope: Scope, index: int, exclude_id: Optional[int]) -> Tuple[Optional[int], Optional[int], bool]:
+    """
+    Keys either side of a drop index (ignoring the ticket being moved)
+
+    Returns:
+        (before, after, ok); ok is False when a neighbour has no key yet
+    """
+    attribute = _attribute(scope)
+    query = scope_query(scope, exclude_id).with_entities(attribute)
+    if index <= 0:
+        rows = query.limit(1).all()
+        before, after = [], rows
+    else:
+        rows = query.offset(index - 1).limit(2).all()
+        if not rows:
+            # Dropped past the end: append after the last ticket
+            rows = scope_query(scope, exclude_id).with_entities(attribute).order_by(None).order_by(
+                attribute.desc().nullsfirst(), Ticket.id.desc()
+            ).limit(1).all()
+        before, after = rows[:1], rows[1:]
+
+    keys = [row[0] for row in before + after]
+    if any(key is None for key in keys):
+        return None, None, False
+    return (before[0][0] if before else None), (after[0][0] if after else None), True
+
+
+def _key_between(before: Optional[int], after: Optional[int]) -> Optional[int]:
+    """A key strictly between two neighbours, or None if there is no room"""
+    if before is None and after is None:
+        return POSITION_GAP
+    if before is None:
+        key = after - POSITION_GAP
+    elif after is None:
+        key = before + POSITION_GAP
+    elif after - before >= 2:
+        key = (before + after) // 2
+    else:
+        return None
+    return key if MIN_POSITION <= key <= MAX_POSITION else None
+
+
+def rebalance(scope: Scope, exclude_id: Optional[int] = None) -> int:
+    """
+    Renumber a scope to POSITION_GAP, 2 * POSITION_GAP, ... keeping its order
+
+    Rows already on the right key are left alone, so rebalancing a column
+    that is mostly even writes little. Also migrates old sequential keys.
+    Runs in the caller's transaction.
+
+    Returns:
+        Number of tickets whose key changed
+    """
+    attribute = _attribute(scope)
+    rows = scope_query(scope, exclude_id).with_entities(Ticket.id, attribute).with_for_update().all()
+    updates = [
+        {'id': ticket_id, attribute.key: (i + 1) * POSITION_GAP}
+        for i, (ticket_id, key) in enumerate(rows)
+        if key != (i + 1) * POSITION_GAP
+    ]
+    if updates:
+        db.session.execute(db.update(Ticket), updates)
+    return len(updates)
+
+
+def position_for_index(scope: Scope, index: int, exclude_id: Optional[int] = None) -> Tuple[int, bool]:
+    """
+    Key that places a ticket at a drop index within a scope
+
+    Args:
+        scope: Column or route the ticket is dropped into
+        index: Position among the scope's other tickets (0 = first)
+        exclude_id: The ticket being moved, if it is already in the scope
+
+    Returns:
+        (key, tight); tight means the gap is nearly used up and the scope
+        should be rebalanced soon (see schedule_rebalance)
+    """
+    index = max(int(index or 0), 0)
+    before, after, ok = _neighbours(scope, index, exclude_id)
+    key = _key_between(before, after) if ok else None
+    if key is None:
+        # No room (or keys from before gaps existed): renumber once and retry
+        rebalance(scope, exclude_id)
+        before, after, ok = _neighbours(scope, index, exclude_id)
+        key = _key_between(before, after)
+
+    tight = before is not None and after is not None and after - before < REBALANCE_THRESHOLD
+    return key, tight
+
+
+def append_positions(scope: Scope, count: int) -> List[int]:
+    """Keys for `count` new tickets at the end of a scope"""
+    last = scope_query(scope).with_entities(_attribute(scope)).order_by(None).order_by(
+        _attribute(scope).desc().nullslast()
+    ).limit(1).scalar()
+    start = (last or 0) + POSITION_GAP
+    return [start + i * POSITION_GAP for i in range(count)]
+
+
+# Background rebalancing
+
+_scheduled = set()
+_scheduled_lock = threading.Lock()
+
+
+def _rebalance_worker(app, scope: Scope):
+    try:
+        with app.app_context():
+            try:
+                changed = rebalance(scope)
+                db.session.commit()
+                print(f"Rebalanced {scope.kind} {scope.status or f'{scope.truck_id}/{scope.day}'}: {changed} tickets")
+            except Exception as e:
+                db.session.rollback()
+                print(f"Position rebalance error: {e}")
+            finally:
+                db.session.remove()
+    finally:
+        with _scheduled_lock:
+            _scheduled.discard(scope)
+
+
+def schedule_rebalance(app, scope: Scope) -> bool:
+    """
+    Rebalance a scope after the current request, off the request thread
+
+    Call after committing the move that made the scope tight. At most one
+    rebalance per scope is in flight per worker.
+
+    Returns:
+        True if a rebalance was started
+    """
+    if not REBALANCE_IN_BACKGROUND:
+        return False
+    with _scheduled_lock:
+        if scope in _scheduled:
+            return False
+        _scheduled.add(scope)
+    threading.Thread(target=_rebalance_worker, args=(app, scope), name='position-rebalance', daemon=True).start()
+    return True
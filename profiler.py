@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+SQL Query Profiler for TrueTank
+
+This module handles:
+- Opt-in profiling of the SQL each request runs (SQL_PROFILER=1, or the
+  switch on /admin), optionally for a sample of requests
+- Grouping statements by shape (literals and IN-list lengths removed) and
+  flagging shapes repeated within one request as N+1 suspects, with the
+  application line that issued the first of them
+- Capturing the plan of statements slower than SQL_PROFILER_SLOW_MS:
+  EXPLAIN (ANALYZE, BUFFERS) for SELECTs on PostgreSQL, plain EXPLAIN for
+  other statements there, EXPLAIN QUERY PLAN on SQLite
+- Keeping the last SQL_PROFILER_BUFFER request reports in a ring buffer
+  per worker, shown on /admin
+
+EXPLAIN ANALYZE runs the statement a second time, so profiling is for
+finding hot paths, not for leaving on.
+"""
+
+from typing import Dict, List, Optional
+from collections import deque
+from datetime import datetime
+import itertools
+import os
+import random
+import re
+import sysconfig
+import threading
+import time
+import traceback
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SQL_PROFILER_SLOW_MS = float(os.environ.get('SQL_PROFILER_SLOW_MS', 100))
+SQL_PROFILER_N_PLUS_ONE = int(os.environ.get('SQL_PROFILER_N_PLUS_ONE', 5))
+SQL_PROFILER_BUFFER = int(os.environ.get('SQL_PROFILER_BUFFER', 200))
+
+# Plans captured per request, and shapes listed per report
+MAX_EXPLAINS = 5
+TOP_SHAPES = 10
+
+# Requests never profiled (the profiler's own endpoints and static files)
+SKIP_PATHS = ('/api/profiler', '/metrics', '/static/')
+
+# Frames from these paths are skipped when finding the line that issued a query
+_LIBRARY_PATHS = (os.sep + 'site-packages' + os.sep, os.sep + 'sqlalchemy' + os.sep, os.sep + 'flask' + os.sep,
+                  os.sep + 'jinja2' + os.sep, os.sep + 'werkzeug' + os.sep, sysconfig.get_paths()['stdlib'], __file__)
+
+_state = {
+    'enabled': os.environ.get('SQL_PROFILER', '0') == '1',
+    'sample_rate': float(os.environ.get('SQL_PROFILER_SAMPLE', 1.0)),
+}
+_reports = deque(maxlen=SQL_PROFILER_BUFFER)
+_reports_lock = threading.Lock()
+_report_ids = itertools.count(1)
+
+
+def is_enabled() -> bool:
+    return _state['enabled']
+
+
+def configure(enabled: Optional[bool] = None, sample_rate: Optional[float] = None) -> Dict:
+    """
+    Turn profiling on or off for this worker
+
+    Raises:
+        ValueError: For sample rates outside (0, 1]
+    """
+    if sample_rate is not None:
+        sample_rate = float(sample_rate)
+        if not 0 < sample_rate <= 1:
+            raise ValueError('sample_rate must be greater than 0 and at most 1')
+        _state['sample_rate'] = sample_rate
+    if enabled is not None:
+        _state['enabled'] = bool(enabled)
+    return settings()
+
+
+def settings() -> Dict:
+    return {
+        'enabled': _state['enabled'],
+        'sample_rate': _state['sample_rate'],
+        'slow_ms': SQL_PROFILER_SLOW_MS,
+        'n_plus_one_threshold': SQL_PROFILER_N_PLUS_ONE,
+        'buffer_size': SQL_PROFILER_BUFFER,
+    }
+
+
+# Statement shapes
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_NAMED_PARAMETER = re.compile(r"%\(\w+\)s|:\w+\b|\$\d+|\?")
+_PARAMETER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """A statement with literals and parameters replaced by ? and IN lists collapsed"""
+    shape = _STRING_LITERAL.sub('?', statement)
+    shape = _NAMED_PARAMETER.sub('?', shape)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _PARAMETER_LIST.sub('(?, ...)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+def _caller() -> Optional[str]:
+    """The innermost application frame on the stack (file:line in function)"""
+    for frame in reversed(traceback.extract_stack()):
+        if not any(part in frame.filename for part in _LIBRARY_PATHS):
+            return f"{os.path.basename(frame.filename)}:{frame.lineno} in {frame.name}"
+    return None
+
+
+# Plans
+
+def _explain(cursor, dialect_name: str, statement: str, parameters) -> List[str]:
+    """Plan of a statement, run on the statement's own DBAPI connection"""
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    if dialect_name == 'postgresql':
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS) ' if verb in ('SELECT', 'WITH') else 'EXPLAIN '
+    elif dialect_name == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        prefix = 'EXPLAIN '
+    # A raw cursor, so the profiler doesn't see its own statements
+    explain_cursor = cursor.connection.cursor()
+    # On PostgreSQL a failed EXPLAIN would abort the request's transaction
+    savepoint = dialect_name == 'postgresql'
+    try:
+        if savepoint:
+            explain_cursor.execute('SAVEPOINT sql_profiler_explain')
+        try:
+            explain_cursor.execute(prefix + statement, parameters)
+            rows = explain_cursor.fetchall()
+        except Exception:
+            if savepoint:
+                explain_cursor.execute('ROLLBACK TO SAVEPOINT sql_profiler_explain')
+            raise
+        if savepoint:
+            explain_cursor.execute('RELEASE SAVEPOINT sql_profiler_explain')
+        return [str(row[-1]) if dialect_name == 'sqlite' else ' '.join(str(value) for value in row) for row in rows]
+    finally:
+        explain_cursor.close()
+
+
+# Hooks
+
+def _profiling() -> bool:
+    return has_request_context() and g.get('profiler') is not None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _profiling():
+        conn.info.setdefault('profiler_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('profiler_query_start')
+    if not starts or not _profiling():
+        return
+    elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+    profile = g.profiler
+    profile['statements'] += 1
+    profile['sql_ms'] += elapsed_ms
+
+    shape = statement_shape(statement)
+    entry = profile['shapes'].get(shape)
+    if entry is None:
+        entry = profile['shapes'][shape] = {'shape': shape, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                            'caller': _caller()}
+    entry['count'] += 1
+    entry['total_ms'] += elapsed_ms
+    entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+
+    if elapsed_ms >= SQL_PROFILER_SLOW_MS and not executemany and len(profile['slow']) < MAX_EXPLAINS:
+        slow = {'statement': statement, 'duration_ms': round(elapsed_ms, 2), 'caller': entry['caller']}
+        try:
+            slow['plan'] = _explain(cursor, conn.dialect.name, statement, parameters)
+        except Exception as e:
+            slow['plan_error'] = str(e)
+        profile['slow'].append(slow)
+
+
+def _discard_query_start(context):
+    starts = context.connection.info.get('profiler_query_start') if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+event.listen(Engine, 'handle_error', _discard_query_start)
+
+
+def _start_request():
+    if not _state['enabled'] or request.path.startswith(SKIP_PATHS):
+        return
+    if _state['sample_rate'] < 1 and random.random() >= _state['sample_rate']:
+        return
+    g.profiler = {'started': time.perf_counter(), 'statements': 0, 'sql_ms': 0.0, 'shapes': {}, 'slow': []}
+
+
+def _record_status(response):
+    if g.get('profiler') is not None:
+        g.profiler['status'] = response.status_code
+    return response
+
+
+def _finish_request(error=None):
+    profile = g.pop('profiler', None)
+    if profile is None:
+        return
+    shapes = sorted(profile['shapes'].values(), key=lambda entry: entry['total_ms'], reverse=True)
+    for entry in shapes:
+        entry['total_ms'] = round(entry['total_ms'], 2)
+        entry['max_ms'] = round(entry['max_ms'], 2)
+    report = {
+        'id': next(_report_ids),
+        'at': datetime.utcnow().isoformat(timespec='seconds'),
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'route': request.url_rule.rule if request.url_rule is not None else None,
+        'status': profile.get('status', 500),
+        'duration_ms': round((time.perf_counter() - profile['started']) * 1000, 2),
+        'statements': profile['statements'],
+        'sql_ms': round(profile['sql_ms'], 2),
+        'n_plus_one': sorted([entry for entry in shapes if entry['count'] >= SQL_PROFILER_N_PLUS_ONE],
+                             key=lambda entry: entry['count'], reverse=True),
+        'slow': profile['slow'],
+        'shapes': shapes[:TOP_SHAPES],
+        'distinct_shapes': len(shapes),
+    }
+    with _reports_lock:
+        _reports.append(report)
+
+
+def init_app(app):
+    """Profile requests of a Flask app while the profiler is enabled"""
+    app.before_request(_start_request)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_request)
+
+
+# Reports
+
+def reports(limit: Optional[int] = None, suspects_only: bool = False) -> List[Dict]:
+    """Recent request reports, newest first"""
+    with _reports_lock:
+        found = list(reversed(_reports))
+    if suspects_only:
+        found = [report for report in found if report['n_plus_one'] or report['slow']]
+    return found[:limit] if limit else found
+
+
+def clear():
+    with _reports_lock:
+        _reports.clear()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Stop Sequence Optimization for TrueTank
+
+This module handles:
+- Nearest-neighbor route construction over a duration matrix
+- 2-opt and Or-opt local search improvement
+- Routes that start and end at the truck's storage location
+- Fixed-position stops (dumps, jobs already started) that must not move
+
+All functions work on matrix indexes only, so they can be reused by any
+planner that can produce a duration matrix.
+"""
+
+from typing import Dict, List, Optional, Sequence
+import time
+
+# Cost used for pairs the routing provider could not route
+UNREACHABLE = 10 ** 6
+
+# Longest chain of consecutive stops Or-opt tries to relocate
+OR_OPT_MAX_CHAIN = 3
+
+
+def leg_cost(durations: Sequence[Sequence[Optional[float]]], a: int, b: int) -> float:
+    """Duration between two matrix indexes (UNREACHABLE if unknown)"""
+    value = durations[a][b]
+    return UNREACHABLE if value is None else value
+
+
+def path_cost(durations: Sequence[Sequence[Optional[float]]], path: Sequence[int]) -> float:
+    """Total duration along a path of matrix indexes"""
+    return sum(leg_cost(durations, path[i], path[i + 1]) for i in range(len(path) - 1))
+
+
+def nearest_neighbor(durations: Sequence[Sequence[Optional[float]]], start: int, stops: Sequence[int]) -> List[int]:
+    """
+    Order stops by repeatedly visiting the closest unvisited one
+
+    Args:
+        durations: Duration matrix
+        start: Matrix index the path leaves from
+        stops: Matrix indexes to visit
+
+    Returns:
+        Stops in visiting order (start not included)
+    """
+    remaining = list(stops)
+    order = []
+    current = start
+    while remaining:
+        nearest = min(remaining, key=lambda stop: leg_cost(durations, current, stop))
+        remaining.remove(nearest)
+        order.append(nearest)
+        current = nearest
+    return order
+
+
+def two_opt(durations: Sequence[Sequence[Optional[float]]], path: List[int]) -> bool:
+    """
+    Apply the first improving 2-opt move (segment reversal) to a path in place
+
+    The first and last entries of the path are fixed endpoints. Durations may
+    be asymmetric, so reversed segment costs come from prefix sums in both
+    directions, keeping each move evaluation O(1).
+
+    Returns:
+        True if the path was improved
+    """
+    n = len(path)
+    if n < 4:
+        return False
+
+    forward = [0.0] * n
+    backward = [0.0] * n
+    for k in range(1, n):
+        forward[k] = forward[k - 1] + leg_cost(durations, path[k - 1], path[k])
+        backward[k] = backward[k - 1] + leg_cost(durations, path[k], path[k - 1])
+
+    for i in range(1, n - 2):
+        for j in range(i + 1, n - 1):
+            before = (leg_cost(durations, path[i - 1], path[i])
+                      + (forward[j] - forward[i])
+                      + leg_cost(durations, path[j], path[j + 1]))
+            after = (leg_cost(durations, path[i - 1], path[j])
+                     + (backward[j] - backward[i])
+                     + leg_cost(durations, path[i], path[j + 1]))
+            if after < before - 1e-9:
+                path[i:j + 1] = reversed(path[i:j + 1])
+                return True
+    return False
+
+
+def or_opt(durations: Sequence[Sequence[Optional[float]]], path: List[int]) -> bool:
+    """
+    Apply the first improving Or-opt move (relocate a chain of 1-3 stops) in place
+
+    The first and last entries of the path are fixed endpoints.
+
+    Returns:
+        True if the path was improved
+    """
+    n = len(path)
+    for length in range(1, OR_OPT_MAX_CHAIN + 1):
+        for i in range(1, n - length):
+            j = i + length - 1  # last index of the chain
+            if j >= n - 1:
+                break
+            prev_stop, next_stop = path[i - 1], path[j + 1]
+            first, last = path[i], path[j]
+            removal_gain = (leg_cost(durations, prev_stop, first)
+                            + leg_cost(durations, last, next_stop)
+                            - leg_cost(durations, prev_stop, next_stop))
+
+            for k in range(0, n - 1):
+                # Insert between path[k] and path[k + 1], outside the chain
+                if i - 1 <= k <= j:
+                    continue
+                a, b = path[k], path[k + 1]
+                insertion_cost = (leg_cost(durations, a, first)
+                                  + leg_cost(durations, last, b)
+                                  - leg_cost(durations, a, b))
+                if insertion_cost < removal_gain - 1e-9:
+                    chain = path[i:j + 1]
+                    del path[i:j + 1]
+                    insert_at = k + 1 if k < i else k + 1 - length
+                    path[insert_at:insert_at] = chain
+                    return True
+    return False
+
+
+def improve_path(durations: Sequence[Sequence[Optional[float]]], path: List[int],
+                 deadline: Optional[float] = None) -> List[int]:
+    """Run 2-opt and Or-opt until neither improves the path (or the deadline passes)"""
+    improved = True
+    while improved:
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+        improved = two_opt(durations, path) or or_opt(durations, path)
+    return path
+
+
+def _solve_segment(durations, head: int, segment: Sequence[int], tail: int,
+                   deadline: Optional[float]) -> List[int]:
+    """Order the free stops between two anchors"""
+    if len(segment) < 2:
+        return list(segment)
+    path = [head] + nearest_neighbor(durations, head, segment) + [tail]
+    improve_path(durations, path, deadline)
+    return path[1:-1]
+
+
+def optimize_sequence(durations: Sequence[Sequence[Optional[float]]], start: int, end: int,
+                      stops: Sequence[int], fixed: Optional[Sequence[int]] = None,
+                      time_budget: Optional[float] = None) -> Dict:
+    """
+    Find a short visiting order for a truck's stops
+
+    Fixed stops keep their position in the sequence and split the route into
+    segments; free stops are reordered within their segment, so the stops
+    between two dumps stay between those dumps.
+
+    Args:
+        durations: Duration matrix (minutes); None entries are unroutable
+        start: Matrix index of the start (storage location)
+        end: Matrix index of the end (usually the same storage location)
+        stops: Matrix indexes of the stops in their current order
+        fixed: Matrix indexes of stops that must not move
+        time_budget: Optional seconds to spend on improvement
+
+    Returns:
+        Dict with order (stops only), cost, initial_cost, minutes_saved and elapsed_ms
+    """
+    started = time.perf_counter()
+    deadline = started + time_budget if time_budget else None
+    fixed = set(fixed or [])
+
+    initial_cost = path_cost(durations, [start] + list(stops) + [end])
+
+    # Split into segments between anchors (start, fixed stops, end)
+    order = []
+    segment = []
+    anchor = start
+    for stop in stops:
+        if stop in fixed:
+            order.extend(_solve_segment(durations, anchor, segment, stop, deadline))
+            order.append(stop)
+            anchor = stop
+            segment = []
+        else:
+            segment.append(stop)
+    order.extend(_solve_segment(durations, anchor, segment, end, deadline))
+
+    cost = path_cost(durations, [start] + order + [end])
+    if cost > initial_cost:
+        # Local search never makes things worse than the dispatcher's order
+        order, cost = list(stops), initial_cost
+
+    return {
+        'order': order,
+        'cost': round(cost, 1),
+        'initial_cost': round(initial_cost, 1),
+        'minutes_saved': round(initial_cost - cost, 1),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+    }
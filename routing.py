@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""
+Drive-Time Routing and Leg Cache for TrueTank
+
+This module handles:
+- Snapping coordinates to a ~10 m grid for cache keys
+- Persistent route leg cache (duration, distance, encoded geometry) with TTL
+- Routing provider abstraction (OpenRouteService) with batch matrix requests
+- Duration/distance matrices for multi-stop routes, geometry only on demand
+- One provider call for concurrent misses of the same leg or matrix block
+  (singleflight)
+- Cache hit/miss counters
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from datetime import datetime, timedelta
+import os
+import threading
+
+import http_client
+from models import db, RouteLegCache
+import geocoding
+import singleflight
+from geocoding import LRUCache, OPENROUTE_BASE_URL
+
+DEFAULT_PROFILE = 'driving-car'
+
+# 4 decimal places is ~11 m of latitude; close enough that two geocodes of
+# the same driveway share a leg, far enough apart to keep neighbours distinct
+SNAP_DECIMALS = 4
+
+ROUTE_LEG_CACHE_TTL_SECONDS = int(os.environ.get('ROUTE_LEG_CACHE_TTL_SECONDS', 30 * 24 * 3600))
+ROUTE_LEG_LRU_SIZE = int(os.environ.get('ROUTE_LEG_LRU_SIZE', 8192))
+
+# Largest number of sources (and destinations) sent in one matrix request;
+# bigger matrices are requested block by block
+MATRIX_BLOCK_SIZE = int(os.environ.get('ROUTE_MATRIX_BLOCK_SIZE', 25))
+
+_memory_cache = LRUCache(ROUTE_LEG_LRU_SIZE)
+
+_stats_lock = threading.Lock()
+_stats = {
+    'memory_hits': 0,
+    'db_hits': 0,
+    'misses': 0,
+    'provider_calls': 0,
+    'matrix_calls': 0,
+    'provider_errors': 0,
+}
+
+
+def _count(name: str, amount: int = 1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def get_cache_stats() -> Dict:
+    """Return leg cache hit/miss counters for this process"""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+    stats['lookups'] = lookups
+    stats['hit_rate'] = round((stats['memory_hits'] + stats['db_hits']) / lookups, 3) if lookups else None
+    stats['memory_entries'] = len(_memory_cache)
+    return stats
+
+
+def snap_coordinate(latitude: float, longitude: float) -> Tuple[float, float]:
+    """Snap a coordinate pair to the leg cache grid"""
+    return round(float(latitude), SNAP_DECIMALS), round(float(longitude), SNAP_DECIMALS)
+
+
+def leg_key(origin: Dict, destination: Dict, profile: str = DEFAULT_PROFILE) -> str:
+    """Build the cache key for an origin/destination/profile triple"""
+    o_lat, o_lng = snap_coordinate(origin['latitude'], origin['longitude'])
+    d_lat, d_lng = snap_coordinate(destination['latitude'], destination['longitude'])
+    return f"{profile}:{o_lat:.{SNAP_DECIMALS}f},{o_lng:.{SNAP_DECIMALS}f}:{d_lat:.{SNAP_DECIMALS}f},{d_lng:.{SNAP_DECIMALS}f}"
+
+
+# Routing providers
+
+class RoutingProvider:
+    """Interface for drive-time providers used by the route planners"""
+    name = 'base'
+
+    def directions(self, origin: Tuple[float, float], destination: Tuple[float, float],
+                   profile: str = DEFAULT_PROFILE) -> Optional[Dict]:
+        """Return duration_seconds, distance_meters and geometry for one leg"""
+        raise NotImplementedError
+
+    def matrix(self, sources: Sequence[Tuple[float, float]], destinations: Sequence[Tuple[float, float]],
+               profile: str = DEFAULT_PROFILE) -> Optional[Dict]:
+        """Return 'durations' (seconds) and 'distances' (meters) as sources x destinations lists"""
+        raise NotImplementedError
+
+
+class OpenRouteServiceProvider(RoutingProvider):
+    """OpenRouteService directions and matrix API"""
+    name = 'openroute'
+
+    def __init__(self, api_key: str, base_url: str = OPENROUTE_BASE_URL):
+        self.api_key = api_key
+        self.base_url = base_url
+
+    def _post(self, path: str, payload: Dict) -> Dict:
+        response = http_client.post(
+            'openroute',
+            f"{self.base_url}{path}",
+            json=payload,
+            headers={
+                'Authorization': self.api_key,
+                'Content-Type': 'application/json'
+            }
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def directions(self, origin, destination, profile=DEFAULT_PROFILE):
+        _count('provider_calls')
+        try:
+            data = self._post(f"/v2/directions/{profile}", {
+                'coordinates': [
+                    [origin[1], origin[0]],
+                    [destination[1], destination[0]]
+                ],
+                'instructions': False
+            })
+            routes = data.get('routes') or []
+            if not routes:
+                return None
+
+            route = routes[0]
+            return {
+                'duration_seconds': route['summary'].get('duration', 0),
+                'distance_meters': route['summary'].get('distance', 0),
+                'geometry': route.get('geometry')
+            }
+        except Exception as e:
+            _count('provider_errors')
+            print(f"Directions error for {origin} -> {destination}: {e}")
+            return None
+
+    def matrix(self, sources, destinations, profile=DEFAULT_PROFILE):
+        _count('matrix_calls')
+        # ORS takes one location list plus index lists for sources/destinations
+        locations = [[lng, lat] for lat, lng in sources] + [[lng, lat] for lat, lng in destinations]
+        try:
+            data = self._post(f"/v2/matrix/{profile}", {
+                'locations': locations,
+                'sources': list(range(len(sources))),
+                'destinations': list(range(len(sources), len(locations))),
+                'metrics': ['duration', 'distance'],
+                'units': 'm'
+            })
+            return {
+                'durations': data.get('durations'),
+                'distances': data.get('distances')
+            }
+        except Exception as e:
+            _count('provider_errors')
+            print(f"Matrix error for {len(sources)}x{len(destinations)} locations: {e}")
+            return None
+
+
+_provider_override = None
+
+
+def set_provider(provider: Optional[RoutingProvider]):
+    """Replace the routing provider (None restores the environment default)"""
+    global _provider_override
+    _provider_override = provider
+
+
+def get_provider() -> Optional[RoutingProvider]:
+    """Return the configured routing provider, or None if routing is unavailable"""
+    if _provider_override is not None:
+        return _provider_override
+
+    api_key = os.environ.get('OPENROUTE_API_KEY')
+    if not api_key:
+        print("Warning: OPENROUTE_API_KEY not configured")
+        return None
+    return OpenRouteServiceProvider(api_key)
+
+
+# Database cache
+
+def _row_to_leg(row) -> Dict:
+    return {
+        'duration_minutes': round(row['duration_seconds'] / 60, 1),
+        'distance_km': round(row['distance_meters'] / 1000, 2),
+        'geometry': row['geometry']
+    }
+
+
+def _row_expiry(row) -> datetime:
+    return row['created_at'] + timedelta(seconds=row['ttl_seconds'] or ROUTE_LEG_CACHE_TTL_SECONDS)
+
+
+def _load_many(keys: Iterable[str]) -> Dict[str, Dict]:
+    """Read non-expired leg cache rows for many keys (outside the request session)"""
+    table = RouteLegCache.__table__
+    keys = list(keys)
+    found = {}
+    now = datetime.utcnow()
+    try:
+        with db.engine.connect() as conn:
+            for start in range(0, len(keys), 500):
+                rows = conn.execute(
+                    table.select().where(table.c.leg_key.in_(keys[start:start + 500]))
+                ).mappings().all()
+                for row in rows:
+                    expires_at = _row_expiry(row)
+                    if expires_at > now:
+                        leg = _row_to_leg(row)
+                        leg['_expires_at'] = expires_at
+                        found[row['leg_key']] = leg
+    except Exception as e:
+        print(f"Route leg cache read error: {e}")
+    return found
+
+
+def _store_many(rows: List[Dict], ttl_seconds: int):
+    """Insert or replace leg cache rows in one transaction"""
+    if not rows:
+        return
+    table = RouteLegCache.__table__
+    now = datetime.utcnow()
+    for row in rows:
+        row['created_at'] = now
+        row['ttl_seconds'] = ttl_seconds
+    try:
+        with db.engine.begin() as conn:
+            keys = [row['leg_key'] for row in rows]
+            for start in range(0, len(keys), 500):
+                conn.execute(table.delete().where(table.c.leg_key.in_(keys[start:start + 500])))
+            conn.execute(table.insert(), rows)
+    except Exception as e:
+        print(f"Route leg cache write error: {e}")
+
+
+def _cache_row(key: str, origin: Tuple[float, float], destination: Tuple[float, float], profile: str,
+               duration_seconds: float, distance_meters: float, geometry: Optional[str]) -> Dict:
+    return {
+        'leg_key': key,
+        'profile': profile,
+        'origin_latitude': origin[0],
+        'origin_longitude': origin[1],
+        'dest_latitude': destination[0],
+        'dest_longitude': destination[1],
+        'duration_seconds': duration_seconds,
+        'distance_meters': distance_meters,
+        'geometry': geometry
+    }
+
+
+def _lookup(keys: Sequence[str]) -> Dict[str, Dict]:
+    """Look keys up in the LRU, then the database; counts hits and misses"""
+    found = {}
+    remaining = []
+    for key in keys:
+        leg = _memory_cache.get(key)
+        if leg is not None:
+            found[key] = leg
+        else:
+            remaining.append(key)
+    _count('memory_hits', len(found))
+
+    if remaining:
+        from_db = _load_many(remaining)
+        for key, leg in from_db.items():
+            expires_at = leg.pop('_expires_at')
+            _memory_cache.put(key, leg, expires_at)
+            found[key] = leg
+        _count('db_hits', len(from_db))
+        _count('misses', len(remaining) - len(from_db))
+
+    return found
+
+
+def get_leg(origin: Dict, destination: Dict, profile: str = DEFAULT_PROFILE,
+            need_geometry: bool = True, ttl_seconds: Optional[int] = None) -> Optional[Dict]:
+    """
+    Get drive time, distance and geometry for one leg, using the leg cache
+
+    Args:
+        origin: Dict with latitude and longitude
+        destination: Dict with latitude and longitude
+        profile: Routing profile
+        need_geometry: Treat cached legs without geometry (from matrix requests) as misses
+        ttl_seconds: TTL for a newly cached leg (defaults to ROUTE_LEG_CACHE_TTL_SECONDS)
+
+    Returns:
+        Dict with duration_minutes, distance_km and geometry, or None
+    """
+    key = leg_key(origin, destination, profile)
+    cached = _lookup([key]).get(key)
+    if cached is not None and (cached['geometry'] or not need_geometry):
+        return dict(cached)
+
+    provider = get_provider()
+    if not provider:
+        return None
+
+    snapped_origin = snap_coordinate(origin['latitude'], origin['longitude'])
+    snapped_destination = snap_coordinate(destination['latitude'], destination['longitude'])
+    ttl_seconds = ttl_seconds or ROUTE_LEG_CACHE_TTL_SECONDS
+
+    def fetch():
+        fetched = provider.directions(snapped_origin, snapped_destination, profile)
+        if fetched:
+            _store_many([_cache_row(key, snapped_origin, snapped_destination, profile,
+                                    fetched['duration_seconds'], fetched['distance_meters'],
+                                    fetched['geometry'])], ttl_seconds)
+        return fetched
+
+    # Concurrent misses for this leg (in any worker) share one directions call
+    result = singleflight.do('leg', key, fetch)
+    if not result:
+        return None
+
+    leg = {
+        'duration_minutes': round(result['duration_seconds'] / 60, 1),
+        'distance_km': round(result['distance_meters'] / 1000, 2),
+        'geometry': result['geometry']
+    }
+    _memory_cache.put(key, leg, datetime.utcnow() + timedelta(seconds=ttl_seconds))
+    return dict(leg)
+
+
+def store_leg(origin: Dict, destination: Dict, duration_seconds: float, distance_meters: float,
+              profile: str = DEFAULT_PROFILE, ttl_seconds: Optional[int] = None):
+    """
+    Cache the summary of a leg fetched elsewhere (e.g. full directions)
+
+    Only fills a missing entry; a cached leg (possibly with geometry) is
+    left alone. The leg is stored without geometry.
+    """
+    key = leg_key(origin, destination, profile)
+    if _lookup([key]).get(key) is not None:
+        return
+    ttl_seconds = ttl_seconds or ROUTE_LEG_CACHE_TTL_SECONDS
+    snapped_origin = snap_coordinate(origin['latitude'], origin['longitude'])
+    snapped_destination = snap_coordinate(destination['latitude'], destination['longitude'])
+    _store_many([_cache_row(key, snapped_origin, snapped_destination, profile,
+                            duration_seconds, distance_meters, None)], ttl_seconds)
+    _memory_cache.put(key, {
+        'duration_minutes': round(duration_seconds / 60, 1),
+        'distance_km': round(distance_meters / 1000, 2),
+        'geometry': None
+    }, datetime.utcnow() + timedelta(seconds=ttl_seconds))
+
+
+def get_matrix(points: Sequence[Dict], profile: str = DEFAULT_PROFILE,
+               ttl_seconds: Optional[int] = None) -> Optional[Dict]:
+    """
+    Build full duration/distance matrices for a list of points
+
+    Cached legs are reused; everything else is fetched with as few matrix
+    requests as possible (one request for up to MATRIX_BLOCK_SIZE points).
+    No geometry is fetched - use get_leg() for legs that will be drawn.
+
+    Args:
+        points: List of dicts with latitude and longitude
+        profile: Routing profile
+        ttl_seconds: TTL for newly cached legs
+
+    Returns:
+        Dict with 'durations' (minutes) and 'distances' (km) as n x n lists,
+        None entries for unroutable pairs; or None if the provider failed
+    """
+    n = len(points)
+    snapped = [snap_coordinate(p['latitude'], p['longitude']) for p in points]
+    durations = [[0.0] * n for _ in range(n)]
+    distances = [[0.0] * n for _ in range(n)]
+
+    keys = {}
+    for i in range(n):
+        for j in range(n):
+            if i != j and snapped[i] != snapped[j]:
+                keys[(i, j)] = leg_key(points[i], points[j], profile)
+
+    cached = _lookup(list(set(keys.values())))
+    missing = set()
+    for (i, j), key in keys.items():
+        leg = cached.get(key)
+        if leg is None:
+            missing.add((i, j))
+        else:
+            durations[i][j] = leg['duration_minutes']
+            distances[i][j] = leg['distance_km']
+
+    if missing:
+        provider = get_provider()
+        if not provider:
+            return None
+
+        ttl_seconds = ttl_seconds or ROUTE_LEG_CACHE_TTL_SECONDS
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl_seconds)
+        blocks = [list(range(start, min(start + MATRIX_BLOCK_SIZE, n))) for start in range(0, n, MATRIX_BLOCK_SIZE)]
+        new_rows = {}
+
+        for source_block in blocks:
+            for dest_block in blocks:
+                if not any((i, j) in missing for i in source_block for j in dest_block):
+                    continue
+
+                sources = [snapped[i] for i in source_block]
+                destinations = [snapped[j] for j in dest_block]
+                result = singleflight.do('matrix', [profile, sources, destinations],
+                                         lambda: provider.matrix(sources, destinations, profile))
+                if not result or result.get('durations') is None:
+                    return None
+
+                for si, i in enumerate(source_block):
+                    for dj, j in enumerate(dest_block):
+                        if (i, j) not in missing:
+                            continue
+                        seconds = result['durations'][si][dj]
+                        meters = result['distances'][si][dj] if result.get('distances') else None
+                        if seconds is None:
+                            durations[i][j] = None
+                            distances[i][j] = None
+                            continue
+
+                        durations[i][j] = round(seconds / 60, 1)
+                        distances[i][j] = round((meters or 0) / 1000, 2)
+                        key = keys[(i, j)]
+                        new_rows[key] = _cache_row(key, snapped[i], snapped[j], profile, seconds, meters or 0, None)
+                        _memory_cache.put(key, {
+                            'duration_minutes': durations[i][j],
+                            'distance_km': distances[i][j],
+                            'geometry': None
+                        }, expires_at)
+
+        _store_many(list(new_rows.values()), ttl_seconds)
+
+    return {'durations': durations, 'distances': distances}
+
+
+def matrix_for_addresses(addresses: Sequence[str], profile: str = DEFAULT_PROFILE,
+                         known: Optional[Dict[str, Dict]] = None) -> Dict:
+    """
+    Geocode addresses (cached) and build their drive-time matrix in one batch
+
+    Repeated addresses (e.g. the storage yard at both ends of a route) are
+    geocoded and routed once.
+
+    Args:
+        addresses: List of address strings
+        profile: Routing profile
+        known: Coordinates already stored for some addresses (address ->
+            dict with latitude and longitude); these are not geocoded
+
+    Returns:
+        Dict with 'coords' (per-address geocode or None) and n x n
+        'durations' (minutes) / 'distances' (km); entries are None when
+        either address could not be geocoded or routed
+    """
+    n = len(addresses)
+    unique_addresses = list(dict.fromkeys(addresses))
+    known = known or {}
+    coords_by_address = {address: known.get(address) or geocoding.geocode(address) for address in unique_addresses}
+    coords = [coords_by_address[address] for address in addresses]
+
+    routable = [address for address in unique_addresses if coords_by_address[address]]
+    index = {address: i for i, address in enumerate(routable)}
+    matrix = get_matrix([coords_by_address[address] for address in routable], profile) if len(routable) > 1 else None
+
+    durations = [[None] * n for _ in range(n)]
+    distances = [[None] * n for _ in range(n)]
+    for i, a in enumerate(addresses):
+        for j, b in enumerate(addresses):
+            if a == b and coords[i]:
+                durations[i][j] = 0.0
+                distances[i][j] = 0.0
+            elif matrix and a in index and b in index:
+                durations[i][j] = matrix['durations'][index[a]][index[b]]
+                distances[i][j] = matrix['distances'][index[a]][index[b]]
+
+    return {'coords': coords, 'durations': durations, 'distances': distances}
@@ -12,6 +12,11 @@ export FLASK_DEBUG=true
 export DATABASE_URL=sqlite:///truetank_dev.db
 export PORT=5555
 
+# Background jobs (route optimization, imports, geocoding) need a worker
+python jobs.py &
+WORKER_PID=$!
+trap 'kill $WORKER_PID 2>/dev/null' EXIT
+
 # Run the Flask development server
 python app.py
 
@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+"""
+Full-Text Search for TrueTank
+
+This module handles:
+- One search document per customer, ticket and permitted septic system in a
+  full-text index: a tsvector column with a GIN index on Postgres, an FTS5
+  virtual table on SQLite
+- Keeping the index current from the ORM flush that writes the record, in
+  the same transaction, so a search never sees an uncommitted or rolled
+  back record
+- Ranked prefix queries for typeahead ("smi 4567" finds John Smith with a
+  phone ending in 4567); titles (names, job IDs, permit numbers) weigh more
+  than the rest of the text
+- Rebuilding the index from the source tables into a shadow table that is
+  renamed into place, so searches and writes are only held up for the swap
+- Building a missing index in a background job instead of in a search request
+
+Results carry their title and subtitle, so a search reads only the index.
+If SQLite was built without FTS5, searches fall back to LIKE over the
+source tables.
+
+Run from the command line:
+    python search.py --rebuild           # re-index every record
+    python search.py "smith septic"      # try a query
+"""
+
+from typing import Dict, Iterable, List, Optional
+from datetime import datetime, timedelta
+import argparse
+import os
+import re
+import weakref
+
+from sqlalchemy import bindparam, event, inspect, text
+from sqlalchemy.orm import Session
+
+import jobs
+from models import db, Customer, SepticSystem, Ticket
+
+SQLITE_TABLE = 'search_index'
+POSTGRES_TABLE = 'search_document'
+SHADOW_SUFFIX = '_rebuild'  # rebuilds fill <table>_rebuild, then rename it over <table>
+
+# Records written this long before a rebuild started are re-indexed again at
+# the swap, covering transactions that flushed before the build's snapshot
+# but committed after it
+REBUILD_CATCH_UP_SECONDS = int(os.environ.get('SEARCH_REBUILD_CATCH_UP_SECONDS', 300))
+
+# Document ids pack the record type into the low bits of the record id so
+# each record has exactly one row, found by primary key on every write
+KIND_CODES = {'customer': 1, 'ticket': 2, 'septic_system': 3}
+KIND_BITS = 2
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+MIN_QUERY_LENGTH = 2
+MAX_QUERY_TERMS = 8
+REBUILD_CHUNK = 1000
+
+# Queries matching more documents than this (a shared area code, a common
+# first name) rank only the newest this-many matches, keeping typeahead
+# latency flat however broad the prefix
+SEARCH_CANDIDATE_LIMIT = int(os.environ.get('SEARCH_CANDIDATE_LIMIT', 10000))
+
+# Columns whose changes re-index a record (everything its document is built from)
+INDEXED_FIELDS = {
+    Customer: ('first_name', 'last_name', 'company_name', 'email', 'phone_primary', 'phone_secondary',
+               'street_address', 'city', 'state', 'zip_code', 'billing_street_address', 'billing_city',
+               'billing_state', 'billing_zip_code'),
+    Ticket: ('job_id', 'customer_id', 'service_type', 'office_notes', 'technician_notes', 'customer_notes',
+             'internal_notes', 'issues_found', 'work_performed'),
+    SepticSystem: ('permit_number', 'customer_id', 'system_type', 'tank_size'),
+}
+
+_TERM = re.compile(r'\w+', re.UNICODE)
+
+
+def doc_id(kind: str, record_id: int) -> int:
+    return (record_id << KIND_BITS) | KIND_CODES[kind]
+
+
+def _digits(value: Optional[str]) -> str:
+    return re.sub(r'\D', '', value or '')
+
+
+def _phone_tokens(value: Optional[str]) -> str:
+    """
+    A phone number as bare digits plus its local number and last four, so
+    prefix queries for "5025554567", "5554567" and "4567" all match it
+    """
+    digits = _digits(value)
+    return _join(dict.fromkeys([digits, digits[-7:], digits[-4:]]))
+
+
+def _compact(value: Optional[str]) -> str:
+    return re.sub(r'\W', '', value or '')
+
+
+def _join(values: Iterable, separator: str = ' ') -> str:
+    return separator.join(str(value) for value in values if value)
+
+
+# Documents
+
+def customer_document(customer: Customer) -> Dict:
+    name = _join([customer.first_name, customer.last_name])
+    phones = [customer.phone_primary, customer.phone_secondary]
+    email = customer.email or ''
+    body = _join([
+        customer.street_address, customer.city, customer.state, customer.zip_code,
+        customer.billing_street_address, customer.billing_city, customer.billing_state, customer.billing_zip_code,
+        *phones, *[_phone_tokens(phone) for phone in phones],
+        # Emails whole and split at @ and dots, so "gmail" and "jsmith" both match
+        email, email.replace('@', ' ').replace('.', ' '),
+    ])
+    return {
+        'kind': 'customer', 'record_id': customer.id, 'customer_id': customer.id,
+        'title': name, 'keywords': _join([name, customer.company_name]),
+        'subtitle': _join([customer.company_name, _join([customer.city, customer.state], ', '),
+                           customer.phone_primary], ' · '),
+        'body': body,
+    }
+
+
+def ticket_document(ticket: Ticket) -> Dict:
+    return {
+        'kind': 'ticket', 'record_id': ticket.id, 'customer_id': ticket.customer_id,
+        'title': ticket.job_id, 'keywords': _join([ticket.job_id, _compact(ticket.job_id)]),
+        'subtitle': ticket.service_type or '',
+        'body': _join([ticket.office_notes, ticket.technician_notes, ticket.customer_notes,
+                       ticket.internal_notes, ticket.issues_found, ticket.work_performed]),
+    }
+
+
+def septic_system_document(system: SepticSystem) -> Optional[Dict]:
+    """Systems are found by permit number; those without one have no document"""
+    if not system.permit_number:
+        return None
+    return {
+        'kind': 'septic_system', 'record_id': system.id, 'customer_id': system.customer_id,
+        'title': system.permit_number,
+        'keywords': _join([system.permit_number, _compact(system.permit_number)]),
+        'subtitle': _join([system.system_type, f"{system.tank_size} gal" if system.tank_size else None], ' · '),
+        'body': '',
+    }
+
+
+DOCUMENTS = {
+    Customer: ('customer', customer_document),
+    Ticket: ('ticket', ticket_document),
+    SepticSystem: ('septic_system', septic_system_document),
+}
+
+
+# Index storage
+
+def _backend(connection) -> str:
+    return 'postgresql' if connection.dialect.name == 'postgresql' else 'sqlite'
+
+
+# Per-engine answers to "was SQLite built with FTS5?" and "does the index table exist?"
+_fts5_engines = weakref.WeakKeyDictionary()
+_known_indexes = weakref.WeakKeyDictionary()
+
+
+def _fts5_available(connection) -> bool:
+    engine = connection.engine
+    if engine not in _fts5_engines:
+        try:
+            rows = connection.exec_driver_sql('PRAGMA compile_options').fetchall()
+            _fts5_engines[engine] = any(row[0] == 'ENABLE_FTS5' for row in rows)
+        except Exception:
+            _fts5_engines[engine] = False
+    return _fts5_engines[engine]
+
+
+def _create_index(connection, table: Optional[str] = None):
+    table = table or _table(connection)
+    if _backend(connection) == 'postgresql':
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "doc_id BIGINT PRIMARY KEY, kind VARCHAR(20) NOT NULL, record_id INTEGER NOT NULL, "
+            "customer_id INTEGER, title TEXT, subtitle TEXT, document TSVECTOR NOT NULL)"
+        ))
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_document ON {table} USING GIN (document)"
+        ))
+    else:
+        # prefix= keeps 2-4 character prefix queries (typeahead) off a term-range scan
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+            "keywords, body, kind UNINDEXED, record_id UNINDEXED, customer_id UNINDEXED, title UNINDEXED, "
+            "subtitle UNINDEXED, "
+            "prefix='2 3 4', tokenize='unicode61 remove_diacritics 2')"
+        ))
+
+
+def _table(connection) -> str:
+    return POSTGRES_TABLE if _backend(connection) == 'postgresql' else SQLITE_TABLE
+
+
+def _index_exists(connection) -> bool:
+    """True once the index table exists (a missing table is checked again next time)"""
+    engine = connection.engine
+    if not _known_indexes.get(engine):
+        _known_indexes[engine] = inspect(connection).has_table(_table(connection))
+    return _known_indexes[engine]
+
+
+def _write(connection, documents: List[Dict], removed: List[int], table: Optional[str] = None):
+    """Upsert documents and delete removed doc ids"""
+    table = table or _table(connection)
+    rows = [dict(document, doc_id=doc_id(document['kind'], document['record_id'])) for document in documents]
+    doomed = [{'doc_id': value} for value in removed] + [{'doc_id': row['doc_id']} for row in rows]
+
+    if _backend(connection) == 'postgresql':
+        if removed:
+            connection.execute(text(f"DELETE FROM {table} WHERE doc_id = :doc_id"), [{'doc_id': v} for v in removed])
+        if rows:
+            connection.execute(text(
+                f"INSERT INTO {table} (doc_id, kind, record_id, customer_id, title, subtitle, document) "
+                "VALUES (:doc_id, :kind, :record_id, :customer_id, :title, :subtitle, "
+                "setweight(to_tsvector('simple', :keywords), 'A') || setweight(to_tsvector('simple', :body), 'B')) "
+                "ON CONFLICT (doc_id) DO UPDATE SET kind = EXCLUDED.kind, record_id = EXCLUDED.record_id, "
+                "customer_id = EXCLUDED.customer_id, title = EXCLUDED.title, subtitle = EXCLUDED.subtitle, "
+                "document = EXCLUDED.document"
+            ), rows)
+        return
+
+    # FTS5 has no upsert: delete by rowid (a b-tree lookup), then insert
+    if doomed:
+        connection.execute(text(f"DELETE FROM {table} WHERE rowid = :doc_id"), doomed)
+    if rows:
+        connection.execute(text(
+            f"INSERT INTO {table} (rowid, keywords, body, kind, record_id, customer_id, title, subtitle) "
+            "VALUES (:doc_id, :keywords, :body, :kind, :record_id, :customer_id, :title, :subtitle)"
+        ), rows)
+
+
+# Incremental maintenance
+
+def _changed(obj, fields) -> bool:
+    state = inspect(obj)
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+
+def _index_changes(session, flush_context):
+    """after_flush: re-index records whose searched fields were written, on the flush's connection"""
+    documents, removed = [], []
+    for obj in list(session.new) + list(session.dirty):
+        entry = DOCUMENTS.get(type(obj))
+        if entry is None or (obj not in session.new and not _changed(obj, INDEXED_FIELDS[type(obj)])):
+            continue
+        kind, build = entry
+        document = build(obj)
+        if document is None:
+            removed.append(doc_id(kind, obj.id))
+        else:
+            documents.append(document)
+    for obj in session.deleted:
+        entry = DOCUMENTS.get(type(obj))
+        if entry is not None:
+            removed.append(doc_id(entry[0], obj.id))
+
+    if not documents and not removed:
+        return
+    connection = session.connection()
+    if _backend(connection) == 'sqlite' and not _fts5_available(connection):
+        return
+    # Until ensure_search_index() creates the table there is nothing to keep current
+    if _index_exists(connection):
+        _write(connection, documents, removed)
+
+
+event.listen(Session, 'after_flush', _index_changes)
+
+
+def _document_changes(session, model, query):
+    """(documents, removed doc ids) for the records a query returns"""
+    kind, build = DOCUMENTS[model]
+    documents, removed = [], []
+    for record in session.scalars(query):
+        document = build(record)
+        if document is None:
+            removed.append(doc_id(kind, record.id))
+        else:
+            documents.append(document)
+    return documents, removed
+
+
+def _fill(connection, table: str) -> int:
+    """Index every record into a table; returns the number of documents written"""
+    written = 0
+    # A private session on the same connection, so the caller's identity
+    # map doesn't fill with every record
+    with Session(bind=connection) as session:
+        for model, (kind, build) in DOCUMENTS.items():
+            batch = []
+            query = db.select(model).order_by(model.id).execution_options(yield_per=REBUILD_CHUNK)
+            for record in session.scalars(query):
+                document = build(record)
+                if document is not None:
+                    batch.append(document)
+                if len(batch) >= REBUILD_CHUNK:
+                    _write(connection, batch, [], table)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                _write(connection, batch, [], table)
+                written += len(batch)
+    return written
+
+
+def _catch_up(connection, table: str, since: datetime):
+    """Re-index records written since a time and drop documents of deleted records"""
+    key = 'doc_id' if _backend(connection) == 'postgresql' else 'rowid'
+    with Session(bind=connection) as session:
+        for model, (kind, build) in DOCUMENTS.items():
+            documents, removed = _document_changes(
+                session, model, db.select(model).where(model.updated_at >= since)
+            )
+            removed += connection.execute(text(
+                f"SELECT {key} FROM {table} WHERE kind = :kind "
+                f"AND record_id NOT IN (SELECT id FROM {model.__tablename__})"
+            ), {'kind': kind}).scalars().all()
+            _write(connection, documents, removed, table)
+
+
+def rebuild_index() -> int:
+    """
+    Re-index every customer, ticket and septic system from scratch
+
+    The documents go into a shadow table built in its own transaction, so
+    searches and writes keep using the live index meanwhile. A short swap
+    transaction then blocks index writes, catches the shadow up with
+    records written during the build, and renames it into place.
+    Recreating rather than emptying also picks up index definition changes.
+
+    Returns:
+        Number of documents written
+    """
+    started = datetime.utcnow()
+    with db.engine.begin() as conn:
+        live = _table(conn)
+        shadow = live + SHADOW_SUFFIX
+        conn.execute(text(f"DROP TABLE IF EXISTS {shadow}"))
+        _create_index(conn, shadow)
+        written = _fill(conn, shadow)
+
+    with db.engine.begin() as conn:
+        postgres = _backend(conn) == 'postgresql'
+        if postgres and inspect(conn).has_table(live):
+            # Writers wait here (readers don't) so none of their changes miss the catch-up
+            conn.execute(text(f"LOCK TABLE {live} IN EXCLUSIVE MODE"))
+        _catch_up(conn, shadow, started - timedelta(seconds=REBUILD_CATCH_UP_SECONDS))
+        conn.execute(text(f"DROP TABLE IF EXISTS {live}"))
+        conn.execute(text(f"ALTER TABLE {shadow} RENAME TO {live}"))
+        if postgres:
+            conn.execute(text(f"ALTER INDEX ix_{shadow}_document RENAME TO ix_{live}_document"))
+    _known_indexes[db.engine] = True
+    return written
+
+
+def ensure_search_index(rebuild: bool = False) -> Optional[int]:
+    """
+    Create the index if it is missing and fill it when it is empty
+
+    Args:
+        rebuild: Re-index everything even if the index has documents
+
+    Returns:
+        Number of documents indexed, None if nothing needed doing or
+        full-text search is unavailable (SQLite without FTS5)
+    """
+    with db.engine.begin() as conn:
+        if _backend(conn) == 'sqlite' and not _fts5_available(conn):
+            return None
+        _create_index(conn)
+        empty = conn.execute(text(f"SELECT 1 FROM {_table(conn)} LIMIT 1")).first() is None
+    _known_indexes[db.engine] = True
+    if rebuild or empty:
+        return rebuild_index()
+    return None
+
+
+# Queries
+
+def query_terms(q: str) -> List[str]:
+    return _TERM.findall((q or '').lower())[:MAX_QUERY_TERMS]
+
+
+def _match_expression(terms: List[str], backend: str) -> str:
+    """Every term as a prefix: FTS5 '"smi"* "45"*', tsquery 'smi:* & 45:*'"""
+    if backend == 'postgresql':
+        return ' & '.join(f"{term}:*" for term in terms)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _result(row, score: float) -> Dict:
+    return {
+        'type': row.kind, 'id': int(row.record_id),
+        'customer_id': int(row.customer_id) if row.customer_id is not None else None,
+        'title': row.title, 'subtitle': row.subtitle or '', 'score': round(score, 4),
+    }
+
+
+def _index_search(connection, terms: List[str], kinds: List[str], limit: int) -> List[Dict]:
+    backend = _backend(connection)
+    key = 'doc_id' if backend == 'postgresql' else 'rowid'
+    if backend == 'postgresql':
+        source = f"{POSTGRES_TABLE}, to_tsquery('simple', :match) AS query"
+        match = "document @@ query"
+        score = "ts_rank(document, query)"
+    else:
+        # bm25 is lower-is-better; names, job IDs and permits weigh ten times the body
+        source = SQLITE_TABLE
+        match = f"{SQLITE_TABLE} MATCH :match"
+        score = f"-bm25({SQLITE_TABLE}, 10.0, 1.0)"
+    if kinds:
+        match += " AND kind IN :kinds"
+    params = {'match': _match_expression(terms, backend), 'limit': limit, 'kinds': kinds,
+              'candidates': SEARCH_CANDIDATE_LIMIT}
+
+    def run(sql):
+        statement = text(sql)
+        if kinds:
+            statement = statement.bindparams(bindparam('kinds', expanding=True))
+        return connection.execute(statement, {name: value for name, value in params.items()
+                                              if f':{name}' in sql})
+
+    # Scoring costs per matching document: bound it for very broad queries
+    floor = run(f"SELECT {key} FROM {source} WHERE {match} ORDER BY {key} DESC "
+                f"LIMIT 1 OFFSET :candidates").scalar()
+    if floor is not None:
+        match += f" AND {key} > :floor"
+        params['floor'] = floor
+
+    rows = run(f"SELECT kind, record_id, customer_id, title, subtitle, {score} AS score "
+               f"FROM {source} WHERE {match} ORDER BY score DESC, {key} LIMIT :limit")
+    return [_result(row, row.score) for row in rows]
+
+
+def _like_search(terms: List[str], kinds: List[str], limit: int) -> List[Dict]:
+    """Unranked fallback for SQLite builds without FTS5, and while the index is being built"""
+    results = []
+    for model, (kind, build) in DOCUMENTS.items():
+        if kinds and kind not in kinds:
+            continue
+        columns = [getattr(model, field) for field in INDEXED_FIELDS[model] if field != 'customer_id']
+        columns = [column if isinstance(column.type, db.String) else db.cast(column, db.String)
+                   for column in columns]
+        query = model.query.filter(*[db.or_(*[column.ilike(f'%{term}%') for column in columns]) for term in terms])
+        for record in query.order_by(model.id).limit(limit):
+            document = build(record)
+            if document is not None:
+                results.append({
+                    'type': kind, 'id': record.id, 'customer_id': document['customer_id'],
+                    'title': document['title'], 'subtitle': document['subtitle'], 'score': 0.0,
+                })
+    return results[:limit]
+
+
+def search(q: str, kinds: Optional[List[str]] = None, limit: int = DEFAULT_LIMIT) -> List[Dict]:
+    """
+    Ranked typeahead search, best match first
+
+    Args:
+        q: Free text; every word must match the start of a word in the record
+        kinds: Restrict to 'customer', 'ticket' and/or 'septic_system'
+        limit: Maximum results (capped at MAX_LIMIT)
+
+    Returns:
+        List of {type, id, customer_id, title, subtitle, score}
+
+    Raises:
+        ValueError: For unknown kinds
+    """
+    kinds = list(kinds or [])
+    unknown = [kind for kind in kinds if kind not in KIND_CODES]
+    if unknown:
+        raise ValueError(f"Unknown search type: {unknown[0]} (expected one of {', '.join(KIND_CODES)})")
+    terms = query_terms(q)
+    if sum(len(term) for term in terms) < MIN_QUERY_LENGTH:
+        return []
+    limit = max(1, min(int(limit), MAX_LIMIT))
+
+    connection = db.session.connection()
+    if _backend(connection) == 'sqlite' and not _fts5_available(connection):
+        return _like_search(terms, kinds, limit)
+    if not _index_exists(connection):
+        # Never build the index inside a search request: queue it and answer from the source tables
+        request_index_build()
+        return _like_search(terms, kinds, limit)
+    return _index_search(connection, terms, kinds, limit)
+
+
+# Index builds as jobs
+
+_build_requested = weakref.WeakKeyDictionary()
+
+
+@jobs.task('search_index')
+def search_index_job(payload: Dict) -> Dict:
+    """Create and fill a missing (or empty) index; rebuild=true re-indexes everything"""
+    return {'indexed': ensure_search_index(rebuild=bool(payload.get('rebuild')))}
+
+
+def request_index_build():
+    """Queue one index build per process (the job does nothing if another already built it)"""
+    engine = db.engine
+    if _build_requested.get(engine):
+        return
+    _build_requested[engine] = True
+    try:
+        jobs.enqueue('search_index')
+    except Exception as e:
+        print(f"Search index job error: {e}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Build or query the full-text search index')
+    parser.add_argument('query', nargs='?', help='Search text to try')
+    parser.add_argument('--rebuild', action='store_true', help='Re-index every record')
+    parser.add_argument('--type', action='append', dest='kinds', help='Restrict results to a record type')
+    args = parser.parse_args(argv)
+
+    from app import app
+    with app.app_context():
+        db.create_all()
+        if args.rebuild:
+            print(f"Indexed {rebuild_index()} documents")
+        else:
+            ensure_search_index()
+        if args.query:
+            for result in search(args.query, args.kinds, MAX_LIMIT):
+                print(f"{result['score']:8.3f}  {result['type']:14} {result['id']:>7}  "
+                      f"{result['title']}  {result['subtitle']}")
+
+
+if __name__ == '__main__':
+    main()
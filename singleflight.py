@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Single-Flight Call Coalescing for TrueTank
+
+This module handles:
+- Coalescing identical concurrent provider calls (geocodes, directions,
+  matrix blocks), keyed by the normalized call: one caller runs it, the
+  others wait and share its result
+- Within a worker: waiters block on the leader thread's call
+- Across workers: the leader holds a lease row in the single_flight table;
+  other workers poll it and read the result the leader publishes there,
+  which is kept for SINGLE_FLIGHT_RESULT_SECONDS
+- Taking over when a leader dies (its lease expires) or gives up (its row
+  is removed), and running the call directly if the table is unavailable
+- Leader/waiter counters
+
+Results must be JSON-serializable to be shared across workers; a leader's
+exception is raised in its own worker's waiters, while other workers'
+waiters then run the call themselves.
+"""
+
+from typing import Callable, Dict, Optional, Tuple
+from datetime import datetime, timedelta
+import copy
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, SingleFlight
+
+# Share in-flight calls across workers through the single_flight table
+SINGLE_FLIGHT_SHARED = os.environ.get('SINGLE_FLIGHT_SHARED', '1') != '0'
+
+# Longest a leader may hold a call before others take over (beyond the
+# HTTP client's longest time budget)
+SINGLE_FLIGHT_LEASE_SECONDS = int(os.environ.get('SINGLE_FLIGHT_LEASE_SECONDS', 30))
+# How long a finished call's result stays readable by other workers
+SINGLE_FLIGHT_RESULT_SECONDS = int(os.environ.get('SINGLE_FLIGHT_RESULT_SECONDS', 5))
+# Longest a waiter waits before running the call itself
+SINGLE_FLIGHT_WAIT_SECONDS = float(os.environ.get('SINGLE_FLIGHT_WAIT_SECONDS', 20))
+SINGLE_FLIGHT_POLL_SECONDS = float(os.environ.get('SINGLE_FLIGHT_POLL_SECONDS', 0.05))
+SINGLE_FLIGHT_PURGE_INTERVAL = int(os.environ.get('SINGLE_FLIGHT_PURGE_INTERVAL', 300))
+
+_last_purge = None
+
+_stats_lock = threading.Lock()
+_stats = {
+    'leaders': 0,          # calls this worker ran
+    'local_waiters': 0,    # callers that shared another thread's call
+    'shared_waiters': 0,   # callers that shared another worker's call
+    'takeovers': 0,        # leases taken over after their leader went away
+    'timeouts': 0,         # waiters that gave up and ran the call themselves
+    'lease_errors': 0,     # calls run without a lease (table unavailable)
+}
+
+
+def _count(name: str, amount: int = 1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def get_single_flight_stats() -> Dict:
+    """Return coalescing counters for this process"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['in_flight'] = len(_calls)
+    return stats
+
+
+def flight_key(namespace: str, call) -> str:
+    """Fixed-length key for a namespace and a JSON-serializable description of the call"""
+    digest = hashlib.sha1(json.dumps(call, sort_keys=True, default=str).encode()).hexdigest()
+    return f"{namespace}:{digest}"
+
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"[:80]
+
+
+# Within a worker
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_calls_lock = threading.Lock()
+
+
+def do(namespace: str, call, fn: Callable, shared: Optional[bool] = None):
+    """
+    Run fn() once for all concurrent callers with the same namespace and call
+
+    Args:
+        namespace: Kind of call ('geocode', 'leg', ...)
+        call: JSON-serializable normalized arguments identifying the call
+        fn: Zero-argument function making the call
+        shared: Coalesce across workers too (default SINGLE_FLIGHT_SHARED)
+
+    Returns:
+        fn()'s result, or a copy of the leader's
+    """
+    key = flight_key(namespace, call)
+    with _calls_lock:
+        current = _calls.get(key)
+        leader = current is None
+        if leader:
+            current = _calls[key] = _Call()
+
+    if not leader:
+        _count('local_waiters')
+        if not current.done.wait(SINGLE_FLIGHT_WAIT_SECONDS):
+            _count('timeouts')
+            return fn()
+        if current.error is not None:
+            raise current.error
+        return copy.deepcopy(current.result)
+
+    try:
+        share = SINGLE_FLIGHT_SHARED if shared is None else shared
+        current.result = _run_shared(key, fn) if share else _lead(fn)
+        return current.result
+    except Exception as e:
+        current.error = e
+        raise
+    finally:
+        with _calls_lock:
+            _calls.pop(key, None)
+        current.done.set()
+
+
+def _lead(fn: Callable):
+    _count('leaders')
+    return fn()
+
+
+# Across workers
+
+def _claim(key: str, owner: str) -> Tuple[str, object]:
+    """
+    Take the lease on a call, or report its state
+
+    Returns:
+        ('leader', None), ('running', None) or ('done', result)
+    """
+    table = SingleFlight.__table__
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        expired = conn.execute(table.delete().where(table.c.key == key, table.c.expires_at <= now)).rowcount
+        dialect = postgresql if conn.dialect.name == 'postgresql' else sqlite
+        inserted = conn.execute(dialect.insert(table).values(
+            key=key, owner=owner, status='running', result=None,
+            expires_at=now + timedelta(seconds=SINGLE_FLIGHT_LEASE_SECONDS)
+        ).on_conflict_do_nothing(index_elements=['key'])).rowcount
+        if inserted:
+            if expired:
+                _count('takeovers')
+            return 'leader', None
+        row = conn.execute(db.select(table.c.status, table.c.result).where(table.c.key == key)).first()
+    if row is not None and row.status == 'done':
+        return 'done', json.loads(row.result)
+    return 'running', None
+
+
+def _publish(key: str, owner: str, result):
+    """Store a finished call's result for other workers, or drop the lease if it can't be stored"""
+    table = SingleFlight.__table__
+    mine = (table.c.key == key) & (table.c.owner == owner)
+    try:
+        payload = json.dumps(result)
+    except (TypeError, ValueError):
+        payload = None
+    try:
+        with db.engine.begin() as conn:
+            if payload is None:
+                conn.execute(table.delete().where(mine))
+            else:
+                conn.execute(table.update().where(mine).values(
+                    status='done', result=payload,
+                    expires_at=datetime.utcnow() + timedelta(seconds=SINGLE_FLIGHT_RESULT_SECONDS)
+                ))
+    except Exception as e:
+        print(f"Single-flight publish error for {key}: {e}")
+
+
+def _release(key: str, owner: str):
+    table = SingleFlight.__table__
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(table.delete().where((table.c.key == key) & (table.c.owner == owner)))
+    except Exception as e:
+        print(f"Single-flight release error for {key}: {e}")
+
+
+def _run_shared(key: str, fn: Callable):
+    owner = _owner()
+    deadline = time.monotonic() + SINGLE_FLIGHT_WAIT_SECONDS
+    while True:
+        try:
+            state, result = _claim(key, owner)
+        except Exception as e:
+            print(f"Single-flight lease error for {key}: {e}")
+            _count('lease_errors')
+            return _lead(fn)
+
+        if state == 'done':
+            _count('shared_waiters')
+            return result
+        if state == 'leader':
+            try:
+                result = _lead(fn)
+            except Exception:
+                _release(key, owner)
+                raise
+            _publish(key, owner, result)
+            maybe_purge()
+            return result
+
+        if time.monotonic() >= deadline:
+            _count('timeouts')
+            return _lead(fn)
+        time.sleep(SINGLE_FLIGHT_POLL_SECONDS)
+
+
+def purge_expired() -> int:
+    """Delete expired leases and results (claims also remove their own key's)"""
+    table = SingleFlight.__table__
+    try:
+        with db.engine.begin() as conn:
+            return conn.execute(table.delete().where(table.c.expires_at <= datetime.utcnow())).rowcount
+    except Exception as e:
+        print(f"Single-flight purge error: {e}")
+        return 0
+
+
+def maybe_purge():
+    """Purge at most once per SINGLE_FLIGHT_PURGE_INTERVAL seconds per worker"""
+    global _last_purge
+    now = time.monotonic()
+    if _last_purge is not None and now - _last_purge < SINGLE_FLIGHT_PURGE_INTERVAL:
+        return
+    _last_purge = now
+    purge_expired()
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Spatial Index for TrueTank
+
+This module handles:
+- Numeric latitude/longitude kept in sync with the legacy gps_coordinates text
+- In-memory grid index per record type (customers, septic systems,
+  locations, dump sites) for nearest-K, radius and bounding-box queries
+- Incremental index updates from committed inserts, updates and deletes
+- Reloading an index when the table changes outside this process (jobs
+  worker, bulk updates, the backfill CLI) or has not been reloaded for a while
+- Adding the latitude/longitude columns to databases created before them
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+import math
+import os
+import threading
+import time
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+
+from models import db, Customer, SepticSystem, Location, DumpSite
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LAT = 69.0
+
+# Grid cell size in degrees (0.01 deg is roughly 0.7 miles)
+SPATIAL_CELL_DEGREES = float(os.environ.get('SPATIAL_CELL_DEGREES', 0.01))
+
+# Below this many points a straight scan beats walking grid rings
+BRUTE_FORCE_LIMIT = 256
+
+# How often a loaded index checks its table for writes made elsewhere
+# (row count, highest id, latest updated_at), and the longest it goes
+# without a full reload (catches raw SQL that leaves updated_at alone)
+SPATIAL_INDEX_CHECK_SECONDS = float(os.environ.get('SPATIAL_INDEX_CHECK_SECONDS', 15))
+SPATIAL_INDEX_MAX_AGE_SECONDS = float(os.environ.get('SPATIAL_INDEX_MAX_AGE_SECONDS', 600))
+
+MODELS = {
+    'customer': Customer,
+    'septic_system': SepticSystem,
+    'location': Location,
+    'dump_site': DumpSite,
+}
+
+
+def parse_gps_coordinates(value: Optional[str]) -> Optional[Tuple[float, float]]:
+    """Parse a "latitude,longitude" string into floats (None if missing or invalid)"""
+    if not value or ',' not in value:
+        return None
+    try:
+        lat, lng = (float(part) for part in value.split(',')[:2])
+    except ValueError:
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+def haversine_miles(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in miles"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    """
+    Points bucketed into fixed-size lat/lng cells
+
+    Inserts, moves and removals touch one or two cells, so the index can be
+    kept current on every write instead of being rebuilt.
+    """
+
+    def __init__(self, cell_degrees: float = SPATIAL_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._points = {}  # key -> (lat, lng, payload)
+        self._cells = {}   # (row, col) -> set of keys
+        self._lock = threading.RLock()
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (int(math.floor(lat / self.cell_degrees)), int(math.floor(lng / self.cell_degrees)))
+
+    def __len__(self):
+        return len(self._points)
+
+    def upsert(self, key, lat: float, lng: float, payload: Optional[Dict] = None):
+        with self._lock:
+            self.remove(key)
+            self._points[key] = (lat, lng, payload or {})
+            self._cells.setdefault(self._cell(lat, lng), set()).add(key)
+
+    def remove(self, key):
+        with self._lock:
+            point = self._points.pop(key, None)
+            if point is None:
+                return
+            cell = self._cell(point[0], point[1])
+            members = self._cells.get(cell)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del self._cells[cell]
+
+    def clear(self):
+        with self._lock:
+            self._points.clear()
+            self._cells.clear()
+
+    def _result(self, key, distance: float) -> Dict:
+        lat, lng, payload = self._points[key]
+        result = dict(payload)
+        result.update({'id': key, 'latitude': lat, 'longitude': lng, 'distance_miles': round(distance, 3)})
+        return result
+
+    def nearest(self, lat: float, lng: float, k: int = 1,
+                where: Optional[Callable[[Dict], bool]] = None,
+                max_miles: Optional[float] = None) -> List[Dict]:
+        """
+        The k closest points, nearest first
+
+        Walks rings of cells outward from the query cell and stops once the
+        k-th best distance is closer than anything an unvisited ring could hold.
+        """
+        with self._lock:
+            if not self._points or k <= 0:
+                return []
+
+            found = []  # (distance, key)
+
+            def consider(keys):
+                for key in keys:
+                    point_lat, point_lng, payload = self._points[key]
+                    if where is not None and not where(payload):
+                        continue
+                    distance = haversine_miles(lat, lng, point_lat, point_lng)
+                    if max_miles is None or distance <= max_miles:
+                        found.append((distance, key))
+
+            if len(self._points) <= BRUTE_FORCE_LIMIT:
+                consider(self._points)
+            else:
+                row, col = self._cell(lat, lng)
+                # Longitude cells shrink with latitude; bound using the widest latitude reached
+                ring = 0
+                while True:
+                    if 8 * ring > len(self._cells):
+                        # Ring is bigger than the occupied grid: finish with a scan
+                        found = []
+                        consider(self._points)
+                        break
+                    if ring == 0:
+                        cells = [(row, col)]
+                    else:
+                        cells = [(row + dr, col + dc)
+                                 for dr in range(-ring, ring + 1)
+                                 for dc in (-ring, ring)]
+                        cells += [(row + dr, col + dc)
+                                  for dr in (-ring, ring)
+                                  for dc in range(-ring + 1, ring)]
+                    for cell in cells:
+                        members = self._cells.get(cell)
+                        if members:
+                            consider(members)
+
+                    edge_lat = min(89.0, abs(lat) + (ring + 1) * self.cell_degrees)
+                    unvisited_miles = ring * self.cell_degrees * MILES_PER_DEGREE_LAT * math.cos(math.radians(edge_lat))
+                    if max_miles is not None and unvisited_miles > max_miles:
+                        break
+                    if len(found) >= k and sorted(found)[k - 1][0] <= unvisited_miles:
+                        break
+                    ring += 1
+
+            found.sort()
+            return [self._result(key, distance) for distance, key in found[:k]]
+
+    def within_radius(self, lat: float, lng: float, miles: float,
+                      where: Optional[Callable[[Dict], bool]] = None, limit: Optional[int] = None) -> List[Dict]:
+        """Points within a radius, nearest first"""
+        lat_span = miles / MILES_PER_DEGREE_LAT
+        lng_span = miles / (MILES_PER_DEGREE_LAT * max(0.01, math.cos(math.radians(min(89.0, abs(lat) + lat_span)))))
+        candidates = self.within_bbox(lat - lat_span, lng - lng_span, lat + lat_span, lng + lng_span, where)
+        results = []
+        for item in candidates:
+            distance = haversine_miles(lat, lng, item['latitude'], item['longitude'])
+            if distance <= miles:
+                item['distance_miles'] = round(distance, 3)
+                results.append(item)
+        results.sort(key=lambda item: item['distance_miles'])
+        return results[:limit] if limit else results
+
+    def within_bbox(self, south: float, west: float, north: float, east: float,
+                    where: Optional[Callable[[Dict], bool]] = None) -> List[Dict]:
+        """Points inside a bounding box (distance_miles is 0 - no reference point)"""
+        with self._lock:
+            min_row, min_col = self._cell(south, west)
+            max_row, max_col = self._cell(north, east)
+            span = (max_row - min_row + 1) * (max_col - min_col + 1)
+            if span > len(self._cells):
+                cells = [cell for cell in self._cells
+                         if min_row <= cell[0] <= max_row and min_col <= cell[1] <= max_col]
+            else:
+                cells = [(r, c) for r in range(min_row, max_row + 1) for c in range(min_col, max_col + 1)]
+
+            results = []
+            for cell in cells:
+                for key in self._cells.get(cell, ()):
+                    point_lat, point_lng, payload = self._points[key]
+                    if not (south <= point_lat <= north and west <= point_lng <= east):
+                        continue
+                    if where is not None and not where(payload):
+                        continue
+                    results.append(self._result(key, 0.0))
+            return results
+
+
+# Record payloads carried in the index (enough to filter and label results)
+
+def _payload(kind: str, record) -> Dict:
+    if kind == 'customer':
+        return {'name': f"{record.first_name} {record.last_name}", 'company_name': record.company_name}
+    if kind == 'septic_system':
+        return {'customer_id': record.customer_id, 'system_type': record.system_type}
+    if kind == 'location':
+        return {'name': record.name, 'location_type': record.location_type, 'is_active': record.is_active}
+    return {
+        'name': record.name,
+        'is_active': record.is_active,
+        'accepts_septic_waste': record.accepts_septic_waste,
+        'accepts_grease_waste': record.accepts_grease_waste,
+        'cost_per_gallon': record.cost_per_gallon
+    }
+
+
+def _coordinates(record) -> Optional[Tuple[float, float]]:
+    if record.latitude is not None and record.longitude is not None:
+        return record.latitude, record.longitude
+    return parse_gps_coordinates(record.gps_coordinates)
+
+
+_indexes = {kind: GridIndex() for kind in MODELS}
+_loaded = set()
+_load_lock = threading.Lock()
+_fingerprints = {}
+_loaded_at = {}
+_checked_at = {}
+
+
+def _fingerprint(kind: str) -> Tuple:
+    """Changes whenever rows are added, removed or updated through SQLAlchemy in any process"""
+    model = MODELS[kind]
+    return tuple(db.session.query(db.func.count(model.id), db.func.max(model.id), db.func.max(model.updated_at)).one())
+
+
+def _load(kind: str) -> GridIndex:
+    index = GridIndex()
+    model = MODELS[kind]
+    for record in model.query.filter(
+        db.or_(model.latitude.isnot(None), model.gps_coordinates.isnot(None))
+    ).yield_per(1000):
+        coords = _coordinates(record)
+        if coords:
+            index.upsert(record.id, coords[0], coords[1], _payload(kind, record))
+    return index
+
+
+def get_index(kind: str) -> GridIndex:
+    """
+    The index for a record type, loaded from the database on first use
+
+    At most every SPATIAL_INDEX_CHECK_SECONDS the table's fingerprint is
+    compared with the one seen at load time, and the index is rebuilt (and
+    swapped in whole) if it differs or is older than
+    SPATIAL_INDEX_MAX_AGE_SECONDS.
+    """
+    if kind not in MODELS:
+        raise ValueError(f"Unknown spatial index '{kind}'")
+    if kind in _loaded and time.monotonic() - _checked_at[kind] < SPATIAL_INDEX_CHECK_SECONDS:
+        return _indexes[kind]
+    with _load_lock:
+        now = time.monotonic()
+        if kind in _loaded and now - _checked_at[kind] < SPATIAL_INDEX_CHECK_SECONDS:
+            return _indexes[kind]
+        fingerprint = _fingerprint(kind)
+        if (kind not in _loaded or fingerprint != _fingerprints[kind]
+                or now - _loaded_at[kind] >= SPATIAL_INDEX_MAX_AGE_SECONDS):
+            _indexes[kind] = _load(kind)
+            _fingerprints[kind] = fingerprint
+            _loaded_at[kind] = now
+            _loaded.add(kind)
+        _checked_at[kind] = now
+    return _indexes[kind]
+
+
+def reset_indexes():
+    """Drop all in-memory indexes; they reload on next use"""
+    with _load_lock:
+        _loaded.clear()
+        for kind in MODELS:
+            _indexes[kind] = GridIndex()
+
+
+def nearest(kind: str, lat: float, lng: float, k: int = 1, **kwargs) -> List[Dict]:
+    return get_index(kind).nearest(lat, lng, k, **kwargs)
+
+
+def within_radius(kind: str, lat: float, lng: float, miles: float, **kwargs) -> List[Dict]:
+    return get_index(kind).within_radius(lat, lng, miles, **kwargs)
+
+
+def within_bbox(kind: str, south: float, west: float, north: float, east: float, **kwargs) -> List[Dict]:
+    return get_index(kind).within_bbox(south, west, north, east, **kwargs)
+
+
+# Keep numeric columns and the index in step with writes
+
+def _sync_coordinates(mapper, connection, target):
+    """Fill latitude/longitude from gps_coordinates (or the reverse) before a write"""
+    state = inspect(target)
+    gps_changed = state.attrs.gps_coordinates.history.has_changes()
+    coords_changed = (state.attrs.latitude.history.has_changes()
+                      or state.attrs.longitude.history.has_changes())
+
+    if gps_changed and not coords_changed:
+        coords = parse_gps_coordinates(target.gps_coordinates)
+        target.latitude, target.longitude = coords if coords else (None, None)
+    elif coords_changed and target.latitude is not None and target.longitude is not None:
+        target.gps_coordinates = f"{target.latitude},{target.longitude}"
+
+
+def _queue_change(kind: str, removed: bool = False):
+    def listener(mapper, connection, target):
+        session = Session.object_session(target)
+        if session is None:
+            return
+        coords = None if removed else _coordinates(target)
+        payload = None if removed else _payload(kind, target)
+        session.info.setdefault('spatial_pending', []).append((kind, target.id, coords, payload))
+    return listener
+
+
+def _apply_pending(session):
+    for kind, key, coords, payload in session.info.pop('spatial_pending', []):
+        if kind not in _loaded:
+            continue
+        if coords:
+            _indexes[kind].upsert(key, coords[0], coords[1], payload)
+        else:
+            _indexes[kind].remove(key)
+
+
+def _discard_pending(session, *args):
+    session.info.pop('spatial_pending', None)
+
+
+for _kind, _model in MODELS.items():
+    event.listen(_model, 'before_insert', _sync_coordinates)
+    event.listen(_model, 'before_update', _sync_coordinates)
+    event.listen(_model, 'after_insert', _queue_change(_kind))
+    event.listen(_model, 'after_update', _queue_change(_kind))
+    event.listen(_model, 'after_delete', _queue_change(_kind, removed=True))
+event.listen(Session, 'after_commit', _apply_pending)
+event.listen(Session, 'after_rollback', _discard_pending)
+
+
+def ensure_spatial_columns():
+    """
+    Add latitude/longitude columns and indexes to tables created before them,
+    then backfill them from gps_coordinates
+
+    Returns:
+        Dict of table name -> number of rows backfilled
+    """
+    inspector = inspect(db.engine)
+    backfilled = {}
+    for model in MODELS.values():
+        table = model.__tablename__
+        if not inspector.has_table(table):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table)}
+        with db.engine.begin() as conn:
+            for column in ('latitude', 'longitude'):
+                if column not in existing:
+                    conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} FLOAT'))
+                conn.execute(text(f'CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})'))
+
+            rows = conn.execute(text(
+                f'SELECT id, gps_coordinates FROM {table} '
+                f'WHERE latitude IS NULL AND gps_coordinates IS NOT NULL'
+            )).fetchall()
+            count = 0
+            for row_id, gps in rows:
+                coords = parse_gps_coordinates(gps)
+                if coords:
+                    conn.execute(text(f'UPDATE {table} SET latitude = :lat, longitude = :lng WHERE id = :id'),
+                                 {'lat': coords[0], 'lng': coords[1], 'id': row_id})
+                    count += 1
+            backfilled[table] = count
+    reset_indexes()
+    return backfilled
@@ -0,0 +1,168 @@
+// Typeahead customer picker for TrueTank forms
+//
+// Turns a customer <select> into a search box backed by /api/search, so a
+// form never has to render every customer. The <select> stays the form
+// field: picking a customer makes it the select's one option and fires
+// 'change', so code reading select.value or listening for changes works
+// unchanged.
+
+const CUSTOMER_PICKER_LIMIT = 8;
+const CUSTOMER_PICKER_DELAY_MS = 150;
+const CUSTOMER_PICKER_MIN_LENGTH = 2;
+
+function attachCustomerPicker(select, options = {}) {
+    const placeholder = options.placeholder || 'Search by name, phone, address or company';
+
+    const wrapper = document.createElement('div');
+    wrapper.className = 'customer-picker';
+    const input = document.createElement('input');
+    input.type = 'search';
+    input.autocomplete = 'off';
+    input.placeholder = placeholder;
+    input.setAttribute('role', 'combobox');
+    input.setAttribute('aria-autocomplete', 'list');
+    const list = document.createElement('ul');
+    list.className = 'customer-picker-results';
+    list.setAttribute('role', 'listbox');
+    list.hidden = true;
+
+    select.parentNode.insertBefore(wrapper, select);
+    wrapper.appendChild(input);
+    wrapper.appendChild(list);
+    wrapper.appendChild(select);
+    select.hidden = true;
+
+    // The visible input carries the required check (a hidden select can't be focused)
+    input.required = select.required;
+    select.required = false;
+
+    let results = [];
+    let active = -1;
+    let timer = null;
+    let controller = null;
+
+    function selectedLabel() {
+        const option = select.options[select.selectedIndex];
+        return option && option.value ? option.textContent.trim().replace(/\s+/g, ' ') : '';
+    }
+
+    function validate() {
+        input.setCustomValidity(input.value && !select.value ? 'Choose a customer from the list' : '');
+    }
+
+    function close() {
+        list.hidden = true;
+        active = -1;
+        input.setAttribute('aria-expanded', 'false');
+    }
+
+    function render() {
+        list.innerHTML = '';
+        if (!results.length) {
+            const empty = document.createElement('li');
+            empty.className = 'customer-picker-empty';
+            empty.textContent = 'No matching customers';
+            list.appendChild(empty);
+        }
+        results.forEach((result, index) => {
+            const item = document.createElement('li');
+            item.setAttribute('role', 'option');
+            item.className = index === active ? 'active' : '';
+            const title = document.createElement('div');
+            title.className = 'customer-picker-title';
+            title.textContent = result.title;
+            item.appendChild(title);
+            if (result.subtitle) {
+                const subtitle = document.createElement('div');
+                subtitle.className = 'customer-picker-subtitle';
+                subtitle.textContent = result.subtitle;
+                item.appendChild(subtitle);
+            }
+            // mousedown fires before the input's blur closes the list
+            item.addEventListener('mousedown', event => {
+                event.preventDefault();
+                choose(result);
+            });
+            list.appendChild(item);
+        });
+        list.hidden = false;
+        input.setAttribute('aria-expanded', 'true');
+    }
+
+    function lookup(query) {
+        if (controller) {
+            controller.abort();
+        }
+        controller = new AbortController();
+        const params = new URLSearchParams({q: query, types: 'customer', limit: CUSTOMER_PICKER_LIMIT});
+        fetch(`/api/search?${params}`, {signal: controller.signal})
+            .then(response => response.json())
+            .then(data => {
+                if (input.value.trim() !== query) {
+                    return;  // typed on since this lookup started
+                }
+                results = data.results || [];
+                active = results.length ? 0 : -1;
+                render();
+            })
+            .catch(error => {
+                if (error.name !== 'AbortError') {
+                    console.error('Customer lookup failed:', error);
+                }
+            });
+    }
+
+    function choose(customer) {
+        Array.from(select.options).forEach(option => {
+            if (option.value) {
+                option.remove();
+            }
+        });
+        const option = document.createElement('option');
+        option.value = customer.id;
+        option.textContent = customer.title + (customer.company_name ? ` - ${customer.company_name}` : '');
+        option.selected = true;
+        select.appendChild(option);
+        input.value = selectedLabel();
+        validate();
+        close();
+        select.dispatchEvent(new Event('change', {bubbles: true}));
+    }
+
+    input.addEventListener('input', () => {
+        const query = input.value.trim();
+        if (select.value && input.value !== selectedLabel()) {
+            select.value = '';
+            select.dispatchEvent(new Event('change', {bubbles: true}));
+        }
+        validate();
+        clearTimeout(timer);
+        if (query.length < CUSTOMER_PICKER_MIN_LENGTH) {
+            close();
+            return;
+        }
+        timer = setTimeout(() => lookup(query), CUSTOMER_PICKER_DELAY_MS);
+    });
+
+    input.addEventListener('keydown', event => {
+        if (list.hidden || !results.length) {
+            return;
+        }
+        if (event.key === 'ArrowDown' || event.key === 'ArrowUp') {
+            event.preventDefault();
+            const step = event.key === 'ArrowDown' ? 1 : -1;
+            active = (active + step + results.length) % results.length;
+            render();
+        } else if (event.key === 'Enter' && active >= 0) {
+            event.preventDefault();
+            choose(results[active]);
+        } else if (event.key === 'Escape') {
+            close();
+        }
+    });
+
+    input.addEventListener('blur', close);
+
+    input.value = selectedLabel();
+    return {choose, input};
+}
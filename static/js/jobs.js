@@ -0,0 +1,68 @@
+// Background job polling for TrueTank
+//
+// Heavy endpoints answer 202 with a job id instead of doing the work in the
+// request. jobResult(response) takes the fetch() response of such an
+// endpoint and resolves with the same JSON the endpoint used to return:
+// the job's result once it succeeds, or {success: false, error} if it fails.
+// Responses other than 202 are read as they are.
+//
+// Polling stops (resolving {success: false, error, job_id, status}) once the
+// job has run for options.timeoutMs, or has sat queued for
+// options.queuedTimeoutMs - usually a sign that no worker is running. The
+// job itself is not cancelled and still runs when a worker picks it up.
+
+const JOB_POLL_MS = 1000;
+const JOB_TIMEOUT_MS = 10 * 60 * 1000;
+const JOB_QUEUED_TIMEOUT_MS = 60 * 1000;
+
+async function jobResult(response, options = {}) {
+    const data = await response.json();
+    if (response.status !== 202 || !data.status_url) {
+        return data;
+    }
+
+    const started = Date.now();
+    const timeoutMs = options.timeoutMs || JOB_TIMEOUT_MS;
+    const queuedTimeoutMs = options.queuedTimeoutMs || JOB_QUEUED_TIMEOUT_MS;
+    let queuedNoticeSent = false;
+
+    while (true) {
+        await new Promise((resolve, reject) => {
+            const timer = setTimeout(resolve, options.pollMs || JOB_POLL_MS);
+            if (options.signal) {
+                options.signal.addEventListener('abort', () => {
+                    clearTimeout(timer);
+                    reject(new DOMException('Job polling aborted', 'AbortError'));
+                }, {once: true});
+            }
+        });
+
+        const job = await (await fetch(data.status_url, {signal: options.signal})).json();
+        if (job.progress && options.onProgress) {
+            options.onProgress(job.progress);
+        }
+        if (job.status === 'succeeded') {
+            return job.result;
+        }
+        if (job.status === 'failed' || job.error === 'Job not found') {
+            return {success: false, error: job.error || 'Job failed'};
+        }
+
+        const waited = Date.now() - started;
+        if (job.status === 'queued' && job.attempts === 0) {
+            // Still waiting for its first worker
+            if (!queuedNoticeSent && options.onQueued && waited >= (options.pollMs || JOB_POLL_MS) * 5) {
+                queuedNoticeSent = true;
+                options.onQueued(job);
+            }
+            if (waited >= queuedTimeoutMs) {
+                return {success: false, job_id: data.job_id, status: job.status,
+                        error: 'No background worker has started this job yet; it will run once one is available'};
+            }
+        }
+        if (waited >= timeoutMs) {
+            return {success: false, job_id: data.job_id, status: job.status,
+                    error: 'Still running in the background; check back later'};
+        }
+    }
+}
@@ -5,13 +5,14 @@ Tank Fill Tracking and Dump Site Logic for TrueTank
 This module handles:
 - Gallons estimation by service type
 - Tank fill calculation and monitoring
-- Dump site selection and routing logic
-- Route optimization with dump stops
+- Dump site selection by detour, disposal cost, hours, capacity and waste type
+- Dump placement along a route (dynamic program over the stop gaps)
 """
 
 from typing import List, Dict, Tuple, Optional
 from datetime import datetime
-import math
+import os
+import re
 
 # Service type gallons estimation based on industry averages
 SERVICE_TYPE_GALLONS = {
@@ -27,6 +28,15 @@ SERVICE_TYPE_GALLONS = {
     'Lift Station Service': 500,    # Large capacity lift station pumping
 }
 
+# Dollar value of one minute of truck + crew time, used to weigh detours against disposal fees
+DRIVE_COST_PER_MINUTE = float(os.environ.get('DRIVE_COST_PER_MINUTE', 1.5))
+
+# Assumed drive time for legs the routing provider could not price
+UNKNOWN_LEG_MINUTES = 30
+
+# Clock time (minutes after midnight) routes start when no shift is known
+DEFAULT_ROUTE_START_MINUTES = 8 * 60
+
 def estimate_gallons_for_job(service_type: str, septic_tank_size: Optional[int] = None, 
                            customer_history: Optional[List[int]] = None) -> float:
     """
@@ -128,68 +138,253 @@ def find_dump_points(truck_capacity: int, current_level: float,
     
     return dump_points
 
-def find_nearest_dump_site(current_location: Dict, dump_sites: List[Dict], 
-                          waste_type: str = 'septic') -> Optional[Dict]:
+# Dump placement planning
+
+DAY_NAMES = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+DAY_PATTERN = r'(mon|tue|wed|thu|fri|sat|sun)[a-z]*'
+
+def parse_days(text: str) -> set:
+    """Weekday numbers (Monday = 0) named in text, as ranges ('Mon-Fri') or single days"""
+    days = set()
+    for first, last in re.findall(DAY_PATTERN + r'\s*(?:-|to|through|thru)\s*' + DAY_PATTERN, text):
+        first, last = DAY_NAMES.index(first), DAY_NAMES.index(last)
+        days.update(day % 7 for day in range(first, last + 1 if last >= first else last + 8))
+    text = re.sub(DAY_PATTERN + r'\s*(?:-|to|through|thru)\s*' + DAY_PATTERN, ' ', text)
+    days.update(DAY_NAMES.index(day) for day in re.findall(r'\b' + DAY_PATTERN, text))
+    return days
+
+def parse_operating_hours(operating_hours: Optional[str]) -> Optional[Dict]:
     """
-    Find the nearest appropriate dump site to current location
+    Parse an operating hours string like '6:00 AM - 6:00 PM, Mon-Fri'
+    
+    Days are read per clause (split on commas and semicolons). Days after
+    'closed' or 'except' are shut ('Mon-Sat closed Sun', 'daily except
+    Wed'), as are the days of a clause ending in 'closed' ('Sun closed').
+    Every other day is open, unless some clause names open days.
     
     Args:
-        current_location: Dict with 'lat' and 'lng' keys
-        dump_sites: List of dump site dictionaries
-        waste_type: Type of waste ('septic', 'grease', etc.)
+        operating_hours: Free-text hours from the DumpSite record
     
     Returns:
-        Best dump site dictionary or None if none available
+        Dict with open/close (minutes after midnight) and days (set of
+        weekday numbers, Monday = 0), or None if the site is always open or
+        the text cannot be parsed
     """
     
-    if not dump_sites or not current_location.get('lat') or not current_location.get('lng'):
+    if not operating_hours:
         return None
     
-    # Filter active dump sites that accept the waste type
-    suitable_sites = []
-    for site in dump_sites:
-        if not site.get('is_active', True):
-            continue
+    text = operating_hours.lower()
+    
+    open_days = set()
+    closed_days = set()
+    for clause in re.split(r'[,;]', text):
+        match = re.search(r'closed|except', clause)
+        if not match:
+            before, after = clause, ''
+        elif match.group() == 'closed' and not parse_days(clause[match.end():]):
+            before, after = '', clause  # 'Sun closed'
+        else:
+            before, after = clause[:match.start()], clause[match.end():]
+        open_days |= parse_days(before)
+        closed_days |= parse_days(after)
+    days = (open_days or set(range(7))) - closed_days
+    
+    if '24' in text and ('7' in text or 'hour' in text):
+        return {'open': 0, 'close': 24 * 60, 'days': days} if len(days) < 7 else None
+    
+    times = re.findall(r'(\d{1,2})(?::(\d{2}))?\s*(am|pm)', text)
+    if len(times) < 2:
+        return None
+    
+    def to_minutes(hour, minute, meridiem):
+        hour = int(hour) % 12 + (12 if meridiem == 'pm' else 0)
+        return hour * 60 + int(minute or 0)
+    
+    return {
+        'open': to_minutes(*times[0]),
+        'close': to_minutes(*times[1]),
+        'days': days
+    }
+
+def is_dump_site_open(dump_site: Dict, arrival_minutes: float, service_date=None) -> bool:
+    """Whether a dump site takes loads at a clock time (and weekday, if known)"""
+    hours = parse_operating_hours(dump_site.get('operating_hours'))
+    if hours is None:
+        return True
+    if service_date is not None and service_date.weekday() not in hours['days']:
+        return False
+    dump_time = dump_site.get('estimated_dump_time') or 15
+    return hours['open'] <= arrival_minutes and arrival_minutes + dump_time <= hours['close']
+
+def ticket_waste_type(ticket: Dict) -> str:
+    """Waste category a ticket's load counts as ('grease' or 'septic')"""
+    waste_type = (ticket.get('waste_type') or '').lower()
+    if 'grease' in waste_type or ticket.get('service_type') == 'Grease Trap Service':
+        return 'grease'
+    return 'septic'
+
+def dump_site_accepts(dump_site: Dict, waste_types) -> bool:
+    """Whether a dump site is active and accepts every waste type in a load"""
+    if not dump_site.get('is_active', True):
+        return False
+    if 'septic' in waste_types and not dump_site.get('accepts_septic_waste', True):
+        return False
+    if 'grease' in waste_types and not dump_site.get('accepts_grease_waste', False):
+        return False
+    return True
+
+def plan_dump_stops(truck: Dict, tickets: List[Dict], dump_sites: List[Dict],
+                    durations: Optional[List[List[Optional[float]]]] = None,
+                    start_minutes: float = DEFAULT_ROUTE_START_MINUTES,
+                    service_date=None) -> Optional[Dict]:
+    """
+    Choose where to dump, and at which site, for a fixed job order
+    
+    Dynamic program over the gaps between stops: best[g] is the cheapest
+    plan whose latest dump happens in gap g (tank empty afterwards). Each
+    transition covers the jobs since the previous dump, which must fit under
+    the dump threshold and the site's max_capacity_per_visit, with a site
+    that accepts the load's waste and is open on arrival. Costs are detour
+    minutes (at DRIVE_COST_PER_MINUTE) plus cost_per_gallon for the load;
+    gallons still in the tank at the end of the day are charged at the
+    cheapest suitable site, since they get dumped tomorrow.
+    
+    Args:
+        truck: Truck dictionary with capacity, current level and threshold
+        tickets: Ticket dictionaries in route order
+        dump_sites: Available dump site dictionaries
+        durations: Drive-minute matrix over [storage, tickets..., storage,
+            dump sites...]; None entries (or no matrix) count as
+            UNKNOWN_LEG_MINUTES
+        start_minutes: Clock time the truck leaves storage
+        service_date: Date of the route, used for operating days
+    
+    Returns:
+        Dict with dumps (list of {'before_job', 'site_index', 'gallons',
+        'arrival_minutes', 'detour_minutes', 'disposal_cost'}), detour_minutes,
+        disposal_cost and total_cost, or None if no feasible plan exists
+    """
+    
+    tank_capacity = truck.get('tank_capacity') or 3000
+    threshold = truck.get('tank_full_threshold') or 0.85
+    limit = tank_capacity * threshold
+    start_level = truck.get('current_tank_level') or 0
+    
+    n = len(tickets)
+    site_offset = n + 2
+    
+    def leg(a, b):
+        if durations is None:
+            return UNKNOWN_LEG_MINUTES
+        value = durations[a][b]
+        return UNKNOWN_LEG_MINUTES if value is None else value
+    
+    # Stop k: 0 = storage, 1..n = tickets, n + 1 = storage again
+    gallons = [0.0] + [t.get('estimated_gallons') or 0 for t in tickets] + [0.0]
+    service = [0.0] + [t.get('estimated_duration') or 60 for t in tickets] + [0.0]
+    waste = [None] + [ticket_waste_type(t) for t in tickets] + [None]
+    
+    # arrive[k]: arrival at stop k with no dumps at all; filled[k]: gallons collected through stop k
+    arrive = [0.0] * (n + 2)
+    filled = [0.0] * (n + 2)
+    for k in range(1, n + 2):
+        arrive[k] = arrive[k - 1] + service[k - 1] + leg(k - 1, k)
+        filled[k] = filled[k - 1] + gallons[k]
+    
+    def segment_load(j, g):
+        """Gallons in the tank after stop g when the last dump was in gap j"""
+        return (start_level if j == -1 else 0) + filled[g] - (filled[j] if j >= 0 else 0)
+    
+    def segment_fits(j, g, load):
+        # The starting load, or a single oversized job, only has to fit in the tank at all
+        single = g == 0 or (g == j + 1 and (j != -1 or not start_level))
+        return load <= limit or (single and load <= tank_capacity)
+    
+    def leftover_cost(load, waste_types):
+        prices = [site.get('cost_per_gallon') or 0 for site in dump_sites if dump_site_accepts(site, waste_types)]
+        return load * min(prices) if prices else 0
+    
+    # best[g] = (cost, clock leaving the dump, previous gap, site index, load, arrival, detour)
+    # Gap g sits between stop g and stop g + 1; gap -1 is the start of the day
+    best = {-1: (0.0, start_minutes, None, None, start_level, None, 0.0)}
+    
+    for g in range(0, n + 1):
+        for j in sorted(best):
+            if j >= g:
+                continue
+            cost_j, clock_j, _, site_j, _, _, _ = best[j]
+            load = segment_load(j, g)
+            if load <= 0 or not segment_fits(j, g, load):
+                continue
+            waste_types = {w for w in waste[j + 1:g + 1] if w} or {'septic'}
             
-        # Check if site accepts the waste type
-        if waste_type == 'septic' and not site.get('accepts_septic_waste', True):
-            continue
-        if waste_type == 'grease' and not site.get('accepts_grease_waste', False):
-            continue
+            # Clock at stop g's departure, coming from the previous dump (or storage)
+            if j == -1:
+                depart_g = start_minutes + arrive[g] + service[g]
+            else:
+                depart_g = clock_j + leg(site_offset + site_j, j + 1) + (arrive[g] - arrive[j + 1]) + service[g]
             
-        suitable_sites.append(site)
+            for s, site in enumerate(dump_sites):
+                if not dump_site_accepts(site, waste_types):
+                    continue
+                max_visit = site.get('max_capacity_per_visit')
+                if max_visit and load > max_visit:
+                    continue
+                arrival = depart_g + leg(g, site_offset + s)
+                if not is_dump_site_open(site, arrival, service_date):
+                    continue
+                
+                detour = leg(g, site_offset + s) + leg(site_offset + s, g + 1) - leg(g, g + 1)
+                disposal = load * (site.get('cost_per_gallon') or 0)
+                cost = cost_j + detour * DRIVE_COST_PER_MINUTE + disposal
+                if g not in best or cost < best[g][0]:
+                    leave = arrival + (site.get('estimated_dump_time') or 15)
+                    best[g] = (cost, leave, j, s, load, arrival, detour)
+    
+    # Close out: the jobs after the last dump must fit without another dump
+    final = None
+    for j, (cost_j, _, _, _, _, _, _) in best.items():
+        load = segment_load(j, n) if j < n else 0
+        if not segment_fits(j, n, load):
+            continue
+        waste_types = {w for w in waste[j + 1:n + 1] if w} or {'septic'}
+        total = cost_j + leftover_cost(load, waste_types)
+        if final is None or total < final[0]:
+            final = (total, j)
     
-    if not suitable_sites:
+    if final is None:
         return None
     
-    # Calculate distances and find nearest
-    current_lat = current_location['lat']
-    current_lng = current_location['lng']
-    
-    best_site = None
-    min_distance = float('inf')
-    
-    for site in suitable_sites:
-        # Parse GPS coordinates if available
-        gps_coords = site.get('gps_coordinates', '')
-        if gps_coords and ',' in gps_coords:
-            try:
-                site_lat, site_lng = map(float, gps_coords.split(','))
-                # Simple distance calculation (not perfect but good enough for selection)
-                distance = math.sqrt((current_lat - site_lat)**2 + (current_lng - site_lng)**2)
-                
-                if distance < min_distance:
-                    min_distance = distance
-                    best_site = site
-                    
-            except (ValueError, IndexError):
-                continue
+    dumps = []
+    g = final[1]
+    while g is not None and g != -1:
+        _, _, previous, s, load, arrival, detour = best[g]
+        site = dump_sites[s]
+        dumps.append({
+            'before_job': g,  # index into tickets of the job after this dump (n = end of day)
+            'site_index': s,
+            'gallons': round(load, 1),
+            'arrival_minutes': round(arrival, 1),
+            'detour_minutes': round(detour, 1),
+            'disposal_cost': round(load * (site.get('cost_per_gallon') or 0), 2)
+        })
+        g = previous
+    dumps.reverse()
     
-    # If no GPS coordinates available, return first suitable site
-    return best_site or suitable_sites[0]
+    return {
+        'dumps': dumps,
+        'detour_minutes': round(sum(d['detour_minutes'] for d in dumps), 1),
+        'disposal_cost': round(sum(d['disposal_cost'] for d in dumps), 2),
+        'total_cost': round(final[0], 2)
+    }
 
 def optimize_route_with_dumps(truck: Dict, tickets: List[Dict], 
-                            dump_sites: List[Dict]) -> List[Dict]:
+                            dump_sites: List[Dict],
+                            durations: Optional[List[List[Optional[float]]]] = None,
+                            start_minutes: float = DEFAULT_ROUTE_START_MINUTES,
+                            service_date=None) -> List[Dict]:
     """
     Create optimized route including necessary dump stops
     
@@ -197,44 +392,57 @@ def optimize_route_with_dumps(truck: Dict, tickets: List[Dict],
         truck: Truck dictionary with capacity and current level
         tickets: List of ticket dictionaries in route order
         dump_sites: List of available dump sites
+        durations: Drive-minute matrix laid out as in plan_dump_stops
+        start_minutes: Clock time the truck leaves storage
+        service_date: Date of the route
     
     Returns:
         List of route stops including customer jobs and dump sites
     """
     
-    tank_capacity = truck.get('tank_capacity', 3000)
-    current_level = truck.get('current_tank_level', 0)
-    dump_threshold = truck.get('tank_full_threshold', 0.85)
-    
-    # Find where dumps are needed
-    dump_points = find_dump_points(tank_capacity, current_level, dump_threshold, tickets)
+    plan = plan_dump_stops(truck, tickets, dump_sites, durations, start_minutes, service_date)
+    if plan is None:
+        # Nothing feasible (e.g. every site closed): fall back to threshold dumps at the cheapest site
+        tank_capacity = truck.get('tank_capacity', 3000)
+        current_level = truck.get('current_tank_level', 0)
+        dump_threshold = truck.get('tank_full_threshold', 0.85)
+        sites = [(site.get('cost_per_gallon') or 0, s) for s, site in enumerate(dump_sites)
+                 if dump_site_accepts(site, {'septic'})]
+        dumps = []
+        if sites:
+            site_index = min(sites)[1]
+            for i, gallons in find_dump_points(tank_capacity, current_level, dump_threshold, tickets):
+                dumps.append({'before_job': i, 'site_index': site_index, 'gallons': gallons,
+                              'arrival_minutes': None, 'detour_minutes': None,
+                              'disposal_cost': round(gallons * (dump_sites[site_index].get('cost_per_gallon') or 0), 2)})
+    else:
+        dumps = plan['dumps']
+    
+    dumps_before = {dump['before_job']: dump for dump in dumps}
+    
+    def dump_stop(dump):
+        dump_site = dump_sites[dump['site_index']]
+        return {
+            'type': 'dump_site',
+            'dump_site_id': dump_site['id'],
+            'name': dump_site['name'],
+            'address': dump_site['full_address'],
+            'description': f"Dump at {dump_site['name']}",
+            'estimated_time': dump_site.get('estimated_dump_time', 15),
+            'icon': '🗑️',
+            'gallons_dumped': dump['gallons'],
+            'arrival_minutes': dump['arrival_minutes'],
+            'detour_minutes': dump['detour_minutes'],
+            'disposal_cost': dump['disposal_cost']
+        }
     
     # Build route with dump stops inserted
     route_stops = []
-    dump_index = 0
     
     for i, ticket in enumerate(tickets):
         # Check if we need a dump before this job
-        if dump_index < len(dump_points) and dump_points[dump_index][0] == i:
-            # Find nearest dump site (simplified - using first customer location as reference)
-            current_location = {
-                'lat': 38.25,  # Default Louisville area
-                'lng': -85.75
-            }
-            
-            dump_site = find_nearest_dump_site(current_location, dump_sites)
-            if dump_site:
-                route_stops.append({
-                    'type': 'dump_site',
-                    'dump_site_id': dump_site['id'],
-                    'name': dump_site['name'],
-                    'address': dump_site['full_address'],
-                    'description': f"Dump at {dump_site['name']}",
-                    'estimated_time': dump_site.get('estimated_dump_time', 15),
-                    'icon': '🗑️',
-                    'gallons_dumped': dump_points[dump_index][1]
-                })
-            dump_index += 1
+        if i in dumps_before:
+            route_stops.append(dump_stop(dumps_before[i]))
         
         # Add the customer job
         route_stops.append({
@@ -250,6 +458,10 @@ def optimize_route_with_dumps(truck: Dict, tickets: List[Dict],
             'icon': '🏠'
         })
     
+    # End-of-day dump on the way back to storage
+    if len(tickets) in dumps_before:
+        route_stops.append(dump_stop(dumps_before[len(tickets)]))
+    
     return route_stops
 
 def update_ticket_gallons_estimates(tickets: List[Dict]) -> List[Dict]:
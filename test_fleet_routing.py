@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Test the fleet-wide vehicle routing solver
+"""
+
+from datetime import date
+import math
+import random
+
+import fleet_routing
+
+
+def build_problem(job_count=60, vehicle_count=4, seed=0, shift_minutes=600):
+    """Two depots, two dump sites and random jobs on a 100x100 grid"""
+    rng = random.Random(seed)
+    points = [(30, 30), (70, 70), (10, 90), (90, 10)]
+    points += [(rng.uniform(0, 100), rng.uniform(0, 100)) for _ in range(job_count)]
+    durations = [[math.hypot(a[0] - b[0], a[1] - b[1]) for b in points] for a in points]
+    vehicles = [
+        {'id': v, 'depot': v % 2, 'capacity': 1700, 'max_load': 2000,
+         'start_load': 0, 'shift_minutes': shift_minutes}
+        for v in range(vehicle_count)
+    ]
+    dump_sites = [{'id': k, 'node': 2 + k, 'service_minutes': 15} for k in range(2)]
+    jobs = [
+        {'id': i, 'node': 4 + i, 'service_minutes': 30,
+         'gallons': rng.choice([0, 150, 400, 500]), 'priority': rng.choice(['low', 'medium', 'urgent'])}
+        for i in range(job_count)
+    ]
+    return durations, vehicles, jobs, dump_sites
+
+
+def test_routes_respect_capacity_and_shift():
+    durations, vehicles, jobs, dump_sites = build_problem()
+    plan = fleet_routing.solve_fleet(durations, vehicles, jobs, dump_sites, time_budget=5, max_iterations=20)
+
+    assigned = [stop['job_index'] for route in plan['routes'] for stop in route['stops'] if stop['type'] == 'job']
+    assert sorted(assigned + plan['unassigned']) == list(range(len(jobs)))
+
+    for route in plan['routes']:
+        assert route['duration_minutes'] <= 600
+        load = 0
+        for stop in route['stops']:
+            if stop['type'] == 'dump':
+                load = 0
+            else:
+                load += jobs[stop['job_index']]['gallons']
+                assert load <= 2000
+
+
+def test_same_seed_same_plan():
+    problem = build_problem(seed=4)
+    first = fleet_routing.solve_fleet(*problem, time_budget=10, seed=7, max_iterations=10)
+    second = fleet_routing.solve_fleet(*problem, time_budget=10, seed=7, max_iterations=10)
+    assert first['routes'] == second['routes']
+    assert first['unassigned'] == second['unassigned']
+
+
+def test_urgent_jobs_scheduled_first_when_short_on_time():
+    durations, vehicles, jobs, dump_sites = build_problem(job_count=40, vehicle_count=1, shift_minutes=300)
+    plan = fleet_routing.solve_fleet(durations, vehicles, jobs, dump_sites, time_budget=5, max_iterations=20)
+    assert plan['unassigned']
+    left_out = {jobs[j]['priority'] for j in plan['unassigned']}
+    urgent_total = sum(1 for job in jobs if job['priority'] == 'urgent')
+    urgent_left = sum(1 for j in plan['unassigned'] if jobs[j]['priority'] == 'urgent')
+    assert urgent_left < urgent_total
+    assert 'low' in left_out
+
+
+def test_hard_windows_respected_and_urgent_jobs_early():
+    durations, vehicles, jobs, dump_sites = build_problem(job_count=40, vehicle_count=3)
+    for vehicle in vehicles:
+        vehicle.update(start_minutes=480, end_minutes=1080)
+    for i, job in enumerate(jobs):
+        job.update(fleet_routing.ticket_time_window(job['priority'], None, None, date(2026, 10, 19), 480))
+        if i % 10 == 0:
+            job.update(earliest=720, latest=780, hard=True)
+
+    plan = fleet_routing.solve_fleet(durations, vehicles, jobs, dump_sites, time_budget=5, max_iterations=20)
+    starts = {}
+    for route in plan['routes']:
+        for stop in route['stops']:
+            if stop['type'] == 'job':
+                starts[stop['job_index']] = stop['start_minutes']
+
+    for i in range(0, len(jobs), 10):
+        if i in starts:
+            assert 720 <= starts[i] <= 780
+
+    def mean_start(priority):
+        values = [start for j, start in starts.items() if jobs[j]['priority'] == priority and not jobs[j].get('hard')]
+        return sum(values) / len(values)
+    assert mean_start('urgent') < mean_start('low')
+
+
+def test_insertion_check_matches_full_evaluation():
+    """Without dumps the O(1) segment checks agree with walking the route"""
+    durations, vehicles, jobs, _ = build_problem(job_count=12, vehicle_count=1, seed=2)
+    vehicles[0].update(start_minutes=480, end_minutes=900)
+    for i, job in enumerate(jobs):
+        job['gallons'] = 0
+        if i % 3 == 0:
+            job.update(earliest=540 + 10 * i, latest=600 + 10 * i, hard=True)
+
+    problem = fleet_routing.FleetProblem(durations, vehicles, jobs)
+    route = [j for j in range(8) if problem.walk(0, [j]) is not None][:5]
+    schedule = problem.schedule(0, route)
+    while schedule is None:
+        route.pop()
+        schedule = problem.schedule(0, route)
+
+    for job_index in range(len(jobs)):
+        if job_index in route:
+            continue
+        for position in range(len(route) + 1):
+            new_route = route[:position] + [job_index] + route[position:]
+            feasible = problem.walk(0, new_route) is not None
+            assert problem.can_insert(schedule, 0, job_index, position) == feasible
+
+            if position < len(route):
+                replaced = route[:position] + [job_index] + route[position + 1:]
+                assert problem.can_replace(schedule, position, job_index) == (problem.walk(0, replaced) is not None)
+
+    for position in range(len(route)):
+        removed = route[:position] + route[position + 1:]
+        for target in range(len(route)):
+            moved = removed[:target] + [route[position]] + removed[target:]
+            assert problem.can_relocate(schedule, position, target) == (problem.walk(0, moved) is not None)
+
+
+def test_ticket_time_window_from_priority_and_due_date():
+    service_date = date(2026, 10, 19)
+    urgent = fleet_routing.ticket_time_window('medium', 'Emergency Service', None, service_date, 480)
+    assert urgent['priority'] == 'urgent' and urgent['latest'] == 600
+
+    overdue = fleet_routing.ticket_time_window('low', 'Septic Pumping', date(2026, 10, 1), service_date, 480)
+    later = fleet_routing.ticket_time_window('low', 'Septic Pumping', date(2026, 11, 1), service_date, 480)
+    assert overdue['priority'] == 'high'
+    assert overdue['unassigned_penalty'] > later['unassigned_penalty']
+    assert later['latest'] is None
+
+
+if __name__ == '__main__':
+    test_routes_respect_capacity_and_shift()
+    test_same_seed_same_plan()
+    test_urgent_jobs_scheduled_first_when_short_on_time()
+    test_hard_windows_respected_and_urgent_jobs_early()
+    test_insertion_check_matches_full_evaluation()
+    test_ticket_time_window_from_priority_and_due_date()
+    print('All fleet routing tests passed')
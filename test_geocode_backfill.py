@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test that the geocoding backfill checkpoints its progress and resumes from it
+"""
+
+import os
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import pytest
+
+from app import app, db
+import geocode_backfill
+import geocoding
+from models import Customer, GeocodeBackfillCheckpoint
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """A fake geocoding provider that knows every address except those on 'Nowhere Rd'"""
+    if app.config['SQLALCHEMY_DATABASE_URI'] != 'sqlite://':
+        pytest.skip('needs the in-memory test database')
+    calls = []
+
+    def lookup(address):
+        calls.append(address)
+        if 'Nowhere' in address:
+            return None
+        return {'latitude': 38.0 + len(calls) / 100, 'longitude': -85.7}
+
+    monkeypatch.setitem(geocoding.PROVIDERS, 'fake', lookup)
+    monkeypatch.setattr(geocoding.singleflight, 'SINGLE_FLIGHT_SHARED', False)
+    geocoding._memory_cache.clear()
+    with app.app_context():
+        db.create_all()
+        yield calls
+        db.session.remove()
+        db.drop_all()
+    geocoding._memory_cache.clear()
+
+
+def add_customers(*streets):
+    for number, street in enumerate(streets, start=1):
+        db.session.add(Customer(first_name='Pat', last_name=f'Customer {number}', street_address=street,
+                                city='Louisville', state='KY', zip_code='40202'))
+    db.session.commit()
+
+
+def backfill(**kwargs):
+    return geocode_backfill.run_backfill(kinds=['customer'], providers=('fake',), batch_size=2,
+                                         progress=None, **kwargs)
+
+
+def test_backfill_resumes_after_the_checkpoint(lookups):
+    add_customers('1 Oak St', '2 Oak St', '3 Nowhere Rd', '4 Oak St', '5 Oak St')
+
+    report = backfill(limit=3)
+    assert (report['processed'], report['geocoded'], report['failed']) == (3, 2, 1)
+    checkpoint = GeocodeBackfillCheckpoint.query.filter_by(kind='customer').one()
+    assert checkpoint.last_id == 3 and checkpoint.completed_at is None
+
+    # The next run picks up after the last committed record
+    report = backfill()
+    assert (report['processed'], report['geocoded'], report['failed']) == (2, 2, 0)
+    assert len(lookups) == 5
+    checkpoint = GeocodeBackfillCheckpoint.query.filter_by(kind='customer').one()
+    assert (checkpoint.processed, checkpoint.geocoded, checkpoint.failed) == (5, 4, 1)
+    assert checkpoint.completed_at is not None
+    assert Customer.query.filter(Customer.latitude.is_(None)).count() == 1
+
+    # Nothing is left after the checkpoint
+    assert backfill()['processed'] == 0
+    assert len(lookups) == 5
+
+
+def test_retry_failed_revisits_earlier_failures(lookups):
+    add_customers('1 Oak St', '2 Nowhere Rd')
+    backfill()
+    assert geocode_backfill.backfill_status(['customer'])['customer']['failures'] == \
+        [{'id': 2, 'address': '2 Nowhere Rd, Louisville, KY, 40202', 'reason': 'not found'}]
+
+    customer = db.session.get(Customer, 2)
+    customer.street_address = '2 Oak St'
+    db.session.commit()
+
+    report = backfill(retry_failed=True)
+    assert (report['processed'], report['geocoded']) == (1, 1)
+    checkpoint = GeocodeBackfillCheckpoint.query.filter_by(kind='customer').one()
+    assert checkpoint.failed == 0 and checkpoint.failures is None
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Test address normalization and the in-process and database geocode caches
+"""
+
+import os
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import pytest
+
+from app import app, db
+import geocoding
+from models import GeocodeCache, RateLimitBucket
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    """A fake geocoding provider that counts its calls"""
+    if app.config['SQLALCHEMY_DATABASE_URI'] != 'sqlite://':
+        pytest.skip('needs the in-memory test database')
+    calls = []
+
+    def lookup(address):
+        calls.append(address)
+        return {'latitude': 38.25, 'longitude': -85.75, 'display_name': address}
+
+    monkeypatch.setitem(geocoding.PROVIDERS, 'fake', lookup)
+    # Finished calls stay shared for a few seconds; every lookup here should be fresh
+    monkeypatch.setattr(geocoding.singleflight, 'SINGLE_FLIGHT_SHARED', False)
+    geocoding._memory_cache.clear()
+    with app.app_context():
+        db.create_all()
+        yield calls
+        db.session.remove()
+        db.drop_all()
+    geocoding._memory_cache.clear()
+
+
+def test_normalize_address():
+    assert geocoding.normalize_address('123 Main Street, Louisville, KY') == '123 main st, louisville, ky'
+    assert geocoding.normalize_address(' 123  MAIN st. ,Louisville,  ky ') == '123 main st, louisville, ky'
+    assert geocoding.normalize_address('9 North Oak Avenue #4') == '9 n oak ave 4'
+    assert geocoding.normalize_address('') == ''
+    assert geocoding.normalize_address(None) == ''
+
+
+def test_lru_evicts_oldest_and_expires_entries():
+    cache = geocoding.LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1  # a is now the most recent
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+    cache.put('old', 4, datetime.utcnow() - timedelta(seconds=1))
+    assert len(cache) == 2
+    assert cache.get('old') is None
+    assert len(cache) == 1
+
+
+def test_geocode_serves_spellings_from_the_caches(provider):
+    first = geocoding.geocode('123 Main Street, Louisville, KY', providers=('fake',))
+    assert first['latitude'] == 38.25 and first['provider'] == 'fake'
+    assert geocoding.geocode('123 main st., louisville, ky', providers=('fake',)) == first
+    assert len(provider) == 1
+
+    # Another worker's process starts with an empty LRU and reads the row
+    geocoding._memory_cache.clear()
+    cached = geocoding.geocode('123 Main St, Louisville, KY', providers=('fake',))
+    assert (cached['latitude'], cached['longitude'], cached['provider']) == (38.25, -85.75, 'fake')
+    assert len(provider) == 1
+    assert GeocodeCache.query.count() == 1
+
+
+def test_expired_rows_are_looked_up_again(provider):
+    geocoding.geocode('5 Elm Rd, Louisville, KY', providers=('fake',), ttl_seconds=60)
+    row = GeocodeCache.query.one()
+    row.created_at = datetime.utcnow() - timedelta(seconds=120)
+    db.session.commit()
+
+    geocoding._memory_cache.clear()
+    geocoding.geocode('5 Elm Rd, Louisville, KY', providers=('fake',))
+    assert len(provider) == 2
+    assert GeocodeCache.query.one().created_at > datetime.utcnow() - timedelta(seconds=60)
+
+
+def test_token_bucket_refills_at_its_rate(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(geocoding.time, 'monotonic', lambda: clock[0])
+    bucket = geocoding.TokenBucket(rate=2.0, capacity=2)
+    assert bucket.try_acquire() == 0 and bucket.try_acquire() == 0
+    assert bucket.try_acquire() == pytest.approx(0.5)
+    clock[0] += 0.25
+    assert bucket.try_acquire() == pytest.approx(0.25)
+    clock[0] += 0.25
+    assert bucket.try_acquire() == 0
+
+    # A daily quota never waits for its refill
+    daily = geocoding.TokenBucket(rate=1 / 86400.0, capacity=1, blocking=False)
+    assert daily.acquire() is True
+    assert daily.acquire() is False
+
+
+def test_provider_quota_is_not_spent_on_calls_that_time_out(monkeypatch):
+    daily = geocoding.TokenBucket(rate=1 / 86400.0, capacity=1, blocking=False)
+    minute = geocoding.TokenBucket(rate=1 / 60.0, capacity=1)
+    monkeypatch.setitem(geocoding.RATE_LIMITS, 'test', [daily, minute])
+    assert geocoding.acquire_provider('test', timeout=0) is True
+
+    # The minute bucket is empty: giving up on it leaves the daily token alone
+    daily._tokens = 1
+    assert geocoding.acquire_provider('test', timeout=0) is False
+    assert daily.try_acquire() == 0
+
+
+def test_shared_buckets_draw_from_one_row(provider):
+    # Two processes' buckets with the same name
+    first = geocoding.SharedTokenBucket('test:minute', rate=1 / 60.0, capacity=3)
+    second = geocoding.SharedTokenBucket('test:minute', rate=1 / 60.0, capacity=3)
+    assert first.try_acquire() == 0
+    assert second.try_acquire() == 0
+    assert first.try_acquire() == 0
+    assert second.try_acquire() > 50
+    assert first._tokens == 3  # the in-process fallback was never touched
+
+    # A restart starts from the row, not from a full bucket
+    restarted = geocoding.SharedTokenBucket('test:minute', rate=1 / 60.0, capacity=3, blocking=False)
+    assert restarted.acquire() is False
+
+    row = db.session.get(RateLimitBucket, 'test:minute')
+    row.updated_at -= timedelta(seconds=60)
+    db.session.commit()
+    assert restarted.acquire() is True
+    assert restarted.acquire() is False
+
+
+def test_shared_bucket_falls_back_to_the_process_bucket(provider):
+    db.drop_all()
+    bucket = geocoding.SharedTokenBucket('test:second', rate=1.0, capacity=1)
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() > 0
+    db.create_all()
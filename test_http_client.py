@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test retries and circuit breaking in the outbound HTTP client
+"""
+
+import io
+
+import pytest
+import requests
+
+import http_client
+
+
+class FakeSession:
+    """Plays back a script of status codes and exceptions"""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        outcome = self.script.pop(0) if self.script else 200
+        if isinstance(outcome, Exception):
+            raise outcome
+        response = requests.Response()
+        response.status_code = outcome
+        response.raw = io.BytesIO(b"")
+        return response
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    http_client.reset()
+    monkeypatch.setattr(http_client.time, 'sleep', lambda seconds: None)
+
+    def install(script):
+        session = FakeSession(script)
+        monkeypatch.setattr(http_client, 'session_for', lambda url: session)
+        return session
+    yield install
+    http_client.reset()
+
+
+def test_retries_transient_failures(fake):
+    session = fake([503, requests.ConnectionError('reset'), 200])
+    response = http_client.get('census', 'https://census.example/geo')
+    assert response.status_code == 200
+    assert session.calls == 3
+
+    stats = http_client.get_stats()['census']
+    assert (stats['calls'], stats['attempts'], stats['retries'], stats['errors']) == (1, 3, 2, 0)
+    assert stats['status_codes'] == {'503': 1, 'ConnectionError': 1, '200': 1}
+    assert sum(stats['latency_buckets'].values()) == 3
+
+    # Client errors are the caller's problem, not the provider's
+    session = fake([404])
+    assert http_client.get('census', 'https://census.example/geo').status_code == 404
+    assert session.calls == 1
+    assert http_client.get_stats()['census']['circuit']['state'] == 'closed'
+
+
+def test_circuit_opens_and_recovers(fake, monkeypatch):
+    session = fake([requests.Timeout('slow')] * 100)
+    for _ in range(http_client.CIRCUIT_FAILURE_THRESHOLD):
+        with pytest.raises(requests.Timeout):
+            http_client.get('nominatim', 'https://osm.example/search', retries=0)
+    assert http_client.get_stats()['nominatim']['circuit']['state'] == 'open'
+
+    calls = session.calls
+    with pytest.raises(http_client.CircuitOpenError):
+        http_client.get('nominatim', 'https://osm.example/search')
+    assert session.calls == calls
+    assert http_client.get_stats()['nominatim']['short_circuited'] == 1
+    assert http_client.get_stats()['openroute']['circuit']['state'] == 'closed'
+
+    # After the cool-down one probe goes through, and its success closes the circuit
+    session = fake([200])
+    breaker = http_client._breakers['nominatim']
+    breaker.opened_at -= http_client.CIRCUIT_RESET_SECONDS
+    assert http_client.get('nominatim', 'https://osm.example/search').status_code == 200
+    assert http_client.get_stats()['nominatim']['circuit']['state'] == 'closed'
+
+
+def test_probe_is_released_whatever_it_raises(fake):
+    fake([requests.Timeout('slow')] * http_client.CIRCUIT_FAILURE_THRESHOLD)
+    for _ in range(http_client.CIRCUIT_FAILURE_THRESHOLD):
+        with pytest.raises(requests.Timeout):
+            http_client.get('census', 'https://census.example/geo', retries=0)
+    breaker = http_client._breakers['census']
+
+    # A probe failing with any other request error re-opens the circuit (and isn't retried)
+    session = fake([requests.exceptions.ChunkedEncodingError('cut off'), 200])
+    breaker.opened_at -= http_client.CIRCUIT_RESET_SECONDS
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        http_client.get('census', 'https://census.example/geo')
+    assert session.calls == 1
+    assert breaker.snapshot()['state'] == 'open'
+
+    # A probe that blows up outside requests lets the next caller probe
+    fake([ValueError('bad response'), 200])
+    breaker.opened_at -= http_client.CIRCUIT_RESET_SECONDS
+    with pytest.raises(ValueError):
+        http_client.get('census', 'https://census.example/geo')
+    assert http_client.get('census', 'https://census.example/geo').status_code == 200
+    assert breaker.snapshot()['state'] == 'closed'
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+Test the job board endpoints: query counts, ticket field profiles, versions and change events
+"""
+
+import os
+from datetime import date, datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import pytest
+from sqlalchemy import event
+
+from app import app, db
+import board_events
+import board_versions
+import positions
+import ticket_serializer
+from models import (BoardChange, Customer, Location, SepticSystem, TeamMember, Ticket, Truck,
+                    TruckTeamAssignment, DumpSite)
+
+BOARD_DATE = date(2026, 3, 2)
+
+
+@pytest.fixture
+def client():
+    if app.config['SQLALCHEMY_DATABASE_URI'] != 'sqlite://':
+        pytest.skip('needs the in-memory test database')
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def add_board(trucks, tickets_per_truck, pending):
+    """Trucks with crews, customers' scheduled tickets and unscheduled pending tickets"""
+    location = Location(name='Yard', street_address='1 Yard Rd', city='Louisville', state='KY', zip_code='40000')
+    dump_site = DumpSite(name='Plant', street_address='2 Plant Rd', city='Louisville', state='KY')
+    db.session.add_all([location, dump_site])
+    db.session.flush()
+
+    first_truck = Truck.query.count()
+    count = Ticket.query.count()
+    for t in range(first_truck, first_truck + trucks):
+        truck = Truck(truck_number=f'TT-{t:02d}', tank_capacity=3000, current_location_id=location.id,
+                      preferred_dump_site_id=dump_site.id)
+        member = TeamMember(first_name='Crew', last_name=str(t), position='driver', hire_date=BOARD_DATE)
+        db.session.add_all([truck, member])
+        db.session.flush()
+        db.session.add(TruckTeamAssignment(truck_id=truck.id, team_member_id=member.id, assignment_date=BOARD_DATE))
+
+        for position in range(tickets_per_truck):
+            count += 1
+            customer = Customer(first_name='Cust', last_name=str(count), street_address=f'{count} Main St',
+                                city='Louisville', state='KY')
+            db.session.add(customer)
+            db.session.flush()
+            db.session.add(Ticket(job_id=f'S-{count}', customer_id=customer.id, truck_id=truck.id,
+                                  scheduled_date=datetime(2026, 3, 2, 9), route_position=position))
+
+    for p in range(count, count + pending):
+        customer = Customer(first_name='Pending', last_name=str(p), street_address=f'{p} Oak St',
+                            city='Louisville', state='KY')
+        db.session.add(customer)
+        db.session.flush()
+        db.session.add(Ticket(job_id=f'P-{p}', customer_id=customer.id, status='pending'))
+    db.session.commit()
+    db.session.expunge_all()
+
+
+def run_queries(client, url, json=None):
+    """GET (or POST json to) a URL and return the SQL statements it ran with the JSON response"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(url) if json is None else client.post(url, json=json)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    return statements, response.get_json()
+
+
+def test_job_board_query_count_is_flat(client):
+    add_board(trucks=2, tickets_per_truck=2, pending=2)
+    client.get(f'/api/job-board?date={BOARD_DATE.isoformat()}')  # warm-up (periodic housekeeping)
+    small, data = run_queries(client, f'/api/job-board?date={BOARD_DATE.isoformat()}')
+    assert sum(len(tickets) for tickets in data['truck_schedules'].values()) == 4
+    assert len(data['team_assignments']) == 2
+
+    add_board(trucks=6, tickets_per_truck=10, pending=20)
+    large, data = run_queries(client, f'/api/job-board?date={BOARD_DATE.isoformat()}')
+    assert sum(len(tickets) for tickets in data['truck_schedules'].values()) == 64
+    assert len(data['pending_tickets']) == 22
+    assert len(large) == len(small)
+
+    for sort_by in ('priority', 'customer', 'due_date'):
+        sorted_statements, _ = run_queries(client, f'/api/job-board?date={BOARD_DATE.isoformat()}&sort={sort_by}')
+        assert len(sorted_statements) == len(small)
+
+
+def test_job_board_orders_by_route_position(client):
+    add_board(trucks=1, tickets_per_truck=4, pending=0)
+    ticket = Ticket.query.filter_by(job_id='S-1').first()
+    ticket.route_position = 10
+    db.session.commit()
+
+    _, data = run_queries(client, f'/api/job-board?date={BOARD_DATE.isoformat()}')
+    schedule = next(iter(data['truck_schedules'].values()))
+    assert [t['job_id'] for t in schedule] == ['S-2', 'S-3', 'S-4', 'S-1']
+    assert schedule[0]['customer_name'] == 'Cust 2'
+
+
+def test_ticket_field_profiles(client):
+    add_board(trucks=1, tickets_per_truck=2, pending=1)
+    ticket = Ticket.query.filter_by(job_id='S-1').first()
+    ticket.office_notes = 'Gate code 1234'
+    db.session.add(Ticket(job_id='DUMP-1', truck_id=ticket.truck_id, service_type='Waste Disposal',
+                          disposal_location='Plant', scheduled_date=datetime(2026, 3, 2, 12), route_position=5))
+    db.session.commit()
+    expected = {t.job_id: t.to_dict() for t in Ticket.query.all()}
+
+    _, data = run_queries(client, f'/api/job-board?date={BOARD_DATE.isoformat()}&profile=card')
+    schedule = next(iter(data['truck_schedules'].values()))
+    assert set(schedule[0]) == set(ticket_serializer.PROFILES['card'])
+    assert schedule[-1]['customer_name'] == '🗑️ Plant'
+
+    # Heavy text is deferred unless asked for, and never selected when deferred
+    statements, page = run_queries(client, '/api/tickets?limit=50')
+    tickets = page['items']
+    assert all('office_notes' not in t for t in tickets)
+    assert not any('office_notes' in statement for statement in statements)
+
+    tickets = client.get('/api/tickets?fields=job_id,office_notes&limit=50').get_json()['items']
+    assert {t['job_id']: t['office_notes'] for t in tickets}['S-1'] == 'Gate code 1234'
+    assert set(tickets[0]) == {'job_id', 'office_notes'}
+
+    # The export profile matches Ticket.to_dict(), and is what an unpaged request gets
+    for url in ('/api/tickets?profile=export&limit=50', '/api/tickets'):
+        rows = client.get(url).get_json()
+        for row in rows['items'] if 'items' in rows else rows:
+            for name, value in expected[row['job_id']].items():
+                assert row[name] == value, name
+    assert [t['job_id'] for t in client.get('/api/tickets?fields=job_id').get_json()] == \
+        [t.job_id for t in Ticket.query.order_by(Ticket.status, Ticket.column_position, Ticket.id)]
+
+    jobs = client.get(f"/api/trucks/{ticket.truck_id}/jobs?date={BOARD_DATE.isoformat()}&fields=job_id,customer_name").get_json()
+    assert [job['customer_name'] for job in jobs] == ['Cust 1', 'Cust 2', '🗑️ Plant']
+
+    columns = client.get('/api/job-board/tickets?fields=job_id').get_json()
+    assert [t['job_id'] for t in columns['pending']] and all(set(t) == {'job_id'} for t in columns['pending'])
+
+    assert client.get('/api/tickets?fields=job_id,nope').status_code == 400
+
+
+def test_board_versions_and_deltas(client):
+    add_board(trucks=1, tickets_per_truck=3, pending=2)
+    url = f'/api/job-board?date={BOARD_DATE.isoformat()}&profile=card'
+    first = client.get(url)
+    version = first.get_json()['version']
+    assert first.headers['ETag'] and version > 0
+
+    # Idle pollers get a 304
+    assert client.get(url, headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    # Writes to another date's board leave this one alone
+    other = Ticket.query.filter_by(job_id='S-1').first()
+    db.session.add(Ticket(job_id='OTHER', truck_id=other.truck_id, scheduled_date=datetime(2026, 3, 9, 9)))
+    db.session.commit()
+    assert client.get(url, headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    # Reorder a stop, schedule a pending ticket and delete another stop
+    truck_id = other.truck_id
+    ids = {t.job_id: t.id for t in Ticket.query.all()}
+    Ticket.query.filter_by(job_id='S-1').first().route_position = 9
+    pending = Ticket.query.filter_by(job_id='P-3').first()
+    pending.truck_id, pending.scheduled_date, pending.route_position = truck_id, datetime(2026, 3, 2, 13), 1
+    db.session.delete(Ticket.query.filter_by(job_id='S-3').first())
+    db.session.commit()
+
+    response = client.get(f'{url}&since={version}', headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 200
+    delta = response.get_json()
+    assert delta['delta'] and delta['version'] > version
+    assert {t['job_id']: t['board_column'] for t in delta['tickets']} == {'S-1': str(truck_id), 'P-3': str(truck_id)}
+    assert delta['removed_ticket_ids'] == [ids['S-3']]
+    assert delta['schedule_order'] == {str(truck_id): [ids['S-2'], ids['P-3'], ids['S-1']]}
+    assert delta['pending_order'] == [ids['P-4']]
+
+    # Nothing new since the latest version: an empty delta
+    empty = client.get(f"{url}&since={delta['version']}").get_json()
+    assert empty['tickets'] == [] and empty['removed_ticket_ids'] == []
+
+    # Truck changes (and unknown versions) send the whole board
+    truck = Truck.query.get(truck_id)
+    truck.current_tank_level = 500
+    db.session.commit()
+    assert client.get(f"{url}&since={delta['version']}").get_json()['full'] is True
+    assert client.get(f'{url}&since=999999').get_json()['full'] is True
+
+
+def test_deleting_a_ticket_leaves_the_rest_of_the_column_alone(client):
+    add_board(trucks=1, tickets_per_truck=0, pending=3)
+    positions_before = {t.id: t.column_position for t in Ticket.query}
+    doomed = min(positions_before)
+    before = board_versions.latest_version()
+
+    assert client.delete(f'/api/job-board/tickets/{doomed}').get_json()['success'] is True
+    del positions_before[doomed]
+    assert {t.id: t.column_position for t in Ticket.query} == positions_before
+    changes = BoardChange.query.filter(BoardChange.version > before).all()
+    assert [(c.entity, c.entity_id) for c in changes] == [('ticket', doomed)]
+
+
+def test_board_versions_come_from_the_counter_in_the_writing_transaction(client):
+    add_board(trucks=1, tickets_per_truck=2, pending=1)
+    before = board_versions.latest_version()
+
+    # Every row a flush logs shares the version it bumped the counter to
+    ticket = Ticket.query.filter(Ticket.scheduled_date.is_(None)).first()
+    ticket.scheduled_date = datetime.combine(BOARD_DATE, datetime.min.time())
+    db.session.flush()
+    assert {change.version for change in BoardChange.query.filter(BoardChange.version > before)} == {before + 1}
+    db.session.commit()
+    assert board_versions.latest_version() == before + 1
+    assert board_versions.board_version(BOARD_DATE)[0] == before + 1
+
+    # A rolled-back write hands its number back with the counter row
+    ticket.status = 'cancelled'
+    db.session.flush()
+    db.session.rollback()
+    assert board_versions.latest_version() == before + 1
+
+
+def test_board_events_reach_viewers_of_the_changed_dates(client, monkeypatch):
+    add_board(trucks=1, tickets_per_truck=2, pending=1)
+    viewer = board_events.subscribe(BOARD_DATE.isoformat())
+    other_day = board_events.subscribe('2026-03-09')
+    try:
+        ticket = Ticket.query.filter_by(job_id='P-2').first()
+        truck = Truck.query.first()
+        response = client.post('/api/tickets/assign', json={
+            'ticket_id': ticket.id, 'truck_id': truck.id, 'scheduled_date': '2026-03-02T13:00:00'
+        })
+        assert response.status_code == 200
+
+        # Scheduling a pending ticket changes every date's pending list
+        event = viewer.get(timeout=1)
+        assert event['type'] == 'ticket_assigned' and event['ticket_id'] == ticket.id
+        assert event['version'] >= board_versions.board_version(BOARD_DATE)[0]
+        assert other_day.get(timeout=1)['type'] == 'ticket_assigned'
+
+        client.post('/api/team-assignments', json={'truck_id': truck.id, 'team_member_id': None,
+                                                  'assignment_date': BOARD_DATE.isoformat()})
+        assert viewer.get(timeout=1)['type'] == 'team_assignment_changed'
+        assert other_day.get(timeout=0.1) is None
+    finally:
+        board_events.broker.unsubscribe(viewer)
+        board_events.broker.unsubscribe(other_day)
+
+    # Viewers that fall too far behind are told to resync
+    monkeypatch.setattr(board_events, 'SUBSCRIBER_QUEUE_SIZE', 2)
+    slow = board_events.subscribe(BOARD_DATE.isoformat())
+    for _ in range(3):
+        board_events.publish('route_reordered', [BOARD_DATE.isoformat()], version=1)
+    messages = list(board_events.stream(slow, {'version': 1}))
+    assert messages[-1].startswith('event: resync')
+    assert board_events.broker.subscriber_count() == 0
+
+
+def test_board_streams_are_capped_per_worker(client, monkeypatch):
+    monkeypatch.setattr(board_events, 'STREAM_MAX_SUBSCRIBERS', 1)
+    viewer = board_events.subscribe(BOARD_DATE.isoformat())
+    try:
+        response = client.get(f'/api/job-board/stream?date={BOARD_DATE.isoformat()}')
+        assert response.status_code == 503 and response.headers['Retry-After']
+    finally:
+        board_events.broker.unsubscribe(viewer)
+
+    response = client.get(f'/api/job-board/stream?date={BOARD_DATE.isoformat()}')
+    assert response.status_code == 200 and response.mimetype == 'text/event-stream'
+    response.close()
+    assert board_events.broker.subscriber_count() == 0
+
+    monkeypatch.setattr(board_events, 'STREAM_MAX_SECONDS', 0)
+    response = client.get(f'/api/job-board/stream?date={BOARD_DATE.isoformat()}')
+    assert response.mimetype == 'text/event-stream'
+    assert 'event: hello' in response.get_data(as_text=True)
+
+
+def test_moves_write_one_row_with_gap_positions(client, monkeypatch):
+    monkeypatch.setattr(positions, 'REBALANCE_IN_BACKGROUND', False)
+    add_board(trucks=1, tickets_per_truck=0, pending=0)
+    for i in range(6):
+        db.session.add(Ticket(job_id=f'K-{i}', status='assigned', column_position=i))  # old sequential keys
+    db.session.commit()
+
+    def column():
+        return [t.job_id for t in Ticket.query.filter_by(status='assigned').order_by(Ticket.column_position)]
+
+    def move(job_id, index):
+        ticket_id = Ticket.query.filter_by(job_id=job_id).first().id
+        statements, result = run_queries(client, '/api/job-board/move', {
+            'ticket_id': ticket_id, 'new_status': 'assigned', 'new_position': index})
+        assert result['success']
+        return [s for s in statements if s.lstrip().upper().startswith('UPDATE TICKET')]
+
+    # The first move migrates the column to gapped keys, later moves write only the moved ticket
+    move('K-5', 1)
+    assert column() == ['K-0', 'K-5', 'K-1', 'K-2', 'K-3', 'K-4']
+    assert len(move('K-0', 3)) == 1
+    assert column() == ['K-5', 'K-1', 'K-2', 'K-0', 'K-3', 'K-4']
+    assert len(move('K-4', 0)) == 1
+    assert len(move('K-1', 99)) == 1
+    assert column() == ['K-4', 'K-5', 'K-2', 'K-0', 'K-3', 'K-1']
+
+    # Repeated drops into the same slot use up the gap, then rebalance inline
+    for _ in range(12):
+        move('K-0', 1)
+        move('K-2', 1)
+    assert column() == ['K-4', 'K-2', 'K-0', 'K-5', 'K-3', 'K-1']
+    positions.rebalance(positions.column_scope('assigned'))
+    keys = [t.column_position for t in Ticket.query.filter_by(status='assigned').order_by(Ticket.column_position)]
+    assert keys == [(i + 1) * positions.POSITION_GAP for i in range(6)]
+
+    # New kanban tickets go on top of pending without shifting the others
+    db.session.add(Ticket(job_id='P-OLD', status='pending', column_position=0))
+    db.session.commit()
+    statements, result = run_queries(client, '/api/job-board/create', {'customer_name': 'New', 'service_type': 'Pump'})
+    assert not [s for s in statements if s.lstrip().upper().startswith('UPDATE TICKET')]
+    pending = Ticket.query.filter_by(status='pending').order_by(Ticket.column_position).all()
+    assert [t.job_id for t in pending] == [result['ticket']['job_id'], 'P-OLD']
+
+    # Route drops work the same way
+    truck = Truck.query.first()
+    for i in range(3):
+        db.session.add(Ticket(job_id=f'R-{i}', truck_id=truck.id, scheduled_date=datetime(2026, 3, 2, 9 + i),
+                              route_position=i))
+    db.session.commit()
+    route_ticket = Ticket.query.filter_by(job_id='R-2').first()
+    client.post('/api/tickets/reorder-route', json={'ticket_id': route_ticket.id, 'truck_id': truck.id,
+                                                   'route_position': 0, 'scheduled_date': '2026-03-02T09:00:00'})
+    route = Ticket.query.filter(Ticket.job_id.like('R-%')).order_by(Ticket.route_position)
+    assert [t.job_id for t in route] == ['R-2', 'R-0', 'R-1']
+
+
+def test_batch_applies_operations_in_one_transaction(client, monkeypatch):
+    monkeypatch.setattr(positions, 'REBALANCE_IN_BACKGROUND', False)
+    add_board(trucks=2, tickets_per_truck=2, pending=2)
+    ids = {t.job_id: t.id for t in Ticket.query.all()}
+    truck_ids = [t.id for t in Truck.query.order_by(Truck.id)]
+    member = TeamMember.query.filter_by(last_name='0').first()
+    before = client.get(f'/api/job-board?date={BOARD_DATE.isoformat()}').get_json()['version']
+
+    # One bad operation rejects the whole batch
+    response = client.post('/api/job-board/batch', json={'operations': [
+        {'op': 'unassign', 'ticket_id': ids['S-1']},
+        {'op': 'assign', 'ticket_id': 99999, 'truck_id': truck_ids[0], 'scheduled_date': '2026-03-02T09:00:00'},
+        {'op': 'explode', 'ticket_id': ids['S-2']},
+    ]})
+    assert response.status_code == 400
+    assert [error['index'] for error in response.get_json()['errors']] == [1, 2]
+    assert Ticket.query.get(ids['S-1']).truck_id == truck_ids[0]
+
+    commits = []
+
+    def record_commit(session):
+        commits.append(session)
+
+    event.listen(db.session, 'after_commit', record_commit)
+    _, result = run_queries(client, '/api/job-board/batch?fields=job_id,truck_id,status', {
+        'date': BOARD_DATE.isoformat(),
+        'operations': [
+            {'op': 'assign', 'ticket_id': ids['P-4'], 'truck_id': truck_ids[1], 'scheduled_date': '2026-03-02T09:00:00',
+             'route_position': 0},
+            {'op': 'reorder', 'ticket_id': ids['P-4'], 'route_position': 1},
+            {'op': 'unassign', 'ticket_id': ids['S-1']},
+            {'op': 'move', 'ticket_id': ids['P-5'], 'new_status': 'assigned', 'new_position': 0},
+            {'op': 'set_team', 'truck_id': truck_ids[1], 'assignment_date': BOARD_DATE.isoformat(),
+             'team_member_id': member.id},
+        ]})
+    event.remove(db.session, 'after_commit', record_commit)
+    assert len(commits) == 1
+
+    assert result['version'] > before
+    assert {t['job_id']: t['status'] for t in result['tickets']} == {'S-1': 'pending', 'P-4': 'scheduled', 'P-5': 'assigned'}
+    assert result['team_assignments'][BOARD_DATE.isoformat()][str(truck_ids[1])]['team_member_id'] == member.id
+
+    board = client.get(f'/api/job-board?date={BOARD_DATE.isoformat()}').get_json()
+    assert [t['job_id'] for t in board['truck_schedules'][str(truck_ids[1])]] == ['S-3', 'P-4', 'S-4']
+    assert board['version'] == result['version']
+
+
+def test_keyset_pagination(client):
+    add_board(trucks=2, tickets_per_truck=5, pending=7)
+    same_time = datetime(2026, 1, 1, 8)
+    for ticket in Ticket.query.filter(Ticket.job_id.in_(['S-2', 'S-3', 'S-4'])):
+        ticket.created_at = same_time  # ties are broken by id
+    db.session.commit()
+    expected = [t.job_id for t in Ticket.query.order_by(Ticket.created_at.desc(), Ticket.id.desc())]
+
+    def walk(url):
+        seen, cursor = [], None
+        while True:
+            page = client.get(url + (f'&cursor={cursor}' if cursor else '')).get_json()
+            seen.extend(page['items'])
+            cursor = page['next_cursor']
+            if not cursor:
+                return seen
+
+    tickets = walk('/api/tickets?sort=newest&limit=4&fields=job_id')
+    assert [t['job_id'] for t in tickets] == expected
+
+    # A ticket created mid-walk doesn't shift later pages
+    first = client.get('/api/tickets?sort=oldest&limit=10&fields=job_id').get_json()
+    db.session.add(Ticket(job_id='LATE', status='pending', created_at=datetime(2020, 1, 1)))
+    db.session.commit()
+    rest = walk(f"/api/tickets?sort=oldest&limit=10&fields=job_id&cursor={first['next_cursor']}")
+    assert len(first['items']) + len(rest) == len(expected)
+
+    assert client.get('/api/tickets?sort=newest&cursor=garbage').status_code == 400
+    assert client.get(f"/api/tickets?sort=job_id&cursor={first['next_cursor']}").status_code == 400
+
+    # Customers come with their systems and latest ticket from per-page queries
+    customer = Customer.query.filter_by(last_name='1').first()
+    db.session.add(SepticSystem(customer_id=customer.id, system_type='conventional', tank_size=1000))
+    db.session.commit()
+    statements, page = run_queries(client, '/api/customers?limit=5&include=septic_systems,latest_ticket')
+    assert [c['last_name'] for c in page['items']] == sorted(c.last_name for c in Customer.query)[:5]
+    assert page['items'][0]['septic_systems'][0]['tank_size'] == 1000
+    assert page['items'][0]['latest_ticket_at']
+    assert len(statements) == 4
+
+    # Lists that were plain arrays stay that way unless a page is asked for
+    systems = client.get(f'/api/septic-systems?customer_id={customer.id}').get_json()
+    assert [s['customer_id'] for s in systems] == [customer.id]
+    systems = client.get(f'/api/septic-systems?customer_id={customer.id}&limit=10').get_json()
+    assert [s['customer_id'] for s in systems['items']] == [customer.id] and systems['next_cursor'] is None
+    assert isinstance(client.get('/api/trucks').get_json(), list)
+    assert client.get('/api/trucks?limit=1').get_json()['next_cursor']
+
+
+def test_forms_render_only_the_selected_customer(client):
+    add_board(trucks=1, tickets_per_truck=3, pending=0)
+    ticket = Ticket.query.filter_by(job_id='S-1').first()
+    other = Customer.query.filter_by(last_name='2').first()
+    db.session.add_all([SepticSystem(customer_id=ticket.customer_id, system_type='aerobic', tank_size=1500),
+                        SepticSystem(customer_id=other.id, system_type='mound', tank_size=900)])
+    db.session.commit()
+
+    page = client.get(f'/ticket/{ticket.id}/edit').get_data(as_text=True)
+    assert 'Cust 1' in page and 'Cust 2' not in page
+    assert 'aerobic' in page and 'mound' not in page
+
+    page = client.get(f'/septic-system/create?customer_id={other.id}').get_data(as_text=True)
+    assert 'Cust 2' in page and 'Cust 1' not in page
+    assert 'Cust 3' not in client.get('/ticket/create').get_data(as_text=True)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Test the background job queue: enqueueing, retries, idempotency and retention
+"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import db
+import jobs
+from models import Job, Ticket
+from test_job_board import add_board, client  # noqa: F401 (client is a fixture)
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ENQUEUE = '''
+import sys
+from app import app, db
+with app.app_context():
+    db.create_all()
+response = app.test_client().post('/api/admin/update-all-dates', headers={'Idempotency-Key': sys.argv[1]})
+print(response.get_json()['job_id'])
+'''
+
+
+def test_heavy_endpoints_run_as_jobs(client, monkeypatch):
+    add_board(trucks=1, tickets_per_truck=2, pending=2)
+
+    response = client.post('/api/admin/update-all-dates')
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+    assert response.headers['Location'] == f'/api/jobs/{job_id}'
+    assert client.get(f'/api/jobs/{job_id}').get_json()['status'] == 'queued'
+
+    # The same request while the job is queued is the same job; an explicit key is honoured
+    assert client.post('/api/admin/update-all-dates').get_json()['job_id'] == job_id
+    keyed = client.post('/api/admin/update-all-dates', headers={'Idempotency-Key': 'dates-1'}).get_json()['job_id']
+    assert keyed != job_id
+
+    assert jobs.run_pending('test-worker') == 2
+    job = client.get(f'/api/jobs/{job_id}').get_json()
+    assert job['status'] == 'succeeded' and job['attempts'] == 1
+    assert job['result']['success'] and job['result']['today_count'] == 2
+    assert Ticket.query.filter(Ticket.scheduled_date.is_(None)).count() == 0
+
+    # Finished: the derived key no longer dedupes, the client's key still does
+    assert client.post('/api/admin/update-all-dates').get_json()['job_id'] not in (job_id, keyed)
+    assert client.post('/api/admin/update-all-dates', headers={'Idempotency-Key': 'dates-1'}).get_json()['job_id'] == keyed
+
+    # 4xx from the view fails at once; other errors are retried with backoff
+    missing = client.post('/api/multi-stop-route/999/2026-03-02', json={}).get_json()['job_id']
+    attempts = []
+
+    @jobs.task('flaky', max_attempts=2)
+    def flaky(payload):
+        attempts.append(payload['n'])
+        raise RuntimeError('provider down')
+
+    flaky_id = jobs.enqueue('flaky', {'n': 1}).id
+    jobs.run_pending('test-worker')
+    assert client.get(f'/api/jobs/{missing}').get_json()['error'] == 'ValueError: Truck not found'
+    assert client.get(f'/api/jobs/{missing}').get_json()['status'] == 'failed'
+    job = client.get(f'/api/jobs/{flaky_id}').get_json()
+    assert job['status'] == 'queued' and job['attempts'] == 1 and 'provider down' in job['error']
+
+    monkeypatch.setattr(jobs, 'retry_delay', lambda attempts: 0)
+    Job.query.filter_by(id=flaky_id).update({'run_after': datetime.utcnow()})
+    db.session.commit()
+    jobs.run_pending('test-worker')
+    assert client.get(f'/api/jobs/{flaky_id}').get_json()['status'] == 'failed'
+    assert attempts == [1, 1]
+    assert client.get('/api/jobs/12345').status_code == 404
+
+
+def test_finished_jobs_are_pruned_after_retention(client):
+    @jobs.task('noop')
+    def noop(payload):
+        return {'ok': True}
+
+    old, recent, waiting = (jobs.enqueue('noop', {'n': n}).id for n in range(3))
+    for job_id in (old, recent):
+        jobs.run_job(jobs.claim_next('test-worker'), 'test-worker')
+    Job.query.filter_by(id=old).update({'finished_at': datetime.utcnow() - timedelta(hours=jobs.JOB_RETENTION_HOURS + 1)})
+    Job.query.filter_by(id=waiting).update({'created_at': datetime.utcnow() - timedelta(days=365)})
+    db.session.commit()
+
+    assert jobs.prune_jobs() == 1
+    assert sorted(job.id for job in Job.query) == [recent, waiting]
+    assert client.get(f'/api/jobs/{old}').status_code == 404
+
+
+def test_worker_cli_runs_queued_jobs(tmp_path):
+    database = tmp_path / 'jobs.db'
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{database}', JOBS_INLINE='0')
+
+    def run(*args):
+        return subprocess.run([sys.executable, *args], cwd=REPO_DIR, env=env,
+                              capture_output=True, text=True, timeout=120, check=True).stdout
+
+    def enqueue(key):
+        return int(run('-c', ENQUEUE, key).split()[-1])
+
+    def job_row(job_id):
+        with sqlite3.connect(database) as conn:
+            return conn.execute('SELECT status, error FROM job WHERE id = ?', (job_id,)).fetchone()
+
+    # As the Procfile and run_dev.sh start it: `python jobs.py` is loaded as __main__
+    first = enqueue('once')
+    run('jobs.py', '--once')
+    assert job_row(first) == ('succeeded', None)
+
+    # Spawned worker processes import the module afresh
+    second = enqueue('processes')
+    run('jobs.py', '--once', '--processes', '2')
+    assert job_row(second) == ('succeeded', None)
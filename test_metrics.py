@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Test request metrics and the health endpoint
+"""
+
+import os
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import metrics
+from test_job_board import BOARD_DATE, add_board, client, run_queries  # noqa: F401 (client is a fixture)
+
+
+def test_metrics_and_health(client):
+    metrics.reset()
+    add_board(trucks=1, tickets_per_truck=3, pending=2)
+    client.get(f'/api/job-board?date={BOARD_DATE.isoformat()}')
+    client.get(f'/api/job-board?date={BOARD_DATE.isoformat()}')
+    client.get('/no/such/page')
+
+    assert client.get('/api/health/live').get_json()['status'] == 'alive'
+    ready = client.get('/api/health/ready').get_json()
+    assert ready['ready'] and ready['checks']['database']['ok']
+    # Probes within the cache window don't touch the database again
+    statements, health = run_queries(client, '/api/health')
+    assert health['status'] == 'healthy' and statements == []
+
+    response = client.get('/metrics')
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    text = response.get_data(as_text=True)
+    route = 'method="GET",route="/api/job-board"'
+    assert f'truetank_http_requests_total{{{route},status="200"}} 2' in text
+    assert f'truetank_http_request_duration_seconds_count{{{route}}} 2' in text
+    assert f'truetank_http_request_duration_seconds_bucket{{{route},le="+Inf"}} 2' in text
+    assert 'route="<unmatched>",status="404"' in text
+    assert 'truetank_http_requests_in_flight 1' in text  # the /metrics request itself
+    assert 'truetank_provider_circuit_state{provider="openroute"} 0' in text
+    assert 'truetank_jobs{status="queued"} 0' in text
+
+    sql_count = next(line for line in text.splitlines()
+                     if line.startswith(f'truetank_http_request_sql_statements_sum{{{route}}}'))
+    assert float(sql_count.split()[-1]) > 0
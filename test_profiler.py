@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Test the SQL profiler's statement capture and N+1 detection
+"""
+
+import os
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import app
+import profiler
+from models import Customer
+from test_job_board import BOARD_DATE, add_board, client  # noqa: F401 (client is a fixture)
+
+
+def test_sql_profiler_flags_n_plus_one(client, monkeypatch):
+    add_board(trucks=2, tickets_per_truck=4, pending=0)
+    assert client.get('/api/profiler').get_json()['settings']['enabled'] is False
+    assert client.post('/api/profiler', json={'sample_rate': 2}).status_code == 400
+    assert client.post('/api/profiler', json={'enabled': True}).get_json()['settings']['enabled'] is True
+    monkeypatch.setattr(profiler, 'SQL_PROFILER_SLOW_MS', 0)
+
+    try:
+        # A lazy load per customer, as a template looping over customer.tickets would do
+        with app.test_request_context('/customers'):
+            profiler._start_request()
+            for customer in Customer.query.all():
+                assert len(customer.tickets) == 1
+            profiler._finish_request()
+
+        client.get(f'/api/job-board?date={BOARD_DATE.isoformat()}')
+    finally:
+        profiler.configure(enabled=False)
+
+    reports = client.get('/api/profiler').get_json()['reports']
+    assert [report['path'] for report in reports] == [f'/api/job-board?date={BOARD_DATE.isoformat()}', '/customers']
+    board, customers = reports
+    assert board['n_plus_one'] == [] and board['statements'] > 0
+
+    suspect, = customers['n_plus_one']
+    assert suspect['count'] == 8 and customers['statements'] == 9
+    assert suspect['caller'].startswith('test_profiler.py:')
+    assert suspect['shape'].endswith('FROM ticket WHERE ? = ticket.customer_id')
+    assert customers['slow'] and customers['slow'][0]['plan']  # EXPLAIN QUERY PLAN on SQLite
+
+    suspects = client.get('/api/profiler?suspects=1&limit=1').get_json()['reports']
+    assert [report['id'] for report in suspects] == [board['id']]
+    client.delete('/api/profiler')
+    assert client.get('/api/profiler').get_json()['reports'] == []
+
+    assert profiler.statement_shape("SELECT * FROM t WHERE a IN (?, ?, ?) AND b = 'x''y' AND c = 42") == \
+        profiler.statement_shape("SELECT * FROM t WHERE a IN (%(a_1)s, %(a_2)s) AND b = 'z' AND c = 7")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Test stop sequence optimization
+"""
+
+from itertools import permutations
+import random
+
+import route_optimization
+
+
+def random_matrix(size, seed):
+    """Asymmetric duration matrix from random points plus noise"""
+    rng = random.Random(seed)
+    points = [(rng.uniform(0, 60), rng.uniform(0, 60)) for _ in range(size)]
+    return [
+        [0 if i == j else abs(a[0] - b[0]) + abs(a[1] - b[1]) + rng.uniform(0, 3)
+         for j, b in enumerate(points)]
+        for i, a in enumerate(points)
+    ]
+
+
+def test_matches_brute_force_on_small_routes():
+    """Local search finds the optimal order for small routes"""
+    for seed in range(5):
+        durations = random_matrix(8, seed)
+        stops = list(range(1, 8))
+        result = route_optimization.optimize_sequence(durations, 0, 0, stops)
+        best = min(
+            route_optimization.path_cost(durations, [0] + list(order) + [0])
+            for order in permutations(stops)
+        )
+        assert sorted(result['order']) == stops
+        assert result['cost'] <= round(best, 1) * 1.02
+
+
+def test_never_worse_than_current_order():
+    durations = random_matrix(13, 42)
+    stops = list(range(1, 13))
+    result = route_optimization.optimize_sequence(durations, 0, 0, stops)
+    assert result['cost'] <= result['initial_cost']
+    assert result['minutes_saved'] >= 0
+
+
+def test_fixed_stops_keep_their_position():
+    durations = random_matrix(10, 7)
+    stops = [3, 1, 8, 5, 2, 9, 4, 6, 7]
+    result = route_optimization.optimize_sequence(durations, 0, 0, stops, fixed=[5])
+    order = result['order']
+    assert order.index(5) == stops.index(5)
+    # Stops stay on the same side of the fixed stop
+    assert set(order[:3]) == {3, 1, 8}
+    assert set(order[4:]) == {2, 9, 4, 6, 7}
+
+
+def test_unroutable_legs_are_avoided():
+    durations = random_matrix(5, 3)
+    durations[0][1] = None
+    result = route_optimization.optimize_sequence(durations, 0, 0, [1, 2, 3, 4])
+    assert result['order'][0] != 1
+
+
+if __name__ == '__main__':
+    test_matches_brute_force_on_small_routes()
+    test_never_worse_than_current_order()
+    test_fixed_stops_keep_their_position()
+    test_unroutable_legs_are_avoided()
+    print('All route optimization tests passed')
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Test coordinate snapping, the route leg cache and blocked matrix requests
+"""
+
+import os
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import pytest
+
+from app import app, db
+import routing
+from models import RouteLegCache
+
+
+class FakeProvider(routing.RoutingProvider):
+    """Counts calls; a leg takes one minute per 0.01 degrees of latitude"""
+    name = 'fake'
+
+    def __init__(self):
+        self.directions_calls = []
+        self.matrix_calls = []
+
+    def directions(self, origin, destination, profile=routing.DEFAULT_PROFILE):
+        self.directions_calls.append((origin, destination))
+        return {'duration_seconds': abs(destination[0] - origin[0]) * 6000, 'distance_meters': 1500.0,
+                'geometry': 'encoded'}
+
+    def matrix(self, sources, destinations, profile=routing.DEFAULT_PROFILE):
+        self.matrix_calls.append((len(sources), len(destinations)))
+        return {
+            'durations': [[abs(d[0] - s[0]) * 6000 for d in destinations] for s in sources],
+            'distances': [[1500.0 for d in destinations] for s in sources]
+        }
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    if app.config['SQLALCHEMY_DATABASE_URI'] != 'sqlite://':
+        pytest.skip('needs the in-memory test database')
+    fake = FakeProvider()
+    routing.set_provider(fake)
+    monkeypatch.setattr(routing.singleflight, 'SINGLE_FLIGHT_SHARED', False)
+    routing._memory_cache.clear()
+    with app.app_context():
+        db.create_all()
+        yield fake
+        db.session.remove()
+        db.drop_all()
+    routing._memory_cache.clear()
+    routing.set_provider(None)
+
+
+def point(latitude, longitude):
+    return {'latitude': latitude, 'longitude': longitude}
+
+
+def test_snapping_shares_keys_within_the_grid():
+    assert routing.snap_coordinate(38.123449, -85.700049) == (38.1234, -85.7)
+    same = routing.leg_key(point(38.12341, -85.70001), point(38.2, -85.8))
+    assert same == routing.leg_key(point(38.12344, -85.70004), point(38.2, -85.8))
+    assert same == 'driving-car:38.1234,-85.7000:38.2000,-85.8000'
+    assert same != routing.leg_key(point(38.2, -85.8), point(38.12341, -85.70001))
+    assert same != routing.leg_key(point(38.12341, -85.70001), point(38.2, -85.8), 'driving-hgv')
+
+
+def test_get_leg_is_cached_in_memory_and_in_the_database(provider):
+    leg = routing.get_leg(point(38.10001, -85.7), point(38.2, -85.7))
+    assert leg == {'duration_minutes': 10.0, 'distance_km': 1.5, 'geometry': 'encoded'}
+    assert provider.directions_calls == [((38.1, -85.7), (38.2, -85.7))]
+
+    assert routing.get_leg(point(38.10003, -85.7), point(38.2, -85.7)) == leg
+    routing._memory_cache.clear()
+    assert routing.get_leg(point(38.1, -85.7), point(38.2, -85.7)) == leg
+    assert len(provider.directions_calls) == 1
+    assert RouteLegCache.query.count() == 1
+
+
+def test_summary_only_legs_are_refetched_for_geometry(provider):
+    routing.store_leg(point(38.1, -85.7), point(38.3, -85.7), 1200, 3000)
+    assert routing.get_leg(point(38.1, -85.7), point(38.3, -85.7), need_geometry=False) == \
+        {'duration_minutes': 20.0, 'distance_km': 3.0, 'geometry': None}
+    assert provider.directions_calls == []
+
+    assert routing.get_leg(point(38.1, -85.7), point(38.3, -85.7))['geometry'] == 'encoded'
+    assert len(provider.directions_calls) == 1
+
+    # A leg with geometry is not replaced by a later summary
+    routing.store_leg(point(38.1, -85.7), point(38.3, -85.7), 1500, 3000)
+    routing._memory_cache.clear()
+    assert routing.get_leg(point(38.1, -85.7), point(38.3, -85.7))['duration_minutes'] == 20.0
+    assert len(provider.directions_calls) == 1
+
+
+def test_matrix_is_requested_in_blocks_and_cached(provider):
+    points = [point(38 + i / 100, -85.7) for i in range(30)]
+    matrix = routing.get_matrix(points)
+    assert sorted(provider.matrix_calls) == [(5, 5), (5, 25), (25, 5), (25, 25)]
+    assert matrix['durations'][0][29] == 29.0 and matrix['durations'][29][0] == 29.0
+    assert matrix['durations'][7][7] == 0.0
+    assert RouteLegCache.query.count() == 30 * 29
+
+    # A cached leg is reused, and only blocks with missing legs are requested again
+    routing._memory_cache.clear()
+    provider.matrix_calls.clear()
+    assert routing.get_matrix(points) == matrix
+    assert provider.matrix_calls == []
+    assert routing.get_matrix(points + [point(39, -85.7)])['durations'][30][0] == 100.0
+    assert sorted(provider.matrix_calls) == [(6, 6), (6, 25), (25, 6)]
+
+
+def test_stored_coordinates_skip_geocoding(provider, monkeypatch):
+    looked_up = []
+    monkeypatch.setattr(routing.geocoding, 'geocode', lambda address: looked_up.append(address) or point(38.5, -85.7))
+    known = {'1 Yard Rd, Louisville, KY, 40000': point(38.1, -85.7)}
+    matrix = routing.matrix_for_addresses(['1 Yard Rd, Louisville, KY, 40000', '9 Elm St, Louisville, KY'],
+                                          known=known)
+    assert looked_up == ['9 Elm St, Louisville, KY']
+    assert matrix['coords'][0] == point(38.1, -85.7)
+    assert matrix['durations'][0][1] == 40.0
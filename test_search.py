@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test the full-text search index: incremental maintenance, rebuilds and queries
+"""
+
+import os
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import pytest
+from sqlalchemy import inspect, text
+
+from app import app, db
+import jobs
+import search
+from models import Customer, Job, SepticSystem, Ticket
+
+
+@pytest.fixture
+def client():
+    if app.config['SQLALCHEMY_DATABASE_URI'] != 'sqlite://':
+        pytest.skip('needs the in-memory test database')
+    with app.app_context():
+        db.create_all()
+        search.rebuild_index()  # the in-memory index outlives drop_all between tests
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def found(client, q, **params):
+    query = '&'.join(f'{key}={value}' for key, value in params.items())
+    data = client.get(f'/api/search?q={q}&{query}').get_json()
+    return [(result['type'], result['id']) for result in data['results']]
+
+
+def test_search_index_follows_writes(client):
+    customer = Customer(first_name='Johanna', last_name='Smithers', company_name='Acme Farms',
+                        phone_primary='(502) 555-4567', email='jsmithers@example.com', city='Louisville', state='KY')
+    db.session.add(customer)
+    db.session.flush()
+    system = SepticSystem(customer_id=customer.id, permit_number='PRM-2291', system_type='aerobic')
+    ticket = Ticket(job_id='JOB-7781', customer_id=customer.id, issues_found='Cracked baffle on outlet')
+    db.session.add_all([system, ticket])
+    db.session.commit()
+
+    def found(q, **params):
+        return globals()['found'](client, q, **params)
+
+    assert found('smi joh') == [('customer', customer.id)]
+    assert found('5554567') == found('4567') == found('example') == [('customer', customer.id)]
+    assert found('baffle') == [('ticket', ticket.id)]
+    assert found('job7781') == found('JOB-77') == [('ticket', ticket.id)]
+    assert found('prm-229') == [('septic_system', system.id)]
+    assert found('acme', types='ticket') == []
+    assert client.get('/api/search?q=acme&types=truck').status_code == 400
+
+    # Edits re-index, rollbacks don't, deletes remove
+    customer.last_name = 'Baker'
+    ticket.issues_found = None
+    db.session.commit()
+    assert found('smithers') == [] and found('baker') == [('customer', customer.id)]
+    assert found('baffle') == []
+    customer.last_name = 'Walker'
+    db.session.flush()
+    db.session.rollback()
+    assert found('walker') == []
+    db.session.delete(ticket)
+    db.session.delete(system)
+    db.session.commit()
+    assert found('7781') == found('prm') == []
+
+
+def test_rebuild_swaps_in_a_shadow_table_caught_up_with_writes_during_the_build(client, monkeypatch):
+    kept = Customer(first_name='Ada', last_name='Quimby', city='Louisville', state='KY')
+    doomed = Customer(first_name='Bo', last_name='Quartz', city='Louisville', state='KY')
+    db.session.add_all([kept, doomed])
+    db.session.commit()
+    table = Customer.__table__
+    fill = search._fill
+
+    def fill_then_write(connection, shadow):
+        written = fill(connection, shadow)
+        # Another writer's changes land after the shadow read the customers
+        connection.execute(table.update().where(table.c.id == kept.id).values(
+            last_name='Quill', updated_at=datetime.utcnow()))
+        connection.execute(table.delete().where(table.c.id == doomed.id))
+        return written
+
+    monkeypatch.setattr(search, '_fill', fill_then_write)
+    assert search.rebuild_index() == 2
+    db.session.expire_all()
+
+    assert found(client, 'quill') == [('customer', kept.id)]
+    assert found(client, 'quimby') == [] and found(client, 'quartz') == []
+    assert not inspect(db.engine).has_table(search.SQLITE_TABLE + search.SHADOW_SUFFIX)
+
+
+def test_missing_index_is_built_by_a_job_not_the_search(client, monkeypatch):
+    customer = Customer(first_name='Cyd', last_name='Ormsby', city='Louisville', state='KY')
+    db.session.add(customer)
+    db.session.commit()
+    customer_id = customer.id
+    with db.engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE {search.SQLITE_TABLE}"))
+    monkeypatch.setitem(search._known_indexes, db.engine, False)
+    monkeypatch.setitem(search._build_requested, db.engine, False)
+
+    # Answered from the source tables meanwhile, with one build queued
+    assert found(client, 'ormsby') == found(client, 'orms') == [('customer', customer_id)]
+    assert not inspect(db.engine).has_table(search.SQLITE_TABLE)
+    assert [job.kind for job in Job.query] == ['search_index']
+
+    assert jobs.run_pending('test-worker') == 1
+    assert inspect(db.engine).has_table(search.SQLITE_TABLE)
+    assert found(client, 'ormsby') == [('customer', customer_id)]
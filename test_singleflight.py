@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Test single-flight coalescing of concurrent identical calls
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import db
+import singleflight
+from models import SingleFlight
+from test_job_board import client  # noqa: F401 (client is a fixture)
+
+
+def test_single_flight_coalesces_calls(client, monkeypatch):
+    calls = []
+
+    def slow_lookup():
+        calls.append(1)
+        time.sleep(0.2)
+        return {'latitude': 38.2, 'longitude': -85.7}
+
+    # Threads in one worker share the leader's call
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(singleflight.do('test', 'a', slow_lookup, shared=False)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [{'latitude': 38.2, 'longitude': -85.7}] * 5
+
+    # Another worker holds the lease: wait for it and read its published result
+    key = singleflight.flight_key('test', 'b')
+    db.session.add(SingleFlight(key=key, owner='other', status='running',
+                                expires_at=datetime.utcnow() + timedelta(seconds=30)))
+    db.session.commit()
+
+    def other_worker_finishes(seconds):
+        lease = db.session.get(SingleFlight, key)
+        lease.status, lease.result = 'done', '{"latitude": 1.5, "longitude": 2.5}'
+        db.session.commit()
+    monkeypatch.setattr(singleflight.time, 'sleep', other_worker_finishes)
+    assert singleflight.do('test', 'b', slow_lookup, shared=True) == {'latitude': 1.5, 'longitude': 2.5}
+    assert len(calls) == 1
+
+    # A dead worker's expired lease is taken over; the result is published for others
+    key = singleflight.flight_key('test', 'c')
+    db.session.add(SingleFlight(key=key, owner='dead', status='running',
+                                expires_at=datetime.utcnow() - timedelta(seconds=1)))
+    db.session.commit()
+    assert singleflight.do('test', 'c', slow_lookup, shared=True)['latitude'] == 38.2
+    assert len(calls) == 2
+    db.session.expire_all()
+    lease = db.session.get(SingleFlight, key)
+    assert lease.status == 'done' and lease.owner != 'dead'
+
+    stats = singleflight.get_single_flight_stats()
+    assert stats['local_waiters'] >= 4 and stats['shared_waiters'] >= 1 and stats['takeovers'] >= 1
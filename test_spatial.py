@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Test the in-memory spatial index
+"""
+
+import os
+import random
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import pytest
+
+from app import app, db
+import spatial
+from models import Customer
+
+
+def build_index(count=5000, seed=0):
+    rng = random.Random(seed)
+    index = spatial.GridIndex()
+    points = {}
+    for key in range(count):
+        lat, lng = 38 + rng.random(), -86 + rng.random()
+        points[key] = (lat, lng)
+        index.upsert(key, lat, lng, {'even': key % 2 == 0})
+    return index, points
+
+
+def brute_force(points, lat, lng, k):
+    distances = sorted((spatial.haversine_miles(lat, lng, a, b), key) for key, (a, b) in points.items())
+    return [key for _, key in distances[:k]]
+
+
+def test_nearest_matches_brute_force():
+    index, points = build_index()
+    rng = random.Random(1)
+    for _ in range(20):
+        lat, lng = 38 + rng.random(), -86 + rng.random()
+        assert [item['id'] for item in index.nearest(lat, lng, 5)] == brute_force(points, lat, lng, 5)
+
+
+def test_filters_radius_and_bbox():
+    index, points = build_index()
+    evens = index.nearest(38.5, -85.5, 3, where=lambda payload: payload['even'])
+    assert all(item['id'] % 2 == 0 for item in evens)
+
+    within = index.within_radius(38.5, -85.5, 2.0)
+    expected = {key for key, (a, b) in points.items() if spatial.haversine_miles(38.5, -85.5, a, b) <= 2.0}
+    assert {item['id'] for item in within} == expected
+
+    boxed = index.within_bbox(38.2, -85.8, 38.3, -85.7)
+    expected = {key for key, (a, b) in points.items() if 38.2 <= a <= 38.3 and -85.8 <= b <= -85.7}
+    assert {item['id'] for item in boxed} == expected
+
+
+def test_incremental_updates():
+    index, _ = build_index(count=500)
+    index.upsert('new', 38.123, -85.456)
+    assert index.nearest(38.123, -85.456, 1)[0]['id'] == 'new'
+    index.upsert('new', 10.0, 10.0)
+    assert index.nearest(38.123, -85.456, 1)[0]['id'] != 'new'
+    index.remove('new')
+    assert len(index) == 500
+
+
+def test_parse_gps_coordinates():
+    assert spatial.parse_gps_coordinates('38.25,-85.75') == (38.25, -85.75)
+    assert spatial.parse_gps_coordinates(' 38.25 , -85.75 ') == (38.25, -85.75)
+    assert spatial.parse_gps_coordinates('not,coords') is None
+    assert spatial.parse_gps_coordinates('138.25,-85.75') is None
+    assert spatial.parse_gps_coordinates(None) is None
+
+
+def test_index_reloads_after_writes_from_other_processes(monkeypatch):
+    if app.config['SQLALCHEMY_DATABASE_URI'] != 'sqlite://':
+        pytest.skip('needs the in-memory test database')
+    monkeypatch.setattr(spatial, 'SPATIAL_INDEX_CHECK_SECONDS', 0)
+    with app.app_context():
+        db.create_all()
+        spatial.reset_indexes()
+        try:
+            customer = Customer(first_name='Ann', last_name='Lee', latitude=38.2, longitude=-85.7)
+            db.session.add(customer)
+            db.session.commit()
+            assert spatial.nearest('customer', 38.2, -85.7)[0]['id'] == customer.id
+
+            # Another worker moves the customer (a Core update, so no session events here)
+            table = Customer.__table__
+            db.session.execute(table.update().where(table.c.id == customer.id).values(latitude=40.0, longitude=-80.0))
+            db.session.commit()
+            assert spatial.nearest('customer', 40.0, -80.0)[0]['distance_miles'] == 0
+
+            # Raw SQL that leaves updated_at alone is picked up by the periodic reload
+            db.session.execute(db.text('UPDATE customer SET latitude = 41.0 WHERE id = :id'), {'id': customer.id})
+            db.session.commit()
+            assert spatial.nearest('customer', 41.0, -80.0)[0]['distance_miles'] > 0
+            monkeypatch.setattr(spatial, 'SPATIAL_INDEX_MAX_AGE_SECONDS', 0)
+            assert spatial.nearest('customer', 41.0, -80.0)[0]['distance_miles'] == 0
+        finally:
+            spatial.reset_indexes()
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    test_nearest_matches_brute_force()
+    test_filters_radius_and_bbox()
+    test_incremental_updates()
+    test_parse_gps_coordinates()
+    print('All spatial index tests passed')
@@ -6,7 +6,7 @@ Test the tank tracking system functionality
 from app import app, db
 from models import Truck, Ticket, DumpSite
 import tank_tracking
-from datetime import datetime
+from datetime import datetime, date
 
 def test_tank_tracking():
     """Test tank tracking system"""
@@ -34,7 +34,7 @@ def test_tank_tracking():
             today = datetime.now().date()
             tickets = Ticket.query.filter(
                 Ticket.truck_id == truck.id,
-                db.func.date(Ticket.scheduled_date) == today
+                Ticket.scheduled_on(today)
             ).order_by(Ticket.route_position).all()
             
             print()
@@ -88,5 +88,62 @@ def test_tank_tracking():
         print()
         print(f'🎯 Tank Tracking System Test Completed!')
 
+def line_matrix(positions):
+    """Drive minutes between points on a line"""
+    return [[abs(a - b) for b in positions] for a in positions]
+
+def test_dump_plan_weighs_detour_against_disposal_cost():
+    """A nearby pricier site beats a cheap one that costs a long detour"""
+    truck = {'tank_capacity': 3000, 'tank_full_threshold': 0.85, 'current_tank_level': 0}
+    tickets = [{'id': i, 'job_id': f'J{i}', 'estimated_gallons': 700, 'estimated_duration': 45} for i in range(6)]
+    dump_sites = [
+        {'id': 1, 'name': 'Far', 'full_address': 'far', 'cost_per_gallon': 0.05},
+        {'id': 2, 'name': 'Near', 'full_address': 'near', 'cost_per_gallon': 0.10},
+    ]
+    # [storage, jobs..., storage, dump sites...]
+    durations = line_matrix([0, 10, 20, 30, 40, 50, 60, 0, 100, 35])
+    
+    plan = tank_tracking.plan_dump_stops(truck, tickets, dump_sites, durations, 480, date(2026, 10, 19))
+    assert [(d['before_job'], d['site_index']) for d in plan['dumps']] == [(3, 1)]
+    
+    # Closed on arrival: the planner has to pay for the far site instead
+    dump_sites[1]['operating_hours'] = '7:00 AM - 10:00 AM, Mon-Fri'
+    plan = tank_tracking.plan_dump_stops(truck, tickets, dump_sites, durations, 480, date(2026, 10, 19))
+    assert [d['site_index'] for d in plan['dumps']] == [0]
+
+def test_dump_plan_respects_capacity_and_waste_type():
+    truck = {'tank_capacity': 3000, 'tank_full_threshold': 0.85, 'current_tank_level': 0}
+    tickets = [{'id': i, 'job_id': f'J{i}', 'estimated_gallons': 500, 'estimated_duration': 30} for i in range(6)]
+    tickets[1]['service_type'] = 'Grease Trap Service'
+    dump_sites = [
+        {'id': 1, 'name': 'Septic only', 'full_address': 'a', 'cost_per_gallon': 0.05, 'max_capacity_per_visit': 1200},
+        {'id': 2, 'name': 'Grease', 'full_address': 'b', 'cost_per_gallon': 0.20, 'accepts_grease_waste': True},
+    ]
+    durations = line_matrix([0, 10, 20, 30, 40, 50, 60, 0, 25, 25])
+    
+    plan = tank_tracking.plan_dump_stops(truck, tickets, dump_sites, durations)
+    for dump in plan['dumps']:
+        site = dump_sites[dump['site_index']]
+        assert dump['gallons'] <= 2550
+        if site.get('max_capacity_per_visit'):
+            assert dump['gallons'] <= site['max_capacity_per_visit']
+    # Whichever load carries the grease job goes to the grease site
+    grease_dump = next(d for d in plan['dumps'] if d['before_job'] > 1)
+    assert grease_dump['site_index'] == 1
+
+def test_parse_operating_hours():
+    hours = tank_tracking.parse_operating_hours('6:00 AM - 6:00 PM, Mon-Fri')
+    assert hours == {'open': 360, 'close': 1080, 'days': {0, 1, 2, 3, 4}}
+    assert tank_tracking.parse_operating_hours('24/7') is None
+    assert not tank_tracking.is_dump_site_open({'operating_hours': '6:00 AM - 6:00 PM, Mon-Fri'}, 600, date(2026, 10, 18))
+    assert tank_tracking.parse_operating_hours('7am-5pm, closed Sun')['days'] == {0, 1, 2, 3, 4, 5}
+    assert tank_tracking.parse_operating_hours('Mon-Sat 7am-3pm; Sun closed')['days'] == {0, 1, 2, 3, 4, 5}
+    assert tank_tracking.parse_operating_hours('Daily 6am-6pm except Wed')['days'] == {0, 1, 3, 4, 5, 6}
+    assert tank_tracking.parse_operating_hours('Open 24 hours, closed Sunday')['days'] == {0, 1, 2, 3, 4, 5}
+    assert not tank_tracking.is_dump_site_open({'operating_hours': '7am-5pm, closed Sun'}, 600, date(2026, 10, 18))
+
 if __name__ == '__main__':
-    test_tank_tracking()
\ No newline at end of file
+    test_tank_tracking()
+    test_dump_plan_weighs_detour_against_disposal_cost()
+    test_dump_plan_respects_capacity_and_waste_type()
+    test_parse_operating_hours()
\ No newline at end of file
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Test the materialized ticket counters: in-transaction deltas, bulk writes and reconciliation
+"""
+
+import os
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import db
+import ticket_counters
+from models import Ticket, Truck
+from test_job_board import BOARD_DATE, add_board, client, run_queries  # noqa: F401 (client is a fixture)
+
+
+def test_ticket_counters_follow_writes(client, monkeypatch):
+    monkeypatch.setattr(ticket_counters, '_last_reconcile', None)
+    monkeypatch.setattr(ticket_counters, 'COUNTER_RECONCILE_INTERVAL', 3600)
+    add_board(trucks=2, tickets_per_truck=3, pending=4)
+
+    def stored():
+        return {(c.dimension, c.key): c.count for c in ticket_counters.TicketCounter.query if c.count}
+
+    def actual():
+        with db.engine.connect() as conn:
+            return dict(ticket_counters.actual_counts(conn))
+
+    assert stored() == actual()
+    assert stored()[('status', 'pending')] == 10 and stored()[('date', '2026-03-02')] == 6
+
+    ids = {t.job_id: t.id for t in Ticket.query}
+    truck_id = Truck.query.first().id
+    ticket = db.session.get(Ticket, ids['P-6'])
+    ticket.truck_id, ticket.scheduled_date, ticket.status = truck_id, datetime(2026, 3, 2, 13), 'scheduled'
+    ticket.priority = 'high'
+    db.session.delete(db.session.get(Ticket, ids['S-1']))
+    db.session.commit()
+    assert stored() == actual()
+
+    ticket.status = 'completed'
+    db.session.flush()
+    db.session.rollback()
+    assert stored() == actual()
+
+    # Bulk writes to counted columns are recounted in their own transaction
+    Ticket.query.filter(Ticket.status == 'pending').update({'priority': 'emergency'})
+    db.session.commit()
+    assert stored() == actual() and stored()[('pending_priority', 'emergency')] == 8
+
+    # ... but bulk position shifts leave the counters alone
+    Ticket.query.filter(Ticket.id > ids['S-2']).update({Ticket.column_position: Ticket.column_position + 1})
+    assert 'ticket_counters_stale' not in db.session.info
+    db.session.commit()
+
+    # Writes that bypass the ORM drift until reconciliation
+    with db.engine.begin() as conn:
+        conn.execute(Ticket.__table__.delete().where(Ticket.__table__.c.job_id == 'P-7'))
+    assert stored() != actual()
+    statements, data = run_queries(client, f'/api/stats?date={BOARD_DATE.isoformat()}')
+    assert stored() == actual() and data['by_status']['pending'] == 7
+    assert data['trucks'][str(truck_id)] == 3 and data['by_date'] == {'2026-03-02': 6}
+
+    statements, data = run_queries(client, f'/api/stats?date={BOARD_DATE.isoformat()}')
+    assert not any('FROM ticket ' in statement or 'FROM ticket\n' in statement for statement in statements)
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Materialized Ticket Counters for TrueTank
+
+This module handles:
+- Ticket counts per status, per scheduled date, per truck per date and
+  pending backlog per priority, stored in the ticket_counter table
+- Keeping them current from the ORM flush that writes a ticket, in the
+  same transaction, as +1/-1 upserts, so counts commit and roll back with
+  the tickets they count
+- Recounting inside the transaction when a bulk UPDATE/DELETE touches
+  counted columns (those don't say which rows they changed)
+- Periodic reconciliation against the tickets table, to repair drift from
+  raw SQL writes, imports and scripts that bypass the ORM
+
+Dashboards read the counters instead of scanning tickets.
+
+Run from the command line:
+    python ticket_counters.py               # reconcile once
+    python ticket_counters.py --every 900   # reconcile every 15 minutes
+"""
+
+from typing import Dict, List, Optional, Tuple
+from collections import Counter
+from datetime import date, datetime
+import argparse
+import os
+import time
+
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import db, Ticket, TicketCounter
+
+STATUS = 'status'
+DATE = 'date'
+TRUCK_DAY = 'truck_day'
+PENDING_PRIORITY = 'pending_priority'
+
+# Ticket columns the counters depend on
+COUNTED_FIELDS = ('status', 'scheduled_date', 'truck_id', 'priority')
+
+COUNTER_RECONCILE_INTERVAL = int(os.environ.get('COUNTER_RECONCILE_INTERVAL', 900))
+
+_last_reconcile = None
+
+
+def _day_key(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)[:10]  # SQLite's date() returns text
+
+
+def truck_day_key(day: str, truck_id) -> str:
+    return f"{day}/{truck_id}"
+
+
+def ticket_keys(status, scheduled_date, truck_id, priority) -> List[Tuple[str, str]]:
+    """Counters one ticket contributes to"""
+    keys = [(STATUS, status)]
+    day = _day_key(scheduled_date)
+    if day:
+        keys.append((DATE, day))
+        if truck_id is not None:
+            keys.append((TRUCK_DAY, truck_day_key(day, truck_id)))
+    if status == 'pending':
+        keys.append((PENDING_PRIORITY, priority or 'medium'))
+    return keys
+
+
+# Transactional maintenance
+
+def _previous(state, name):
+    """Value an attribute had before this flush"""
+    history = state.attrs[name].history
+    return history.deleted[0] if history.deleted else getattr(state.obj(), name)
+
+
+def _ticket_deltas(session) -> Counter:
+    deltas = Counter()
+    for obj in session.new:
+        if isinstance(obj, Ticket):
+            for key in ticket_keys(obj.status, obj.scheduled_date, obj.truck_id, obj.priority):
+                deltas[key] += 1
+    for obj in session.dirty:
+        if not isinstance(obj, Ticket):
+            continue
+        state = inspect(obj)
+        if not any(state.attrs[name].history.has_changes() for name in COUNTED_FIELDS):
+            continue
+        for key in ticket_keys(*[_previous(state, name) for name in COUNTED_FIELDS]):
+            deltas[key] -= 1
+        for key in ticket_keys(obj.status, obj.scheduled_date, obj.truck_id, obj.priority):
+            deltas[key] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Ticket):
+            state = inspect(obj)
+            for key in ticket_keys(*[_previous(state, name) for name in COUNTED_FIELDS]):
+                deltas[key] -= 1
+    return Counter({key: delta for key, delta in deltas.items() if delta})
+
+
+def apply_deltas(connection, deltas: Dict[Tuple[str, str], int]):
+    """
+    Add deltas to counters with one upsert
+
+    Rows are written in key order so concurrent writers lock them in the
+    same order and can't deadlock.
+    """
+    if not deltas:
+        return
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    table = TicketCounter.__table__
+    now = datetime.utcnow()
+    rows = [{'dimension': dimension, 'key': key, 'count': delta, 'updated_at': now}
+            for (dimension, key), delta in sorted(deltas.items())]
+    statement = dialect.insert(table).values(rows)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=['dimension', 'key'],
+        set_={'count': table.c.count + statement.excluded.count, 'updated_at': statement.excluded.updated_at}
+    ))
+
+
+def _count_changes(session, flush_context):
+    """after_flush: move counts for tickets written in this flush, on the flush's connection"""
+    apply_deltas(session.connection(), _ticket_deltas(session))
+
+
+def _flag_bulk_writes(orm_execute_state):
+    """do_orm_execute: bulk writes to counted columns are recounted before commit"""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ is not Ticket:
+        return
+    if orm_execute_state.is_update and not _updated_columns(orm_execute_state) & set(COUNTED_FIELDS):
+        return  # position shifts and rebalances leave every count alone
+    orm_execute_state.session.info['ticket_counters_stale'] = True
+
+
+def _updated_columns(orm_execute_state) -> set:
+    """
+    Columns a bulk UPDATE sets: its SET clause (Query.update, update().values())
+    plus the keys of per-row parameters (bulk updates by primary key)
+    """
+    names = {getattr(key, 'key', key) for key in orm_execute_state.statement._values or ()}
+    parameters = orm_execute_state.parameters
+    rows = parameters if isinstance(parameters, list) else [parameters] if parameters else []
+    for row in rows:
+        names.update(row)
+    return names
+
+
+def _recount_before_commit(session):
+    if session.info.pop('ticket_counters_stale', False):
+        recount(session.connection())
+
+
+def _forget_bulk_writes(session, *args):
+    session.info.pop('ticket_counters_stale', None)
+
+
+event.listen(Session, 'after_flush', _count_changes)
+event.listen(Session, 'do_orm_execute', _flag_bulk_writes)
+event.listen(Session, 'before_commit', _recount_before_commit)
+event.listen(Session, 'after_rollback', _forget_bulk_writes)
+
+
+# Reconciliation
+
+def actual_counts(connection) -> Counter:
+    """Counts computed from the tickets table (full scans; reconciliation only)"""
+    table = Ticket.__table__
+    day = db.func.date(table.c.scheduled_date)
+    counts = Counter()
+    for status, count in connection.execute(
+        db.select(table.c.status, db.func.count()).group_by(table.c.status)
+    ):
+        counts[(STATUS, status)] = count
+    for value, truck_id, count in connection.execute(
+        db.select(day, table.c.truck_id, db.func.count()).where(table.c.scheduled_date.isnot(None))
+        .group_by(day, table.c.truck_id)
+    ):
+        counts[(DATE, _day_key(value))] += count
+        if truck_id is not None:
+            counts[(TRUCK_DAY, truck_day_key(_day_key(value), truck_id))] = count
+    for priority, count in connection.execute(
+        db.select(table.c.priority, db.func.count()).where(table.c.status == 'pending').group_by(table.c.priority)
+    ):
+        counts[(PENDING_PRIORITY, priority or 'medium')] += count
+    return counts
+
+
+def recount(connection) -> int:
+    """
+    Make every counter match the tickets table, in the caller's transaction
+
+    Counter rows are locked before tickets are counted, so a writer that
+    commits meanwhile applies its delta after the recount, not before it.
+
+    Returns:
+        Number of counters corrected
+    """
+    table = TicketCounter.__table__
+    stored = {(row.dimension, row.key): row.count for row in connection.execute(
+        db.select(table.c.dimension, table.c.key, table.c.count).with_for_update()
+    )}
+    actual = actual_counts(connection)
+    corrections = Counter({key: actual.get(key, 0) - count
+                           for key, count in stored.items() if actual.get(key, 0) != count})
+    corrections.update({key: count for key, count in actual.items() if key not in stored})
+    corrections = Counter({key: delta for key, delta in corrections.items() if delta})
+    apply_deltas(connection, corrections)
+    return len(corrections)
+
+
+def reconcile_counters() -> int:
+    """Recount in a transaction of its own (see recount)"""
+    try:
+        with db.engine.begin() as conn:
+            return recount(conn)
+    except Exception as e:
+        print(f"Ticket counter reconcile error: {e}")
+        return 0
+
+
+def maybe_reconcile():
+    """Reconcile at most once per COUNTER_RECONCILE_INTERVAL seconds per worker"""
+    global _last_reconcile
+    now = time.monotonic()
+    if _last_reconcile is not None and now - _last_reconcile < COUNTER_RECONCILE_INTERVAL:
+        return
+    _last_reconcile = now
+    corrected = reconcile_counters()
+    if corrected:
+        print(f"Ticket counters reconciled: {corrected} corrected")
+
+
+# Reads
+
+def counts(dimension: str, start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, int]:
+    """
+    Non-zero counters of one dimension, optionally with keys in [start, end]
+
+    Keys are compared as strings: ISO dates sort correctly, and a truck_day
+    range of ('2026-03-02/', '2026-03-02/~') selects one day's trucks.
+    """
+    query = db.session.query(TicketCounter.key, TicketCounter.count).filter(
+        TicketCounter.dimension == dimension, TicketCounter.count != 0
+    )
+    if start is not None:
+        query = query.filter(TicketCounter.key >= start)
+    if end is not None:
+        query = query.filter(TicketCounter.key <= end)
+    return dict(query.order_by(TicketCounter.key).all())
+
+
+def status_counts() -> Dict[str, int]:
+    return counts(STATUS)
+
+
+def stats(day: date, start: date, end: date) -> Dict:
+    """Everything /api/stats reports, from the counters alone"""
+    by_status = status_counts()
+    prefix = f"{day.isoformat()}/"
+    trucks = counts(TRUCK_DAY, prefix, prefix + '~')
+    return {
+        'total': sum(by_status.values()),
+        'by_status': by_status,
+        'pending_by_priority': counts(PENDING_PRIORITY),
+        'by_date': counts(DATE, start.isoformat(), end.isoformat()),
+        'date': day.isoformat(),
+        'trucks': {key[len(prefix):]: count for key, count in trucks.items()},
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Reconcile materialized ticket counters with the tickets table')
+    parser.add_argument('--every', type=int, metavar='SECONDS', help='Keep reconciling at this interval')
+    args = parser.parse_args(argv)
+
+    from app import app
+    with app.app_context():
+        db.create_all()
+        while True:
+            corrected = reconcile_counters()
+            print(f"{datetime.utcnow().isoformat(timespec='seconds')} {corrected} counters corrected")
+            if not args.every:
+                return
+            time.sleep(args.every)
+
+
+if __name__ == '__main__':
+    main()
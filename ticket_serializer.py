@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Sparse-Fieldset Ticket Serialization for TrueTank
+
+This module handles:
+- Named field profiles (card, detail, export) and ?fields= lists
+- Building ticket dicts from a column projection instead of hydrated ORM objects
+- Deferring the large text columns (notes, findings, photo paths) unless asked for
+- Customer-derived fields (name, phone, address, GPS) from a single outer join
+"""
+
+from typing import Callable, Dict, List, Optional, Sequence
+
+from models import Ticket, Customer
+
+# Ticket columns in the order Ticket.to_dict() emits them
+TICKET_COLUMNS = {
+    'id': Ticket.id,
+    'job_id': Ticket.job_id,
+    'customer_id': Ticket.customer_id,
+    'septic_system_id': Ticket.septic_system_id,
+    'service_type': Ticket.service_type,
+    'service_description': Ticket.service_description,
+    'priority': Ticket.priority,
+    'status': Ticket.status,
+    'scheduled_date': Ticket.scheduled_date,
+    'requested_service_date': Ticket.requested_service_date,
+    'estimated_duration': Ticket.estimated_duration,
+    'route_position': Ticket.route_position,
+    'column_position': Ticket.column_position,
+    'assigned_technician': Ticket.assigned_technician,
+    'assigned_crew': Ticket.assigned_crew,
+    'estimated_cost': Ticket.estimated_cost,
+    'actual_cost': Ticket.actual_cost,
+    'parts_cost': Ticket.parts_cost,
+    'labor_cost': Ticket.labor_cost,
+    'disposal_cost': Ticket.disposal_cost,
+    'gallons_pumped': Ticket.gallons_pumped,
+    'estimated_gallons': Ticket.estimated_gallons,
+    'waste_type': Ticket.waste_type,
+    'disposal_location': Ticket.disposal_location,
+    'trip_ticket_number': Ticket.trip_ticket_number,
+    'tank_condition': Ticket.tank_condition,
+    'sludge_level': Ticket.sludge_level,
+    'scum_level': Ticket.scum_level,
+    'liquid_level': Ticket.liquid_level,
+    'issues_found': Ticket.issues_found,
+    'recommendations': Ticket.recommendations,
+    'follow_up_needed': Ticket.follow_up_needed,
+    'follow_up_date': Ticket.follow_up_date,
+    'work_performed': Ticket.work_performed,
+    'materials_used': Ticket.materials_used,
+    'payment_method': Ticket.payment_method,
+    'payment_status': Ticket.payment_status,
+    'invoice_number': Ticket.invoice_number,
+    'start_time': Ticket.start_time,
+    'end_time': Ticket.end_time,
+    'travel_time': Ticket.travel_time,
+    'work_time': Ticket.work_time,
+    'office_notes': Ticket.office_notes,
+    'technician_notes': Ticket.technician_notes,
+    'customer_notes': Ticket.customer_notes,
+    'internal_notes': Ticket.internal_notes,
+    'permit_required': Ticket.permit_required,
+    'permit_number': Ticket.permit_number,
+    'inspection_required': Ticket.inspection_required,
+    'inspection_passed': Ticket.inspection_passed,
+    'equipment_used': Ticket.equipment_used,
+    'truck_number': Ticket.truck_number,
+    'gps_location': Ticket.gps_location,
+    'photo_paths': Ticket.photo_paths,
+    'created_at': Ticket.created_at,
+    'updated_at': Ticket.updated_at,
+    'completed_at': Ticket.completed_at,
+    'truck_id': Ticket.truck_id,
+}
+
+# Fields computed from the ticket's customer
+CUSTOMER_FIELDS = {
+    'customer_name': (Customer.first_name, Customer.last_name),
+    'customer_phone': (Customer.phone_primary,),
+    'customer_address': (Customer.street_address, Customer.city, Customer.state),
+    'customer_gps_coordinates': (Customer.gps_coordinates,),
+}
+
+# Large free-text columns only sent when asked for by name (or the export profile)
+HEAVY_FIELDS = (
+    'issues_found', 'recommendations', 'work_performed', 'materials_used',
+    'office_notes', 'technician_notes', 'customer_notes', 'internal_notes',
+    'equipment_used', 'photo_paths',
+)
+
+# Columns a customer fallback needs to label stops without a customer (e.g. dumps)
+STOP_COLUMNS = ('job_id', 'service_type', 'disposal_location', 'service_description')
+
+EXPORT_FIELDS = tuple(TICKET_COLUMNS) + tuple(CUSTOMER_FIELDS)
+
+PROFILES = {
+    # Kanban / route cards
+    'card': (
+        'id', 'job_id', 'customer_id', 'truck_id', 'status', 'priority', 'service_type',
+        'service_description', 'scheduled_date', 'requested_service_date', 'estimated_duration',
+        'estimated_gallons', 'estimated_cost', 'route_position', 'column_position', 'waste_type',
+        'disposal_location', 'assigned_technician',
+        'customer_name', 'customer_address', 'customer_gps_coordinates',
+    ),
+    # Everything except the heavy text columns
+    'detail': tuple(name for name in EXPORT_FIELDS if name not in HEAVY_FIELDS),
+    # Everything Ticket.to_dict() has
+    'export': EXPORT_FIELDS,
+}
+
+DEFAULT_PROFILE = 'detail'
+
+
+def parse_fields(fields: Optional[str] = None, profile: Optional[str] = None,
+                 default: str = DEFAULT_PROFILE) -> List[str]:
+    """
+    Resolve a ?fields= / ?profile= request into an ordered list of field names
+
+    `fields` is a comma-separated mix of profile names and field names, so
+    `fields=card,office_notes` is the card profile plus one heavy column.
+
+    Raises:
+        ValueError: For unknown profile or field names
+    """
+    tokens = [token.strip() for token in (fields or '').split(',') if token.strip()]
+    if profile:
+        tokens.insert(0, profile.strip())
+    if not tokens:
+        tokens = [default]
+
+    resolved = []
+    for token in tokens:
+        if token in PROFILES:
+            names = PROFILES[token]
+        elif token in TICKET_COLUMNS or token in CUSTOMER_FIELDS:
+            names = (token,)
+        else:
+            raise ValueError(f"Unknown ticket field or profile: {token}")
+        resolved.extend(name for name in names if name not in resolved)
+    return resolved
+
+
+def _format(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def serialize_tickets(query, fields: Sequence[str], customer_joined: bool = False,
+                      customer_fallback: Optional[Callable[[Dict], Dict]] = None) -> List[Dict]:
+    """
+    Run a Ticket query as a column projection and build one dict per row
+
+    Args:
+        query: Ticket query with filters and ordering already applied
+        fields: Field names from parse_fields()
+        customer_joined: True if the query already joins Customer
+        customer_fallback: Called with the stop columns (STOP_COLUMNS) of
+            tickets without a customer; returns overrides for customer fields
+
+    Returns:
+        List of dicts with exactly the requested fields, in request order
+    """
+    ticket_fields = [name for name in fields if name in TICKET_COLUMNS]
+    customer_fields = [name for name in fields if name in CUSTOMER_FIELDS]
+
+    columns = {name: TICKET_COLUMNS[name] for name in ticket_fields}
+    if customer_fields:
+        columns['_customer_id'] = Customer.id
+        for name in customer_fields:
+            for column in CUSTOMER_FIELDS[name]:
+                columns[f'_customer_{column.key}'] = column
+        if customer_fallback:
+            for name in STOP_COLUMNS:
+                columns[f'_stop_{name}'] = TICKET_COLUMNS[name]
+        if not customer_joined:
+            query = query.outerjoin(Customer, Ticket.customer_id == Customer.id)
+
+    rows = query.with_entities(*[column.label(label) for label, column in columns.items()]).all()
+
+    results = []
+    for row in rows:
+        row = row._mapping
+        customer = {}
+        if customer_fields:
+            if row['_customer_id'] is not None:
+                street = row.get('_customer_street_address')
+                customer = {
+                    'customer_name': f"{row.get('_customer_first_name')} {row.get('_customer_last_name')}",
+                    'customer_phone': row.get('_customer_phone_primary'),
+                    'customer_address': f"{street}, {row.get('_customer_city')}, {row.get('_customer_state')}" if street else None,
+                    'customer_gps_coordinates': row.get('_customer_gps_coordinates'),
+                }
+            elif customer_fallback:
+                stop = {name: row[f'_stop_{name}'] for name in STOP_COLUMNS}
+                customer = customer_fallback(stop)
+
+        results.append({
+            name: _format(row[name]) if name in TICKET_COLUMNS else customer.get(name)
+            for name in fields
+        })
+    return results